@@ -3,14 +3,26 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import argparse
+import itertools
+import json
+import os
 import re
 import sys
 
+from cloudinit.reporting import journal
 from cloudinit.util import json_dumps
 from datetime import datetime
 from . import dump
+from . import history
+from . import imports
+from . import index
 from . import show
 
+CLOUD_INIT_LOG = '/var/log/cloud-init.log'
+INFILE_HELP = (
+    'specify where to read input. Defaults to the event journal %s when it'
+    ' exists, else %s.' % (journal.JOURNAL_PATH, CLOUD_INIT_LOG))
+
 
 def get_parser(parser=None):
     if not parser:
@@ -23,12 +35,12 @@ def get_parser(parser=None):
     parser_blame = subparsers.add_parser(
         'blame', help='Print list of executed stages ordered by time to init')
     parser_blame.add_argument(
-        '-i', '--infile', action='store', dest='infile',
-        default='/var/log/cloud-init.log',
-        help='specify where to read input.')
+        '-i', '--infile', action='store', dest='infile', default=None,
+        help=INFILE_HELP)
     parser_blame.add_argument(
         '-o', '--outfile', action='store', dest='outfile', default='-',
         help='specify where to write output. ')
+    _add_boot_argument(parser_blame)
     parser_blame.set_defaults(action=('blame', analyze_blame))
 
     parser_show = subparsers.add_parser(
@@ -37,33 +49,111 @@ def get_parser(parser=None):
                              dest='print_format', default='%I%D @%Es +%ds',
                              help='specify formatting of output.')
     parser_show.add_argument('-i', '--infile', action='store',
-                             dest='infile', default='/var/log/cloud-init.log',
-                             help='specify where to read input.')
+                             dest='infile', default=None,
+                             help=INFILE_HELP)
     parser_show.add_argument('-o', '--outfile', action='store',
                              dest='outfile', default='-',
                              help='specify where to write output.')
+    _add_boot_argument(parser_show)
     parser_show.set_defaults(action=('show', analyze_show))
     parser_dump = subparsers.add_parser(
         'dump', help='Dump cloud-init events in JSON format')
     parser_dump.add_argument('-i', '--infile', action='store',
-                             dest='infile', default='/var/log/cloud-init.log',
-                             help='specify where to read input. ')
+                             dest='infile', default=None,
+                             help=INFILE_HELP)
     parser_dump.add_argument('-o', '--outfile', action='store',
                              dest='outfile', default='-',
                              help='specify where to write output. ')
+    _add_boot_argument(parser_dump)
     parser_dump.set_defaults(action=('dump', analyze_dump))
     parser_boot = subparsers.add_parser(
         'boot', help='Print list of boot times for kernel and cloud-init')
     parser_boot.add_argument('-i', '--infile', action='store',
-                             dest='infile', default='/var/log/cloud-init.log',
-                             help='specify where to read input. ')
+                             dest='infile', default=None,
+                             help=INFILE_HELP)
     parser_boot.add_argument('-o', '--outfile', action='store',
                              dest='outfile', default='-',
                              help='specify where to write output.')
     parser_boot.set_defaults(action=('boot', analyze_boot))
+    parser_imports = subparsers.add_parser(
+        'imports', help='Print the slowest python imports of a command')
+    parser_imports.add_argument(
+        '-i', '--infile', action='store', dest='infile', default=None,
+        help=('specify where to read python -X importtime output instead of'
+              ' running a command.'))
+    parser_imports.add_argument('-o', '--outfile', action='store',
+                                dest='outfile', default='-',
+                                help='specify where to write output.')
+    parser_imports.add_argument(
+        '-n', '--top', action='store', dest='top', type=int, default=10,
+        help='number of imports to list (default: %(default)s)')
+    parser_imports.add_argument(
+        'command', nargs=argparse.REMAINDER,
+        help='cloud-init command to run (default: status)')
+    parser_imports.set_defaults(action=('imports', analyze_imports))
+    parser_compare = subparsers.add_parser(
+        'compare', help='Compare recorded boot times between boots')
+    _add_history_arguments(parser_compare)
+    parser_compare.add_argument(
+        '--baseline', action='store', dest='baseline', default=None,
+        help=('boots to compare against: all, a boot number counting from 1'
+              ' or back from the last boot when negative, or LABEL=VALUE'
+              ' with a label among: %s. Defaults to all boots but the'
+              ' candidate boots.' % ', '.join(history.LABELS)))
+    parser_compare.add_argument(
+        '--baseline-db', action='store', dest='baseline_db', default=None,
+        help=('database to read baseline boots from, such as the database'
+              ' of another image. Defaults to --db.'))
+    parser_compare.add_argument(
+        '--candidate', action='store', dest='candidate', default='-1',
+        help=('boots to compare, selected like --baseline'
+              ' (default: %(default)s, the last boot)'))
+    parser_compare.add_argument(
+        '--threshold', action='store', dest='threshold', type=float,
+        default=10.0,
+        help=('percentage by which the p50 of an event must grow to be a'
+              ' regression (default: %(default)s)'))
+    parser_compare.add_argument(
+        '--min-delta', action='store', dest='min_delta', type=float,
+        default=0.01,
+        help=('seconds by which the p50 of an event must grow to be a'
+              ' regression (default: %(default)s)'))
+    parser_compare.set_defaults(action=('compare', analyze_compare))
+    parser_trend = subparsers.add_parser(
+        'trend', help='Print recorded boot times grouped by a boot label')
+    _add_history_arguments(parser_trend)
+    parser_trend.add_argument(
+        '--by', action='store', dest='by', default='version',
+        choices=('boot',) + history.LABELS,
+        help='label to group boots by (default: %(default)s)')
+    parser_trend.add_argument(
+        '--name', action='store', dest='name', default=None,
+        help='only print the event with this name, such as init-local')
+    parser_trend.set_defaults(action=('trend', analyze_trend))
     return parser
 
 
+def _add_history_arguments(parser):
+    parser.add_argument(
+        '--db', action='store', dest='db', default=history.DB_PATH,
+        help='database of recorded boot times (default: %(default)s)')
+    parser.add_argument(
+        '--kind', action='store', dest='kind', default=None,
+        choices=history.KINDS, help='only report events of this kind')
+    parser.add_argument('-o', '--outfile', action='store',
+                        dest='outfile', default='-',
+                        help='specify where to write output.')
+
+
+def _add_boot_argument(parser):
+    parser.add_argument(
+        '-b', '--boot', action='store', dest='boot', type=int, default=None,
+        help=('only analyze boot record BOOT, counting from 1 or back from'
+              ' the last boot record when negative (-1 is the last boot).'
+              ' The start of each boot record in %s is indexed in %s.' % (
+                  index.DEFAULT_LOG_PATH, index.DEFAULT_INDEX_PATH)))
+
+
 def analyze_boot(name, args):
     """Report a list of how long different boot operations took.
 
@@ -83,10 +173,17 @@ def analyze_boot(name, args):
     kernel_start_timestamp = datetime.utcfromtimestamp(kernel_start)
     kernel_end_timestamp = datetime.utcfromtimestamp(kernel_end)
     ci_sysd_start_timestamp = datetime.utcfromtimestamp(ci_sysd_start)
+    if _journal_path(infh):
+        # The journal has no log lines, so init-local starts with its event
+        def is_init_local_start(event):
+            return event['event_type'] == 'start'
+    else:
+        def is_init_local_start(event):
+            return 'starting search' in event['description']
     try:
         last_init_local = \
             [e for e in _get_events(infh) if e['name'] == 'init-local' and
-                'starting search' in e['description']][-1]
+                is_init_local_start(e)][-1]
         ci_start = datetime.utcfromtimestamp(last_init_local['timestamp'])
     except IndexError:
         ci_start = 'Could not find init-local log-line in cloud-init.log'
@@ -154,13 +251,16 @@ def analyze_blame(name, args):
     (infh, outfh) = configure_io(args)
     blame_format = '     %ds (%n)'
     r = re.compile(r'(^\s+\d+\.\d+)', re.MULTILINE)
-    for idx, record in enumerate(show.show_events(_get_events(infh),
-                                                  blame_format)):
+    first, events = _get_selected_events(infh, args.boot)
+    count = 0
+    for idx, record in enumerate(show.show_events(events, blame_format),
+                                 start=first):
         srecs = sorted(filter(r.match, record), reverse=True)
-        outfh.write('-- Boot Record %02d --\n' % (idx + 1))
+        outfh.write('-- Boot Record %02d --\n' % idx)
         outfh.write('\n'.join(srecs) + '\n')
         outfh.write('\n')
-    outfh.write('%d boot records analyzed\n' % (idx + 1))
+        count += 1
+    outfh.write('%d boot records analyzed\n' % count)
 
 
 def analyze_show(name, args):
@@ -184,33 +284,184 @@ def analyze_show(name, args):
         Finished stage: (modules-final) 0.NNN seconds
     """
     (infh, outfh) = configure_io(args)
-    for idx, record in enumerate(show.show_events(_get_events(infh),
-                                                  args.print_format)):
-        outfh.write('-- Boot Record %02d --\n' % (idx + 1))
+    first, events = _get_selected_events(infh, args.boot)
+    count = 0
+    for idx, record in enumerate(show.show_events(events, args.print_format),
+                                 start=first):
+        count += 1
+        outfh.write('-- Boot Record %02d --\n' % idx)
         outfh.write('The total time elapsed since completing an event is'
                     ' printed after the "@" character.\n')
         outfh.write('The time the event takes is printed after the "+" '
                     'character.\n\n')
         outfh.write('\n'.join(record) + '\n')
-    outfh.write('%d boot records analyzed\n' % (idx + 1))
+    outfh.write('%d boot records analyzed\n' % count)
 
 
 def analyze_dump(name, args):
     """Dump cloud-init events in json format"""
     (infh, outfh) = configure_io(args)
-    outfh.write(json_dumps(_get_events(infh)) + '\n')
+    _first, events = _get_selected_events(infh, args.boot)
+    outfh.write(json_dumps(list(events)) + '\n')
+
+
+def analyze_imports(name, args):
+    """Report the slowest python imports of a cloud-init command.
+
+    For example:
+    Total import time: 0.35788s (312 modules)
+    -- Top 10 top-level imports by cumulative time --
+         0.29106s (cloudinit.cmd.main)
+         ...
+    -- Top 10 imports by self time --
+         0.03086s (cloudinit.util)
+         ...
+    """
+    if args.infile:
+        (infh, outfh) = configure_io(args)
+        records = imports.parse_importtime(infh)
+    else:
+        (_infh, outfh) = configure_io(
+            argparse.Namespace(infile='-', outfile=args.outfile))
+        records = imports.collect_importtime(args.command or ['status'])
+    outfh.write(imports.format_imports(records, top=args.top))
+
+
+def _open_history(db_path):
+    if not os.path.exists(db_path):
+        sys.stderr.write('No boot times recorded in %s\n' % db_path)
+        sys.exit(1)
+    return history.connect(db_path)
+
+
+def analyze_compare(name, args):
+    """Report the change of each event's recorded duration between boots.
+
+    For example:
+    Baseline: 9 boots, candidate: 1 boots
+      base p50   base p95   cand p50   cand p95   change  name
+      1.20000s   1.50000s   1.80000s   1.80000s   +50.0%  init-local REGRESSION
+      ...
+    1 regressions
+
+    Returns 1 when an event regressed, so that boot time regressions can
+    gate image builds.
+    """
+    (_infh, outfh) = configure_io(
+        argparse.Namespace(infile='-', outfile=args.outfile))
+    conn = _open_history(args.db)
+    base_conn = conn
+    if args.baseline_db:
+        base_conn = _open_history(args.baseline_db)
+    try:
+        boots = history.get_boots(conn)
+        candidate = history.select_boots(boots, args.candidate)
+        if args.baseline:
+            baseline = history.select_boots(
+                history.get_boots(base_conn), args.baseline)
+        elif base_conn is not conn:
+            baseline = history.select_boots(
+                history.get_boots(base_conn), 'all')
+        else:
+            baseline = [boot['id'] for boot in boots
+                        if boot['id'] not in candidate]
+            if not baseline:
+                raise ValueError('No boots recorded before the candidate')
+    except ValueError as e:
+        sys.stderr.write('%s\n' % e)
+        sys.exit(1)
+    rows = history.compare(
+        history.get_samples(base_conn, baseline, args.kind),
+        history.get_samples(conn, candidate, args.kind),
+        args.threshold, args.min_delta)
+    outfh.write(history.format_comparison(
+        rows, len(baseline), len(candidate)))
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+def analyze_trend(name, args):
+    """Report the p50 and p95 of recorded durations for each boot label.
+
+    For example:
+    -- init-local (stage) --
+      version=21.3                        9 boots  p50   1.20000s  ...
+      version=21.4                        1 boots  p50   1.80000s  ...
+    """
+    (_infh, outfh) = configure_io(
+        argparse.Namespace(infile='-', outfile=args.outfile))
+    conn = _open_history(args.db)
+    outfh.write(history.format_trend(
+        history.trend(conn, args.by, args.kind, args.name), args.by))
+
+
+def _journal_path(infile):
+    """Return the path of infile when it is an event journal, else None."""
+    path = getattr(infile, 'name', None)
+    if (infile is not sys.stdin and isinstance(path, str) and
+            journal.is_journal(path)):
+        return path
+    return None
 
 
 def _get_events(infile):
-    rawdata = None
-    events, rawdata = show.load_events_infile(infile)
-    if not events:
-        events, _ = dump.dump_events(rawdata=rawdata)
-    return events
+    """Return the events of infile, an event journal, a JSON dump or a
+    cloud-init log.
+
+    Logs are parsed one line at a time as the events are iterated.
+    """
+    path = _journal_path(infile)
+    if path:
+        return journal.read_events(path)
+    first_line = infile.readline()
+    if first_line.lstrip().startswith('['):
+        data = first_line + infile.read()
+        try:
+            return json.loads(data)
+        except ValueError:
+            return dump.iter_events(data.splitlines())
+    return dump.iter_events(itertools.chain([first_line], infile))
+
+
+def _get_boot_events(infile, boot):
+    """Return the number and events of one boot record of infile.
+
+    Only the part of a log file holding the boot record is parsed.
+    """
+    path = getattr(infile, 'name', None)
+    if (infile is not sys.stdin and path and os.path.isfile(path) and
+            not _journal_path(infile)):
+        with open(path, 'rb') as fh:
+            is_json = fh.read(4096).lstrip().startswith(b'[')
+        if not is_json:
+            number, lines = index.read_boot(path, boot)
+            return number, dump.iter_events(lines)
+    boots = index.split_boots(_get_events(infile))
+    position = index.select_boot(len(boots), boot)
+    return position + 1, boots[position]
+
+
+def _get_selected_events(infile, boot=None):
+    """Return the number of the first boot record and the events of infile.
+
+    @param boot: Number of the only boot record to return events of, or
+        None for all boot records.
+    """
+    if boot is None:
+        return 1, _get_events(infile)
+    try:
+        return _get_boot_events(infile, boot)
+    except ValueError as e:
+        sys.stderr.write('%s\n' % e)
+        sys.exit(1)
 
 
 def configure_io(args):
     """Common parsing and setup of input/output files"""
+    if args.infile is None:
+        if os.path.exists(journal.JOURNAL_PATH):
+            args.infile = journal.JOURNAL_PATH
+        else:
+            args.infile = CLOUD_INIT_LOG
     if args.infile == '-':
         infh = sys.stdin
     else:
@@ -2,6 +2,7 @@
 
 import calendar
 from datetime import datetime
+import re
 import sys
 
 from cloudinit import subp
@@ -27,11 +28,15 @@ CLOUD_INIT_JOURNALCTL_FMT = "%b %d %H:%M:%S.%f %Y"
 # other
 DEFAULT_FMT = "%b %d %H:%M:%S %Y"
 
+MONTHS = frozenset(calendar.month_abbr[1:])
+
+# Lines which may be cloud-init events, checked before parsing any line
+CI_EVENT_RE = re.compile(r'start:|finish:|Cloud-init v\.')
+
 
 def parse_timestamp(timestampstr):
     # default syslog time does not include the current year
-    months = [calendar.month_abbr[m] for m in range(1, 13)]
-    if timestampstr.split()[0] in months:
+    if timestampstr.split()[0] in MONTHS:
         # Aug 29 22:55:26
         FMT = DEFAULT_FMT
         if '.' in timestampstr:
@@ -58,6 +63,21 @@ def parse_timestamp_from_date(timestampstr):
 
 
 def parse_ci_logline(line):
+    """Return the event logged by line, or None if it logs no event."""
+    parsed = parse_ci_logline_event(line)
+    if not parsed:
+        return None
+    timestampstr, event = parsed
+    event['timestamp'] = parse_timestamp(timestampstr)
+    return event
+
+
+def parse_ci_logline_event(line):
+    """Return the timestamp string and event of line without parsing time.
+
+    The event lacks its 'timestamp', which is costly to parse and not
+    needed to find where boot records start.
+    """
     # Stage Starts:
     # Cloud-init v. 0.7.7 running 'init-local' at \
     #               Fri, 02 Sep 2016 19:28:07 +0000. Up 1.0 seconds.
@@ -130,7 +150,6 @@ def parse_ci_logline(line):
     event = {
         'name': event_name.rstrip(":"),
         'description': event_description,
-        'timestamp': parse_timestamp(timestampstr),
         'origin': 'cloudinit',
         'event_type': event_type.rstrip(":"),
     }
@@ -140,14 +159,25 @@ def parse_ci_logline(line):
         event['result'] = result
         event['description'] = desc.strip()
 
-    return event
+    return timestampstr, event
 
 
-def dump_events(cisource=None, rawdata=None):
-    events = []
-    event = None
-    CI_EVENT_MATCHES = ['start:', 'finish:', 'Cloud-init v.']
+def iter_events(lines):
+    """Yield the events logged in lines, reading one line at a time."""
+    search = CI_EVENT_RE.search
+    for line in lines:
+        if not search(line):
+            continue
+        try:
+            event = parse_ci_logline(line)
+        except ValueError:
+            sys.stderr.write('Skipping invalid entry\n')
+            continue
+        if event:
+            yield event
 
+
+def dump_events(cisource=None, rawdata=None):
     if not any([cisource, rawdata]):
         raise ValueError('Either cisource or rawdata parameters are required')
 
@@ -156,17 +186,7 @@ def dump_events(cisource=None, rawdata=None):
     else:
         data = cisource.readlines()
 
-    for line in data:
-        for match in CI_EVENT_MATCHES:
-            if match in line:
-                try:
-                    event = parse_ci_logline(line)
-                except ValueError:
-                    sys.stderr.write('Skipping invalid entry\n')
-                if event:
-                    events.append(event)
-
-    return events, data
+    return list(iter_events(data)), data
 
 
 def main():
@@ -0,0 +1,320 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Keep the durations of each boot to compare boot times across boots.
+
+At the end of each boot, the durations of its stages, modules, datasource
+searches and other events are read from the event journal and appended to
+a SQLite database, along with labels identifying the boot, such as the
+cloud-init version and the image serial. Boots can then be compared, or
+their durations summarized by label, without keeping or parsing logs. Only
+the last MAX_BOOTS boots are kept.
+"""
+
+import math
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+from cloudinit import log as logging
+from cloudinit import util
+from cloudinit import version
+from cloudinit.reporting import journal
+
+LOG = logging.getLogger(__name__)
+
+DB_PATH = '/var/lib/cloud/data/boot-times.sqlite'
+BOOT_ID_PATH = '/proc/sys/kernel/random/boot_id'
+BUILD_INFO_PATH = '/etc/cloud/build.info'
+RESULT_PATH = '/run/cloud-init/result.json'
+# Number of boots kept in the database, older boots are pruned
+MAX_BOOTS = 100
+
+LABELS = ('boot_id', 'version', 'kernel', 'image', 'datasource')
+KINDS = ('stage', 'datasource', 'module', 'event')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS boots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorded REAL NOT NULL,
+    boot_id TEXT UNIQUE,
+    version TEXT,
+    kernel TEXT,
+    image TEXT,
+    datasource TEXT
+);
+CREATE TABLE IF NOT EXISTS durations (
+    boot INTEGER NOT NULL REFERENCES boots (id),
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS durations_boot ON durations (boot);
+"""
+
+
+def event_kind(name):
+    """Return the kind of event name: one of KINDS."""
+    if '/' not in name:
+        return 'stage'
+    leaf = name.rsplit('/', 1)[1]
+    if leaf.startswith('search-'):
+        return 'datasource'
+    if leaf.startswith('config-'):
+        return 'module'
+    return 'event'
+
+
+def get_durations(journal_path=None):
+    """Return (name, kind, duration) tuples of the events in the journal.
+
+    Only finished events whose start is in the journal have a duration.
+    """
+    _wall_offset, records = journal.read_records(
+        journal_path or journal.JOURNAL_PATH)
+    return [(name, event_kind(name), duration)
+            for (_offset, event_type, _result, name, _description, _parent,
+                 _monotonic, duration) in records
+            if event_type == journal.FINISH and
+            duration != journal.NO_DURATION]
+
+
+def get_labels():
+    """Return a dict of the labels of the current boot."""
+    labels = dict.fromkeys(LABELS)
+    labels['version'] = version.version_string()
+    labels['kernel'] = os.uname().release
+    try:
+        labels['boot_id'] = util.load_file(BOOT_ID_PATH).strip()
+    except OSError:
+        pass
+    try:
+        build_info = util.load_file(BUILD_INFO_PATH)
+    except OSError:
+        build_info = ''
+    for line in build_info.splitlines():
+        key, _, value = line.partition(':')
+        if key.strip() == 'serial':
+            labels['image'] = value.strip()
+    try:
+        result = util.load_json(util.load_file(RESULT_PATH))
+        # Such as "DataSourceNoCloud [seed=/dev/sr0][dsmode=net]"
+        labels['datasource'] = result['v1']['datasource'].split()[0]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError,
+            IndexError):
+        pass
+    return labels
+
+
+def connect(db_path=None):
+    """Return a connection to the database, creating its tables."""
+    db_path = db_path or DB_PATH
+    util.ensure_dir(os.path.dirname(db_path))
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def record_boot(durations, labels, db_path=None, max_boots=MAX_BOOTS):
+    """Append the durations of a boot to the database.
+
+    Boots older than the last max_boots boots are removed.
+
+    @param durations: List of (name, kind, duration) tuples.
+    @param labels: Dict of the labels of the boot, keyed by LABELS.
+    @returns: False when the boot was already recorded, else True.
+    """
+    conn = connect(db_path)
+    try:
+        with conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO boots (recorded, %s) VALUES (?, %s)' % (
+                    ', '.join(LABELS), ', '.join('?' * len(LABELS))),
+                [time.time()] + [labels.get(label) for label in LABELS])
+            if not cursor.rowcount:
+                return False
+            conn.executemany(
+                'INSERT INTO durations (boot, name, kind, duration)'
+                ' VALUES (?, ?, ?, ?)',
+                [(cursor.lastrowid,) + duration for duration in durations])
+            pruned = ('SELECT id FROM boots ORDER BY id DESC'
+                      ' LIMIT -1 OFFSET ?')
+            conn.execute('DELETE FROM durations WHERE boot IN (%s)' % pruned,
+                         (max_boots,))
+            conn.execute('DELETE FROM boots WHERE id IN (%s)' % pruned,
+                         (max_boots,))
+    finally:
+        conn.close()
+    return True
+
+
+def record_current_boot(journal_path=None, db_path=None):
+    """Append the durations in the event journal of the current boot."""
+    try:
+        durations = get_durations(journal_path)
+    except (OSError, ValueError) as e:
+        LOG.debug('Not recording boot times, no event journal: %s', e)
+        return False
+    try:
+        return record_boot(durations, get_labels(), db_path)
+    except (OSError, sqlite3.Error) as e:
+        LOG.warning('Failed to record boot times in %s: %s',
+                    db_path or DB_PATH, e)
+        return False
+
+
+def get_boots(conn):
+    """Return the recorded boots as a list of label dicts with an 'id'."""
+    columns = ('id',) + LABELS
+    return [dict(zip(columns, row)) for row in conn.execute(
+        'SELECT %s FROM boots ORDER BY id' % ', '.join(columns))]
+
+
+def select_boots(boots, selector):
+    """Return the ids of the boots matching selector.
+
+    @param selector: 'all', a boot number counting from 1 or back from the
+        last boot when negative, or a LABEL=VALUE filter.
+    @raises: ValueError for invalid selectors or when no boot matches.
+    """
+    if selector == 'all':
+        ids = [boot['id'] for boot in boots]
+    elif '=' in selector:
+        label, _, value = selector.partition('=')
+        if label not in LABELS:
+            raise ValueError(
+                'Unknown label %s, expected one of: %s' % (
+                    label, ', '.join(LABELS)))
+        ids = [boot['id'] for boot in boots if boot[label] == value]
+    else:
+        try:
+            number = int(selector)
+        except ValueError:
+            raise ValueError(
+                'Invalid boot selection %s, expected all, a boot number or'
+                ' LABEL=VALUE' % selector)
+        position = number - 1 if number > 0 else len(boots) + number
+        if number == 0 or not 0 <= position < len(boots):
+            raise ValueError(
+                'Boot %d not found, %d boots recorded' % (number, len(boots)))
+        ids = [boots[position]['id']]
+    if not ids:
+        raise ValueError('No recorded boots match %s' % selector)
+    return ids
+
+
+def iter_durations(conn, kind=None):
+    """Yield the (boot id, name, duration) of each recorded duration."""
+    query = 'SELECT boot, name, duration FROM durations'
+    params = []
+    if kind:
+        query += ' WHERE kind = ?'
+        params.append(kind)
+    return conn.execute(query, params)
+
+
+def get_samples(conn, boot_ids, kind=None):
+    """Return a dict of event name to its list of durations in boot_ids."""
+    samples = {}
+    # Boots are filtered here, as their number may exceed the number of
+    # parameters SQLite accepts in a query
+    boot_ids = set(boot_ids)
+    for boot, name, duration in iter_durations(conn, kind):
+        if boot in boot_ids:
+            samples.setdefault(name, []).append(duration)
+    return samples
+
+
+def percentile(values, pct):
+    """Return the nearest-rank percentile pct of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def compare(baseline, candidate, threshold=10.0, min_delta=0.01):
+    """Return the comparison of two dicts of samples, largest change first.
+
+    @param threshold: Percentage by which the p50 of an event must grow to
+        be a regression.
+    @param min_delta: Seconds by which the p50 of an event must grow to be
+        a regression, so that noise in short events is ignored.
+    @returns: List of dicts with the event name, the p50 and p95 of both
+        samples, the change of p50 in percent and whether it regressed.
+        Only events in both samples are compared.
+    """
+    rows = []
+    for name in set(baseline).intersection(candidate):
+        base_p50 = percentile(baseline[name], 50)
+        cand_p50 = percentile(candidate[name], 50)
+        delta = cand_p50 - base_p50
+        change = delta / base_p50 * 100 if base_p50 else 0.0
+        rows.append({
+            'name': name,
+            'baseline_p50': base_p50,
+            'baseline_p95': percentile(baseline[name], 95),
+            'candidate_p50': cand_p50,
+            'candidate_p95': percentile(candidate[name], 95),
+            'change': change,
+            'regression': delta >= min_delta and (
+                not base_p50 or change > threshold),
+        })
+    return sorted(rows, key=lambda row: (
+        row['candidate_p50'] - row['baseline_p50'], row['name']),
+        reverse=True)
+
+
+def format_comparison(rows, baseline_count, candidate_count):
+    """Return a report of the rows returned by compare."""
+    lines = [
+        'Baseline: %d boots, candidate: %d boots' % (
+            baseline_count, candidate_count),
+        '%10s %10s %10s %10s %8s  %s' % (
+            'base p50', 'base p95', 'cand p50', 'cand p95', 'change',
+            'name')]
+    for row in rows:
+        lines.append('%9.5fs %9.5fs %9.5fs %9.5fs %+7.1f%%  %s%s' % (
+            row['baseline_p50'], row['baseline_p95'], row['candidate_p50'],
+            row['candidate_p95'], row['change'], row['name'],
+            ' REGRESSION' if row['regression'] else ''))
+    lines.append('%d regressions' % sum(row['regression'] for row in rows))
+    return '\n'.join(lines) + '\n'
+
+
+def trend(conn, by='version', kind=None, name=None):
+    """Return the p50 and p95 of each event for each value of label by.
+
+    @returns: List of (event name, [(value, boot count, p50, p95)]) tuples
+        sorted by event name, with values in the order they were first
+        recorded.
+    """
+    groups = OrderedDict()
+    group_of = {}
+    for boot in get_boots(conn):
+        value = boot['id'] if by == 'boot' else boot[by]
+        groups[value] = groups.get(value, 0) + 1
+        group_of[boot['id']] = value
+    samples = {}
+    for boot, event, duration in iter_durations(conn, kind):
+        if name and event != name:
+            continue
+        samples.setdefault(event, {}).setdefault(
+            group_of[boot], []).append(duration)
+    return [(event, [(value, count, percentile(samples[event][value], 50),
+                      percentile(samples[event][value], 95))
+                     for value, count in groups.items()
+                     if value in samples[event]])
+            for event in sorted(samples)]
+
+
+def format_trend(events, by='version'):
+    """Return a report of the events returned by trend."""
+    lines = []
+    for event, groups in events:
+        lines.append('-- %s (%s) --' % (event, event_kind(event)))
+        for value, count, p50, p95 in groups:
+            lines.append('  %s=%-24s %4d boots  p50 %9.5fs  p95 %9.5fs' % (
+                by, value, count, p50, p95))
+    return '\n'.join(lines) + '\n'
+
+# vi: ts=4 expandtab
@@ -0,0 +1,85 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Report the time spent importing python modules for a cloud-init command.
+
+Import times are read from the output of ``python -X importtime``, either
+by running a cloud-init command or from a previously captured log, such as
+the journal of a boot stage run with PYTHONPROFILEIMPORTTIME=1.
+"""
+
+import re
+import sys
+
+from cloudinit import subp
+
+# import time: <self us> | <cumulative us> | <indent><module>
+IMPORTTIME_RE = re.compile(
+    r'import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \|'
+    r'(?P<indent> *)(?P<name>\S+)\s*$')
+
+# Run the cloud-init entry point, so that its own imports are reported
+RUN_MAIN = (
+    'import sys; from cloudinit.cmd.main import main;'
+    ' sys.exit(main(["cloud-init"] + sys.argv[1:]))')
+
+
+def parse_importtime(lines):
+    """Return a list of import records parsed from importtime output.
+
+    @param lines: Iterable of lines which may contain importtime output.
+    @return: List of dicts with the module name, self and cumulative import
+        time in seconds and the depth at which the module was imported.
+        Lines which are not importtime output are ignored.
+    """
+    records = []
+    for line in lines:
+        match = IMPORTTIME_RE.search(line)
+        if not match:
+            continue
+        records.append({
+            'name': match.group('name'),
+            'self': int(match.group('self')) / 1e6,
+            'cumulative': int(match.group('cumulative')) / 1e6,
+            # Top-level imports are indented by a single space
+            'depth': len(match.group('indent')) // 2,
+        })
+    return records
+
+
+def collect_importtime(command):
+    """Run cloud-init command with -X importtime and return its records.
+
+    @param command: List of cloud-init arguments, such as ['status'].
+    """
+    if command and command[0] == '--':
+        command = command[1:]
+    try:
+        _out, err = subp.subp(
+            [sys.executable, '-X', 'importtime', '-c', RUN_MAIN] + command,
+            decode='replace')
+    except subp.ProcessExecutionError as e:
+        # Import times are still reported when the command itself fails
+        err = e.stderr
+    return parse_importtime(err.splitlines())
+
+
+def format_imports(records, top=10):
+    """Return a report of the slowest imports in records.
+
+    @param records: List of import records from parse_importtime.
+    @param top: Number of modules to list by cumulative and by self time.
+    """
+    total = sum(r['cumulative'] for r in records if r['depth'] == 0)
+    lines = ['Total import time: %.5fs (%d modules)' % (total, len(records))]
+    for key, title in (('cumulative', 'top-level imports by cumulative'),
+                       ('self', 'imports by self')):
+        candidates = records
+        if key == 'cumulative':
+            candidates = [r for r in records if r['depth'] == 0]
+        lines.append('-- Top %d %s time --' % (top, title))
+        for record in sorted(
+                candidates, key=lambda r: r[key], reverse=True)[:top]:
+            lines.append('     %.5fs (%s)' % (record[key], record['name']))
+    return '\n'.join(lines) + '\n'
+
+# vi: ts=4 expandtab
@@ -0,0 +1,198 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Find the boot records of a cloud-init log without parsing all of it.
+
+The byte offset at which each boot record starts is kept in an index, so
+selecting one boot reads only its part of the log. The index is extended as
+the log grows and rebuilt when the log is rotated or truncated. Only the
+default log is indexed, in /run/cloud-init where other users cannot plant
+files, other logs and logs whose index cannot be written are indexed in
+memory for each run.
+"""
+
+import json
+import os
+import re
+
+from cloudinit import atomic_helper
+from cloudinit.analyze import dump
+
+DEFAULT_LOG_PATH = '/var/log/cloud-init.log'
+DEFAULT_INDEX_PATH = '/run/cloud-init/analyze-index.json'
+INDEX_VERSION = 1
+
+CI_EVENT_RE = re.compile(dump.CI_EVENT_RE.pattern.encode())
+
+
+class BootSplitter(object):
+    """Find the events starting boot records, like show.iter_records.
+
+    A boot record starts at a start event for a stage which was already
+    started in the current boot record. A start event counts as started
+    once it is known not to be immediately followed by an event of the same
+    name, so each event only needs its name and type.
+    """
+
+    def __init__(self, seen=None, pending=None):
+        self.seen = list(seen or [])
+        self.pending = pending
+
+    def feed(self, event):
+        """Return True when event starts a new boot record."""
+        name = event['name']
+        if self.pending is not None and self.pending != name:
+            self.seen.append(self.pending)
+        self.pending = None
+        if event['event_type'] != 'start':
+            return False
+        new_boot = name in self.seen
+        if new_boot:
+            self.seen = []
+        self.pending = name
+        return new_boot
+
+    def state(self):
+        return {'seen': self.seen, 'pending': self.pending}
+
+
+def scan_boot_offsets(fh, offset=0, splitter=None):
+    """Return the offsets of boot records starting after offset in fh.
+
+    @param fh: Log file opened in binary mode.
+    @param offset: Offset of the first complete line to read.
+    @param splitter: BootSplitter with the state of the log before offset.
+    @returns: Tuple of the list of offsets, the offset after the last
+        complete line read and the splitter.
+    """
+    if splitter is None:
+        splitter = BootSplitter()
+    offsets = []
+    search = CI_EVENT_RE.search
+    fh.seek(offset)
+    for line in fh:
+        if not line.endswith(b'\n'):
+            # Incomplete line which is still being written
+            break
+        if search(line):
+            try:
+                parsed = dump.parse_ci_logline_event(
+                    line.decode('utf-8', 'replace'))
+            except ValueError:
+                parsed = None
+            if parsed and splitter.feed(parsed[1]):
+                offsets.append(offset)
+        offset += len(line)
+    return offsets, offset, splitter
+
+
+def _read_index(index_path, stat):
+    try:
+        with open(index_path) as fh:
+            index = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(index, dict) or
+            index.get('version') != INDEX_VERSION or
+            index.get('inode') != stat.st_ino or
+            index.get('size', 0) > stat.st_size):
+        return None
+    return index
+
+
+def get_index_path(log_path):
+    """Return the path of the index of log_path, None if it is not indexed."""
+    if os.path.realpath(log_path) == DEFAULT_LOG_PATH:
+        return DEFAULT_INDEX_PATH
+    return None
+
+
+def get_boot_offsets(log_path, index_path=None):
+    """Return the offsets at which the boot records of log_path start.
+
+    @param log_path: Path of the cloud-init log.
+    @param index_path: Path of the index, by default get_index_path.
+    """
+    if index_path is None:
+        index_path = get_index_path(log_path)
+    with open(log_path, 'rb') as fh:
+        stat = os.fstat(fh.fileno())
+        index = None
+        if index_path:
+            index = _read_index(index_path, stat)
+        if index is None:
+            index = {'version': INDEX_VERSION, 'inode': stat.st_ino,
+                     'size': 0, 'offsets': [0],
+                     'splitter': BootSplitter().state()}
+        if index['size'] == stat.st_size:
+            return index['offsets']
+        offsets, size, splitter = scan_boot_offsets(
+            fh, index['size'], BootSplitter(**index['splitter']))
+    index['offsets'] += offsets
+    index['size'] = size
+    index['splitter'] = splitter.state()
+    if not index_path:
+        return index['offsets']
+    try:
+        # Written to a temporary file renamed into place, which replaces
+        # rather than follows a symlink at index_path
+        atomic_helper.write_json(index_path, index)
+    except OSError:
+        # The index is an optimization, so unprivileged users can still
+        # analyze logs they may read
+        pass
+    return index['offsets']
+
+
+def select_boot(count, boot):
+    """Return the 0-based position of boot among count boot records.
+
+    @param boot: 1-based number of the boot record, or a negative number
+        counting back from the last boot record.
+    @raises: ValueError when there is no such boot record.
+    """
+    position = boot - 1 if boot > 0 else count + boot
+    if boot == 0 or not 0 <= position < count:
+        raise ValueError(
+            'Boot record %d not found, %d boot records in the log' % (
+                boot, count))
+    return position
+
+
+def read_boot(log_path, boot, index_path=None):
+    """Return the number and lines of one boot record of log_path.
+
+    @param boot: 1-based number of the boot record, or a negative number
+        counting back from the last boot record.
+    @returns: Tuple of the 1-based number of the boot record and a
+        generator of its decoded lines.
+    @raises: ValueError when there is no such boot record.
+    """
+    offsets = get_boot_offsets(log_path, index_path)
+    position = select_boot(len(offsets), boot)
+    start = offsets[position]
+    end = offsets[position + 1] if position + 1 < len(offsets) else None
+
+    def lines():
+        with open(log_path, 'rb') as fh:
+            fh.seek(start)
+            offset = start
+            for line in fh:
+                if end is not None and offset >= end:
+                    break
+                offset += len(line)
+                yield line.decode('utf-8', 'replace')
+
+    return position + 1, lines()
+
+
+def split_boots(events):
+    """Return the events of each boot record as a list of lists."""
+    splitter = BootSplitter()
+    boots = [[]]
+    for event in events:
+        if splitter.feed(event):
+            boots.append([])
+        boots[-1].append(event)
+    return boots
+
+# vi: ts=4 expandtab
@@ -283,43 +283,40 @@ def gather_timestamps_using_systemd():
     return status, kernel_start, kernel_end, cloudinit_sysd
 
 
-def generate_records(events, blame_sort=False,
-                     print_format="(%n) %d seconds in %I%D",
-                     dump_files=False, log_datafiles=False):
+def _with_next(events):
+    """Yield each event of events together with the event following it."""
+    events = iter(events)
+    event = next(events, None)
+    for next_evt in events:
+        yield event, next_evt
+        event = next_evt
+    if event is not None:
+        yield event, None
+
+
+def iter_records(events, print_format="(%n) %d seconds in %I%D"):
     '''
-    Take in raw events and create parent-child dependencies between events
-    in order to order events in chronological order.
+    Take in raw events and yield the records of each boot as soon as the
+    boot has been read, so events can be streamed from a log.
 
-    :param events: JSONs from dump that represents events taken from logs
-    :param blame_sort: whether to sort by timestamp or by time taken.
+    :param events: Iterable of events in the order they were logged
     :param print_format: formatting to represent event, time stamp,
     and time taken by the event in one line
-    :param dump_files: whether to dump files into JSONs
-    :param log_datafiles: whether or not to log events generated
 
-    :return: boot records ordered chronologically
+    :return: generator of the list of records of each boot
     '''
-
-    sorted_events = sorted(events, key=lambda x: x['timestamp'])
     records = []
     start_time = None
     total_time = 0.0
     stage_start_time = {}
     stages_seen = []
-    boot_records = []
 
     unprocessed = []
-    for e in range(0, len(sorted_events)):
-        event = events[e]
-        try:
-            next_evt = events[e + 1]
-        except IndexError:
-            next_evt = None
-
+    for event, next_evt in _with_next(events):
         if event_type(event) == 'start':
             if event.get('name') in stages_seen:
                 records.append(total_time_record(total_time))
-                boot_records.append(records)
+                yield records
                 records = []
                 start_time = None
                 total_time = 0.0
@@ -342,7 +339,7 @@ def generate_records(events, blame_sort=False,
                 unprocessed.append(event)
                 stages_seen.append(event.get('name'))
                 continue
-        else:
+        elif unprocessed:
             prev_evt = unprocessed.pop()
             if event_name(event) == event_name(prev_evt):
                 record = event_record(start_time, prev_evt, event)
@@ -355,8 +352,26 @@ def generate_records(events, blame_sort=False,
                 unprocessed.append(prev_evt)
 
     records.append(total_time_record(total_time))
-    boot_records.append(records)
-    return boot_records
+    yield records
+
+
+def generate_records(events, blame_sort=False,
+                     print_format="(%n) %d seconds in %I%D",
+                     dump_files=False, log_datafiles=False):
+    '''
+    Take in raw events and create parent-child dependencies between events
+    in order to order events in chronological order.
+
+    :param events: JSONs from dump that represents events taken from logs
+    :param blame_sort: whether to sort by timestamp or by time taken.
+    :param print_format: formatting to represent event, time stamp,
+    and time taken by the event in one line
+    :param dump_files: whether to dump files into JSONs
+    :param log_datafiles: whether or not to log events generated
+
+    :return: boot records ordered chronologically
+    '''
+    return list(iter_records(events, print_format=print_format))
 
 
 def show_events(events, print_format):
@@ -367,9 +382,9 @@ def show_events(events, print_format):
     :param print_format: formatting to represent event, time stamp,
     and time taken by the event in one line
 
-    :return: boot records ordered chronologically
+    :return: generator of boot records ordered chronologically
     '''
-    return generate_records(events, print_format=print_format)
+    return iter_records(events, print_format=print_format)
 
 
 def load_events_infile(infile):
@@ -0,0 +1,178 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+import io
+
+from cloudinit.analyze import history
+from cloudinit.analyze.__main__ import (
+    analyze_compare, analyze_trend, get_parser)
+from cloudinit.reporting import journal
+from cloudinit.tests.helpers import CiTestCase, mock
+
+M_PATH = 'cloudinit.analyze.history.'
+
+
+def durations(local, network, ntp=0.1):
+    return [('init-local', 'stage', local),
+            ('init-local/search-NoCloud', 'datasource', local / 2),
+            ('init-network', 'stage', network),
+            ('modules-config/config-ntp', 'module', ntp)]
+
+
+class TestRecordBoot(CiTestCase):
+
+    def setUp(self):
+        super(TestRecordBoot, self).setUp()
+        self.db_path = self.tmp_path('boot-times.sqlite')
+
+    def test_event_kind(self):
+        """Events are classified by their position and name."""
+        self.assertEqual('stage', history.event_kind('init-local'))
+        self.assertEqual(
+            'datasource', history.event_kind('init-local/search-NoCloud'))
+        self.assertEqual(
+            'module', history.event_kind('modules-final/config-final'))
+        self.assertEqual(
+            'event', history.event_kind('init-network/activate-datasource'))
+
+    def test_boots_are_recorded_once(self):
+        """A boot recorded again, such as by a rerun stage, is skipped."""
+        labels = {'boot_id': 'b1', 'version': '21.4'}
+        self.assertTrue(
+            history.record_boot(durations(1, 2), labels, self.db_path))
+        self.assertFalse(
+            history.record_boot(durations(3, 4), labels, self.db_path))
+        conn = history.connect(self.db_path)
+        self.addCleanup(conn.close)
+        self.assertEqual(
+            [{'id': 1, 'boot_id': 'b1', 'version': '21.4', 'kernel': None,
+              'image': None, 'datasource': None}], history.get_boots(conn))
+        self.assertEqual({'init-local': [1], 'init-network': [2]},
+                         history.get_samples(conn, [1], 'stage'))
+
+    def test_only_the_last_boots_are_kept(self):
+        """Boots older than the last max_boots are pruned."""
+        for boot in range(1, 5):
+            history.record_boot(
+                durations(boot, boot), {'boot_id': 'b%d' % boot},
+                self.db_path, max_boots=2)
+        conn = history.connect(self.db_path)
+        self.addCleanup(conn.close)
+        boots = history.get_boots(conn)
+        self.assertEqual(['b3', 'b4'], [boot['boot_id'] for boot in boots])
+        self.assertEqual(
+            {3, 4}, set(boot for boot, _name, _duration in
+                        history.iter_durations(conn)))
+
+    @mock.patch(M_PATH + 'get_labels', return_value={'boot_id': 'b1'})
+    def test_record_current_boot_reads_the_journal(self, m_get_labels):
+        """Durations of finished events in the journal are recorded."""
+        journal_path = self.tmp_path('events.journal')
+        writer = journal.JournalWriter(journal_path)
+        writer.write(journal.START, 'init-local', 'searching', monotonic=1)
+        writer.write(journal.START, 'init-local/search-NoCloud', 'searching',
+                     monotonic=1.5)
+        writer.write(journal.FINISH, 'init-local/search-NoCloud', 'found',
+                     result='SUCCESS', monotonic=2)
+        writer.write(journal.FINISH, 'init-local', 'searching',
+                     result='SUCCESS', monotonic=3)
+        self.assertTrue(
+            history.record_current_boot(journal_path, self.db_path))
+        conn = history.connect(self.db_path)
+        self.addCleanup(conn.close)
+        self.assertEqual(
+            {'init-local': [2.0], 'init-local/search-NoCloud': [0.5]},
+            history.get_samples(conn, [1]))
+
+    def test_record_current_boot_without_journal(self):
+        """Nothing is recorded without an event journal."""
+        self.assertFalse(history.record_current_boot(
+            self.tmp_path('events.journal'), self.db_path))
+
+
+class TestCompare(CiTestCase):
+
+    def test_percentile(self):
+        """Percentiles are nearest-rank values of the samples."""
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(3, history.percentile(values, 50))
+        self.assertEqual(5, history.percentile(values, 95))
+        self.assertEqual(7, history.percentile([7], 95))
+
+    def test_select_boots(self):
+        """Boots are selected by number, by label or all of them."""
+        boots = [{'id': 1, 'version': '21.3'}, {'id': 2, 'version': '21.3'},
+                 {'id': 3, 'version': '21.4'}]
+        self.assertEqual([3], history.select_boots(boots, '-1'))
+        self.assertEqual([1], history.select_boots(boots, '1'))
+        self.assertEqual([1, 2], history.select_boots(boots, 'version=21.3'))
+        self.assertEqual([1, 2, 3], history.select_boots(boots, 'all'))
+        for selector, error in (('4', 'Boot 4 not found'),
+                                ('version=1', 'No recorded boots'),
+                                ('bogus=1', 'Unknown label'),
+                                ('last', 'Invalid boot selection')):
+            with self.assertRaisesRegex(ValueError, error):
+                history.select_boots(boots, selector)
+
+    def test_compare_flags_regressions(self):
+        """Events whose p50 grew by the threshold and min_delta regress."""
+        rows = history.compare(
+            {'init-local': [1.0, 1.0, 1.2], 'init-network': [2.0],
+             'config-ntp': [0.001], 'only-baseline': [1.0]},
+            {'init-local': [1.5], 'init-network': [2.1],
+             'config-ntp': [0.005], 'only-candidate': [1.0]})
+        self.assertEqual(
+            [('init-local', True), ('init-network', False),
+             ('config-ntp', False)],
+            [(row['name'], row['regression']) for row in rows])
+        self.assertEqual(1.2, rows[0]['baseline_p95'])
+        self.assertEqual(50.0, rows[0]['change'])
+
+
+class TestAnalyzeHistory(CiTestCase):
+
+    def setUp(self):
+        super(TestAnalyzeHistory, self).setUp()
+        self.db_path = self.tmp_path('boot-times.sqlite')
+        for n, (local, version) in enumerate(
+                ((1.0, '21.3'), (1.1, '21.3'), (1.0, '21.3'),
+                 (1.6, '21.4'))):
+            history.record_boot(
+                durations(local, 2.0),
+                {'boot_id': str(n), 'version': version}, self.db_path)
+
+    def _run(self, action, argv):
+        args = get_parser().parse_args(argv + ['--db', self.db_path])
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as m_stdout:
+            result = action(argv[0], args)
+        return result, m_stdout.getvalue()
+
+    def test_compare_last_boot_to_previous_boots(self):
+        """The last boot is compared to the others and fails on regressions."""
+        result, output = self._run(analyze_compare, ['compare'])
+        self.assertEqual(1, result)
+        self.assertIn('Baseline: 3 boots, candidate: 1 boots', output)
+        self.assertIn('+60.0%  init-local REGRESSION', output)
+        self.assertIn('+0.0%  init-network\n', output)
+        self.assertIn('2 regressions', output)
+
+    def test_compare_by_label_and_kind(self):
+        """Boots are selected by label and events by kind."""
+        result, output = self._run(
+            analyze_compare, ['compare', '--baseline', 'version=21.3',
+                              '--candidate', '1', '--kind', 'module'])
+        self.assertEqual(0, result)
+        self.assertIn('modules-config/config-ntp', output)
+        self.assertNotIn('init-local', output)
+
+    def test_trend_groups_boots_by_label(self):
+        """Each event's p50 and p95 are reported for each label value."""
+        _result, output = self._run(
+            analyze_trend, ['trend', '--name', 'init-local'])
+        self.assertEqual(
+            '-- init-local (stage) --\n'
+            '  version=21.3                        3 boots  p50   1.00000s'
+            '  p95   1.10000s\n'
+            '  version=21.4                        1 boots  p50   1.60000s'
+            '  p95   1.60000s\n', output)
+
+# vi: ts=4 expandtab
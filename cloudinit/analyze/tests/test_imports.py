@@ -0,0 +1,81 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+from textwrap import dedent
+
+from cloudinit.analyze.imports import (
+    collect_importtime, format_imports, parse_importtime)
+from cloudinit.subp import ProcessExecutionError
+from cloudinit.tests.helpers import CiTestCase, mock
+
+IMPORTTIME = dedent("""\
+    import time: self [us] | cumulative | imported package
+    import time:       250 |        250 | site
+    import time:      1000 |       1000 |     cloudinit.log
+    import time:      3000 |       4500 |   cloudinit.util
+    import time:       500 |       5000 | cloudinit.cmd.main
+    Cloud-init v. 21.4 running 'status'
+    """)
+
+
+class TestParseImporttime(CiTestCase):
+
+    def test_parse_importtime_returns_records(self):
+        """Each importtime line is parsed into a record in seconds."""
+        self.assertEqual(
+            [{'name': 'site', 'self': 0.00025, 'cumulative': 0.00025,
+              'depth': 0},
+             {'name': 'cloudinit.log', 'self': 0.001, 'cumulative': 0.001,
+              'depth': 2},
+             {'name': 'cloudinit.util', 'self': 0.003, 'cumulative': 0.0045,
+              'depth': 1},
+             {'name': 'cloudinit.cmd.main', 'self': 0.0005,
+              'cumulative': 0.005, 'depth': 0}],
+            parse_importtime(IMPORTTIME.splitlines()))
+
+    def test_parse_importtime_handles_log_prefixes(self):
+        """Importtime output captured in the journal is parsed."""
+        line = ('Aug 08 15:12:51 host cloud-init[123]: import time:'
+                '       500 |       5000 | cloudinit.cmd.main')
+        self.assertEqual(
+            ['cloudinit.cmd.main'],
+            [r['name'] for r in parse_importtime([line])])
+
+
+class TestFormatImports(CiTestCase):
+
+    def test_format_imports_lists_slowest_imports(self):
+        """Top-level imports are listed by cumulative time, all by self."""
+        records = parse_importtime(IMPORTTIME.splitlines())
+        self.assertEqual(
+            dedent("""\
+                Total import time: 0.00525s (4 modules)
+                -- Top 2 top-level imports by cumulative time --
+                     0.00500s (cloudinit.cmd.main)
+                     0.00025s (site)
+                -- Top 2 imports by self time --
+                     0.00300s (cloudinit.util)
+                     0.00100s (cloudinit.log)
+                """),
+            format_imports(records, top=2))
+
+
+class TestCollectImporttime(CiTestCase):
+
+    @mock.patch('cloudinit.analyze.imports.subp.subp')
+    def test_collect_importtime_runs_command(self, m_subp):
+        """The cloud-init command is run with -X importtime."""
+        m_subp.return_value = ('', IMPORTTIME)
+        records = collect_importtime(['--', 'status', '--long'])
+        self.assertEqual(4, len(records))
+        args = m_subp.call_args[0][0]
+        self.assertEqual(['-X', 'importtime', '-c'], args[1:4])
+        self.assertEqual(['status', '--long'], args[5:])
+
+    @mock.patch('cloudinit.analyze.imports.subp.subp')
+    def test_collect_importtime_reports_failed_commands(self, m_subp):
+        """Import times are reported when the command fails."""
+        m_subp.side_effect = ProcessExecutionError(
+            stderr=IMPORTTIME, exit_code=1)
+        self.assertEqual(4, len(collect_importtime(['status'])))
+
+# vi: ts=4 expandtab
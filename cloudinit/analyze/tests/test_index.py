@@ -0,0 +1,194 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+import io
+import json
+import os
+from textwrap import dedent
+
+from cloudinit.analyze import index
+from cloudinit.analyze.__main__ import (
+    analyze_show, configure_io, get_parser)
+from cloudinit.analyze.dump import dump_events
+from cloudinit.analyze.show import generate_records
+from cloudinit.reporting import journal
+from cloudinit.tests.helpers import CiTestCase, mock
+from cloudinit.util import load_file, write_file
+
+BOOT = dedent("""\
+    2021-01-01 00:00:0{n},000 - handlers.py[DEBUG]: start: init-local: \
+searching for local datasources
+    2021-01-01 00:00:0{n},001 - util.py[DEBUG]: Cloud-init v. 21.4 running \
+'init-local' at Fri, 01 Jan 2021 00:00:0{n} +0000. Up 1.0 seconds.
+    2021-01-01 00:00:0{n},002 - handlers.py[DEBUG]: start: \
+init-local/check-cache: attempting to read from cache [check]
+    2021-01-01 00:00:0{n},003 - util.py[DEBUG]: Reading from /proc/uptime
+    2021-01-01 00:00:0{n},004 - handlers.py[DEBUG]: finish: \
+init-local/check-cache: SUCCESS: no cache found
+    2021-01-01 00:00:0{n},005 - handlers.py[DEBUG]: finish: init-local: \
+SUCCESS: searching for local datasources
+    """)
+
+
+def make_log(boots):
+    return ''.join(BOOT.format(n=n) for n in range(boots))
+
+
+class TestBootSplitter(CiTestCase):
+
+    def test_split_boots_matches_generate_records(self):
+        """Events are split into the boot records of generate_records."""
+        events, _ = dump_events(rawdata=make_log(3))
+        boots = index.split_boots(events)
+        self.assertEqual(3, len(boots))
+        self.assertEqual(
+            generate_records(events),
+            [generate_records(boot)[0] for boot in boots])
+
+
+class TestGetBootOffsets(CiTestCase):
+
+    def setUp(self):
+        super(TestGetBootOffsets, self).setUp()
+        self.log_path = self.tmp_path('cloud-init.log')
+        self.index_path = self.tmp_path('analyze-index.json')
+
+    def test_offsets_are_indexed(self):
+        """Each boot record's offset is written to the index."""
+        write_file(self.log_path, make_log(3))
+        boot_size = len(BOOT.format(n=0))
+        self.assertEqual(
+            [0, boot_size, 2 * boot_size],
+            index.get_boot_offsets(self.log_path, self.index_path))
+        self.assertEqual([0, boot_size, 2 * boot_size],
+                         json.loads(load_file(self.index_path))['offsets'])
+
+    def test_index_is_extended_as_the_log_grows(self):
+        """Only lines appended since the last run are scanned."""
+        log = make_log(3)
+        first, rest = log[:len(log) // 2], log[len(log) // 2:]
+        write_file(self.log_path, first)
+        index.get_boot_offsets(self.log_path, self.index_path)
+        write_file(self.log_path, rest, omode='a')
+        with open(self.log_path, 'rb') as fh:
+            fresh, _, _ = index.scan_boot_offsets(fh)
+        self.assertEqual(
+            [0] + fresh,
+            index.get_boot_offsets(self.log_path, self.index_path))
+
+    def test_index_is_rebuilt_for_a_truncated_log(self):
+        """A log which shrank, such as after rotation, is scanned again."""
+        write_file(self.log_path, make_log(3))
+        index.get_boot_offsets(self.log_path, self.index_path)
+        write_file(self.log_path, make_log(1))
+        self.assertEqual(
+            [0], index.get_boot_offsets(self.log_path, self.index_path))
+
+    def test_only_the_default_log_is_indexed(self):
+        """Other logs are indexed in memory, no file is written."""
+        self.assertEqual(index.DEFAULT_INDEX_PATH,
+                         index.get_index_path(index.DEFAULT_LOG_PATH))
+        self.assertIsNone(index.get_index_path(self.log_path))
+        write_file(self.log_path, make_log(2))
+        self.assertEqual(2, len(index.get_boot_offsets(self.log_path)))
+        self.assertEqual(['cloud-init.log'],
+                         os.listdir(os.path.dirname(self.log_path)))
+
+    def test_symlink_at_index_path_is_replaced(self):
+        """The index replaces a symlink rather than writing through it."""
+        write_file(self.log_path, make_log(2))
+        victim = self.tmp_path('victim')
+        write_file(victim, 'precious')
+        os.symlink(victim, self.index_path)
+        index.get_boot_offsets(self.log_path, self.index_path)
+        self.assertEqual('precious', load_file(victim))
+        self.assertFalse(os.path.islink(self.index_path))
+        self.assertIn('"offsets"', load_file(self.index_path))
+
+    def test_unwritable_index_is_not_fatal(self):
+        """Offsets are returned when the index cannot be written."""
+        write_file(self.log_path, make_log(2))
+        self.assertEqual(
+            2, len(index.get_boot_offsets(
+                self.log_path, os.path.join(self.log_path, 'index'))))
+
+
+class TestReadBoot(CiTestCase):
+
+    def test_read_boot_returns_only_that_boot(self):
+        """Boot records are counted from 1, or back from the last one."""
+        log_path = self.tmp_path('cloud-init.log')
+        write_file(log_path, make_log(3))
+        number, lines = index.read_boot(log_path, 2)
+        self.assertEqual(2, number)
+        self.assertEqual(BOOT.format(n=1), ''.join(lines))
+        number, lines = index.read_boot(log_path, -1)
+        self.assertEqual(3, number)
+        self.assertEqual(BOOT.format(n=2), ''.join(lines))
+
+    def test_read_boot_rejects_missing_boots(self):
+        """Boot records which are not in the log raise ValueError."""
+        log_path = self.tmp_path('cloud-init.log')
+        write_file(log_path, make_log(2))
+        for boot in (0, 3, -3):
+            with self.assertRaisesRegex(ValueError, 'Boot record'):
+                index.read_boot(log_path, boot)
+
+
+class TestAnalyzeShowBoot(CiTestCase):
+
+    def _show(self, infile, boot):
+        args = get_parser().parse_args(['show', '-i', infile, '--boot', boot])
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as m_stdout:
+            analyze_show('show', args)
+        return m_stdout.getvalue()
+
+    def test_show_boot_from_log_and_dump(self):
+        """A boot record is selected from logs and from JSON dumps alike."""
+        log_path = self.tmp_path('cloud-init.log')
+        write_file(log_path, make_log(3))
+        dump_path = self.tmp_path('dump.json')
+        events, _ = dump_events(cisource=io.StringIO(make_log(3)))
+        write_file(dump_path, json.dumps(events))
+        output = self._show(log_path, '-1')
+        self.assertIn('-- Boot Record 03 --', output)
+        self.assertNotIn('-- Boot Record 02 --', output)
+        self.assertIn('1 boot records analyzed', output)
+        self.assertEqual(output, self._show(dump_path, '3'))
+
+    def test_show_boot_from_journal(self):
+        """Boot records are read from an event journal without a log."""
+        journal_path = self.tmp_path('events.journal')
+        writer = journal.JournalWriter(journal_path)
+        for n in range(2):
+            for event_type, name, offset in (
+                    (journal.START, 'init-local', 0),
+                    (journal.START, 'init-local/check-cache', 0.1),
+                    (journal.FINISH, 'init-local/check-cache', 0.2),
+                    (journal.FINISH, 'init-local', 0.5)):
+                writer.write(event_type, name, 'searching', result='SUCCESS',
+                             monotonic=n + offset)
+        output = self._show(journal_path, '-1')
+        self.assertIn('-- Boot Record 02 --', output)
+        self.assertIn('Finished stage: (init-local) 00.50000 seconds', output)
+        self.assertIn('1 boot records analyzed', output)
+
+    def test_journal_is_read_by_default(self):
+        """The event journal is the default input when it exists."""
+        journal_path = self.tmp_path('events.journal')
+        log_path = self.tmp_path('cloud-init.log')
+        write_file(log_path, make_log(1))
+        m_main = 'cloudinit.analyze.__main__.'
+        with mock.patch(m_main + 'journal.JOURNAL_PATH', journal_path):
+            with mock.patch(m_main + 'CLOUD_INIT_LOG', log_path):
+                args = get_parser().parse_args(['show'])
+                infh, _outfh = configure_io(args)
+                infh.close()
+                self.assertEqual(log_path, args.infile)
+                journal.JournalWriter(journal_path).write(
+                    journal.START, 'init-local', 'searching')
+                args = get_parser().parse_args(['show'])
+                infh, _outfh = configure_io(args)
+                infh.close()
+                self.assertEqual(journal_path, args.infile)
+
+# vi: ts=4 expandtab
@@ -0,0 +1,256 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Run cloud-init boot stages in a single long-lived process.
+
+When the cloud-init-daemon.socket unit is enabled, 'cloud-init init' and
+'cloud-init modules' connect to the socket and ask the daemon to run the
+stage instead of running it themselves. The daemon runs each stage through
+the same code path as the command line, so status.json and result.json are
+written as usual. Only the interpreter and the imported modules stay warm
+between stages: each stage builds its own Init, datasource and merged
+configuration, as it would in its own process. The output redirection,
+reporting handlers and pooled url sessions a stage sets up are reset once
+it finishes. The daemon exits after the final stage.
+
+The protocol is one JSON line in each direction per message. The client
+sends {"argv": [...], "cwd": "..."}, the daemon acknowledges with
+{"started": true} once it begins the stage and replies {"exit_code": N}
+when the stage finishes. The stage runs in the client's working directory,
+so relative paths in argv resolve as they would for the client. A client
+that receives no acknowledgement runs the stage itself.
+
+This module is imported by the command line entry point, so it must only
+import from the standard library.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import traceback
+
+NAME = 'daemon'
+SOCKET_PATH = '/run/cloud-init/daemon.sock'
+RESULT_PATH = '/run/cloud-init/result.json'
+
+# Subcommands which are forwarded to the daemon
+STAGE_SUBCOMMANDS = ('init', 'modules')
+
+# Seconds to wait for a stage request before exiting
+IDLE_TIMEOUT = 3600
+
+# The file descriptor of the first socket passed by systemd
+SD_LISTEN_FDS_START = 3
+
+# Set while this process is serving stages, to avoid forwarding to itself
+_serving = False
+
+
+def error(msg):
+    sys.stderr.write("ERROR: " + msg + "\n")
+
+
+def get_parser(parser=None):
+    """Build or extend an arg parser for the boot stage daemon.
+
+    @param parser: Optional existing ArgumentParser instance representing the
+        daemon subcommand which will be extended to support the args of
+        this utility.
+
+    @returns: ArgumentParser with proper argument configuration.
+    """
+    if not parser:
+        parser = argparse.ArgumentParser(
+            prog=NAME,
+            description='Run boot stages requested over a unix socket')
+    parser.add_argument(
+        '-s', '--socket', action='store', default=SOCKET_PATH,
+        help=('Unix socket to listen on when not started by systemd socket'
+              ' activation (default: %(default)s)'))
+    parser.add_argument(
+        '-t', '--idle-timeout', action='store', type=int,
+        default=IDLE_TIMEOUT,
+        help='Seconds to wait for a stage request before exiting')
+    return parser
+
+
+def _send(conn, message):
+    conn.sendall(json.dumps(message).encode() + b'\n')
+
+
+def _recv(reader):
+    line = reader.readline()
+    if not line:
+        return None
+    return json.loads(line.decode())
+
+
+def should_forward(argv):
+    """Return True when the command in argv should run in the daemon.
+
+    @param argv: Command line arguments without the program name.
+    """
+    return bool(
+        not _serving and argv and argv[0] in STAGE_SUBCOMMANDS and
+        not set(argv).intersection(('-h', '--help')))
+
+
+def forward_to_daemon(argv, socket_path=SOCKET_PATH):
+    """Ask the boot stage daemon to run the cloud-init command in argv.
+
+    @param argv: Command line arguments without the program name.
+    @param socket_path: Path of the daemon's unix socket.
+
+    @returns: The exit code of the command, or None when no daemon accepted
+        the request and the command should be run by the caller.
+    """
+    if not os.path.exists(socket_path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        _send(sock, {'argv': argv, 'cwd': os.getcwd()})
+        reader = sock.makefile('rb')
+        if not _recv(reader):
+            error('cloud-init daemon did not start %s' % ' '.join(argv))
+            return None
+        reply = _recv(reader)
+    except OSError as e:
+        error('Could not reach cloud-init daemon at %s: %s' % (
+            socket_path, e))
+        return None
+    finally:
+        sock.close()
+    if not reply:
+        error('cloud-init daemon exited while running %s' % ' '.join(argv))
+        return 1
+    return reply['exit_code']
+
+
+def get_listen_socket(socket_path):
+    """Return the socket passed by systemd or listen on socket_path."""
+    if (os.environ.get('LISTEN_PID') == str(os.getpid()) and
+            os.environ.get('LISTEN_FDS') == '1'):
+        return socket.socket(fileno=SD_LISTEN_FDS_START)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    sock.listen()
+    return sock
+
+
+def run_stage(argv, cwd=None):
+    """Run the cloud-init command in argv in this process.
+
+    The process-wide state the command leaves behind, its output
+    redirection, reporting handlers and pooled url sessions, is reset once
+    it returns, so that the next command starts as it would in a new
+    process.
+
+    @param cwd: Optional directory to run the command in.
+    @returns: The exit code of the command.
+    """
+    from cloudinit import reporting, url_helper
+    from cloudinit.cmd import main
+
+    daemon_cwd = os.getcwd()
+    try:
+        if cwd:
+            os.chdir(cwd)
+    except OSError as e:
+        error('Could not run %s in %s: %s' % (' '.join(argv), cwd, e))
+        return 1
+    # Stages redirect stdout and stderr as configured by output
+    saved_fds = [(fd, os.dup(fd)) for fd in (1, 2)]
+    try:
+        return main.main(['cloud-init'] + argv) or 0
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 1
+    except Exception:
+        traceback.print_exc(file=sys.stderr)
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, saved_fd in saved_fds:
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+        os.chdir(daemon_cwd)
+        reporting.reset_configuration()
+        url_helper.close_sessions()
+
+
+def is_finished():
+    """Return True once the final stage has written result.json."""
+    return os.path.exists(RESULT_PATH)
+
+
+def serve(sock, idle_timeout=IDLE_TIMEOUT):
+    """Run stage requests from sock until the final stage has run.
+
+    Requests are handled one at a time, so stages run in the order their
+    units start them.
+    """
+    global _serving
+    _serving = True
+    sock.settimeout(idle_timeout)
+    try:
+        while True:
+            try:
+                conn, _addr = sock.accept()
+            except socket.timeout:
+                error('No cloud-init stage requested in %d seconds' %
+                      idle_timeout)
+                return 0
+            with conn:
+                conn.settimeout(None)
+                try:
+                    request = _recv(conn.makefile('rb'))
+                except ValueError:
+                    request = None
+                if not request or not request.get('argv'):
+                    error('Ignoring invalid cloud-init daemon request')
+                    continue
+                argv = request['argv']
+                try:
+                    _send(conn, {'started': True})
+                except OSError as e:
+                    error('Could not start %s: %s' % (' '.join(argv), e))
+                    continue
+                exit_code = run_stage(argv, request.get('cwd'))
+                try:
+                    _send(conn, {'exit_code': exit_code})
+                except OSError as e:
+                    error('Could not report %s result: %s' % (
+                        ' '.join(argv), e))
+            if is_finished():
+                return 0
+    finally:
+        _serving = False
+
+
+def handle_args(name, args):
+    """Handle calls to 'cloud-init daemon' as a subcommand."""
+    try:
+        sock = get_listen_socket(args.socket)
+    except OSError as e:
+        error('Could not listen on %s: %s' % (args.socket, e))
+        return 1
+    with sock:
+        return serve(sock, args.idle_timeout)
+
+
+def main():
+    """Tool to run cloud-init boot stages in a single process."""
+    parser = get_parser()
+    sys.exit(handle_args(NAME, parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
+
+# vi: ts=4 expandtab
@@ -3,12 +3,16 @@
 import abc
 import argparse
 import os
+import select
+import shlex
 import sys
 import time
+from typing import List  # noqa: F401
 
 from cloudinit import log
 from cloudinit import reporting
 from cloudinit import stages
+from cloudinit import url_helper
 from cloudinit.event import EventScope, EventType
 from cloudinit.net import activators, read_sys_net_safe
 from cloudinit.net.network_state import parse_net_config_data
@@ -21,6 +25,24 @@ from cloudinit.sources import DataSourceNotFoundException
 LOG = log.getLogger(__name__)
 NAME = 'hotplug-hook'
 
+# FIFO written by tools/hook-hotplug for each udev event
+HOTPLUG_FIFO = '/run/cloud-init/hook-hotplug-cmd'
+
+# The file descriptor of the first socket passed by systemd
+SD_LISTEN_FDS_START = 3
+
+# Seconds to wait for further events before handling a batch of events
+COALESCE_WINDOW = 1
+# Seconds to collect a batch of events for at most
+MAX_COALESCE_TIME = 10
+
+# Seconds between metadata refreshes, doubled after each refresh until
+# MAX_POLL_INTERVAL, while waiting for devices to appear in the metadata
+POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 5
+# Seconds to wait for devices to appear in the metadata in total
+POLL_TIMEOUT = 50
+
 
 def get_parser(parser=None):
     """Build or extend an arg parser for hotplug-hook utility.
@@ -64,6 +86,13 @@ def get_parser(parser=None):
         choices=['add', 'remove']
     )
 
+    subparsers.add_parser(
+        'daemon',
+        help=('handle events read from %s until stopped, refreshing the'
+              ' metadata once for events which arrive together' %
+              HOTPLUG_FIFO)
+    )
+
     return parser
 
 
@@ -75,8 +104,18 @@ class UeventHandler(abc.ABC):
         self.action = action
         self.success_fn = success_fn
 
-    @abc.abstractmethod
     def apply(self):
+        self.write_config()
+        self.activate()
+
+    @abc.abstractmethod
+    def write_config(self):
+        """Write the configuration from the datasource's metadata."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def activate(self):
+        """Bring up or down the hotplugged device."""
         raise NotImplementedError()
 
     @property
@@ -121,11 +160,13 @@ class NetHandler(UeventHandler):
         id = read_sys_net_safe(os.path.basename(devpath), 'address')
         super().__init__(id, datasource, devpath, action, success_fn)
 
-    def apply(self):
+    def write_config(self):
         self.datasource.distro.apply_network_config(
             self.config,
             bring_up=False,
         )
+
+    def activate(self):
         interface_name = os.path.basename(self.devpath)
         activator = activators.select_activator()
         if self.action == 'add':
@@ -187,44 +228,266 @@ def initialize_datasource(hotplug_init, subsystem):
     return datasource
 
 
-def handle_hotplug(
-    hotplug_init: Init, devpath, subsystem, udevaction
-):
-    datasource = initialize_datasource(hotplug_init, subsystem)
-    if not datasource:
-        return
-    handler_cls = SUBSYSTEM_PROPERTES_MAP[subsystem][0]
-    LOG.debug('Creating %s event handler', subsystem)
-    event_handler = handler_cls(
-        datasource=datasource,
-        devpath=devpath,
-        action=udevaction,
-        success_fn=hotplug_init._write_to_cache
-    )  # type: UeventHandler
-    wait_times = [1, 3, 5, 10, 30]
-    for attempt, wait in enumerate(wait_times):
-        LOG.debug(
-            'subsystem=%s update attempt %s/%s',
-            subsystem,
-            attempt,
-            len(wait_times)
-        )
+def _poll_waits():
+    """Yield the seconds to sleep between polls until POLL_TIMEOUT.
+
+    The interval starts at POLL_INTERVAL and is doubled after each poll
+    until MAX_POLL_INTERVAL.
+    """
+    wait = POLL_INTERVAL
+    waited = 0
+    while waited < POLL_TIMEOUT:
+        yield wait
+        waited += wait
+        wait = min(wait * 2, MAX_POLL_INTERVAL)
+
+
+def _drop_pending(event_handlers, pending, reason, last_exception):
+    """Return the handlers not pending, warning about the dropped ones.
+
+    @raises: last_exception when no handler is left.
+    """
+    for event_handler in pending:
+        LOG.warning('Dropping %s event for %s, %s: %s',
+                    event_handler.action, event_handler.devpath, reason,
+                    last_exception)
+    if len(pending) == len(event_handlers):
+        raise last_exception
+    return [
+        event_handler for event_handler in event_handlers
+        if event_handler not in pending
+    ]
+
+
+def refresh_until_detected(event_handlers):
+    """Refresh the metadata until it reflects the events of the handlers.
+
+    The metadata is polled with a growing interval instead of fixed sleeps,
+    so the devices are configured as soon as they show up in the metadata.
+    Each handler is detected on its own, so a device that never shows up
+    does not hold back the rest of the batch.
+
+    @param event_handlers: List of UeventHandlers sharing one datasource.
+    @return: List of the handlers whose event is reflected in the metadata.
+        Handlers still undetected after POLL_TIMEOUT seconds are dropped.
+    @raises: The last exception when no handler was detected.
+    """
+    pending = list(event_handlers)
+    waits = _poll_waits()
+    attempt = 1
+    while True:
+        LOG.debug('Refreshing metadata, attempt %s', attempt)
         try:
-            LOG.debug('Refreshing metadata')
-            event_handler.update_metadata()
-            LOG.debug('Detecting device in updated metadata')
-            event_handler.detect_hotplugged_device()
-            LOG.debug('Applying config change')
-            event_handler.apply()
-            LOG.debug('Updating cache')
-            event_handler.success()
-            break
+            event_handlers[0].update_metadata()
+        except Exception as e:
+            LOG.debug('Exception while processing hotplug event. %s', e)
+            last_exception = e
+        else:
+            LOG.debug('Detecting devices in updated metadata')
+            for event_handler in list(pending):
+                try:
+                    event_handler.detect_hotplugged_device()
+                except Exception as e:
+                    LOG.debug(
+                        'Exception while processing hotplug event. %s', e)
+                    last_exception = e
+                else:
+                    pending.remove(event_handler)
+            if not pending:
+                return list(event_handlers)
+        wait = next(waits, None)
+        if wait is None:
+            return _drop_pending(
+                event_handlers, pending, 'not detected in the metadata',
+                last_exception)
+        time.sleep(wait)
+        attempt += 1
+
+
+def apply_until_success(event_handlers):
+    """Write the config and activate the devices of the handlers.
+
+    Both steps are retried with the same growing interval as the metadata
+    refresh; devices already activated are not activated again.
+
+    @param event_handlers: List of UeventHandlers sharing one datasource.
+    @return: List of the handlers whose device was activated. Handlers
+        still failing after POLL_TIMEOUT seconds are dropped.
+    @raises: The last exception when no device was activated.
+    """
+    pending = list(event_handlers)
+    waits = _poll_waits()
+    attempt = 1
+    while True:
+        LOG.debug('Applying config change, attempt %s', attempt)
+        try:
+            event_handlers[0].write_config()
         except Exception as e:
             LOG.debug('Exception while processing hotplug event. %s', e)
-            time.sleep(wait)
             last_exception = e
-    else:
-        raise last_exception  # type: ignore
+        else:
+            for event_handler in list(pending):
+                try:
+                    event_handler.activate()
+                except Exception as e:
+                    LOG.debug(
+                        'Exception while processing hotplug event. %s', e)
+                    last_exception = e
+                else:
+                    pending.remove(event_handler)
+            if not pending:
+                return list(event_handlers)
+        wait = next(waits, None)
+        if wait is None:
+            return _drop_pending(
+                event_handlers, pending, 'failed to apply', last_exception)
+        time.sleep(wait)
+        attempt += 1
+
+
+def handle_events(hotplug_init: Init, hotplug_events):
+    """Handle hotplug events with one metadata refresh per subsystem.
+
+    @param hotplug_init: Init whose datasource is refreshed.
+    @param hotplug_events: List of (subsystem, devpath, udevaction) tuples.
+    """
+    by_subsystem = {}
+    for subsystem, devpath, udevaction in hotplug_events:
+        by_subsystem.setdefault(subsystem, []).append((devpath, udevaction))
+    for subsystem, subsystem_events in by_subsystem.items():
+        datasource = initialize_datasource(hotplug_init, subsystem)
+        if not datasource:
+            continue
+        handler_cls = SUBSYSTEM_PROPERTES_MAP[subsystem][0]
+        LOG.debug('Creating %s event handlers for %s events',
+                  subsystem, len(subsystem_events))
+        event_handlers = [
+            handler_cls(
+                datasource=datasource,
+                devpath=devpath,
+                action=udevaction,
+                success_fn=hotplug_init._write_to_cache
+            ) for devpath, udevaction in subsystem_events
+        ]  # type: List[UeventHandler]
+        event_handlers = refresh_until_detected(event_handlers)
+        event_handlers = apply_until_success(event_handlers)
+        LOG.debug('Updating cache')
+        event_handlers[0].success()
+
+
+def handle_hotplug(
+    hotplug_init: Init, devpath, subsystem, udevaction
+):
+    handle_events(hotplug_init, [(subsystem, devpath, udevaction)])
+
+
+def coalesce_events(hotplug_events):
+    """Return hotplug_events with only the last event for each device."""
+    latest = {}
+    for subsystem, devpath, udevaction in hotplug_events:
+        latest.pop((subsystem, devpath), None)
+        latest[(subsystem, devpath)] = udevaction
+    return [
+        (subsystem, devpath, udevaction)
+        for (subsystem, devpath), udevaction in latest.items()]
+
+
+def parse_event(line):
+    """Return the (subsystem, devpath, udevaction) written by hook-hotplug.
+
+    @raises: SystemExit when line is not a valid handle command.
+    """
+    args = get_parser().parse_args(shlex.split(line))
+    if args.hotplug_action != 'handle':
+        raise SystemExit(2)
+    return (args.subsystem, args.devpath, args.udevaction)
+
+
+def read_event_batch(fd, pending=b''):
+    """Block until events arrive on fd and return the events read.
+
+    Reading continues until no event arrived for COALESCE_WINDOW seconds,
+    or for at most MAX_COALESCE_TIME seconds after the first event.
+
+    @param fd: File descriptor of the hotplug FIFO.
+    @param pending: Bytes of an incomplete line returned by the last call.
+    @returns: Tuple of the list of complete lines read and the bytes of
+        any incomplete line.
+    """
+    lines = []
+    deadline = None
+    while True:
+        timeout = None
+        if deadline is not None:
+            timeout = min(COALESCE_WINDOW, deadline - time.monotonic())
+            if timeout <= 0:
+                break
+        readable, _, _ = select.select([fd], [], [], timeout)
+        if not readable:
+            break
+        data = os.read(fd, 4096)
+        if not data:
+            break
+        *complete, pending = (pending + data).split(b'\n')
+        lines.extend(line.decode() for line in complete if line.strip())
+        if lines and deadline is None:
+            deadline = time.monotonic() + MAX_COALESCE_TIME
+    return lines, pending
+
+
+def get_event_fd():
+    """Return the FIFO passed by systemd or open HOTPLUG_FIFO."""
+    if (os.environ.get('LISTEN_PID') == str(os.getpid()) and
+            os.environ.get('LISTEN_FDS') == '1'):
+        return SD_LISTEN_FDS_START
+    # Opened for writing too, so reads do not see EOF between events
+    return os.open(HOTPLUG_FIFO, os.O_RDWR)
+
+
+def load_init(reporter):
+    """Return an Init which has read the current configuration."""
+    hotplug_init = Init(ds_deps=[], reporter=reporter)
+    hotplug_init.read_cfg()
+    return hotplug_init
+
+
+def serve(fd, reporter):
+    """Handle batches of hotplug events read from fd until fd is closed.
+
+    The configuration and cached datasource are loaded again for each batch,
+    so changes made by other cloud-init commands since the last batch are
+    seen and not overwritten. The events of each batch are handled with one
+    metadata refresh and one network configuration apply.
+    """
+    pending = b''
+    while True:
+        lines, pending = read_event_batch(fd, pending)
+        if not lines:
+            LOG.debug('Hotplug event FIFO closed')
+            return
+        hotplug_events = []
+        for line in lines:
+            try:
+                hotplug_events.append(parse_event(line))
+            except SystemExit:
+                LOG.warning('Ignoring invalid hotplug event: %s', line)
+        hotplug_events = coalesce_events(hotplug_events)
+        if not hotplug_events:
+            continue
+        LOG.debug('Handling %s hotplug events: %s',
+                  len(hotplug_events), hotplug_events)
+        try:
+            with events.ReportEventStack(
+                    name='handle',
+                    description='handle %s hotplug events' % len(
+                        hotplug_events),
+                    parent=reporter):
+                handle_events(load_init(reporter), hotplug_events)
+        except Exception:
+            LOG.exception('Received exception handling hotplug events')
+        reporting.flush_events()
+        # Connections must not outlive the network they were opened on
+        url_helper.close_sessions()
 
 
 def handle_args(name, args):
@@ -234,8 +497,7 @@ def handle_args(name, args):
         name, __doc__, reporting_enabled=True
     )
 
-    hotplug_init = Init(ds_deps=[], reporter=hotplug_reporter)
-    hotplug_init.read_cfg()
+    hotplug_init = load_init(hotplug_reporter)
 
     log.setupLogging(hotplug_init.cfg)
     if 'reporting' in hotplug_init.cfg:
@@ -263,6 +525,8 @@ def handle_args(name, args):
                         "detected")
                     sys.exit(1)
                 print('enabled' if datasource else 'disabled')
+            elif args.hotplug_action == 'daemon':
+                serve(get_event_fd(), hotplug_reporter)
             else:
                 handle_hotplug(
                     hotplug_init=hotplug_init,
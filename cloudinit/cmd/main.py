@@ -22,14 +22,10 @@ from cloudinit import patcher
 patcher.patch_logging()
 
 from cloudinit import log as logging
-from cloudinit import netinfo
 from cloudinit import signal_handler
-from cloudinit import sources
-from cloudinit import stages
 from cloudinit import url_helper
 from cloudinit import util
 from cloudinit import version
-from cloudinit import warnings
 
 from cloudinit import reporting
 from cloudinit.reporting import events
@@ -39,8 +35,7 @@ from cloudinit.settings import (PER_INSTANCE, PER_ALWAYS, PER_ONCE,
 
 from cloudinit import atomic_helper
 
-from cloudinit.config import cc_set_hostname
-from cloudinit import dhclient_hook
+from cloudinit.cmd import daemon
 
 
 # Welcome message template
@@ -123,6 +118,28 @@ def apply_reporting_cfg(cfg):
         reporting.update_configuration(cfg.get('reporting'))
 
 
+def enable_event_journal():
+    """Record the events of boot stages in the journal read by analyze.
+
+    The journal can be disabled with 'reporting: {journal: null}', which
+    takes effect once the stage has read its configuration.
+    """
+    handlers = reporting.instantiated_handler_registry.registered_items
+    if 'journal' not in handlers:
+        reporting.update_configuration({'journal': {'type': 'journal'}})
+
+
+def record_boot_times():
+    """Append the durations of this boot to the boot times database."""
+    try:
+        from cloudinit.analyze import history
+    except ImportError as e:
+        # Python builds without sqlite3
+        LOG.debug("Not recording boot times: %s", e)
+        return
+    history.record_current_boot()
+
+
 def parse_cmdline_url(cmdline, names=('cloud-config-url', 'url')):
     data = util.keyval_str_to_dict(cmdline)
     for key in names:
@@ -246,6 +263,10 @@ def _should_bring_up_interfaces(init, args):
 
 
 def main_init(name, args):
+    from cloudinit import netinfo
+    from cloudinit import sources
+    from cloudinit import stages
+
     deps = [sources.DEP_FILESYSTEM, sources.DEP_NETWORK]
     if args.local:
         deps = [sources.DEP_FILESYSTEM]
@@ -459,6 +480,9 @@ def main_init(name, args):
 
 
 def di_report_warn(datasource, cfg):
+    from cloudinit import sources
+    from cloudinit import warnings
+
     if 'di_report' not in cfg:
         LOG.debug("no di_report found in config.")
         return
@@ -501,6 +525,9 @@ def di_report_warn(datasource, cfg):
 
 
 def main_modules(action_name, args):
+    from cloudinit import sources
+    from cloudinit import stages
+
     name = args.mode
     # Cloud-init 'modules' stages are broken up into the following sub-stages
     # 1. Ensure that the init object fetches its config without errors
@@ -553,6 +580,9 @@ def main_modules(action_name, args):
 
 
 def main_single(name, args):
+    from cloudinit import sources
+    from cloudinit import stages
+
     # Cloud-init single stage is broken up into the following sub-stages
     # 1. Ensure that the init object fetches its config without errors
     # 2. Attempt to fetch the datasource (warn if it doesn't work)
@@ -701,6 +731,9 @@ def status_wrapper(name, args, data_d=None, link_d=None):
         print_exc("failed run of stage %s" % mode)
         v1[mode]['errors'] = [str(e)]
 
+    # Resources used by each module, see stages.Modules
+    reporter = getattr(args, 'reporter', None)
+    v1[mode]['modules'] = (reporter and reporter.metrics) or {}
     v1[mode]['finished'] = time.time()
     v1['stage'] = None
 
@@ -709,13 +742,16 @@ def status_wrapper(name, args, data_d=None, link_d=None):
     if mode == "modules-final":
         # write the 'finished' file
         errors = []
+        modules = {}
         for m in modes:
             if v1[m]['errors']:
                 errors.extend(v1[m].get('errors', []))
+            if v1[m].get('modules'):
+                modules[m] = v1[m]['modules']
 
         atomic_helper.write_json(
             result_path, {'v1': {'datasource': v1['datasource'],
-                          'errors': errors}})
+                          'errors': errors, 'modules': modules}})
         util.sym_link(os.path.relpath(result_path, link_d), result_link,
                       force=True)
 
@@ -724,6 +760,8 @@ def status_wrapper(name, args, data_d=None, link_d=None):
 
 def _maybe_persist_instance_data(init):
     """Write instance-data.json file if absent and datasource is restored."""
+    from cloudinit import sources
+
     if init.ds_restored:
         instance_data_file = os.path.join(
             init.paths.run_dir, sources.INSTANCE_JSON_FILE)
@@ -737,6 +775,8 @@ def _maybe_set_hostname(init, stage, retry_stage):
     @param stage: String representing current stage in which we are running.
     @param retry_stage: String represented logs upon error setting hostname.
     """
+    from cloudinit.config import cc_set_hostname
+
     cloud = init.cloudify()
     (hostname, _fqdn) = util.get_hostname_fqdn(
         init.cfg, cloud, metadata_only=True)
@@ -759,6 +799,12 @@ def main(sysv_args=None):
     parser = argparse.ArgumentParser(prog=sysv_args[0])
     sysv_args = sysv_args[1:]
 
+    # Boot stages run in the boot stage daemon when it is listening
+    if daemon.should_forward(sysv_args):
+        retval = daemon.forward_to_daemon(sysv_args)
+        if retval is not None:
+            return retval
+
     # Top level args
     parser.add_argument('--version', '-v', action='version',
                         version='%(prog)s ' + (version.version_string()))
@@ -827,8 +873,7 @@ def main(sysv_args=None):
         help='Query standardized instance metadata from the command line.')
 
     parser_dhclient = subparsers.add_parser(
-        dhclient_hook.NAME, help=dhclient_hook.__doc__)
-    dhclient_hook.get_parser(parser_dhclient)
+        'dhclient-hook', help='Run the dhclient hook to record network info.')
 
     parser_features = subparsers.add_parser('features',
                                             help=('list defined features'))
@@ -849,9 +894,15 @@ def main(sysv_args=None):
     parser_status = subparsers.add_parser(
         'status', help='Report cloud-init status or wait on completion.')
 
+    parser_daemon = subparsers.add_parser(
+        daemon.NAME, help='Run boot stages in a single long-lived process.')
+
     if sysv_args:
         # Only load subparsers if subcommand is specified to avoid load cost
-        if sysv_args[0] == 'analyze':
+        if sysv_args[0] == 'dhclient-hook':
+            from cloudinit import dhclient_hook
+            dhclient_hook.get_parser(parser_dhclient)
+        elif sysv_args[0] == 'analyze':
             from cloudinit.analyze.__main__ import get_parser as analyze_parser
             # Construct analyze subcommand parser
             analyze_parser(parser_analyze)
@@ -877,6 +928,10 @@ def main(sysv_args=None):
             query_parser(parser_query)
             parser_query.set_defaults(
                 action=('render', handle_query_args))
+        elif sysv_args[0] == daemon.NAME:
+            daemon.get_parser(parser_daemon)
+            parser_daemon.set_defaults(
+                action=(daemon.NAME, daemon.handle_args))
         elif sysv_args[0] == 'status':
             from cloudinit.cmd.status import (
                 get_parser as status_parser, handle_status_args)
@@ -920,6 +975,9 @@ def main(sysv_args=None):
         rdesc = "running 'cloud-init %s'" % name
         report_on = False
 
+    if report_on and name in ("init", "modules", "single"):
+        enable_event_journal()
+
     args.reporter = events.ReportEventStack(
         rname, rdesc, reporting_enabled=report_on)
 
@@ -928,7 +986,11 @@ def main(sysv_args=None):
             logfunc=LOG.debug, msg="cloud-init mode '%s'" % name,
             get_uptime=True, func=functor, args=(name, args))
         reporting.flush_events()
-        return retval
+        url_helper.close_sessions()
+    if name == "modules" and args.mode == "final" and report_on:
+        # Once the final stage's own finish event is journaled
+        record_boot_times()
+    return retval
 
 
 if __name__ == '__main__':
@@ -0,0 +1,210 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+import os
+import socket
+import threading
+
+from cloudinit.cmd import daemon
+from cloudinit.cmd import main
+from cloudinit.tests.helpers import CiTestCase, mock
+
+M_PATH = 'cloudinit.cmd.daemon.'
+
+
+class TestShouldForward(CiTestCase):
+
+    def test_should_forward_boot_stages(self):
+        """Only boot stage subcommands are run by the daemon."""
+        self.assertTrue(daemon.should_forward(['init', '--local']))
+        self.assertTrue(daemon.should_forward(['modules', '--mode=final']))
+        self.assertFalse(daemon.should_forward(['status']))
+        self.assertFalse(daemon.should_forward(['init', '--help']))
+        self.assertFalse(daemon.should_forward([]))
+
+    def test_should_not_forward_from_the_daemon(self):
+        """The daemon runs stages itself instead of forwarding them."""
+        with mock.patch(M_PATH + '_serving', True):
+            self.assertFalse(daemon.should_forward(['init']))
+
+
+class TestDaemon(CiTestCase):
+
+    def setUp(self):
+        super(TestDaemon, self).setUp()
+        tmpd = self.tmp_dir()
+        self.socket_path = os.path.join(tmpd, 'daemon.sock')
+        self.result_path = os.path.join(tmpd, 'result.json')
+        self.add_patch(M_PATH + 'RESULT_PATH', 'm_result_path',
+                       new=self.result_path, autospec=False)
+        self.add_patch(M_PATH + 'error', 'm_error')
+
+    def _serve(self, run_stage, idle_timeout=5):
+        """Serve requests in a thread with run_stage as the stage runner."""
+        sock = daemon.get_listen_socket(self.socket_path)
+        self.addCleanup(sock.close)
+        result = {}
+
+        def serve():
+            with mock.patch(M_PATH + 'run_stage', side_effect=run_stage):
+                result['exit_code'] = daemon.serve(sock, idle_timeout)
+
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return thread, result
+
+    def test_forward_returns_none_without_socket(self):
+        """Without the daemon socket the caller runs the stage."""
+        self.assertIsNone(daemon.forward_to_daemon(['init'], self.socket_path))
+
+    def test_stages_run_in_order_until_final_stage(self):
+        """Each stage runs in the daemon, which exits after the final one."""
+        ran = []
+        cwds = []
+
+        def run_stage(argv, cwd):
+            ran.append(argv)
+            cwds.append(cwd)
+            if argv == ['modules', '--mode=final']:
+                open(self.result_path, 'w').close()
+            return len(ran) - 1
+
+        thread, result = self._serve(run_stage)
+        stages = [['init', '--local'], ['init'], ['modules', '--mode=config'],
+                  ['modules', '--mode=final']]
+        exit_codes = [daemon.forward_to_daemon(argv, self.socket_path)
+                      for argv in stages]
+        thread.join(5)
+        self.assertEqual(stages, ran)
+        self.assertEqual([0, 1, 2, 3], exit_codes)
+        self.assertEqual([os.getcwd()] * 4, cwds)
+        self.assertEqual(0, result['exit_code'])
+
+    def test_serve_exits_when_idle(self):
+        """The daemon exits when no stage is requested in time."""
+        thread, result = self._serve(mock.Mock(), idle_timeout=0.01)
+        thread.join(5)
+        self.assertEqual(0, result['exit_code'])
+        self.m_error.assert_called_once_with(
+            'No cloud-init stage requested in 0 seconds')
+
+    def test_forward_without_acknowledgement_runs_stage_locally(self):
+        """A daemon which never starts the stage leaves it to the caller."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.socket_path)
+        sock.listen()
+        self.addCleanup(sock.close)
+
+        def close_connection():
+            conn, _addr = sock.accept()
+            conn.makefile('rb').readline()
+            conn.close()
+
+        thread = threading.Thread(target=close_connection)
+        thread.start()
+        self.assertIsNone(daemon.forward_to_daemon(['init'], self.socket_path))
+        thread.join(5)
+        self.m_error.assert_called_once_with(
+            'cloud-init daemon did not start init')
+
+    def test_forward_fails_when_daemon_exits_during_stage(self):
+        """A stage interrupted in the daemon fails instead of running twice."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.socket_path)
+        sock.listen()
+        self.addCleanup(sock.close)
+
+        def start_and_close():
+            conn, _addr = sock.accept()
+            conn.makefile('rb').readline()
+            conn.sendall(b'{"started": true}\n')
+            conn.close()
+
+        thread = threading.Thread(target=start_and_close)
+        thread.start()
+        self.assertEqual(1, daemon.forward_to_daemon(['init'],
+                                                     self.socket_path))
+        thread.join(5)
+
+
+class TestRunStage(CiTestCase):
+
+    def setUp(self):
+        super(TestRunStage, self).setUp()
+        self.add_patch('cloudinit.reporting.reset_configuration', 'm_reset')
+        self.add_patch('cloudinit.url_helper.close_sessions', 'm_close')
+
+    def test_run_stage_in_client_cwd_and_resets_state(self):
+        """A stage runs in the client's cwd; global state is reset after."""
+        cwd = os.getcwd()
+        tmpd = os.path.realpath(self.tmp_dir())
+        stage_cwd = []
+
+        def stage(argv):
+            stage_cwd.append(os.getcwd())
+            return 0
+
+        with mock.patch('cloudinit.cmd.main.main', side_effect=stage):
+            self.assertEqual(0, daemon.run_stage(['init'], tmpd))
+        self.assertEqual([tmpd], stage_cwd)
+        self.assertEqual(cwd, os.getcwd())
+        self.assertEqual(1, self.m_reset.call_count)
+        self.assertEqual(1, self.m_close.call_count)
+
+    def test_run_stage_restores_redirected_output(self):
+        """Output redirected by a stage is restored once it returns."""
+        out_path = self.tmp_path('output')
+
+        def stage(argv):
+            with open(out_path, 'wb') as stream:
+                os.dup2(stream.fileno(), 2)
+            return 0
+
+        before = os.fstat(2)
+        with mock.patch('cloudinit.cmd.main.main', side_effect=stage):
+            daemon.run_stage(['init'])
+        after = os.fstat(2)
+        self.assertEqual(
+            (before.st_dev, before.st_ino), (after.st_dev, after.st_ino))
+
+    def test_run_stage_fails_in_missing_cwd(self):
+        """A stage whose cwd does not exist fails without running."""
+        with mock.patch('cloudinit.cmd.main.main') as m_main:
+            self.assertEqual(
+                1, daemon.run_stage(['init'], self.tmp_path('missing')))
+        self.assertEqual(0, m_main.call_count)
+
+    @mock.patch('cloudinit.cmd.main.main', side_effect=SystemExit(2))
+    def test_run_stage_returns_exit_code(self, m_main):
+        """Usage errors are returned as the stage exit code."""
+        self.assertEqual(2, daemon.run_stage(['init', '--bogus']))
+        m_main.assert_called_once_with(['cloud-init', 'init', '--bogus'])
+
+    @mock.patch('cloudinit.cmd.main.main', side_effect=RuntimeError('boom'))
+    def test_run_stage_handles_exceptions(self, m_main):
+        """An exception in a stage fails the stage, not the daemon."""
+        with mock.patch('sys.stderr'):
+            self.assertEqual(1, daemon.run_stage(['init']))
+
+
+class TestMainForwarding(CiTestCase):
+
+    @mock.patch('cloudinit.cmd.main.status_wrapper')
+    @mock.patch(M_PATH + 'forward_to_daemon', return_value=3)
+    def test_main_forwards_boot_stages(self, m_forward, m_status_wrapper):
+        """main returns the daemon's exit code for boot stages."""
+        self.assertEqual(3, main.main(['cloud-init', 'init', '--local']))
+        m_forward.assert_called_once_with(['init', '--local'])
+        self.assertEqual(0, m_status_wrapper.call_count)
+
+    @mock.patch('cloudinit.cmd.main.enable_event_journal')
+    @mock.patch('cloudinit.cmd.main.status_wrapper', return_value=0)
+    @mock.patch(M_PATH + 'forward_to_daemon', return_value=None)
+    def test_main_runs_stage_without_daemon(
+            self, m_forward, m_status_wrapper, m_enable_event_journal):
+        """main runs the stage itself when no daemon accepts it."""
+        main.main(['cloud-init', 'init'])
+        self.assertEqual(1, m_status_wrapper.call_count)
+
+# vi: ts=4 expandtab
@@ -3,6 +3,8 @@
 from collections import namedtuple
 import copy
 import os
+import subprocess
+import sys
 from io import StringIO
 from unittest import mock
 
@@ -61,7 +63,7 @@ class TestMain(FilesystemMockingTestCase):
             debug=False, files=None, force=False, local=False, reporter=None,
             subcommand='init')
         (_item1, item2) = wrap_and_call(
-            'cloudinit.cmd.main',
+            'cloudinit',
             {'util.close_stdin': True,
              'netinfo.debug_info': 'my net debug info',
              'util.fixup_output': ('outfmt', 'errfmt')},
@@ -90,7 +92,7 @@ class TestMain(FilesystemMockingTestCase):
             debug=False, files=None, force=False, local=False, reporter=None,
             subcommand='init')
         (_item1, item2) = wrap_and_call(
-            'cloudinit.cmd.main',
+            'cloudinit',
             {'util.close_stdin': True,
              'netinfo.debug_info': 'my net debug info',
              'util.fixup_output': ('outfmt', 'errfmt')},
@@ -141,10 +143,10 @@ class TestMain(FilesystemMockingTestCase):
             self.assertIsNone(args)
 
         (_item1, item2) = wrap_and_call(
-            'cloudinit.cmd.main',
+            'cloudinit',
             {'util.close_stdin': True,
              'netinfo.debug_info': 'my net debug info',
-             'cc_set_hostname.handle': {'side_effect': set_hostname},
+             'config.cc_set_hostname.handle': {'side_effect': set_hostname},
              'util.fixup_output': ('outfmt', 'errfmt')},
             main.main_init, 'init', cmdargs)
         self.assertEqual([], item2)
@@ -185,4 +187,33 @@ class TestShouldBringUpInterfaces:
         result = main._should_bring_up_interfaces(init, args)
         assert result == expected
 
+
+class TestImportBudget:
+    """Importing the entry point must not import what subcommands need."""
+
+    # Imported by boot stages and subcommands only when they are run
+    DEFERRED_MODULES = (
+        'cloudinit.dhclient_hook',
+        'cloudinit.distros',
+        'cloudinit.net',
+        'cloudinit.netinfo',
+        'cloudinit.sources',
+        'cloudinit.stages',
+        'jinja2',
+    )
+    # Number of cloudinit modules imported by cloudinit.cmd.main
+    MAX_CLOUDINIT_MODULES = 25
+
+    def test_main_defers_subcommand_imports(self):
+        out = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, cloudinit.cmd.main; print("\\n".join(sys.modules))'
+        ], universal_newlines=True)
+        imported = out.splitlines()
+        assert [] == [m for m in self.DEFERRED_MODULES if m in imported]
+        cloudinit_modules = [m for m in imported if m.startswith('cloudinit')]
+        assert len(cloudinit_modules) <= self.MAX_CLOUDINIT_MODULES, (
+            'cloudinit.cmd.main imports %d cloudinit modules: %s' % (
+                len(cloudinit_modules), ', '.join(sorted(cloudinit_modules))))
+
 # vi: ts=4 expandtab
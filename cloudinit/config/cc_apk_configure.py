@@ -13,7 +13,7 @@ from cloudinit import temp_utils
 from cloudinit import templater
 from cloudinit import util
 from cloudinit.config.schema import (
-    get_schema_doc, validate_cloudconfig_schema)
+    set_lazy_schema_doc, validate_cloudconfig_schema)
 from cloudinit.settings import PER_INSTANCE
 
 LOG = logging.getLogger(__name__)
@@ -178,7 +178,12 @@ schema = {
     }
 }
 
-__doc__ = get_schema_doc(schema)
+set_lazy_schema_doc(__name__)
+
+
+def changes_package_sources(_name, cfg, _cloud, _log, _args):
+    """Return whether handle would configure the apk repositories."""
+    return bool(cfg.get('apk_repos'))
 
 
 def handle(name, cfg, cloud, log, _args):
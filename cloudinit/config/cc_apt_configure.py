@@ -15,7 +15,7 @@ import pathlib
 from textwrap import dedent
 
 from cloudinit.config.schema import (
-    get_schema_doc, validate_cloudconfig_schema)
+    set_lazy_schema_doc, validate_cloudconfig_schema)
 from cloudinit import gpg
 from cloudinit import log as logging
 from cloudinit import subp
@@ -398,7 +398,7 @@ schema = {
     }
 }
 
-__doc__ = get_schema_doc(schema)
+set_lazy_schema_doc(__name__)
 
 
 # place where apt stores cached repository data
@@ -433,6 +433,11 @@ def get_default_mirrors(arch=None, target=None):
     raise ValueError("No default mirror known for arch %s" % arch)
 
 
+def changes_package_sources(_name, _cfg, _cloud, _log, _args):
+    """Return True as handle always renders the apt sources."""
+    return True
+
+
 def handle(name, ocfg, cloud, log, _):
     """process the config for apt_config. This can be called from
        curthooks if a global apt config was provided or via the "apt"
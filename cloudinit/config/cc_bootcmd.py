@@ -13,7 +13,7 @@ import os
 from textwrap import dedent
 
 from cloudinit.config.schema import (
-    get_schema_doc, validate_cloudconfig_schema)
+    set_lazy_schema_doc, validate_cloudconfig_schema)
 from cloudinit.settings import PER_ALWAYS
 from cloudinit import temp_utils
 from cloudinit import subp
@@ -74,7 +74,7 @@ schema = {
     }
 }
 
-__doc__ = get_schema_doc(schema)  # Supplement python help()
+set_lazy_schema_doc(__name__)  # Supplement python help()
 
 
 def handle(name, cfg, cloud, log, _args):
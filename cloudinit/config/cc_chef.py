@@ -15,7 +15,7 @@ from textwrap import dedent
 
 from cloudinit import subp
 from cloudinit.config.schema import (
-    get_schema_doc, validate_cloudconfig_schema)
+    set_lazy_schema_doc, validate_cloudconfig_schema)
 from cloudinit import templater
 from cloudinit import temp_utils
 from cloudinit import url_helper
@@ -357,7 +357,7 @@ schema = {
     }
 }
 
-__doc__ = get_schema_doc(schema)
+set_lazy_schema_doc(__name__)
 
 
 def post_run_chef(chef_cfg, log):
@@ -399,6 +399,25 @@ def get_template_params(iid, chef_cfg, log):
     return params
 
 
+def package_intents(_name, cfg, _cloud, _log, _args):
+    """Return the packages handle installs, see package_planner."""
+    if 'chef' not in cfg:
+        return []
+    chef_cfg = cfg['chef']
+    force_install = util.get_cfg_option_bool(chef_cfg,
+                                             'force_install', default=False)
+    if subp.is_exe(CHEF_EXEC_PATH) and not force_install:
+        return []
+    install_type = util.get_cfg_option_str(chef_cfg, 'install_type',
+                                           'packages')
+    if install_type == 'packages':
+        return ['chef']
+    if install_type == 'gems':
+        return get_ruby_packages(util.get_cfg_option_str(
+            chef_cfg, 'ruby_version', RUBY_VERSION_DEFAULT))
+    return []
+
+
 def handle(name, cfg, cloud, log, _args):
     """Handler method activated by cloud-init."""
 
@@ -74,6 +74,12 @@ A label can be specified for the filesystem using
 .. note::
     ``replace_fs`` is ignored unless ``partition`` is ``auto`` or ``any``.
 
+Disks are partitioned and then their filesystems are created. Within each of
+these two phases, the entries of different disks are handled concurrently,
+while the entries of the same disk are handled one after the other in the
+order they are listed. udev is settled once at the end of each phase, and the
+time taken by each disk is logged.
+
 **Internal name:** ``cc_disk_setup``
 
 **Module frequency:** per instance
@@ -103,9 +109,12 @@ A label can be specified for the filesystem using
 from cloudinit.settings import PER_INSTANCE
 from cloudinit import util
 from cloudinit import subp
+from collections import OrderedDict
+from concurrent import futures
 import logging
 import os
 import shlex
+import time
 
 frequency = PER_INSTANCE
 
@@ -134,40 +143,120 @@ def handle(_name, cfg, cloud, log, _args):
         name = device_aliases.get(cand)
         return cloud.device_name_to_device(name or cand) or name
 
+    def partition(item):
+        (disk, definition) = item
+        try:
+            log.debug("Creating new partition table/disk")
+            util.log_time(logfunc=LOG.debug,
+                          msg="Creating partition on %s" % disk,
+                          func=mkpart, args=(disk, definition),
+                          kwargs={'settle': False})
+        except Exception as e:
+            util.logexc(LOG, "Failed partitioning operation\n%s" % e)
+
+    def make_filesystem(definition):
+        try:
+            log.debug("Creating new filesystem.")
+            device = definition.get('device')
+            util.log_time(logfunc=LOG.debug,
+                          msg="Creating fs for %s" % device,
+                          func=mkfs, args=(definition,),
+                          kwargs={'settle': False})
+        except Exception as e:
+            util.logexc(LOG, "Failed during filesystem operation\n%s" % e)
+
+    # Disks are set up concurrently in two phases, partitioning and then
+    # creating filesystems, each settling udev once when it is done.
+    settled = False
     disk_setup = cfg.get("disk_setup")
     if isinstance(disk_setup, dict):
         update_disk_setup_devices(disk_setup, alias_to_device)
         log.debug("Partitioning disks: %s", str(disk_setup))
+        jobs = OrderedDict()
         for disk, definition in disk_setup.items():
             if not isinstance(definition, dict):
                 log.warning("Invalid disk definition for %s" % disk)
                 continue
-
-            try:
-                log.debug("Creating new partition table/disk")
-                util.log_time(logfunc=LOG.debug,
-                              msg="Creating partition on %s" % disk,
-                              func=mkpart, args=(disk, definition))
-            except Exception as e:
-                util.logexc(LOG, "Failed partitioning operation\n%s" % e)
+            jobs.setdefault(get_parent_disk(disk), []).append(
+                (disk, definition))
+        if jobs:
+            util.udevadm_settle()
+            settled = True
+            durations = setup_disks(jobs, partition)
+            log.debug("Partitioned disks: %s", format_durations(durations))
 
     fs_setup = cfg.get("fs_setup")
     if isinstance(fs_setup, list):
         log.debug("setting up filesystems: %s", str(fs_setup))
         update_fs_setup_devices(fs_setup, alias_to_device)
+        jobs = OrderedDict()
         for definition in fs_setup:
             if not isinstance(definition, dict):
                 log.warning("Invalid file system definition: %s" % definition)
                 continue
+            jobs.setdefault(get_parent_disk(definition.get('device')),
+                            []).append(definition)
+        if jobs:
+            if not settled:
+                util.udevadm_settle()
+            durations = setup_disks(jobs, make_filesystem)
+            log.debug("Created filesystems: %s", format_durations(durations))
+
+
+def get_parent_disk(device):
+    """Return the path of the disk holding device, which may be a disk.
+
+    Devices which do not exist, such as None, are returned as they are.
+    """
+    if not device or not os.path.exists(device):
+        return device
+    rpath = os.path.realpath(device)
+    syspath = "/sys/class/block/%s" % os.path.basename(rpath)
+    if os.path.exists(os.path.join(syspath, "partition")):
+        disksyspath = os.path.dirname(os.path.realpath(syspath))
+        return "/dev/%s" % os.path.basename(disksyspath)
+    return rpath
+
+
+def setup_disks(jobs, setup):
+    """Set up the entries of each disk, concurrently across disks.
+
+    The entries of a disk are set up in turn by a thread of its own, as
+    they may depend on each other, such as a filesystem created on the
+    first free partition. udev is settled once all disks are set up, in
+    place of the settles of each entry, so callers pass settle=False to
+    mkpart and mkfs and settle before the first phase.
+
+    @param jobs: OrderedDict of disk path to the list of its entries.
+    @param setup: Callable setting up an entry, handling its own errors.
+    @returns: OrderedDict of disk path to the seconds its entries took.
+    """
+    durations = OrderedDict((disk, None) for disk in jobs)
+
+    def setup_disk(disk):
+        start = time.monotonic()
+        for entry in jobs[disk]:
+            setup(entry)
+        durations[disk] = time.monotonic() - start
+
+    if len(jobs) == 1:
+        setup_disk(next(iter(jobs)))
+    elif jobs:
+        with futures.ThreadPoolExecutor(
+                max_workers=len(jobs),
+                thread_name_prefix="disk-setup") as executor:
+            for future in [executor.submit(setup_disk, disk)
+                           for disk in jobs]:
+                future.result()
+    util.udevadm_settle()
+    return durations
 
-            try:
-                log.debug("Creating new filesystem.")
-                device = definition.get('device')
-                util.log_time(logfunc=LOG.debug,
-                              msg="Creating fs for %s" % device,
-                              func=mkfs, args=(definition,))
-            except Exception as e:
-                util.logexc(LOG, "Failed during filesystem operation\n%s" % e)
+
+def format_durations(durations):
+    """Return a summary of the seconds taken by each disk."""
+    return ", ".join(
+        "%s in %.3f seconds" % (disk, seconds)
+        for (disk, seconds) in durations.items())
 
 
 def update_disk_setup_devices(disk_setup, tformer):
@@ -646,7 +735,7 @@ def get_partition_gpt_layout(size, layout):
     return partition_specs
 
 
-def purge_disk_ptable(device):
+def purge_disk_ptable(device, settle=True):
     # wipe the first and last megabyte of a disk (or file)
     # gpt stores partition table both at front and at end.
     null = '\0'
@@ -658,10 +747,10 @@ def purge_disk_ptable(device):
         fp.write(null * end_len)
         fp.flush()
 
-    read_parttbl(device)
+    read_parttbl(device, settle=settle)
 
 
-def purge_disk(device):
+def purge_disk(device, settle=True):
     """
     Remove parition table entries
     """
@@ -678,7 +767,7 @@ def purge_disk(device):
                     "Failed FS purge of /dev/%s" % d['name']
                 ) from e
 
-    purge_disk_ptable(device)
+    purge_disk_ptable(device, settle=settle)
 
 
 def get_partition_layout(table_type, size, layout):
@@ -693,10 +782,14 @@ def get_partition_layout(table_type, size, layout):
     return get_dyn_func("get_partition_%s_layout", table_type, size, layout)
 
 
-def read_parttbl(device):
+def read_parttbl(device, settle=True):
     """
     `Partprobe` is preferred over `blkdev` since it is more reliably
     able to probe the partition table.
+
+    udev is always settled before probing, as it may still hold the device
+    open after the partition table was written. Unless settle is False, it
+    is settled again so the partitions are fully recognized on return.
     """
     if PARTPROBE_CMD is not None:
         probe_cmd = [PARTPROBE_CMD, device]
@@ -708,10 +801,11 @@ def read_parttbl(device):
     except Exception as e:
         util.logexc(LOG, "Failed reading the partition table %s" % e)
 
-    util.udevadm_settle()
+    if settle:
+        util.udevadm_settle()
 
 
-def exec_mkpart_mbr(device, layout):
+def exec_mkpart_mbr(device, layout, settle=True):
     """
     Break out of mbr partition to allow for future partition
     types, i.e. gpt
@@ -725,10 +819,10 @@ def exec_mkpart_mbr(device, layout):
             "Failed to partition device %s\n%s" % (device, e)
         ) from e
 
-    read_parttbl(device)
+    read_parttbl(device, settle=settle)
 
 
-def exec_mkpart_gpt(device, layout):
+def exec_mkpart_gpt(device, layout, settle=True):
     try:
         subp.subp([SGDISK_CMD, '-Z', device])
         for index, (partition_type, (start, end)) in enumerate(layout):
@@ -745,10 +839,10 @@ def exec_mkpart_gpt(device, layout):
         LOG.warning("Failed to partition device %s", device)
         raise
 
-    read_parttbl(device)
+    read_parttbl(device, settle=settle)
 
 
-def exec_mkpart(table_type, device, layout):
+def exec_mkpart(table_type, device, layout, settle=True):
     """
     Fetches the function for creating the table type.
     This allows to dynamically find which function to call.
@@ -757,12 +851,22 @@ def exec_mkpart(table_type, device, layout):
         table_type: type of partition table to use
         device: the device to work on
         layout: layout definition specific to partition table
+        settle: whether to settle udev once the table is written
     """
-    return get_dyn_func("exec_mkpart_%s", table_type, device, layout)
+    return get_dyn_func("exec_mkpart_%s", table_type, device, layout, settle)
+
+
+def assert_and_settle_device(device, settle=True):
+    """Assert that device exists and settle so it is fully recognized.
 
+    When settle is False the caller already settled udev, so device is only
+    asserted to exist.
+    """
+    if not settle:
+        if not os.path.exists(device):
+            raise RuntimeError("Device %s did not exist." % device)
+        return
 
-def assert_and_settle_device(device):
-    """Assert that device exists and settle so it is fully recognized."""
     if not os.path.exists(device):
         util.udevadm_settle()
         if not os.path.exists(device):
@@ -775,7 +879,7 @@ def assert_and_settle_device(device):
     util.udevadm_settle()
 
 
-def mkpart(device, definition):
+def mkpart(device, definition, settle=True):
     """
     Creates the partition table.
 
@@ -788,9 +892,11 @@ def mkpart(device, definition):
                 layout: the layout of the partition table
                 table_type: Which partition table to use, defaults to MBR
                 device: the device to work on.
+        settle: whether to settle udev around the changes, False when the
+            caller settles it for all devices.
     """
     # ensure that we get a real device rather than a symbolic link
-    assert_and_settle_device(device)
+    assert_and_settle_device(device, settle=settle)
     device = os.path.realpath(device)
 
     LOG.debug("Checking values for %s definition", device)
@@ -814,7 +920,7 @@ def mkpart(device, definition):
     # Remove the partition table entries
     if isinstance(layout, str) and layout.lower() == "remove":
         LOG.debug("Instructed to remove partition table entries")
-        purge_disk(device)
+        purge_disk(device, settle=settle)
         return
 
     LOG.debug("Checking if device layout matches")
@@ -835,7 +941,7 @@ def mkpart(device, definition):
     LOG.debug("   Layout is: %s", part_definition)
 
     LOG.debug("Creating partition table on %s", device)
-    exec_mkpart(table_type, device, part_definition)
+    exec_mkpart(table_type, device, part_definition, settle)
 
     LOG.debug("Partition table created for %s", device)
 
@@ -862,7 +968,7 @@ def lookup_force_flag(fs):
     return ''
 
 
-def mkfs(fs_cfg):
+def mkfs(fs_cfg, settle=True):
     """
     Create a file system on the device.
 
@@ -882,6 +988,8 @@ def mkfs(fs_cfg):
                             on the device.
 
             When 'cmd' is provided then no other parameter is required.
+        settle: whether to settle udev before checking the device, False
+            when the caller settled it for all devices.
     """
     label = fs_cfg.get('label')
     device = fs_cfg.get('device')
@@ -893,7 +1001,7 @@ def mkfs(fs_cfg):
     overwrite = fs_cfg.get('overwrite', False)
 
     # ensure that we get a real device rather than a symbolic link
-    assert_and_settle_device(device)
+    assert_and_settle_device(device, settle=settle)
     device = os.path.realpath(device)
 
     # This allows you to define the default ephemeral or swap
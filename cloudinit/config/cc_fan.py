@@ -74,6 +74,13 @@ def stop_update_start(distro, service, config_file, content):
     distro.manage_service('enable', service)
 
 
+def package_intents(_name, cfg, _cloud, _log, _args):
+    """Return the packages handle installs, see package_planner."""
+    if not (cfg.get('fan') or {}).get('config') or subp.which('fanctl'):
+        return []
+    return ['ubuntu-fan']
+
+
 def handle(name, cfg, cloud, log, args):
     cfgin = cfg.get('fan')
     if not cfgin:
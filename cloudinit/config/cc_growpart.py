@@ -21,6 +21,12 @@ The devices on which to run growpart are specified as a list under the
 device's mountpoint in the filesystem or a path to the block device in
 ``/dev``.
 
+Partitions on the same disk are resized one after the other, in the order
+they are listed, while partitions on different disks are resized
+concurrently. Unless ``resize_fs`` is set to ``false``, the filesystem
+mounted from each grown partition is resized right after it. The root
+filesystem is left to ``cc_resizefs``, which honours ``resize_rootfs``.
+
 The utility to use for resizing can be selected using the ``mode`` config key.
 If the ``mode`` key is set to ``auto``, then any available utility (either
 ``growpart`` or BSD ``gpart``) will be used. If neither utility is available,
@@ -47,6 +53,7 @@ growpart is::
         mode: auto
         devices: ["/"]
         ignore_growroot_disabled: false
+        resize_fs: true
 
 **Internal name:** ``cc_growpart``
 
@@ -62,14 +69,19 @@ growpart is::
             - "/"
             - "/dev/vdb1"
         ignore_growroot_disabled: <true/false>
+        resize_fs: <true/false>
 """
 
 import os
 import os.path
 import re
 import stat
+import time
+from collections import OrderedDict
+from concurrent import futures
 
 from cloudinit import log as logging
+from cloudinit.config import cc_resizefs
 from cloudinit.settings import PER_ALWAYS
 from cloudinit import subp
 from cloudinit import temp_utils
@@ -81,6 +93,7 @@ DEFAULT_CONFIG = {
     'mode': 'auto',
     'devices': ['/'],
     'ignore_growroot_disabled': False,
+    'resize_fs': True,
 }
 
 
@@ -286,9 +299,71 @@ def devent2dev(devent):
     return dev
 
 
-def resize_devices(resizer, devices):
+def get_mount(blockdev):
+    """Return the (mount point, fs type) of blockdev, None if not mounted."""
+    realdev = os.path.realpath(blockdev)
+    for (dev, mount) in util.mounts().items():
+        if os.path.realpath(dev) == realdev:
+            return (mount['mountpoint'], mount['fstype'])
+    return None
+
+
+def resize_filesystem(blockdev):
+    """Grow the filesystem mounted from blockdev to fill its partition.
+
+    The root filesystem is left to cc_resizefs, which runs next and honours
+    resize_rootfs.
+
+    @returns: A message describing what was done.
+    @raises: ProcessExecutionError if the resize command failed.
+    """
+    mount = get_mount(blockdev)
+    if not mount:
+        return "filesystem not mounted"
+    (mount_point, fs_type) = mount
+    if mount_point == "/":
+        return "root filesystem left to resizefs"
+    resize_cmd = cc_resizefs.get_resize_cmd(fs_type, mount_point, blockdev)
+    if not resize_cmd:
+        return "not resizing unknown filesystem type %s" % fs_type
+    start = time.monotonic()
+    cc_resizefs.do_resize(resize_cmd, LOG)
+    return "resized %s filesystem on %s in %.3f seconds" % (
+        fs_type, mount_point, time.monotonic() - start)
+
+
+def resize_partition(resizer, devent, blockdev, disk, ptnum, resize_fs):
+    # returns a tuple of (entry-in-devices, action, message)
+    start = time.monotonic()
+    try:
+        (old, new) = resizer.resize(disk, ptnum, blockdev)
+    except ResizeFailedException as e:
+        return (devent, RESIZE.FAILED,
+                "failed to resize: disk=%s, ptnum=%s: %s" % (disk, ptnum, e))
+    elapsed = time.monotonic() - start
+    if old == new:
+        return (devent, RESIZE.NOCHANGE,
+                "no change necessary (%s, %s) in %.3f seconds" %
+                (disk, ptnum, elapsed))
+    msg = "changed (%s, %s) from %s to %s in %.3f seconds" % (
+        disk, ptnum, old, new, elapsed)
+    if resize_fs:
+        try:
+            msg += ", " + resize_filesystem(blockdev)
+        except subp.ProcessExecutionError as e:
+            msg += ", failed to resize filesystem: %s" % e
+    return (devent, RESIZE.CHANGED, msg)
+
+
+def resize_devices(resizer, devices, resize_fs=False):
     # returns a tuple of tuples containing (entry-in-devices, action, message)
+    #
+    # Partitions of a disk are resized in turn, as each resize rewrites the
+    # partition table, while the partitions of different disks are resized
+    # concurrently, each followed by a resize of its filesystem if resize_fs.
     info = []
+    # disk: list of (position in info, devent, blockdev, ptnum)
+    disks = OrderedDict()
     for devent in devices:
         try:
             blockdev = devent2dev(devent)
@@ -317,20 +392,24 @@ def resize_devices(resizer, devices):
                          "device_part_info(%s) failed: %s" % (blockdev, e),))
             continue
 
-        try:
-            (old, new) = resizer.resize(disk, ptnum, blockdev)
-            if old == new:
-                info.append((devent, RESIZE.NOCHANGE,
-                             "no change necessary (%s, %s)" % (disk, ptnum),))
-            else:
-                info.append((devent, RESIZE.CHANGED,
-                             "changed (%s, %s) from %s to %s" %
-                             (disk, ptnum, old, new),))
-
-        except ResizeFailedException as e:
-            info.append((devent, RESIZE.FAILED,
-                         "failed to resize: disk=%s, ptnum=%s: %s" %
-                         (disk, ptnum, e),))
+        disks.setdefault(disk, []).append(
+            (len(info), devent, blockdev, ptnum))
+        info.append(None)
+
+    def resize_disk(disk, partitions):
+        for (position, devent, blockdev, ptnum) in partitions:
+            info[position] = resize_partition(
+                resizer, devent, blockdev, disk, ptnum, resize_fs)
+
+    if len(disks) == 1:
+        resize_disk(*disks.popitem())
+    elif disks:
+        with futures.ThreadPoolExecutor(
+                max_workers=len(disks),
+                thread_name_prefix="growpart") as executor:
+            for future in [executor.submit(resize_disk, disk, partitions)
+                           for (disk, partitions) in disks.items()]:
+                future.result()
 
     return info
 
@@ -370,8 +449,10 @@ def handle(_name, cfg, _cloud, log, _args):
             raise e
         return
 
-    resized = util.log_time(logfunc=log.debug, msg="resize_devices",
-                            func=resize_devices, args=(resizer, devices))
+    resized = util.log_time(
+        logfunc=log.debug, msg="resize_devices", func=resize_devices,
+        args=(resizer, devices),
+        kwargs={'resize_fs': util.is_true(mycfg.get('resize_fs', True))})
     for (entry, action, msg) in resized:
         if action == RESIZE.CHANGED:
             log.info("'%s' resized: %s" % (entry, msg))
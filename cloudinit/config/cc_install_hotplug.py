@@ -6,7 +6,8 @@ from textwrap import dedent
 from cloudinit import util
 from cloudinit import subp
 from cloudinit import stages
-from cloudinit.config.schema import get_schema_doc, validate_cloudconfig_schema
+from cloudinit.config.schema import (
+    set_lazy_schema_doc, validate_cloudconfig_schema)
 from cloudinit.distros import ALL_DISTROS
 from cloudinit.event import EventType, EventScope
 from cloudinit.settings import PER_INSTANCE
@@ -81,7 +82,7 @@ schema = {
     }
 }
 
-__doc__ = get_schema_doc(schema)
+set_lazy_schema_doc(__name__)
 
 
 HOTPLUG_UDEV_PATH = "/etc/udev/rules.d/10-cloud-init-hook-hotplug.rules"
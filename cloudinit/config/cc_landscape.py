@@ -84,6 +84,14 @@ LSC_BUILTIN_CFG = {
 }
 
 
+def package_intents(_name, cfg, _cloud, _log, _args):
+    """Return the packages handle installs, see package_planner."""
+    ls_cloudcfg = cfg.get("landscape", {})
+    if not ls_cloudcfg or not isinstance(ls_cloudcfg, (dict)):
+        return []
+    return ['landscape-client']
+
+
 def handle(_name, cfg, cloud, log, _args):
     """
     Basically turn a top level 'landscape' entry with a 'client' dict
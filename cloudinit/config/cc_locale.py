@@ -11,7 +11,8 @@
 from textwrap import dedent
 
 from cloudinit import util
-from cloudinit.config.schema import get_schema_doc, validate_cloudconfig_schema
+from cloudinit.config.schema import (
+    set_lazy_schema_doc, validate_cloudconfig_schema)
 from cloudinit.settings import PER_INSTANCE
 
 
@@ -57,7 +58,7 @@ schema = {
     },
 }
 
-__doc__ = get_schema_doc(schema)  # Supplement python help()
+set_lazy_schema_doc(__name__)  # Supplement python help()
 
 
 def handle(name, cfg, cloud, log, args):
@@ -59,6 +59,28 @@ LOG = logging.getLogger(__name__)
 _DEFAULT_NETWORK_NAME = "lxdbr0"
 
 
+def get_required_packages(init_cfg):
+    """Return the packages lxd needs to be set up with init_cfg."""
+    packages = []
+    if not subp.which("lxd"):
+        packages.append('lxd')
+
+    if init_cfg.get("storage_backend") == "zfs" and not subp.which('zfs'):
+        packages.append('zfsutils-linux')
+    return packages
+
+
+def package_intents(_name, cfg, _cloud, _log, _args):
+    """Return the packages handle installs, see package_planner."""
+    lxd_cfg = cfg.get('lxd')
+    if not lxd_cfg or not isinstance(lxd_cfg, dict):
+        return []
+    init_cfg = lxd_cfg.get('init')
+    if not isinstance(init_cfg, dict):
+        init_cfg = {}
+    return get_required_packages(init_cfg)
+
+
 def handle(name, cfg, cloud, log, args):
     # Get config
     lxd_cfg = cfg.get('lxd')
@@ -85,13 +107,7 @@ def handle(name, cfg, cloud, log, args):
         bridge_cfg = {}
 
     # Install the needed packages
-    packages = []
-    if not subp.which("lxd"):
-        packages.append('lxd')
-
-    if init_cfg.get("storage_backend") == "zfs" and not subp.which('zfs'):
-        packages.append('zfsutils-linux')
-
+    packages = get_required_packages(init_cfg)
     if len(packages):
         try:
             cloud.distro.install_packages(packages)
@@ -123,6 +123,13 @@ def configure(config, server_cfg=SERVER_CFG,
     util.write_file(server_cfg, contents.getvalue(), mode=0o644)
 
 
+def package_intents(_name, cfg, _cloud, _log, _args):
+    """Return the packages handle installs, see package_planner."""
+    if 'mcollective' not in cfg:
+        return []
+    return ["mcollective"]
+
+
 def handle(name, cfg, cloud, log, _args):
 
     # If there isn't a mcollective key in the configuration don't do anything
@@ -41,7 +41,15 @@ equates to the more standard `nofail`.
 Swap files can be configured by setting the path to the swap file to create
 with ``filename``, the size of the swap file with ``size`` maximum size of
 the swap file if using an ``size: auto`` with ``maxsize``. By default no
-swap file is created.
+swap file is created. The swap file is allocated with ``fallocate`` where the
+filesystem supports it for swap, or else filled with zeros. On btrfs, copy on
+write is disabled for the swap file first.
+
+Setting ``background`` to ``true`` creates and enables the swap file in the
+background once boot finished, so that allocating a large swap file does not
+delay boot. The swap file is only added to ``/etc/fstab`` once it is created.
+Its progress is recorded in ``/run/cloud-init/swap-status.json``, whose
+``status`` is one of ``pending``, ``allocating``, ``enabled`` or ``failed``.
 
 **Internal name:** ``cc_mounts``
 
@@ -60,6 +68,7 @@ swap file is created.
         filename: <file>
         size: <"auto"/size in bytes>
         maxsize: <size in bytes>
+        background: <true/false>
 """
 
 from string import whitespace
@@ -67,7 +76,9 @@ from string import whitespace
 import logging
 import os
 import re
+import time
 
+from cloudinit import atomic_helper
 from cloudinit import type_utils
 from cloudinit import subp
 from cloudinit import util
@@ -81,6 +92,10 @@ NETWORK_NAME_RE = re.compile(NETWORK_NAME_FILTER)
 WS = re.compile("[%s]+" % (whitespace))
 FSTAB_PATH = "/etc/fstab"
 MNT_COMMENT = "comment=cloudconfig"
+# Bytes written at once when filling a swap file with zeros
+SWAP_WRITE_SIZE = 8 * 2 ** 20
+# Seconds a background swap file waits for boot to finish
+SWAP_BACKGROUND_TIMEOUT = 600
 
 LOG = logging.getLogger(__name__)
 
@@ -242,7 +257,33 @@ def suggested_swapsize(memsize=None, maxsize=None, fsys=None):
     return size
 
 
-def create_swapfile(fname: str, size: str) -> None:
+def allocate_swapfile(fname, size, method, progress=None):
+    """Allocate size MiB to the swap file fname, replacing its contents.
+
+    @param method: "fallocate" to reserve the blocks without writing them,
+        or "write" to fill the file with zeros.
+    @param progress: Optional callable passed the MiB allocated so far and
+        size, as the zeros are written.
+    """
+    size = int(size)
+    total = size * 2 ** 20
+    fd = os.open(fname, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        if method == "fallocate":
+            if total:
+                os.posix_fallocate(fd, 0, total)
+        else:
+            zeros = memoryview(bytearray(min(total, SWAP_WRITE_SIZE)))
+            offset = 0
+            while offset < total:
+                offset += os.pwrite(fd, zeros[:total - offset], offset)
+                if progress:
+                    progress(offset // 2 ** 20, size)
+    finally:
+        os.close(fd)
+
+
+def create_swapfile(fname: str, size: str, progress=None) -> None:
     """Size is in MiB."""
 
     errmsg = "Failed to create swapfile '%s' of size %sMB via %s: %s"
@@ -251,15 +292,14 @@ def create_swapfile(fname: str, size: str) -> None:
         LOG.debug("Creating swapfile in '%s' on fstype '%s' using '%s'",
                   fname, fstype, method)
 
-        if method == "fallocate":
-            cmd = ['fallocate', '-l', '%sM' % size, fname]
-        elif method == "dd":
-            cmd = ['dd', 'if=/dev/zero', 'of=%s' % fname, 'bs=1M',
-                   'count=%s' % size]
-
         try:
-            subp.subp(cmd, capture=True)
-        except subp.ProcessExecutionError as e:
+            if fstype == "btrfs":
+                # Swap files must not be copied on write, which can only be
+                # disabled while a file is empty
+                util.write_file(fname, "", mode=0o600)
+                subp.subp(['chattr', '+C', fname])
+            allocate_swapfile(fname, size, method, progress)
+        except OSError as e:
             LOG.info(errmsg, fname, size, method, e)
             util.del_file(fname)
             raise
@@ -269,15 +309,16 @@ def create_swapfile(fname: str, size: str) -> None:
 
     fstype = util.get_mount_info(swap_dir)[1]
 
-    if (fstype == "xfs" and
-            util.kernel_version() < (4, 18)) or fstype == "btrfs":
-        create_swap(fname, size, "dd")
+    # Blocks allocated by fallocate on xfs before 4.18 are rejected by swapon
+    if fstype == "xfs" and util.kernel_version() < (4, 18):
+        create_swap(fname, size, "write")
     else:
         try:
             create_swap(fname, size, "fallocate")
-        except subp.ProcessExecutionError:
-            LOG.info("fallocate swap creation failed, will attempt with dd")
-            create_swap(fname, size, "dd")
+        except OSError:
+            LOG.info("fallocate swap creation failed, will attempt writing"
+                     " zeros")
+            create_swap(fname, size, "write")
 
     if os.path.exists(fname):
         util.chmod(fname, 0o600)
@@ -288,11 +329,82 @@ def create_swapfile(fname: str, size: str) -> None:
         raise
 
 
-def setup_swapfile(fname, size=None, maxsize=None):
+def write_swap_status(status_file, fname, size, status, **kwargs):
+    """Record the status of a swap file created in the background."""
+    data = {'filename': fname, 'size': int(size), 'status': status}
+    data.update(kwargs)
+    atomic_helper.write_json(status_file, data, mode=0o644)
+
+
+def add_swap_to_fstab(fname):
+    """Add the swap file fname to fstab, as handle does."""
+    line = '\t'.join([fname, "none", "swap", "sw,%s" % MNT_COMMENT, "0", "0"])
+    fstab_lines = []
+    if os.path.exists(FSTAB_PATH):
+        fstab_lines = util.load_file(FSTAB_PATH).splitlines()
+    if line not in fstab_lines:
+        fstab_lines.append(line)
+        util.write_file(FSTAB_PATH, "%s\n" % '\n'.join(fstab_lines))
+
+
+def create_swapfile_after_boot(fname, size, boot_finished, status_file,
+                               timeout=SWAP_BACKGROUND_TIMEOUT):
+    """Create and enable the swap file once boot_finished exists.
+
+    This runs in a child process forked by setup_swapfile. Size is in MiB.
+
+    The swap file is created under a temporary name, renamed into place
+    once mkswap succeeded and only then added to fstab, so that a child
+    killed on the way, such as by a reboot, leaves no fstab entry for a
+    missing or incomplete swap file. No swap file is created when boot
+    does not finish within timeout seconds.
+    """
+    end_time = time.time() + timeout
+    while not os.path.exists(boot_finished):
+        if time.time() > end_time:
+            error = "boot did not finish within %s seconds" % timeout
+            LOG.warning("Not creating swap file %s: %s", fname, error)
+            write_swap_status(status_file, fname, size, 'failed',
+                              error=error)
+            return
+        time.sleep(1)
+
+    reported = []
+
+    def progress(allocated, size):
+        # Record every 5 percent, rather than every write
+        step = allocated * 20 // size
+        if not reported or step > reported[-1]:
+            reported.append(step)
+            write_swap_status(status_file, fname, size, 'allocating',
+                              allocated=allocated)
+
+    write_swap_status(status_file, fname, size, 'allocating', allocated=0)
+    tmp_fname = fname + ".tmp"
+    try:
+        util.log_time(LOG.debug, msg="Setting up swap file in background",
+                      func=create_swapfile, args=[tmp_fname, size],
+                      kwargs={'progress': progress})
+        os.rename(tmp_fname, fname)
+        add_swap_to_fstab(fname)
+        subp.subp(['swapon', fname])
+    except Exception as e:
+        LOG.warning("failed to setup swap: %s", e)
+        write_swap_status(status_file, fname, size, 'failed', error=str(e))
+        return
+    write_swap_status(status_file, fname, size, 'enabled',
+                      allocated=int(size))
+
+
+def setup_swapfile(fname, size=None, maxsize=None, paths=None):
     """
     fname: full path string of filename to setup
     size: the size to create. set to "auto" for recommended
     maxsize: the maximum size
+    paths: when given, the swap file is created, added to fstab and
+        enabled in the background once boot finished, see
+        create_swapfile_after_boot. None is returned, as fstab is left
+        to the background child.
     """
     swap_dir = os.path.dirname(fname)
     if str(size).lower() == "auto":
@@ -311,15 +423,25 @@ def setup_swapfile(fname, size=None, maxsize=None):
         LOG.debug("Not creating swap: suggested size was 0")
         return
 
+    if paths:
+        status_file = paths.get_runpath('swap_status')
+        write_swap_status(status_file, fname, mibsize, 'pending')
+        util.fork_cb(create_swapfile_after_boot, fname, mibsize,
+                     paths.boot_finished, status_file)
+        return None
+
     util.log_time(LOG.debug, msg="Setting up swap file", func=create_swapfile,
                   args=[fname, mibsize])
 
     return fname
 
 
-def handle_swapcfg(swapcfg):
+def handle_swapcfg(swapcfg, paths=None):
     """handle the swap config, calling setup_swap if necessary.
        return None or (filename, size)
+
+       With background set in swapcfg, paths locates the status file and
+       the marker of finished boots, see setup_swapfile.
     """
     if not isinstance(swapcfg, dict):
         LOG.warning("input for swap config was not a dict.")
@@ -328,6 +450,8 @@ def handle_swapcfg(swapcfg):
     fname = swapcfg.get('filename', '/swap.img')
     size = swapcfg.get('size', 0)
     maxsize = swapcfg.get('maxsize', None)
+    if not util.is_true(swapcfg.get('background', False)):
+        paths = None
 
     if not (size and fname):
         LOG.debug("no need to setup swap")
@@ -349,12 +473,17 @@ def handle_swapcfg(swapcfg):
                         fname)
             return fname
 
+    # Left behind by a background child killed while allocating, it would
+    # take the disk space the swap file is sized from
+    util.del_file(fname + ".tmp")
+
     try:
         if isinstance(size, str) and size != "auto":
             size = util.human2bytes(size)
         if isinstance(maxsize, str):
             maxsize = util.human2bytes(maxsize)
-        return setup_swapfile(fname=fname, size=size, maxsize=maxsize)
+        return setup_swapfile(fname=fname, size=size, maxsize=maxsize,
+                              paths=paths)
 
     except Exception as e:
         LOG.warning("failed to setup swap: %s", e)
@@ -488,7 +617,7 @@ def handle(_name, cfg, cloud, log, _args):
         else:
             actlist.append(x)
 
-    swapret = handle_swapcfg(cfg.get('swap', {}))
+    swapret = handle_swapcfg(cfg.get('swap', {}), cloud.paths)
     if swapret:
         actlist.append([swapret, "none", "swap", "sw", "0", "0"])
 
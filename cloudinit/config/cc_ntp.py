@@ -16,7 +16,8 @@ from cloudinit import templater
 from cloudinit import type_utils
 from cloudinit import subp
 from cloudinit import util
-from cloudinit.config.schema import get_schema_doc, validate_cloudconfig_schema
+from cloudinit.config.schema import (
+    set_lazy_schema_doc, validate_cloudconfig_schema)
 from cloudinit.settings import PER_INSTANCE
 
 LOG = logging.getLogger(__name__)
@@ -303,7 +304,7 @@ REQUIRED_NTP_CONFIG_KEYS = frozenset([
     'check_exe', 'confpath', 'packages', 'service_name'])
 
 
-__doc__ = get_schema_doc(schema)  # Supplement python help()
+set_lazy_schema_doc(__name__)  # Supplement python help()
 
 
 def distro_ntp_client_configs(distro):
@@ -523,6 +524,31 @@ def supplemental_schema_validation(ntp_config):
             errors='\n'.join(errors)))
 
 
+def get_ntp_client_config(ntp_cfg, distro):
+    """Return the configuration of the ntp client selected by ntp_cfg."""
+    # Select which client is going to be used and get the configuration
+    ntp_client_config = select_ntp_client(ntp_cfg.get('ntp_client'), distro)
+    # Allow user ntp config to override distro configurations
+    return util.mergemanydict(
+        [ntp_client_config, ntp_cfg.get('config', {})], reverse=True)
+
+
+def package_intents(_name, cfg, cloud, _log, _args):
+    """Return the ntp client packages handle installs, see package_planner."""
+    if 'ntp' not in cfg:
+        return []
+    ntp_cfg = cfg['ntp']
+    if ntp_cfg is None:
+        ntp_cfg = {}
+    if not isinstance(ntp_cfg, dict) or util.is_false(
+            ntp_cfg.get('enabled', True)):
+        return []
+    ntp_client_config = get_ntp_client_config(ntp_cfg, cloud.distro)
+    if subp.which(ntp_client_config.get('check_exe', 'ntpd')):
+        return []
+    return ntp_client_config.get('packages') or []
+
+
 def handle(name, cfg, cloud, log, _args):
     """Enable and configure ntp."""
     if 'ntp' not in cfg:
@@ -547,12 +573,7 @@ def handle(name, cfg, cloud, log, _args):
         LOG.debug("Skipping module named %s, disabled by cfg", name)
         return
 
-    # Select which client is going to be used and get the configuration
-    ntp_client_config = select_ntp_client(ntp_cfg.get('ntp_client'),
-                                          cloud.distro)
-    # Allow user ntp config to override distro configurations
-    ntp_client_config = util.mergemanydict(
-        [ntp_client_config, ntp_cfg.get('config', {})], reverse=True)
+    ntp_client_config = get_ntp_client_config(ntp_cfg, cloud.distro)
 
     supplemental_schema_validation(ntp_client_config)
     rename_ntp_conf(confpath=ntp_client_config.get('confpath'))
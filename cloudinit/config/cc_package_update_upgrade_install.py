@@ -72,6 +72,28 @@ def _fire_reboot(log, wait_attempts=6, initial_sleep=1, backoff=2):
                         " after %s seconds!") % (int(elapsed)))
 
 
+def _updates_or_upgrades(cfg):
+    return (_multi_cfg_bool_get(cfg, 'apt_update', 'package_update') or
+            _multi_cfg_bool_get(cfg, 'package_upgrade', 'apt_upgrade'))
+
+
+def package_intents(_name, cfg, _cloud, _log, _args):
+    """Return the packages handle installs, see package_planner.
+
+    The packages are left to handle when it updates or upgrades, as they
+    must be installed from the updated indexes, after the upgrade, which
+    could otherwise replace a pinned version.
+    """
+    if _updates_or_upgrades(cfg):
+        return []
+    return util.get_cfg_option_list(cfg, 'packages', [])
+
+
+def changes_package_sources(_name, cfg, _cloud, _log, _args):
+    """Return whether handle updates or upgrades, see package_planner."""
+    return _updates_or_upgrades(cfg)
+
+
 def handle(_name, cfg, cloud, log, _args):
     # Handle the old style + new config names
     update = _multi_cfg_bool_get(cfg, 'apt_update', 'package_update')
@@ -185,6 +185,20 @@ def install_puppet_aio(url=AIO_INSTALL_URL, version=None,
         return subp.subp([tmpf] + args, capture=False)
 
 
+def package_intents(_name, cfg, _cloud, _log, _args):
+    """Return the packages handle installs, see package_planner."""
+    if 'puppet' not in cfg:
+        return []
+    puppet_cfg = cfg['puppet']
+    install_type = util.get_cfg_option_str(
+        puppet_cfg, 'install_type', 'packages')
+    if (install_type != 'packages' or
+            not util.get_cfg_option_bool(puppet_cfg, 'install', True)):
+        return []
+    return [(util.get_cfg_option_str(puppet_cfg, 'package_name', 'puppet'),
+             util.get_cfg_option_str(puppet_cfg, 'version', None))]
+
+
 def handle(name, cfg, cloud, log, _args):
     # If there isn't a puppet key in the configuration don't do anything
     if 'puppet' not in cfg:
@@ -14,7 +14,7 @@ import stat
 from textwrap import dedent
 
 from cloudinit.config.schema import (
-    get_schema_doc, validate_cloudconfig_schema)
+    set_lazy_schema_doc, validate_cloudconfig_schema)
 from cloudinit.settings import PER_ALWAYS
 from cloudinit import subp
 from cloudinit import util
@@ -52,7 +52,7 @@ schema = {
     }
 }
 
-__doc__ = get_schema_doc(schema)  # Supplement python help()
+set_lazy_schema_doc(__name__)  # Supplement python help()
 
 
 def _resize_btrfs(mount_point, devpth):
@@ -133,6 +133,15 @@ def can_skip_resize(fs_type, resize_what, devpth):
     return False
 
 
+def get_resize_cmd(fs_type, resize_what, devpth):
+    """Return the command resizing a filesystem, None for unknown types."""
+    fstype_lc = fs_type.lower()
+    for (pfix, root_cmd) in RESIZE_FS_PREFIXES_CMDS:
+        if fstype_lc.startswith(pfix):
+            return root_cmd(resize_what, devpth)
+    return None
+
+
 def maybe_get_writable_device_path(devpath, info, log):
     """Return updated devpath if the devpath is a writable block device.
 
@@ -234,24 +243,17 @@ def handle(name, cfg, _cloud, log, args):
     if not devpth:
         return  # devpath was not a writable block device
 
-    resizer = None
     if can_skip_resize(fs_type, resize_what, devpth):
         log.debug("Skip resize filesystem type %s for %s",
                   fs_type, resize_what)
         return
 
-    fstype_lc = fs_type.lower()
-    for (pfix, root_cmd) in RESIZE_FS_PREFIXES_CMDS:
-        if fstype_lc.startswith(pfix):
-            resizer = root_cmd
-            break
-
-    if not resizer:
+    resize_cmd = get_resize_cmd(fs_type, resize_what, devpth)
+    if not resize_cmd:
         log.warning("Not resizing unknown filesystem type %s for %s",
                     fs_type, resize_what)
         return
 
-    resize_cmd = resizer(resize_what, devpth)
     log.debug("Resizing %s (%s) using %s", resize_what, fs_type,
               ' '.join(resize_cmd))
 
@@ -9,7 +9,7 @@
 """Runcmd: run arbitrary commands at rc.local with output to the console"""
 
 from cloudinit.config.schema import (
-    get_schema_doc, validate_cloudconfig_schema)
+    set_lazy_schema_doc, validate_cloudconfig_schema)
 from cloudinit.distros import ALL_DISTROS
 from cloudinit.settings import PER_INSTANCE
 from cloudinit import util
@@ -76,7 +76,7 @@ schema = {
     }
 }
 
-__doc__ = get_schema_doc(schema)  # Supplement python help()
+set_lazy_schema_doc(__name__)  # Supplement python help()
 
 
 def handle(name, cfg, cloud, log, _args):
@@ -79,6 +79,13 @@ class SaltConstants(object):
                                                 self.srv_name)
 
 
+def package_intents(_name, cfg, _cloud, _log, _args):
+    """Return the packages handle installs, see package_planner."""
+    if 'salt_minion' not in cfg:
+        return []
+    return [SaltConstants(cfg=cfg['salt_minion']).pkg_name]
+
+
 def handle(name, cfg, cloud, log, _args):
     # If there isn't a salt key in the configuration don't do anything
     if 'salt_minion' not in cfg:
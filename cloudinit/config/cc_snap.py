@@ -9,7 +9,7 @@ from textwrap import dedent
 
 from cloudinit import log as logging
 from cloudinit.config.schema import (
-    get_schema_doc, validate_cloudconfig_schema)
+    set_lazy_schema_doc, validate_cloudconfig_schema)
 from cloudinit.settings import PER_INSTANCE
 from cloudinit.subp import prepend_base_command
 from cloudinit import subp
@@ -145,7 +145,7 @@ schema = {
     }
 }
 
-__doc__ = get_schema_doc(schema)  # Supplement python help()
+set_lazy_schema_doc(__name__)  # Supplement python help()
 
 SNAP_CMD = "snap"
 ASSERTIONS_FILE = "/var/lib/cloud/instance/snapd.assertions"
@@ -232,6 +232,15 @@ def maybe_install_squashfuse(cloud):
         raise
 
 
+def package_intents(_name, cfg, _cloud, _log, _args):
+    """Return the packages handle installs, see package_planner."""
+    cfgin = cfg.get('snap', {})
+    if (cfgin and util.is_true(cfgin.get('squashfuse_in_container', False))
+            and util.is_container()):
+        return ['squashfuse']
+    return []
+
+
 def handle(name, cfg, cloud, log, args):
     cfgin = cfg.get('snap', {})
     if not cfgin:
@@ -68,6 +68,18 @@ def do_register(server, profile_name,
     subp.subp(cmd, capture=False)
 
 
+def package_intents(name, cfg, cloud, log, args):
+    """Return the packages handle installs, see package_planner."""
+    if not changes_package_sources(name, cfg, cloud, log, args):
+        return []
+    return required_packages
+
+
+def changes_package_sources(_name, cfg, _cloud, _log, _args):
+    """Return whether handle would register with a spacewalk server."""
+    return bool((cfg.get('spacewalk') or {}).get('server'))
+
+
 def handle(name, cfg, cloud, log, _args):
     if 'spacewalk' not in cfg:
         log.debug(("Skipping module named %s,"
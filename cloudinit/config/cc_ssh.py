@@ -109,6 +109,8 @@ using the ``ssh_genkeytypes`` config flag, which accepts a list of host key
 types to use. For each host key type for which this module has been instructed
 to create a keypair, if a key of the same type is already present on the
 system (i.e. if ``ssh_deletekeys`` was false), no key will be generated.
+Keys of different types are generated concurrently, using up to one CPU for
+each key type.
 
 Supported host key types for the ``ssh_keys`` and the ``ssh_genkeytypes``
 config flags are:
@@ -161,6 +163,7 @@ config flags are:
 import glob
 import os
 import sys
+from concurrent import futures
 
 from cloudinit.distros import ug_util
 from cloudinit import ssh_util
@@ -188,6 +191,31 @@ for k in GENERATE_KEY_NAMES:
 KEY_GEN_TPL = 'o=$(ssh-keygen -yf "%s") && echo "$o" root@localhost > "%s"'
 
 
+def generate_keys(keytypes):
+    """Run ssh-keygen for each of keytypes concurrently.
+
+    Generating keys is mostly spent searching for primes, so the keys are
+    generated on as many CPUs as are available rather than one at a time.
+
+    @returns: List of futures of the (out, err) of ssh-keygen for each of
+        keytypes, in the same order.
+    """
+    if not keytypes:
+        return []
+    lang_c = os.environ.copy()
+    lang_c['LANG'] = 'C'
+    workers = min(len(keytypes), os.cpu_count() or 1)
+    with futures.ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="ssh-keygen"
+    ) as executor:
+        return [
+            executor.submit(
+                subp.subp, ['ssh-keygen', '-t', keytype, '-N', '', '-f',
+                            KEY_FILE_TPL % (keytype)],
+                capture=True, env=lang_c)
+            for keytype in keytypes]
+
+
 def handle(_name, cfg, cloud, log, _args):
 
     # remove the static keys from the pristine image
@@ -231,19 +259,21 @@ def handle(_name, cfg, cloud, log, _args):
         genkeys = util.get_cfg_option_list(cfg,
                                            'ssh_genkeytypes',
                                            GENERATE_KEY_NAMES)
-        lang_c = os.environ.copy()
-        lang_c['LANG'] = 'C'
+        keytypes = []
         for keytype in genkeys:
             keyfile = KEY_FILE_TPL % (keytype)
-            if os.path.exists(keyfile):
+            # Two ssh-keygen runs must not write the same key file at once
+            if keytype in keytypes or os.path.exists(keyfile):
                 continue
             util.ensure_dir(os.path.dirname(keyfile))
-            cmd = ['ssh-keygen', '-t', keytype, '-N', '', '-f', keyfile]
+            keytypes.append(keytype)
 
-            # TODO(harlowja): Is this guard needed?
-            with util.SeLinuxGuard("/etc/ssh", recursive=True):
+        # TODO(harlowja): Is this guard needed?
+        with util.SeLinuxGuard("/etc/ssh", recursive=True):
+            for keytype, future in zip(keytypes, generate_keys(keytypes)):
+                keyfile = KEY_FILE_TPL % (keytype)
                 try:
-                    out, err = subp.subp(cmd, capture=True, env=lang_c)
+                    out, err = future.result()
                     if not util.get_cfg_option_bool(cfg, 'ssh_quiet_keygen',
                                                     False):
                         sys.stdout.write(util.decode_binary(out))
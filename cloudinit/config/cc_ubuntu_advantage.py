@@ -5,7 +5,7 @@
 from textwrap import dedent
 
 from cloudinit.config.schema import (
-    get_schema_doc, validate_cloudconfig_schema)
+    set_lazy_schema_doc, validate_cloudconfig_schema)
 from cloudinit import log as logging
 from cloudinit.settings import PER_INSTANCE
 from cloudinit import subp
@@ -82,7 +82,7 @@ schema = {
     }
 }
 
-__doc__ = get_schema_doc(schema)  # Supplement python help()
+set_lazy_schema_doc(__name__)  # Supplement python help()
 
 LOG = logging.getLogger(__name__)
 
@@ -150,6 +150,20 @@ def maybe_install_ua_tools(cloud):
         raise
 
 
+def package_intents(_name, cfg, _cloud, _log, _args):
+    """Return the packages handle installs, see package_planner."""
+    ua_section = cfg.get('ubuntu_advantage', cfg.get('ubuntu-advantage'))
+    if ua_section is None or 'commands' in ua_section or subp.which('ua'):
+        return []
+    return ['ubuntu-advantage-tools']
+
+
+def changes_package_sources(_name, cfg, _cloud, _log, _args):
+    """Return whether handle attaches, enabling package sources."""
+    ua_section = cfg.get('ubuntu_advantage', cfg.get('ubuntu-advantage'))
+    return ua_section is not None and 'commands' not in ua_section
+
+
 def handle(name, cfg, cloud, log, args):
     ua_section = None
     if 'ubuntu-advantage' in cfg:
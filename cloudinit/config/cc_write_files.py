@@ -11,7 +11,7 @@ import os
 from textwrap import dedent
 
 from cloudinit.config.schema import (
-    get_schema_doc, validate_cloudconfig_schema)
+    set_lazy_schema_doc, validate_cloudconfig_schema)
 from cloudinit import log as logging
 from cloudinit.settings import PER_INSTANCE
 from cloudinit import util
@@ -187,7 +187,14 @@ schema = {
     }
 }
 
-__doc__ = get_schema_doc(schema)  # Supplement python help()
+set_lazy_schema_doc(__name__)  # Supplement python help()
+
+
+def changes_package_sources(_name, cfg, _cloud, _log, _args):
+    """Return whether handle would write files, which may configure the
+    package sources."""
+    return any(not util.get_cfg_option_bool(f, 'defer', DEFAULT_DEFER)
+               for f in cfg.get('write_files', []))
 
 
 def handle(name, cfg, _cloud, log, _args):
@@ -37,6 +37,13 @@ schema = util.mergemanydict([
 __doc__ = None
 
 
+def changes_package_sources(_name, cfg, _cloud, _log, _args):
+    """Return whether handle would write files, which may configure the
+    package sources."""
+    return any(util.get_cfg_option_bool(f, 'defer', DEFAULT_DEFER)
+               for f in cfg.get('write_files', []))
+
+
 def handle(name, cfg, _cloud, log, _args):
     validate_cloudconfig_schema(cfg, schema)
     file_list = cfg.get('write_files', [])
@@ -78,6 +78,11 @@ def _format_repository_config(repo_id, repo_config):
     return "".join(lines)
 
 
+def changes_package_sources(_name, cfg, _cloud, _log, _args):
+    """Return whether handle would add yum repositories."""
+    return bool(cfg.get('yum_repos'))
+
+
 def handle(name, cfg, _cloud, log, _args):
     repos = cfg.get('yum_repos')
     if not repos:
@@ -9,7 +9,7 @@ import configobj
 import os
 from textwrap import dedent
 
-from cloudinit.config.schema import get_schema_doc
+from cloudinit.config.schema import set_lazy_schema_doc
 from cloudinit import log as logging
 from cloudinit.settings import PER_ALWAYS
 from cloudinit import util
@@ -93,7 +93,7 @@ schema = {
     }
 }
 
-__doc__ = get_schema_doc(schema)  # Supplement python help()
+set_lazy_schema_doc(__name__)  # Supplement python help()
 
 LOG = logging.getLogger(__name__)
 
@@ -197,6 +197,11 @@ def _write_zypp_config(zypper_config):
     util.write_file(zypp_config, new_config)
 
 
+def changes_package_sources(_name, cfg, _cloud, _log, _args):
+    """Return whether handle would add zypper repositories."""
+    return bool((cfg.get('zypper') or {}).get('repos'))
+
+
 def handle(name, cfg, _cloud, log, _args):
     zypper_section = cfg.get('zypper')
     if not zypper_section:
@@ -12,6 +12,7 @@ import logging
 import os
 import re
 import sys
+import types
 import yaml
 
 _YAML_MAP = {True: 'true', False: 'false', None: 'null'}
@@ -72,6 +73,114 @@ def is_schema_byte_string(checker, instance):
             isinstance(instance, (bytes,)))
 
 
+# Validators built by _get_validator, keyed by id(schema). Each entry keeps
+# a reference to its schema so the id can not be reused by another schema.
+# Once _MAX_VALIDATORS are cached, the oldest validator is evicted.
+_VALIDATORS = {}
+_MAX_VALIDATORS = 128
+_VALIDATOR_CLASS = None
+_FORMAT_CHECKER = None
+
+# Errors found by validate_cloudconfig_modules for each module schema it was
+# passed, keyed by id(schema), along with the config they apply to.
+_PRECOMPUTED_ERRORS = {'config': None, 'errors': {}}
+
+
+def _get_validator(schema, cache=True):
+    """Return a cloud-init jsonschema validator for schema.
+
+    @param cache: Boolean, when False the validator is neither looked up in
+        nor added to the cache. Use it for schemas built on the fly.
+    @raises: ImportError when python-jsonschema is not present.
+    """
+    global _VALIDATOR_CLASS, _FORMAT_CHECKER
+    from jsonschema import Draft4Validator, FormatChecker
+    from jsonschema.validators import create, extend
+
+    cached = _VALIDATORS.get(id(schema)) if cache else None
+    if cached and cached[0] is schema:
+        return cached[1]
+    cloudinitValidator = _VALIDATOR_CLASS
+    if cloudinitValidator is None:
+        # Allow for bytes to be presented as an acceptable valid value for
+        # string type jsonschema attributes in cloud-init's schema.
+        # This allows #cloud-config to provide valid yaml
+        # "content: !!binary | ..."
+        if hasattr(Draft4Validator, 'TYPE_CHECKER'):  # jsonschema 3.0+
+            type_checker = Draft4Validator.TYPE_CHECKER.redefine(
+                'string', is_schema_byte_string)
+            cloudinitValidator = extend(
+                Draft4Validator, type_checker=type_checker)
+        else:  # jsonschema 2.6 workaround
+            types = Draft4Validator.DEFAULT_TYPES
+            # Allow bytes as well as string (and disable a spurious
+            # unsupported-assignment-operation pylint warning which appears
+            # because this code path isn't written against the latest
+            # jsonschema).
+            types['string'] = (str, bytes)  # pylint: disable=E1137
+            cloudinitValidator = create(
+                meta_schema=Draft4Validator.META_SCHEMA,
+                validators=Draft4Validator.VALIDATORS,
+                version="draft4",
+                default_types=types)
+        _VALIDATOR_CLASS = cloudinitValidator
+        _FORMAT_CHECKER = FormatChecker()
+    validator = cloudinitValidator(schema, format_checker=_FORMAT_CHECKER)
+    if cache:
+        if len(_VALIDATORS) >= _MAX_VALIDATORS:
+            del _VALIDATORS[next(iter(_VALIDATORS))]
+        _VALIDATORS[id(schema)] = (schema, validator)
+    return validator
+
+
+def _format_errors(errors):
+    """Return sorted ((flat.config.key, msg),) for jsonschema errors."""
+    result = ()
+    for error in sorted(errors, key=lambda e: e.path):
+        path = '.'.join([str(p) for p in error.path])
+        result += ((path, error.message),)
+    return result
+
+
+def validate_cloudconfig_modules(config, schemas):
+    """Validate config against the schemas of several modules in one pass.
+
+    The errors found for each module schema are kept so that
+    validate_cloudconfig_schema can report them without validating the
+    config again when a module is run with an equal config.
+
+    @param config: Dict of merged cloud configuration settings.
+    @param schemas: List of the schemas of the modules about to run. Only
+        schemas of modules which are already imported should be passed, as
+        get_schema imports every cc_* module.
+    """
+    _PRECOMPUTED_ERRORS['config'] = None
+    _PRECOMPUTED_ERRORS['errors'] = {}
+    full_schema = {'allOf': schemas}
+    try:
+        validator = _get_validator(full_schema, cache=False)
+    except ImportError:
+        logging.debug(
+            'Ignoring schema validation. python-jsonschema is not present')
+        return
+    module_errors = defaultdict(list)
+    for error in validator.iter_errors(config):
+        # Errors from each module schema are nested under allOf.<index>
+        module_errors[error.schema_path[1]].append(error)
+    _PRECOMPUTED_ERRORS['config'] = deepcopy(config)
+    _PRECOMPUTED_ERRORS['errors'] = dict(
+        (id(module_schema), _format_errors(module_errors[idx]))
+        for idx, module_schema in enumerate(full_schema['allOf']))
+
+
+def _get_precomputed_errors(config, schema):
+    """Return errors from validate_cloudconfig_modules or None if unknown."""
+    errors = _PRECOMPUTED_ERRORS['errors'].get(id(schema))
+    if errors is None or config != _PRECOMPUTED_ERRORS['config']:
+        return None
+    return errors
+
+
 def validate_cloudconfig_schema(config, schema, strict=False):
     """Validate provided config meets the schema definition.
 
@@ -86,36 +195,15 @@ def validate_cloudconfig_schema(config, schema, strict=False):
         against the provided schema.
     """
     try:
-        from jsonschema import Draft4Validator, FormatChecker
-        from jsonschema.validators import create, extend
+        validator = _get_validator(schema)
     except ImportError:
         logging.debug(
             'Ignoring schema validation. python-jsonschema is not present')
         return
 
-    # Allow for bytes to be presented as an acceptable valid value for string
-    # type jsonschema attributes in cloud-init's schema.
-    # This allows #cloud-config to provide valid yaml "content: !!binary | ..."
-    if hasattr(Draft4Validator, 'TYPE_CHECKER'):  # jsonschema 3.0+
-        type_checker = Draft4Validator.TYPE_CHECKER.redefine(
-            'string', is_schema_byte_string)
-        cloudinitValidator = extend(Draft4Validator, type_checker=type_checker)
-    else:  # jsonschema 2.6 workaround
-        types = Draft4Validator.DEFAULT_TYPES
-        # Allow bytes as well as string (and disable a spurious
-        # unsupported-assignment-operation pylint warning which appears because
-        # this code path isn't written against the latest jsonschema).
-        types['string'] = (str, bytes)  # pylint: disable=E1137
-        cloudinitValidator = create(
-            meta_schema=Draft4Validator.META_SCHEMA,
-            validators=Draft4Validator.VALIDATORS,
-            version="draft4",
-            default_types=types)
-    validator = cloudinitValidator(schema, format_checker=FormatChecker())
-    errors = ()
-    for error in sorted(validator.iter_errors(config), key=lambda e: e.path):
-        path = '.'.join([str(p) for p in error.path])
-        errors += ((path, error.message),)
+    errors = _get_precomputed_errors(config, schema)
+    if errors is None:
+        errors = _format_errors(validator.iter_errors(config))
     if errors:
         if strict:
             raise SchemaValidationError(errors)
@@ -405,6 +493,37 @@ def get_schema_doc(schema):
     return SCHEMA_DOC_TMPL.format(**schema_copy)
 
 
+class _SchemaDocModule(types.ModuleType):
+    # A module whose __doc__ is rendered from its schema on first access.
+
+    @property
+    def __doc__(self):
+        doc = self.__dict__.get('__doc__')
+        if doc is None:
+            doc = get_schema_doc(self.schema)
+            self.__dict__['__doc__'] = doc
+        return doc
+
+    @__doc__.setter
+    def __doc__(self, value):
+        self.__dict__['__doc__'] = value
+
+
+def set_lazy_schema_doc(module_name):
+    """Render the __doc__ of a cc_* module from its schema when first used.
+
+    Rendering the documentation of every config module on import is only
+    needed by python help() and the docs build, so it is deferred until
+    __doc__ is accessed.
+
+    @param module_name: Name of the module being imported, which defines a
+        module-level schema.
+    """
+    module = sys.modules[module_name]
+    module.__dict__['__doc__'] = None
+    module.__class__ = _SchemaDocModule
+
+
 FULL_SCHEMA = None
 
 
@@ -1,9 +1,13 @@
 # This file is part of cloud-init. See LICENSE file for license information.
+import errno
+import json
+import os
 from unittest import mock
 
 import pytest
 
-from cloudinit.config.cc_mounts import create_swapfile
+from cloudinit.config.cc_mounts import (
+    allocate_swapfile, create_swapfile, create_swapfile_after_boot)
 from cloudinit.subp import ProcessExecutionError
 
 
@@ -19,43 +23,120 @@ class TestCreateSwapfile:
         swap_file = tmpdir.join("swap-file")
         fname = str(swap_file)
 
-        # Some of the calls to subp.subp should create the swap file; this
-        # roughly approximates that
-        m_subp.side_effect = lambda *args, **kwargs: swap_file.write('')
-
         m_get_mount_info.return_value = (mock.ANY, fstype)
 
-        create_swapfile(fname, '')
+        create_swapfile(fname, '1')
         assert mock.call(['mkswap', fname]) in m_subp.call_args_list
+        assert 2 ** 20 == swap_file.size()
+        assert 0o600 == swap_file.stat().mode & 0o777
+        nocow = mock.call(['chattr', '+C', fname]) in m_subp.call_args_list
+        assert (fstype == 'btrfs') == nocow
 
+    @mock.patch(M_PATH + "os.posix_fallocate")
     @mock.patch(M_PATH + "util.get_mount_info")
     @mock.patch(M_PATH + "subp.subp")
-    def test_fallback_from_fallocate_to_dd(
-        self, m_subp, m_get_mount_info, caplog, tmpdir
+    def test_fallback_from_fallocate_to_writing_zeros(
+        self, m_subp, m_get_mount_info, m_fallocate, caplog, tmpdir
     ):
         swap_file = tmpdir.join("swap-file")
         fname = str(swap_file)
 
-        def subp_side_effect(cmd, *args, **kwargs):
-            # Mock fallocate failing, to initiate fallback
-            if cmd[0] == "fallocate":
-                raise ProcessExecutionError()
-
-        m_subp.side_effect = subp_side_effect
-        # Use ext4 so both fallocate and dd are valid swap creation methods
+        # Mock fallocate failing, to initiate fallback
+        m_fallocate.side_effect = OSError(errno.EOPNOTSUPP, "not supported")
+        # Use ext4 so both fallocate and writing zeros are valid methods
         m_get_mount_info.return_value = (mock.ANY, "ext4")
 
-        create_swapfile(fname, "")
-
-        cmds = [args[0][0] for args, _kwargs in m_subp.call_args_list]
-        assert "fallocate" in cmds, "fallocate was not called"
-        assert "dd" in cmds, "fallocate failure did not fallback to dd"
-
-        assert cmds.index("dd") > cmds.index(
-            "fallocate"
-        ), "dd ran before fallocate"
+        create_swapfile(fname, "2")
 
+        assert 1 == m_fallocate.call_count
+        assert 2 * 2 ** 20 == swap_file.size()
         assert mock.call(["mkswap", fname]) in m_subp.call_args_list
 
-        msg = "fallocate swap creation failed, will attempt with dd"
+        msg = "fallocate swap creation failed, will attempt writing zeros"
         assert msg in caplog.text
+
+    @mock.patch(M_PATH + "SWAP_WRITE_SIZE", 2 ** 19)
+    def test_allocate_by_writing_zeros_reports_progress(self, tmpdir):
+        swap_file = tmpdir.join("swap-file")
+        swap_file.write("previous contents")
+        progress = mock.Mock()
+
+        allocate_swapfile(str(swap_file), "2", "write", progress)
+
+        assert b"\0" * 2 * 2 ** 20 == swap_file.read_binary()
+        assert [mock.call(0, 2), mock.call(1, 2), mock.call(1, 2),
+                mock.call(2, 2)] == progress.call_args_list
+
+
+class TestCreateSwapfileAfterBoot:
+
+    @mock.patch(M_PATH + "create_swapfile")
+    @mock.patch(M_PATH + "subp.subp")
+    def test_swap_enabled_once_boot_finished(
+        self, m_subp, m_create, tmpdir
+    ):
+        boot_finished = tmpdir.join("boot-finished")
+        boot_finished.write("")
+        status_file = tmpdir.join("swap-status.json")
+        fstab = tmpdir.join("fstab")
+        fstab.write("/dev/sda1 / ext4 defaults 0 0\n")
+        swap_file = tmpdir.join("swap.img")
+        fname = str(swap_file)
+
+        def create(tmp_fname, size, progress):
+            # The swap file is only in fstab once created and renamed
+            assert fname + ".tmp" == tmp_fname
+            assert fname not in fstab.read()
+            progress(10, 20)
+            assert {"filename": fname, "size": 20,
+                    "status": "allocating", "allocated": 10} == json.loads(
+                        status_file.read())
+            tmpdir.join("swap.img.tmp").write("swap")
+
+        m_create.side_effect = create
+        with mock.patch(M_PATH + "FSTAB_PATH", str(fstab)):
+            create_swapfile_after_boot(
+                fname, "20", str(boot_finished), str(status_file))
+
+        assert "swap" == swap_file.read()
+        assert not tmpdir.join("swap.img.tmp").exists()
+        assert ("/dev/sda1 / ext4 defaults 0 0\n"
+                "%s\tnone\tswap\tsw,comment=cloudconfig\t0\t0\n" % fname
+                ) == fstab.read()
+        m_subp.assert_called_once_with(["swapon", fname])
+        assert {"filename": fname, "size": 20, "status": "enabled",
+                "allocated": 20} == json.loads(status_file.read())
+
+    @mock.patch(M_PATH + "create_swapfile")
+    @mock.patch(M_PATH + "subp.subp")
+    def test_failure_is_recorded(self, m_subp, m_create, tmpdir):
+        boot_finished = tmpdir.join("boot-finished")
+        boot_finished.write("")
+        status_file = tmpdir.join("swap-status.json")
+        m_create.side_effect = ProcessExecutionError("mkswap failed")
+
+        create_swapfile_after_boot(
+            "/swap.img", "20", str(boot_finished), str(status_file))
+
+        assert "failed" == json.loads(status_file.read())["status"]
+        assert "mkswap failed" in json.loads(status_file.read())["error"]
+        m_subp.assert_not_called()
+        m_create.assert_called_once_with(
+            "/swap.img.tmp", "20", progress=mock.ANY)
+
+    @mock.patch(M_PATH + "time.sleep")
+    @mock.patch(M_PATH + "create_swapfile")
+    def test_boot_timeout_is_recorded_as_failure(
+        self, m_create, m_sleep, caplog, tmpdir
+    ):
+        status_file = tmpdir.join("swap-status.json")
+
+        create_swapfile_after_boot(
+            "/swap.img", "20", os.path.join(str(tmpdir), "boot-finished"),
+            str(status_file), timeout=0)
+
+        assert "boot did not finish within 0 seconds" in caplog.text
+        assert {"filename": "/swap.img", "size": 20, "status": "failed",
+                "error": "boot did not finish within 0 seconds"} == json.loads(
+                    status_file.read())
+        m_create.assert_not_called()
@@ -1,9 +1,12 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import io
 import os.path
+import threading
 
 from cloudinit.config import cc_ssh
 from cloudinit import ssh_util
+from cloudinit import subp
 from cloudinit.tests.helpers import CiTestCase, mock
 import logging
 
@@ -105,6 +108,65 @@ class TestHandleSsh(CiTestCase):
         self.assertEqual([mock.call(set(keys), "root", options=options)],
                          m_setup_keys.call_args_list)
 
+    @mock.patch(MODPATH + "util.get_group_id", return_value=-1)
+    @mock.patch(MODPATH + "util.SeLinuxGuard")
+    @mock.patch(MODPATH + "ug_util.normalize_users_groups")
+    def test_handle_generates_keys_concurrently(
+            self, m_nug, m_guard, _m_get_group_id, m_setup_keys):
+        """Keys are generated together, relabelled once and their output
+        written in the order of ssh_genkeytypes."""
+        key_file_tpl = os.path.join(self.tmp_dir(), 'ssh_host_%s_key')
+        started = []
+        rsa_done = threading.Event()
+
+        def fake_keygen(cmd, capture, env):
+            keytype = cmd[2]
+            started.append(keytype)
+            if keytype == 'rsa':
+                # All keys are started before the slow rsa key is done
+                rsa_done.wait(5)
+            elif len(started) == 3:
+                rsa_done.set()
+            if keytype == 'bogus':
+                raise subp.ProcessExecutionError(
+                    exit_code=1, stderr=b'unknown key type bogus')
+            return ('%s key\n' % keytype).encode(), b''
+
+        m_nug.return_value = ([], {})
+        cfg = {'ssh_deletekeys': False,
+               'ssh_genkeytypes': ['rsa', 'bogus', 'ed25519'],
+               'ssh_publish_hostkeys': {'enabled': False}}
+        with mock.patch(MODPATH + 'KEY_FILE_TPL', key_file_tpl):
+            with mock.patch(MODPATH + 'subp.subp', side_effect=fake_keygen):
+                with mock.patch('sys.stdout', new_callable=io.StringIO) as out:
+                    with mock.patch('os.cpu_count', return_value=4):
+                        cc_ssh.handle("name", cfg, self.tmp_cloud('ubuntu'),
+                                      LOG, None)
+        self.assertTrue(rsa_done.is_set())
+        self.assertEqual('rsa key\ned25519 key\n', out.getvalue())
+        self.assertEqual(
+            1, m_guard.call_args_list.count(
+                mock.call("/etc/ssh", recursive=True)))
+
+    @mock.patch(MODPATH + "util.get_group_id", return_value=-1)
+    @mock.patch(MODPATH + "ug_util.normalize_users_groups")
+    def test_handle_generates_repeated_keytypes_once(
+            self, m_nug, _m_get_group_id, m_setup_keys):
+        """A keytype listed twice in ssh_genkeytypes is generated once."""
+        key_file_tpl = os.path.join(self.tmp_dir(), 'ssh_host_%s_key')
+        m_nug.return_value = ([], {})
+        cfg = {'ssh_deletekeys': False,
+               'ssh_genkeytypes': ['rsa', 'ed25519', 'rsa'],
+               'ssh_publish_hostkeys': {'enabled': False}}
+        with mock.patch(MODPATH + 'KEY_FILE_TPL', key_file_tpl):
+            with mock.patch(MODPATH + 'subp.subp',
+                            return_value=(b'', b'')) as m_subp:
+                cc_ssh.handle("name", cfg, self.tmp_cloud('ubuntu'), LOG,
+                              None)
+        self.assertEqual(
+            ['rsa', 'ed25519'],
+            [call[0][0][2] for call in m_subp.call_args_list])
+
     @mock.patch(MODPATH + "glob.glob")
     @mock.patch(MODPATH + "ug_util.normalize_users_groups")
     @mock.patch(MODPATH + "os.path.exists")
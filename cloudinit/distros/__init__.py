@@ -10,6 +10,7 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import abc
+import json
 import os
 import re
 import stat
@@ -85,6 +86,8 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
     _ci_pkl_version = 1
     prefer_fqdn = False
     resolve_conf_fn = "/etc/resolv.conf"
+    # Set while stages.Modules runs the modules of a stage
+    package_planner = None
 
     def __init__(self, name, cfg, paths):
         self._paths = paths
@@ -104,8 +107,22 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
             # missing expected instance state otherwise.
             self.networking = self.networking_cls()
 
-    @abc.abstractmethod
     def install_packages(self, pkglist):
+        """Install pkglist, unless the packages planned for the modules of
+        the stage already include all of it."""
+        planner = self.package_planner
+        if planner and planner.is_installed(pkglist):
+            LOG.debug("Packages %s were already installed as planned",
+                      pkglist)
+            return
+        self._install_packages(pkglist)
+
+    def _install_packages(self, pkglist):
+        """Install pkglist, see install_packages.
+
+        Not abstract, so that distros which override install_packages
+        itself, as they had to before, can still be instantiated.
+        """
         raise NotImplementedError()
 
     def _write_network(self, settings):
@@ -115,6 +132,7 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
             "_write_network_config needs implementation.\n" % self.name)
 
     def _write_network_state(self, network_state):
+        """Render network_state and return the name of the renderer used."""
         priority = util.get_cfg_by_path(
             self._cfg, ('network', 'renderers'), None)
 
@@ -123,6 +141,40 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
                   name, priority)
         renderer = render_cls(config=self.renderer_configs.get(name))
         renderer.render_network_state(network_state)
+        return name
+
+    def _changed_interfaces(self, renderer_name, digests):
+        """Return interfaces whose digests differ from the last bring up.
+
+        @param renderer_name: Name of the renderer which wrote the config.
+        @param digests: Digests from NetworkState.digests.
+
+        @returns: List of interface names, or None when all interfaces need
+            to be brought up because nothing was brought up through this
+            renderer yet during this boot or a shared setting changed.
+        """
+        digests_path = self._paths.get_runpath('network_digests')
+        try:
+            previous = json.loads(util.load_file(digests_path))
+        except (IOError, OSError, ValueError):
+            previous = {}
+        previous = previous.get(renderer_name)
+        if not previous or previous.get('shared') != digests['shared']:
+            return None
+        previous_ifaces = previous.get('interfaces', {})
+        return sorted(
+            name for name, digest in digests['interfaces'].items()
+            if previous_ifaces.get(name) != digest)
+
+    def _store_network_digests(self, renderer_name, digests):
+        """Record digests of the interfaces brought up by renderer_name."""
+        digests_path = self._paths.get_runpath('network_digests')
+        try:
+            util.write_file(
+                digests_path, json.dumps({renderer_name: digests}), mode=0o600)
+        except (IOError, OSError) as e:
+            LOG.debug("Could not write network digests to %s: %s",
+                      digests_path, e)
 
     def _find_tz_file(self, tz):
         tz_file = os.path.join(self.tz_zone_dir, str(tz))
@@ -211,7 +263,8 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
 
         If bring_up is True, attempt to bring up the passed in devices. If
         devices is None, attempt to bring up devices returned by
-        _write_network_config.
+        _write_network_config. Once devices were brought up during this
+        boot, only devices whose configuration changed are brought up again.
 
         Returns True if any devices failed to come up, otherwise False.
         """
@@ -219,7 +272,7 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
         # a much less complete network config format (interfaces(5)).
         network_state = parse_net_config_data(netconfig)
         try:
-            self._write_network_state(network_state)
+            renderer_name = self._write_network_state(network_state)
         except NotImplementedError:
             # backwards compat until all distros have apply_network_config
             return self._apply_network_from_network_config(
@@ -227,9 +280,27 @@ class Distro(persistence.CloudInitPickleMixin, metaclass=abc.ABCMeta):
 
         # Now try to bring them up
         if bring_up:
-            LOG.debug('Bringing up newly configured network interfaces')
             network_activator = activators.select_activator()
-            network_activator.bring_up_all_interfaces(network_state)
+            digests = network_state.digests()
+            changed = self._changed_interfaces(renderer_name, digests)
+            brought_up = True
+            if changed is None:
+                LOG.debug('Bringing up newly configured network interfaces')
+                brought_up = network_activator.bring_up_all_interfaces(
+                    network_state)
+            elif changed:
+                LOG.debug('Bringing up changed network interfaces: %s',
+                          ', '.join(changed))
+                brought_up = network_activator.bring_up_interfaces(changed)
+            else:
+                LOG.debug('Network configuration unchanged, not bringing up'
+                          ' network interfaces')
+            if brought_up:
+                self._store_network_digests(renderer_name, digests)
+            else:
+                # Keep the previous digests so the interfaces which failed
+                # to come up are brought up again on the next apply.
+                LOG.warning('Failed to bring up network interfaces')
         else:
             LOG.debug("Not bringing up newly configured network interfaces")
         return False
@@ -57,13 +57,13 @@ class Distro(distros.Distro):
         # https://github.com/systemd/systemd/pull/9864
         subp.subp(['localectl', 'set-locale', locale], capture=False)
 
-    def install_packages(self, pkglist):
+    def _install_packages(self, pkglist):
         self.update_package_sources()
         self.package_command('', pkgs=pkglist)
 
     def _write_network_state(self, network_state):
         try:
-            super()._write_network_state(network_state)
+            return super()._write_network_state(network_state)
         except RendererNotFoundError as e:
             # Fall back to old _write_network
             raise NotImplementedError from e
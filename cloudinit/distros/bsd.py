@@ -84,7 +84,7 @@ class BSD(distros.Distro):
                  'mac_address': mac, 'subnets': [{'type': 'dhcp'}]})
         return nconf
 
-    def install_packages(self, pkglist):
+    def _install_packages(self, pkglist):
         self.update_package_sources()
         self.package_command('install', pkgs=pkglist)
 
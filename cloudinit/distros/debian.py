@@ -107,7 +107,7 @@ class Distro(distros.Distro):
             # once we've updated the system config, invalidate cache
             self.system_locale = None
 
-    def install_packages(self, pkglist):
+    def _install_packages(self, pkglist):
         self.update_package_sources()
         self.package_command('install', pkgs=pkglist)
 
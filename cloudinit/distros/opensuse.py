@@ -65,7 +65,7 @@ class Distro(distros.Distro):
             locale_cfg = {'RC_LANG': locale}
         rhutil.update_sysconfig_file(out_fn, locale_cfg)
 
-    def install_packages(self, pkglist):
+    def _install_packages(self, pkglist):
         self.package_command(
             'install',
             args='--auto-agree-with-licenses',
@@ -0,0 +1,131 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Batch the packages that the modules of a stage install.
+
+Modules which install packages may define::
+
+    def package_intents(name, cfg, cloud, log, args):
+        # Return the packages handle would install, in any of the forms
+        # accepted by Distro.install_packages, without side effects.
+
+Modules which change the package sources, such as by adding a repository,
+may define::
+
+    def changes_package_sources(name, cfg, cloud, log, args):
+        # Return True when handle would change the package sources.
+
+Before a stage runs its modules, their intents are resolved into batches,
+each installed by a single package manager run just before the first module
+of the batch. A batch is only extended by later modules while no module in
+between changes the package sources, so packages are still installed from
+the sources configured by the modules running before them.
+
+The package indexes are refreshed before each batch. Modules which update
+or upgrade the installed packages leave their packages out of the batches,
+so they are still installed after the upgrade.
+
+Modules still call Distro.install_packages, which returns without running
+the package manager when a batch already installed all the packages asked
+for. When a batch fails, nothing is recorded as installed, so each module
+installs its own packages and reports its own errors as before.
+"""
+
+from cloudinit import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+def package_specs(pkglist):
+    """Return the (name, version) tuples of pkglist, version may be None.
+
+    pkglist is in any form accepted by Distro.install_packages: a package
+    name, a (name, version) tuple, or a list of either.
+    """
+    if not isinstance(pkglist, list):
+        pkglist = [pkglist]
+    specs = []
+    for pkg in pkglist:
+        if isinstance(pkg, str):
+            specs.append((pkg, None))
+        elif isinstance(pkg, (tuple, list)) and 1 <= len(pkg) <= 2:
+            version = pkg[1] if len(pkg) == 2 else None
+            specs.append((pkg[0], version or None))
+        else:
+            raise ValueError("Invalid package %r" % (pkg,))
+    return specs
+
+
+class PackagePlanner(object):
+    """Resolve package intents of modules into package manager runs.
+
+    @param distro: The Distro installing the packages.
+    """
+
+    def __init__(self, distro):
+        self.distro = distro
+        # Lists of (module name, specs), see plan
+        self.batches = {}
+        self.installed = set()
+
+    def plan(self, intents):
+        """Split the intents of the modules of a stage into batches.
+
+        @param intents: List of (module name, pkglist, changes_sources)
+            tuples in the order the modules run. Modules without packages
+            to install have an empty pkglist.
+        @returns: Dict of the position of the module to install each batch
+            before, to the list of (module name, specs) of the batch.
+        """
+        self.batches = {}
+        batch = None
+        for position, (name, pkglist, changes_sources) in enumerate(intents):
+            specs = package_specs(pkglist) if pkglist else []
+            if specs:
+                if batch is None:
+                    batch = self.batches[position] = []
+                batch.append((name, specs))
+            if changes_sources:
+                batch = None
+        return self.batches
+
+    def install(self, position):
+        """Install the batch planned before the module at position.
+
+        @returns: The list of modules whose packages were installed, which
+            is empty when there is no batch there or it failed.
+        """
+        batch = self.batches.pop(position, None)
+        if not batch:
+            return []
+        specs = []
+        for _name, module_specs in batch:
+            for spec in module_specs:
+                if spec not in specs and spec not in self.installed:
+                    specs.append(spec)
+        names = [name for name, _specs in batch]
+        if specs:
+            LOG.debug("Installing packages %s for modules %s", specs, names)
+            try:
+                # Modules such as package_update_upgrade_install refresh the
+                # indexes before installing, which not every distro's
+                # install_packages does
+                self.distro.update_package_sources()
+                self.distro.install_packages(specs)
+            except Exception as e:
+                LOG.warning(
+                    "Failed to install packages for modules %s together,"
+                    " each module will install its own: %s",
+                    ', '.join(names), e)
+                return []
+            self.installed.update(specs)
+        return names
+
+    def is_installed(self, pkglist):
+        """Return whether a batch installed every package of pkglist."""
+        try:
+            specs = package_specs(pkglist)
+        except ValueError:
+            return False
+        return bool(specs) and self.installed.issuperset(specs)
+
+# vi: ts=4 expandtab
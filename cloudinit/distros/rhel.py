@@ -62,7 +62,7 @@ class Distro(distros.Distro):
         self.osfamily = 'redhat'
         cfg['ssh_svcname'] = 'sshd'
 
-    def install_packages(self, pkglist):
+    def _install_packages(self, pkglist):
         self.package_command('install', pkgs=pkglist)
 
     def apply_locale(self, locale, out_fn=None):
@@ -8,6 +8,9 @@
 
 import functools
 import json
+import threading
+import time
+from concurrent import futures
 
 from cloudinit import log as logging
 from cloudinit import url_helper
@@ -50,7 +53,15 @@ class MetadataLeafDecoder(object):
 # See: http://docs.aws.amazon.com/AWSEC2/latest/UserGuide/
 #         ec2-instance-metadata.html
 class MetadataMaterializer(object):
-    def __init__(self, blob, base_url, caller, leaf_decoder=None):
+    """Crawl a metadata tree into a dict.
+
+    With max_workers greater than 1 the tree is crawled breadth-first and
+    all requests for one level of the tree are issued concurrently from a
+    thread pool. The result is identical to the sequential depth-first crawl.
+    """
+
+    def __init__(self, blob, base_url, caller, leaf_decoder=None,
+                 max_workers=1):
         self._blob = blob
         self._md = None
         self._base_url = base_url
@@ -59,6 +70,11 @@ class MetadataMaterializer(object):
             self._leaf_decoder = MetadataLeafDecoder()
         else:
             self._leaf_decoder = leaf_decoder
+        self._max_workers = max(int(max_workers), 1)
+        # Number of requests made and the sum of their durations in seconds
+        self.requests_made = 0
+        self.request_time = 0.0
+        self._stats_lock = threading.Lock()
 
     def _parse(self, blob):
         leaves = {}
@@ -106,9 +122,29 @@ class MetadataMaterializer(object):
     def materialize(self):
         if self._md is not None:
             return self._md
-        self._md = self._materialize(self._blob, self._base_url)
+        start = time.monotonic()
+        if self._max_workers > 1:
+            self._md = self._materialize_concurrently(
+                self._blob, self._base_url)
+        else:
+            self._md = self._materialize(self._blob, self._base_url)
+        wall_time = time.monotonic() - start
+        LOG.debug(
+            "Materialized %s with %d requests in %.3f seconds using %d"
+            " workers (%.3f seconds saved)", self._base_url,
+            self.requests_made, wall_time, self._max_workers,
+            max(self.request_time - wall_time, 0.0))
         return self._md
 
+    def _fetch(self, url):
+        start = time.monotonic()
+        try:
+            return self._caller(url)
+        finally:
+            with self._stats_lock:
+                self.requests_made += 1
+                self.request_time += time.monotonic() - start
+
     def _materialize(self, blob, base_url):
         (leaves, children) = self._parse(blob)
         child_contents = {}
@@ -116,13 +152,61 @@ class MetadataMaterializer(object):
             child_url = url_helper.combine_url(base_url, c)
             if not child_url.endswith("/"):
                 child_url += "/"
-            child_blob = self._caller(child_url)
+            child_blob = self._fetch(child_url)
             child_contents[c] = self._materialize(child_blob, child_url)
         leaf_contents = {}
         for (field, resource) in leaves.items():
             leaf_url = url_helper.combine_url(base_url, resource)
-            leaf_blob = self._caller(leaf_url)
+            leaf_blob = self._fetch(leaf_url)
             leaf_contents[field] = self._leaf_decoder(field, leaf_blob)
+        return self._join(base_url, child_contents, leaf_contents)
+
+    def _materialize_concurrently(self, blob, base_url):
+        root = {'blob': blob, 'url': base_url}
+        level = [root]
+        # Keep a connection alive for each worker
+        url_helper.get_session(base_url, pool_maxsize=self._max_workers)
+        with futures.ThreadPoolExecutor(
+            max_workers=self._max_workers, thread_name_prefix="md-crawl"
+        ) as executor:
+            while level:
+                urls = []
+                for node in level:
+                    (leaves, children) = self._parse(node['blob'])
+                    node['children'] = []
+                    for c in children:
+                        child_url = url_helper.combine_url(node['url'], c)
+                        if not child_url.endswith("/"):
+                            child_url += "/"
+                        node['children'].append((c, {'url': child_url}))
+                        urls.append(child_url)
+                    node['leaves'] = list(leaves.items())
+                    for (_field, resource) in node['leaves']:
+                        urls.append(
+                            url_helper.combine_url(node['url'], resource))
+                # map yields in submission order and raises the first
+                # exception encountered, matching the sequential crawl.
+                blobs = iter(list(executor.map(self._fetch, urls)))
+                next_level = []
+                for node in level:
+                    for (_c, child) in node['children']:
+                        child['blob'] = next(blobs)
+                        next_level.append(child)
+                    node['leaf_blobs'] = [
+                        (field, next(blobs)) for (field, _r) in node['leaves']]
+                level = next_level
+        return self._assemble(root)
+
+    def _assemble(self, node):
+        child_contents = {}
+        for (c, child) in node['children']:
+            child_contents[c] = self._assemble(child)
+        leaf_contents = {}
+        for (field, leaf_blob) in node['leaf_blobs']:
+            leaf_contents[field] = self._leaf_decoder(field, leaf_blob)
+        return self._join(node['url'], child_contents, leaf_contents)
+
+    def _join(self, base_url, child_contents, leaf_contents):
         joined = {}
         joined.update(child_contents)
         for field in leaf_contents.keys():
@@ -172,7 +256,7 @@ def _get_instance_metadata(tree, api_version='latest',
                            ssl_details=None, timeout=5, retries=5,
                            leaf_decoder=None, headers_cb=None,
                            headers_redact=None,
-                           exception_cb=None):
+                           exception_cb=None, max_workers=1):
     md_url = url_helper.combine_url(metadata_address, api_version, tree)
     caller = functools.partial(
         url_helper.read_file_or_url, ssl_details=ssl_details,
@@ -187,7 +271,8 @@ def _get_instance_metadata(tree, api_version='latest',
         response = caller(md_url)
         materializer = MetadataMaterializer(response.contents,
                                             md_url, mcaller,
-                                            leaf_decoder=leaf_decoder)
+                                            leaf_decoder=leaf_decoder,
+                                            max_workers=max_workers)
         md = materializer.materialize()
         if not isinstance(md, (dict)):
             md = {}
@@ -202,7 +287,7 @@ def get_instance_metadata(api_version='latest',
                           ssl_details=None, timeout=5, retries=5,
                           leaf_decoder=None, headers_cb=None,
                           headers_redact=None,
-                          exception_cb=None):
+                          exception_cb=None, max_workers=1):
     # Note, 'meta-data' explicitly has trailing /.
     # this is required for CloudStack (LP: #1356855)
     return _get_instance_metadata(tree='meta-data/', api_version=api_version,
@@ -211,7 +296,8 @@ def get_instance_metadata(api_version='latest',
                                   retries=retries, leaf_decoder=leaf_decoder,
                                   headers_redact=headers_redact,
                                   headers_cb=headers_cb,
-                                  exception_cb=exception_cb)
+                                  exception_cb=exception_cb,
+                                  max_workers=max_workers)
 
 
 def get_instance_identity(api_version='latest',
@@ -219,7 +305,7 @@ def get_instance_identity(api_version='latest',
                           ssl_details=None, timeout=5, retries=5,
                           leaf_decoder=None, headers_cb=None,
                           headers_redact=None,
-                          exception_cb=None):
+                          exception_cb=None, max_workers=1):
     return _get_instance_metadata(tree='dynamic/instance-identity',
                                   api_version=api_version,
                                   metadata_address=metadata_address,
@@ -227,5 +313,6 @@ def get_instance_identity(api_version='latest',
                                   retries=retries, leaf_decoder=leaf_decoder,
                                   headers_redact=headers_redact,
                                   headers_cb=headers_cb,
-                                  exception_cb=exception_cb)
+                                  exception_cb=exception_cb,
+                                  max_workers=max_workers)
 # vi: ts=4 expandtab
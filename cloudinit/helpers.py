@@ -166,6 +166,10 @@ class Runners(object):
             self.sems[sem_path] = FileSemaphores(sem_path)
         return self.sems[sem_path]
 
+    def has_run(self, name, freq=None):
+        sem = self._get_sem(freq)
+        return bool(sem) and sem.has_run(name, freq)
+
     def run(self, name, functor, args, freq=None, clear_on_fail=False):
         sem = self._get_sem(freq)
         if not sem:
@@ -353,6 +357,8 @@ class Paths(persistence.CloudInitPickleMixin):
             "instance_id": ".instance-id",
             "manual_clean_marker": "manual-clean",
             "warnings": "warnings",
+            "network_digests": "network-digests.json",
+            "swap_status": "swap-status.json",
         }
         # Set when a datasource becomes active
         self.datasource = ds
@@ -5,6 +5,7 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import contextlib
 import errno
 import functools
 import ipaddress
@@ -16,7 +17,7 @@ from typing import Any, Dict
 from cloudinit import subp
 from cloudinit import util
 from cloudinit.net.network_state import mask_to_net_prefix
-from cloudinit.url_helper import UrlError, readurl
+from cloudinit.url_helper import UrlError, close_sessions, readurl
 
 LOG = logging.getLogger(__name__)
 SYS_CLASS_NET = "/sys/class/net/"
@@ -365,6 +366,94 @@ def get_devicelist():
     return devs
 
 
+# Readers for the device attributes recorded by InterfaceInventory
+_INVENTORY_READERS = {
+    'address': lambda inv, dev: read_sys_net_safe(dev, 'address'),
+    'bond': lambda inv, dev: is_bond(dev),
+    'bridge': lambda inv, dev: is_bridge(dev),
+    'carrier': lambda inv, dev: read_sys_net_int(dev, 'carrier'),
+    'device_id': lambda inv, dev: device_devid(dev),
+    'dormant': lambda inv, dev: read_sys_net_int(dev, 'dormant'),
+    'driver': lambda inv, dev: device_driver(dev),
+    'ib_hwaddr': lambda inv, dev: get_ib_interface_hwaddr(dev, False),
+    'ib_hwaddr_ethernet': lambda inv, dev: get_ib_interface_hwaddr(dev, True),
+    'mac': lambda inv, dev: get_interface_mac(dev),
+    'master': lambda inv, dev: get_master(dev),
+    'master_is_bridge_or_bond': (
+        lambda inv, dev: master_is_bridge_or_bond(dev)),
+    'master_is_openvswitch': lambda inv, dev: master_is_openvswitch(dev),
+    'netfailover': (
+        lambda inv, dev: is_netfailover(dev, inv.get(dev, 'driver'))),
+    'openvswitch_internal': (
+        lambda inv, dev: is_openvswitch_internal_interface(dev)),
+    'operstate': lambda inv, dev: read_sys_net_safe(dev, 'operstate'),
+    'own_mac': lambda inv, dev: interface_has_own_mac(dev),
+    'renamed': lambda inv, dev: is_renamed(dev),
+    'up': lambda inv, dev: is_up(dev),
+    'vlan': lambda inv, dev: is_vlan(dev),
+}
+
+# The inventory shared by the helpers called within interface_inventory()
+_inventory = None
+
+
+class InterfaceInventory:
+    """A snapshot of the network devices on the system and their attributes.
+
+    The device list and each attribute of a device are read at most once per
+    snapshot, so helpers which walk all devices, such as get_interfaces,
+    find_fallback_nic_on_linux and _get_current_rename_info, share the reads
+    instead of repeating them. A snapshot must be invalidated once devices
+    are added or renamed.
+    """
+
+    def __init__(self):
+        self._devices = None
+        self._attrs = {}
+
+    @property
+    def devices(self) -> list:
+        if self._devices is None:
+            self._devices = get_devicelist()
+        return self._devices
+
+    def get(self, devname, attr):
+        """Return attr of devname, reading it on first use."""
+        key = (devname, attr)
+        if key not in self._attrs:
+            self._attrs[key] = _INVENTORY_READERS[attr](self, devname)
+        return self._attrs[key]
+
+    def invalidate(self):
+        """Discard everything read so far."""
+        self._devices = None
+        self._attrs = {}
+
+
+@contextlib.contextmanager
+def interface_inventory():
+    """Share one InterfaceInventory between the helpers called in a block.
+
+    Nested blocks share the inventory of the outermost block, which is
+    discarded when that block exits.
+    """
+    global _inventory
+    if _inventory is not None:
+        yield _inventory
+        return
+    _inventory = InterfaceInventory()
+    try:
+        yield _inventory
+    finally:
+        _inventory = None
+
+
+def invalidate_interface_inventory():
+    """Invalidate the shared inventory after devices were added or renamed."""
+    if _inventory is not None:
+        _inventory.invalidate()
+
+
 class ParserError(Exception):
     """Raised when a parser has issue parsing a file/content."""
 
@@ -419,21 +508,27 @@ def find_fallback_nic_on_linux(blacklist_drivers=None):
     if not blacklist_drivers:
         blacklist_drivers = []
 
+    with interface_inventory() as inventory:
+        return _find_fallback_nic_in_inventory(inventory, blacklist_drivers)
+
+
+def _find_fallback_nic_in_inventory(inventory, blacklist_drivers):
     if 'net.ifnames=0' in util.get_cmdline():
         LOG.debug('Stable ifnames disabled by net.ifnames=0 in /proc/cmdline')
     else:
-        unstable = [device for device in get_devicelist()
-                    if device != 'lo' and not is_renamed(device)]
+        unstable = [device for device in inventory.devices
+                    if device != 'lo' and not inventory.get(device, 'renamed')]
         if len(unstable):
             LOG.debug('Found unstable nic names: %s; calling udevadm settle',
                       unstable)
             msg = 'Waiting for udev events to settle'
             util.log_time(LOG.debug, msg, func=util.udevadm_settle)
+            inventory.invalidate()
 
     # get list of interfaces that could have connections
     invalid_interfaces = set(['lo'])
-    potential_interfaces = set([device for device in get_devicelist()
-                                if device_driver(device) not in
+    potential_interfaces = set([device for device in inventory.devices
+                                if inventory.get(device, 'driver') not in
                                 blacklist_drivers])
     potential_interfaces = potential_interfaces.difference(invalid_interfaces)
     # sort into interfaces with carrier, interfaces which could have carrier,
@@ -443,27 +538,27 @@ def find_fallback_nic_on_linux(blacklist_drivers=None):
     for interface in potential_interfaces:
         if interface.startswith("veth"):
             continue
-        if is_bridge(interface):
+        if inventory.get(interface, 'bridge'):
             # skip any bridges
             continue
-        if is_bond(interface):
+        if inventory.get(interface, 'bond'):
             # skip any bonds
             continue
-        if is_netfailover(interface):
+        if inventory.get(interface, 'netfailover'):
             # ignore netfailover primary/standby interfaces
             continue
-        carrier = read_sys_net_int(interface, 'carrier')
+        carrier = inventory.get(interface, 'carrier')
         if carrier:
             connected.append(interface)
             continue
         # check if nic is dormant or down, as this may make a nick appear to
         # not have a carrier even though it could acquire one when brought
         # online by dhclient
-        dormant = read_sys_net_int(interface, 'dormant')
+        dormant = inventory.get(interface, 'dormant')
         if dormant:
             possibly_connected.append(interface)
             continue
-        operstate = read_sys_net_safe(interface, 'operstate')
+        operstate = inventory.get(interface, 'operstate')
         if operstate in ['dormant', 'down', 'lowerlayerdown', 'unknown']:
             possibly_connected.append(interface)
             continue
@@ -484,7 +579,7 @@ def find_fallback_nic_on_linux(blacklist_drivers=None):
 
     # pick the first that has a mac-address
     for name in names:
-        if read_sys_net_safe(name, 'address'):
+        if inventory.get(name, 'address'):
             return name
     return None
 
@@ -618,15 +713,16 @@ def _get_current_rename_info(check_downable=True):
          }}
     """
     cur_info = {}
-    for (name, mac, driver, device_id) in get_interfaces():
-        cur_info[name] = {
-            'downable': None,
-            'device_id': device_id,
-            'driver': driver,
-            'mac': mac.lower(),
-            'name': name,
-            'up': is_up(name),
-        }
+    with interface_inventory() as inventory:
+        for (name, mac, driver, device_id) in get_interfaces():
+            cur_info[name] = {
+                'downable': None,
+                'device_id': device_id,
+                'driver': driver,
+                'mac': mac.lower(),
+                'name': name,
+                'up': inventory.get(name, 'up'),
+            }
 
     if check_downable:
         nmatch = re.compile(r"[0-9]+:\s+(\w+)[@:]")
@@ -790,6 +886,7 @@ def _rename_interfaces(renames, strict_present=True, strict_busy=True,
                 errors.append(
                     "[unknown] Error performing %s%s for %s, %s: %s" %
                     (op, params, mac, new_name, e))
+        invalidate_interface_inventory()
 
     if len(errors):
         raise Exception('\n'.join(errors))
@@ -897,22 +994,23 @@ def get_interfaces_by_mac_on_linux(blacklist_drivers=None) -> dict:
 
     Bridges and any devices that have a 'stolen' mac are excluded."""
     ret = {}
-    for name, mac, _driver, _devid in get_interfaces(
-            blacklist_drivers=blacklist_drivers):
-        if mac in ret:
-            raise RuntimeError(
-                "duplicate mac found! both '%s' and '%s' have mac '%s'" %
-                (name, ret[mac], mac))
-        ret[mac] = name
-        # Try to get an Infiniband hardware address (in 6 byte Ethernet format)
-        # for the interface.
-        ib_mac = get_ib_interface_hwaddr(name, True)
-        if ib_mac:
-            if ib_mac in ret:
+    with interface_inventory() as inventory:
+        for name, mac, _driver, _devid in get_interfaces(
+                blacklist_drivers=blacklist_drivers):
+            if mac in ret:
                 raise RuntimeError(
                     "duplicate mac found! both '%s' and '%s' have mac '%s'" %
-                    (name, ret[ib_mac], ib_mac))
-            ret[ib_mac] = name
+                    (name, ret[mac], mac))
+            ret[mac] = name
+            # Try to get an Infiniband hardware address (in 6 byte Ethernet
+            # format) for the interface.
+            ib_mac = inventory.get(name, 'ib_hwaddr_ethernet')
+            if ib_mac:
+                if ib_mac in ret:
+                    raise RuntimeError(
+                        "duplicate mac found! both '%s' and '%s' have mac"
+                        " '%s'" % (name, ret[ib_mac], ib_mac))
+                ret[ib_mac] = name
     return ret
 
 
@@ -923,38 +1021,38 @@ def get_interfaces(blacklist_drivers=None) -> list:
     ret = []
     if blacklist_drivers is None:
         blacklist_drivers = []
-    devs = get_devicelist()
     # 16 somewhat arbitrarily chosen.  Normally a mac is 6 '00:' tokens.
     zero_mac = ':'.join(('00',) * 16)
-    for name in devs:
-        if not interface_has_own_mac(name):
-            continue
-        if is_bridge(name):
-            continue
-        if is_vlan(name):
-            continue
-        if is_bond(name):
-            continue
-        if get_master(name) is not None:
-            if (not master_is_bridge_or_bond(name) and
-                    not master_is_openvswitch(name)):
+    with interface_inventory() as inventory:
+        for name in inventory.devices:
+            if not inventory.get(name, 'own_mac'):
                 continue
-        if is_netfailover(name):
-            continue
-        mac = get_interface_mac(name)
-        # some devices may not have a mac (tun0)
-        if not mac:
-            continue
-        # skip nics that have no mac (00:00....)
-        if name != 'lo' and mac == zero_mac[:len(mac)]:
-            continue
-        if is_openvswitch_internal_interface(name):
-            continue
-        # skip nics that have drivers blacklisted
-        driver = device_driver(name)
-        if driver in blacklist_drivers:
-            continue
-        ret.append((name, mac, driver, device_devid(name)))
+            if inventory.get(name, 'bridge'):
+                continue
+            if inventory.get(name, 'vlan'):
+                continue
+            if inventory.get(name, 'bond'):
+                continue
+            if inventory.get(name, 'master') is not None:
+                if (not inventory.get(name, 'master_is_bridge_or_bond') and
+                        not inventory.get(name, 'master_is_openvswitch')):
+                    continue
+            if inventory.get(name, 'netfailover'):
+                continue
+            mac = inventory.get(name, 'mac')
+            # some devices may not have a mac (tun0)
+            if not mac:
+                continue
+            # skip nics that have no mac (00:00....)
+            if name != 'lo' and mac == zero_mac[:len(mac)]:
+                continue
+            if inventory.get(name, 'openvswitch_internal'):
+                continue
+            # skip nics that have drivers blacklisted
+            driver = inventory.get(name, 'driver')
+            if driver in blacklist_drivers:
+                continue
+            ret.append((name, mac, driver, inventory.get(name, 'device_id')))
     return ret
 
 
@@ -962,14 +1060,15 @@ def get_ib_hwaddrs_by_interface():
     """Build a dictionary mapping Infiniband interface names to their hardware
     address."""
     ret = {}
-    for name, _, _, _ in get_interfaces():
-        ib_mac = get_ib_interface_hwaddr(name, False)
-        if ib_mac:
-            if ib_mac in ret:
-                raise RuntimeError(
-                    "duplicate mac found! both '%s' and '%s' have mac '%s'" %
-                    (name, ret[ib_mac], ib_mac))
-            ret[name] = ib_mac
+    with interface_inventory() as inventory:
+        for name, _, _, _ in get_interfaces():
+            ib_mac = inventory.get(name, 'ib_hwaddr')
+            if ib_mac:
+                if ib_mac in ret:
+                    raise RuntimeError(
+                        "duplicate mac found! both '%s' and '%s' have mac"
+                        " '%s'" % (name, ret[ib_mac], ib_mac))
+                ret[name] = ib_mac
     return ret
 
 
@@ -1111,6 +1210,10 @@ class EphemeralIPv4Network(object):
 
     def __exit__(self, excp_type, excp_value, excp_traceback):
         """Teardown anything we set up."""
+        if self.cleanup_cmds:
+            # Pooled keep-alive connections are bound to the address
+            # going away.
+            close_sessions()
         for cmd in self.cleanup_cmds:
             subp.subp(cmd, capture=True)
 
@@ -170,12 +170,13 @@ def _extract_bond_slaves_by_name(interfaces, entry, bond_master):
 def _clean_default(target=None):
     # clean out any known default files and derived files in target
     # LP: #1675576
+    # returns True if any files were removed
     tpath = subp.target_path(target, "etc/netplan/00-snapd-config.yaml")
     if not os.path.isfile(tpath):
-        return
+        return False
     content = util.load_file(tpath, decode=False)
     if content != KNOWN_SNAPD_CONFIG:
-        return
+        return False
 
     derived = [subp.target_path(target, f) for f in (
                'run/systemd/network/10-netplan-all-en.network',
@@ -187,6 +188,7 @@ def _clean_default(target=None):
 
     for f in [tpath] + existing:
         os.unlink(f)
+    return True
 
 
 class Renderer(renderer.Renderer):
@@ -234,10 +236,14 @@ class Renderer(renderer.Renderer):
 
         if not header.endswith("\n"):
             header += "\n"
-        util.write_file(fpnplan, header + content)
+        changed = renderer.write_file_if_changed(fpnplan, header + content)
 
-        if self.clean_default:
-            _clean_default(target=target)
+        if self.clean_default and _clean_default(target=target):
+            changed = True
+        if not changed:
+            LOG.debug("netplan config %s unchanged, skipping postcmds",
+                      fpnplan)
+            return
         self._netplan_generate(run=self._postcmds)
         self._net_setup_link(run=self._postcmds)
 
@@ -6,6 +6,8 @@
 
 import copy
 import functools
+import hashlib
+import json
 import logging
 import socket
 import struct
@@ -29,6 +31,10 @@ NETWORK_V2_KEY_FILTER = [
     'renderer', 'set-name', 'wakeonlan', 'accept-ra'
 ]
 
+# Sections of a version 2 config which are keyed by device
+NETWORK_V2_DEVICE_SECTIONS = ('ethernets', 'bonds', 'bridges', 'vlans',
+                              'wifis')
+
 NET_CONFIG_TO_V2 = {
     'bond': {'bond-ad-select': 'ad-select',
              'bond-arp-interval': 'arp-interval',
@@ -150,6 +156,46 @@ class NetworkState(object):
             self._has_default_route = self._maybe_has_default_route()
         return self._has_default_route
 
+    def digests(self):
+        """Return digests of the configuration of each interface.
+
+        Two network states render the same configuration for an interface
+        when its digests are equal. Routes, dns and any other settings which
+        are not specific to one interface are digested under 'shared'.
+
+        @returns: Dict with the 'shared' digest and an 'interfaces' dict of
+            interface name to digest.
+        """
+        def digest(obj):
+            return hashlib.sha256(json.dumps(
+                obj, sort_keys=True, default=str).encode()).hexdigest()
+
+        interfaces = {
+            name: [iface] for name, iface in
+            self._network_state.get('interfaces', {}).items()}
+        shared = {key: value for key, value in self._network_state.items()
+                  if key not in ('interfaces', 'config')}
+        if self.version == 2 and isinstance(self.config, dict):
+            # netplan renders the version 2 config itself, so settings not
+            # kept in the interface state still belong to their device
+            shared['config'] = {
+                key: value for key, value in self.config.items()
+                if key not in NETWORK_V2_DEVICE_SECTIONS}
+            for section in NETWORK_V2_DEVICE_SECTIONS:
+                for dev_id, cfg in (self.config.get(section) or {}).items():
+                    name = dev_id
+                    if isinstance(cfg, dict):
+                        name = cfg.get('set-name', dev_id)
+                    if name in interfaces:
+                        interfaces[name].append(cfg)
+                    else:
+                        shared['config'][section + '.' + dev_id] = cfg
+        return {
+            'shared': digest(shared),
+            'interfaces': {
+                name: digest(cfg) for name, cfg in interfaces.items()},
+        }
+
     def iter_interfaces(self, filter_func=None):
         ifaces = self._network_state.get('interfaces', {})
         for iface in ifaces.values():
@@ -211,8 +211,8 @@ class Renderer(renderer.Renderer):
         LOG.debug('Setting Networking Config for %s', link)
 
         net_fn = nwk_dir + '10-cloud-init-' + link + '.network'
-        util.write_file(net_fn, conf)
-        util.chownbyname(net_fn, net_fn_owner, net_fn_owner)
+        if renderer.write_file_if_changed(net_fn, conf):
+            util.chownbyname(net_fn, net_fn_owner, net_fn_owner)
 
     def render_network_state(self, network_state, templates=None, target=None):
         fp_nwkd = self.network_conf_dir
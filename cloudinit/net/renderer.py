@@ -7,7 +7,9 @@
 
 import abc
 import io
+import os
 
+from cloudinit import util
 from cloudinit.net.network_state import parse_net_config_data
 from cloudinit.net.udev import generate_udev_rule
 
@@ -27,6 +29,27 @@ def filter_by_attr(match_name):
 filter_by_physical = filter_by_type('physical')
 
 
+def write_file_if_changed(path, content, mode=0o644):
+    """Write content to path unless the file already has that content.
+
+    Unchanged files keep their mtime, so services and path units watching
+    the network configuration are not triggered by a render which changed
+    nothing.
+
+    @returns: True if the file was written, False if it was left alone.
+    """
+    try:
+        unchanged = (
+            util.load_file(path) == content and
+            os.stat(path).st_mode & 0o7777 == mode)
+    except (IOError, OSError, UnicodeDecodeError):
+        unchanged = False
+    if unchanged:
+        return False
+    util.write_file(path, content, mode)
+    return True
+
+
 class Renderer(object):
     def __init__(self, config=None):
         pass
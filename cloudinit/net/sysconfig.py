@@ -913,24 +913,27 @@ class Renderer(renderer.Renderer):
         for path, data in self._render_sysconfig(base_sysconf_dir,
                                                  network_state, self.flavor,
                                                  templates=templates).items():
-            util.write_file(path, data, file_mode)
+            renderer.write_file_if_changed(path, data, file_mode)
         if self.dns_path:
             dns_path = subp.target_path(target, self.dns_path)
             resolv_content = self._render_dns(network_state,
                                               existing_dns_path=dns_path)
             if resolv_content:
-                util.write_file(dns_path, resolv_content, file_mode)
+                renderer.write_file_if_changed(
+                    dns_path, resolv_content, file_mode)
         if self.networkmanager_conf_path:
             nm_conf_path = subp.target_path(target,
                                             self.networkmanager_conf_path)
             nm_conf_content = self._render_networkmanager_conf(network_state,
                                                                templates)
             if nm_conf_content:
-                util.write_file(nm_conf_path, nm_conf_content, file_mode)
+                renderer.write_file_if_changed(
+                    nm_conf_path, nm_conf_content, file_mode)
         if self.netrules_path:
             netrules_content = self._render_persistent_net(network_state)
             netrules_path = subp.target_path(target, self.netrules_path)
-            util.write_file(netrules_path, netrules_content, file_mode)
+            renderer.write_file_if_changed(
+                netrules_path, netrules_content, file_mode)
         if available_nm(target=target):
             enable_ifcfg_rh(subp.target_path(
                 target, path=NM_CFG_FILE
@@ -944,8 +947,8 @@ class Renderer(renderer.Renderer):
             if network_state.use_ipv6:
                 netcfg.append('NETWORKING_IPV6=yes')
                 netcfg.append('IPV6_AUTOCONF=no')
-            util.write_file(sysconfig_path,
-                            "\n".join(netcfg) + "\n", file_mode)
+            renderer.write_file_if_changed(
+                sysconfig_path, "\n".join(netcfg) + "\n", file_mode)
 
 
 def _supported_vlan_names(rdev, vid):
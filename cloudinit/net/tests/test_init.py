@@ -519,6 +519,88 @@ class TestGetInterfaceMAC(CiTestCase):
                          sorted(interface_names))
 
 
+@mock.patch(
+    "cloudinit.net.is_openvswitch_internal_interface",
+    mock.Mock(return_value=False),
+)
+class TestInterfaceInventory(CiTestCase):
+
+    def setUp(self):
+        super(TestInterfaceInventory, self).setUp()
+        sys_mock = mock.patch('cloudinit.net.get_sys_class_path')
+        self.m_sys_path = sys_mock.start()
+        self.sysdir = self.tmp_dir() + '/'
+        self.m_sys_path.return_value = self.sysdir
+        self.addCleanup(sys_mock.stop)
+        self.add_patch('cloudinit.net.util.is_container', 'm_is_container',
+                       return_value=False)
+        self.add_patch('cloudinit.net.util.udevadm_settle', 'm_settle')
+
+    def _write_nic(self, name, mac):
+        write_file(os.path.join(self.sysdir, name, 'addr_assign_type'), '0')
+        write_file(os.path.join(self.sysdir, name, 'address'), mac)
+        write_file(os.path.join(self.sysdir, name, 'carrier'), '1')
+        write_file(os.path.join(self.sysdir, name, 'name_assign_type'), '4')
+
+    @mock.patch('cloudinit.net.device_driver', return_value='virtio_net')
+    def test_helpers_share_reads_within_inventory(self, m_driver):
+        """Helpers called in one inventory block read each attribute once."""
+        self._write_nic('eth0', 'aa:bb:cc:aa:bb:cc')
+        self._write_nic('eth1', 'dd:ee:ff:dd:ee:ff')
+        with net.interface_inventory():
+            self.assertEqual(
+                {'aa:bb:cc:aa:bb:cc': 'eth0', 'dd:ee:ff:dd:ee:ff': 'eth1'},
+                net.get_interfaces_by_mac())
+            self.assertEqual('eth0', net.find_fallback_nic())
+            self.assertCountEqual(
+                ['eth0', 'eth1'],
+                net._get_current_rename_info(check_downable=False).keys())
+        self.assertCountEqual(
+            [mock.call('eth0'), mock.call('eth1')], m_driver.call_args_list)
+
+    def test_helpers_read_devices_on_each_call_outside_inventory(self):
+        """Without an inventory block each call sees the current devices."""
+        self._write_nic('eth0', 'aa:bb:cc:aa:bb:cc')
+        self.assertEqual(['eth0'], [i[0] for i in net.get_interfaces()])
+        self._write_nic('eth1', 'dd:ee:ff:dd:ee:ff')
+        self.assertCountEqual(
+            ['eth0', 'eth1'], [i[0] for i in net.get_interfaces()])
+
+    def test_invalidate_rereads_devices(self):
+        """New devices are seen after the inventory is invalidated."""
+        self._write_nic('eth0', 'aa:bb:cc:aa:bb:cc')
+        with net.interface_inventory() as inventory:
+            self.assertEqual(['eth0'], [i[0] for i in net.get_interfaces()])
+            self._write_nic('eth1', 'dd:ee:ff:dd:ee:ff')
+            self.assertEqual(['eth0'], [i[0] for i in net.get_interfaces()])
+            net.invalidate_interface_inventory()
+            self.assertCountEqual(
+                ['eth0', 'eth1'], [i[0] for i in net.get_interfaces()])
+            with net.interface_inventory() as nested:
+                self.assertIs(inventory, nested)
+
+    @mock.patch('cloudinit.net.subp.subp')
+    def test_rename_invalidates_inventory(self, m_subp):
+        """Renamed devices are seen by helpers called after the rename."""
+        mac = 'aa:bb:cc:aa:bb:cc'
+        self._write_nic('eth0', mac)
+
+        def rename(cmd, capture):
+            if cmd[-2] == 'name':
+                os.rename(os.path.join(self.sysdir, cmd[-3]),
+                          os.path.join(self.sysdir, cmd[-1]))
+            return '', ''
+
+        m_subp.side_effect = rename
+        with net.interface_inventory():
+            self.assertEqual({mac: 'eth0'}, net.get_interfaces_by_mac())
+            net._rename_interfaces(
+                [[mac, 'ens3', None, None]],
+                current_info=net._get_current_rename_info(
+                    check_downable=False))
+            self.assertEqual({mac: 'ens3'}, net.get_interfaces_by_mac())
+
+
 class TestInterfaceHasOwnMAC(CiTestCase):
 
     def setUp(self):
@@ -614,6 +696,23 @@ class TestEphemeralIPV4Network(CiTestCase):
             self.assertEqual(expected_setup_calls, m_subp.call_args_list)
         m_subp.assert_has_calls(expected_teardown_calls)
 
+    @mock.patch('cloudinit.net.close_sessions')
+    def test_ephemeral_ipv4_network_teardown_closes_sessions(
+            self, m_close_sessions, m_subp):
+        """Pooled url sessions are closed when the network is torn down."""
+        params = {
+            'interface': 'eth0', 'ip': '192.168.2.2',
+            'prefix_or_mask': '255.255.255.0', 'broadcast': '192.168.2.255'}
+        with net.EphemeralIPv4Network(**params):
+            self.assertEqual(0, m_close_sessions.call_count)
+        m_close_sessions.assert_called_once_with()
+        # Nothing is torn down when the interface was already configured
+        m_subp.side_effect = ProcessExecutionError(
+            '', 'RTNETLINK answers: File exists', 2)
+        with net.EphemeralIPv4Network(**params):
+            pass
+        self.assertEqual(1, m_close_sessions.call_count)
+
     @mock.patch('cloudinit.net.readurl')
     def test_ephemeral_ipv4_no_network_if_url_connectivity(
             self, m_readurl, m_subp):
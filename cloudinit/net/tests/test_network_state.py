@@ -161,4 +161,46 @@ class TestNetworkStateParseNameservers:
             'spam.local',
         ] == sorted(config.dns_searchdomains)
 
+
+class TestNetworkStateDigests(CiTestCase):
+
+    def _digests(self, config):
+        return network_state.parse_net_config_data(
+            safeyaml.load(config)['network']).digests()
+
+    def test_digests_are_stable(self):
+        """Equal configs have equal digests."""
+        self.assertEqual(self._digests(V1_CONFIG_NAMESERVERS_VALID),
+                         self._digests(V1_CONFIG_NAMESERVERS_VALID))
+
+    def test_v1_interface_change_only_changes_its_digest(self):
+        """Changing one interface leaves the other digests alone."""
+        before = self._digests(V1_CONFIG_NAMESERVERS_VALID)
+        after = self._digests(V1_CONFIG_NAMESERVERS_VALID.replace(
+            '66:77:88:99:00:11', '66:77:88:99:00:12'))
+        self.assertEqual(before['shared'], after['shared'])
+        self.assertEqual(before['interfaces']['eth0'],
+                         after['interfaces']['eth0'])
+        self.assertNotEqual(before['interfaces']['eth1'],
+                            after['interfaces']['eth1'])
+
+    def test_v1_shared_change_changes_shared_digest(self):
+        """Global nameservers are digested under shared."""
+        before = self._digests(V1_CONFIG_NAMESERVERS_VALID)
+        after = self._digests(V1_CONFIG_NAMESERVERS_VALID.replace(
+            '4.4.4.4', '4.4.4.5'))
+        self.assertNotEqual(before['shared'], after['shared'])
+
+    def test_v2_device_settings_belong_to_the_renamed_interface(self):
+        """Version 2 device settings are digested with their interface."""
+        before = self._digests(V2_CONFIG_NAMESERVERS)
+        after = self._digests(V2_CONFIG_NAMESERVERS.replace(
+            'set-name: "ens92"', 'set-name: "ens92"\n      optional: true'))
+        self.assertEqual(['eth0', 'ens92'], list(after['interfaces']))
+        self.assertEqual(before['shared'], after['shared'])
+        self.assertEqual(before['interfaces']['eth0'],
+                         after['interfaces']['eth0'])
+        self.assertNotEqual(before['interfaces']['ens92'],
+                            after['interfaces']['ens92'])
+
 # vi: ts=4 expandtab
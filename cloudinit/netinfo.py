@@ -10,11 +10,14 @@
 
 from copy import copy, deepcopy
 import re
+import socket
+import struct
 
 from cloudinit import log as logging
 from cloudinit.net.network_state import net_prefix_to_ipv4_mask
 from cloudinit import subp
 from cloudinit import util
+from cloudinit.sources.helpers import netlink
 
 from cloudinit.simpletable import SimpleTable
 
@@ -28,6 +31,96 @@ DEFAULT_NETDEV_INFO = {
     "up": False
 }
 
+# Interface flags and types from linux/if.h and linux/if_arp.h
+IFF_UP = 0x1
+IFF_LOWER_UP = 0x10000
+ARPHRD_ETHER = 1
+
+# Route attributes from linux/rtnetlink.h
+RT_TABLE_MAIN = 254
+RTM_F_CLONED = 0x200
+RTMSG = struct.Struct(netlink.RTMSG_FMT)
+
+# Scope names as printed by iproute2, from /etc/iproute2/rt_scopes
+RT_SCOPES = {0: 'global', 200: 'site', 253: 'link', 254: 'host',
+             255: 'nowhere'}
+
+
+def _netlink_dump(msg_type, request):
+    """Return the messages of an rtnetlink dump, or None if it fails."""
+    try:
+        return netlink.dump_netlink_messages(msg_type, request)
+    except (netlink.NetlinkCreateSocketError,
+            netlink.NetlinkDumpError) as e:
+        LOG.debug("Could not read rtnetlink dump: %s", e)
+        return None
+
+
+def _netdev_info_netlink():
+    """
+    Get network device dicts from rtnetlink link and address dumps.
+
+    @returns: A dict of device info keyed by network device name containing
+              the same values as _netdev_info_iproute, or None if netlink
+              is not available.
+    """
+    links = _netlink_dump(
+        netlink.RTM_GETLINK,
+        struct.pack(netlink.IFINFOMSG_FMT, socket.AF_UNSPEC, 0, 0, 0, 0))
+    if links is None:
+        return None
+    addrs = _netlink_dump(
+        netlink.RTM_GETADDR,
+        struct.pack(netlink.IFADDRMSG_FMT, socket.AF_UNSPEC, 0, 0, 0, 0))
+    if addrs is None:
+        return None
+    devs = {}
+    names = {}
+    for nl_msg in links:
+        _family, if_type, index, flags, _change = struct.unpack_from(
+            netlink.IFINFOMSG_FMT, nl_msg, netlink.NLMSGHDR_SIZE)
+        attrs = netlink.unpack_rta_attrs(nl_msg, netlink.RTATTR_START_OFFSET)
+        if netlink.IFLA_IFNAME not in attrs:
+            continue
+        dev_name = attrs[netlink.IFLA_IFNAME].rstrip(b'\0').decode().lower()
+        names[index] = dev_name
+        hwaddr = ''
+        if if_type == ARPHRD_ETHER and netlink.IFLA_ADDRESS in attrs:
+            hwaddr = ':'.join(
+                '%02x' % octet for octet in attrs[netlink.IFLA_ADDRESS])
+        devs[dev_name] = {
+            'ipv4': [], 'ipv6': [], 'hwaddr': hwaddr,
+            'up': bool(flags & IFF_UP and flags & IFF_LOWER_UP),
+        }
+    for nl_msg in addrs:
+        family, prefix, _flags, scope, index = struct.unpack_from(
+            netlink.IFADDRMSG_FMT, nl_msg, netlink.NLMSGHDR_SIZE)
+        attrs = netlink.unpack_rta_attrs(
+            nl_msg, netlink.NLMSGHDR_SIZE + netlink.IFADDRMSG_SIZE)
+        dev = devs.get(names.get(index))
+        if dev is None:
+            continue
+        scope = RT_SCOPES.get(scope, str(scope))
+        if family == socket.AF_INET:
+            # The local address, as the address is the peer's on ptp links
+            addr = attrs.get(netlink.IFA_LOCAL, attrs.get(netlink.IFA_ADDRESS))
+            if not addr:
+                continue
+            bcast = attrs.get(netlink.IFA_BROADCAST)
+            dev['ipv4'].append({
+                'ip': socket.inet_ntop(family, addr),
+                'bcast': socket.inet_ntop(family, bcast) if bcast else '',
+                'mask': net_prefix_to_ipv4_mask(prefix),
+                'scope': scope})
+        elif family == socket.AF_INET6:
+            addr = attrs.get(netlink.IFA_ADDRESS)
+            if not addr:
+                continue
+            dev['ipv6'].append({
+                'ip': '%s/%d' % (socket.inet_ntop(family, addr), prefix),
+                'scope6': scope})
+    return devs
+
 
 def _netdev_info_iproute(ipaddr_out):
     """
@@ -197,7 +290,10 @@ def _netdev_info_ifconfig(ifconfig_data):
 
 def netdev_info(empty=""):
     devs = {}
-    if util.is_NetBSD():
+    netlink_devs = _netdev_info_netlink() if util.is_Linux() else None
+    if netlink_devs is not None:
+        devs = netlink_devs
+    elif util.is_NetBSD():
         (ifcfg_out, _err) = subp.subp(["ifconfig", "-a"], rcs=[0, 1])
         devs = _netdev_info_ifconfig_netbsd(ifcfg_out)
     elif subp.which('ip'):
@@ -319,6 +415,111 @@ def _netdev_route_info_iproute(iproute_data):
     return routes
 
 
+def _netdev_route_info_netlink():
+    """
+    Get network route dicts from an rtnetlink route dump.
+
+    IPv4 routes are read from the main table, like 'ip route list', and IPv6
+    routes from all tables, like 'ip -6 route list table all'.
+
+    @returns: A dict containing ipv4 and ipv6 route entries as lists, with
+              the same values as _netdev_route_info_iproute, or None if
+              netlink is not available.
+    """
+    dump = _netlink_dump(
+        netlink.RTM_GETROUTE,
+        struct.pack(netlink.RTMSG_FMT, socket.AF_UNSPEC, 0, 0, 0, 0, 0, 0, 0,
+                    0))
+    if dump is None:
+        return None
+    routes = {}
+    routes['ipv4'] = []
+    routes['ipv6'] = []
+    # Routing tables can hold many thousands of routes, so keep lookups out
+    # of the loop and decode the values shared by many routes only once
+    af_inet, af_inet6 = socket.AF_INET, socket.AF_INET6
+    rta_dst, rta_gateway = netlink.RTA_DST, netlink.RTA_GATEWAY
+    rta_oif, rta_priority = netlink.RTA_OIF, netlink.RTA_PRIORITY
+    rta_cacheinfo = netlink.RTA_CACHEINFO
+    unpack_rtmsg = RTMSG.unpack_from
+    unpack_rta_attrs = netlink.unpack_rta_attrs
+    inet_ntop = socket.inet_ntop
+    header_size = netlink.NLMSGHDR_SIZE
+    attrs_offset = netlink.NLMSGHDR_SIZE + netlink.RTMSG_SIZE
+    ifaces = dict(
+        (struct.pack('i', index), name)
+        for index, name in socket.if_nameindex())
+    gateways = {}
+    masks = {}
+    metrics = {}
+    for nl_msg in dump:
+        (family, dst_len, _src_len, _tos, table, _protocol, _scope, _type,
+         flags) = unpack_rtmsg(nl_msg, header_size)
+        if flags & RTM_F_CLONED:
+            continue
+        if family == af_inet and table != RT_TABLE_MAIN:
+            continue
+        attrs = unpack_rta_attrs(nl_msg, attrs_offset)
+        gateway = attrs.get(rta_gateway)
+        if gateway:
+            if gateway not in gateways:
+                gateways[gateway] = inet_ntop(family, gateway)
+            gateway = gateways[gateway]
+        if family == af_inet:
+            entry = {
+                'destination': '', 'flags': '', 'gateway': '', 'genmask': '',
+                'iface': '', 'metric': ''}
+            flags = ['U']
+            if dst_len == 0:
+                entry['destination'] = "0.0.0.0"
+                entry['genmask'] = "0.0.0.0"
+            else:
+                if dst_len == 32:
+                    flags.append("H")
+                if dst_len not in masks:
+                    masks[dst_len] = net_prefix_to_ipv4_mask(dst_len)
+                entry['destination'] = inet_ntop(family, attrs[rta_dst])
+                entry['genmask'] = masks[dst_len]
+                entry['gateway'] = "0.0.0.0"
+            if gateway:
+                entry['gateway'] = gateway
+                flags.insert(1, "G")
+            entry['flags'] = ''.join(flags)
+            routes['ipv4'].append(entry)
+        elif family == af_inet6:
+            entry = {}
+            if dst_len == 0:
+                entry['destination'] = "::/0"
+                entry['flags'] = "UG"
+            else:
+                entry['destination'] = inet_ntop(family, attrs[rta_dst])
+                if dst_len != 128:
+                    entry['destination'] += '/%d' % dst_len
+                entry['gateway'] = "::"
+                entry['flags'] = "U"
+            if gateway:
+                entry['gateway'] = gateway
+                entry['flags'] = "UG"
+            cacheinfo = attrs.get(rta_cacheinfo)
+            # struct rta_cacheinfo: clntref, lastuse, expires, ...
+            if cacheinfo and cacheinfo[8:12] != b'\0\0\0\0':
+                entry['flags'] = entry['flags'] + 'e'
+            routes['ipv6'].append(entry)
+        else:
+            continue
+        oif = attrs.get(rta_oif)
+        if oif:
+            if oif not in ifaces:
+                ifaces[oif] = str(struct.unpack('i', oif)[0])
+            entry['iface'] = ifaces[oif]
+        priority = attrs.get(rta_priority)
+        if priority:
+            if priority not in metrics:
+                metrics[priority] = str(struct.unpack('I', priority)[0])
+            entry['metric'] = metrics[priority]
+    return routes
+
+
 def _netdev_route_info_netstat(route_data):
     routes = {}
     routes['ipv4'] = []
@@ -394,7 +595,10 @@ def _netdev_route_info_netstat(route_data):
 
 def route_info():
     routes = {}
-    if subp.which('ip'):
+    netlink_routes = _netdev_route_info_netlink() if util.is_Linux() else None
+    if netlink_routes is not None:
+        routes = netlink_routes
+    elif subp.which('ip'):
         # Try iproute first of all
         (iproute_out, _err) = subp.subp(["ip", "-o", "route", "list"])
         routes = _netdev_route_info_iproute(iproute_out)
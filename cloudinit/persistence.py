@@ -4,6 +4,32 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import importlib
+import io
+import json
+import pickle
+import struct
+import sys
+
+from cloudinit import version
+
+# Leading bytes of an indexed cache. Pickles always start with b"\x80" so
+# the two formats can be told apart from the first byte.
+INDEXED_CACHE_MAGIC = b"CI-CACHE"
+INDEXED_CACHE_VERSION = 1
+# magic, format version, length of the JSON header which follows
+_INDEXED_CACHE_PREAMBLE = struct.Struct("!8sHI")
+_OWNER_PID = "owner"
+# Persistent ids of references to other attributes are (_ATTR_PID, name)
+_ATTR_PID = "attr"
+# Objects which pickle does not need to share between attributes
+_UNSHARED_TYPES = (
+    str, bytes, int, float, complex, bool, type(None), tuple, frozenset)
+
+
+class IndexedCacheError(Exception):
+    """Raised when an indexed cache is malformed, unsupported or stale."""
+
 
 class CloudInitPickleMixin:
     """Scaffolding for versioning of pickles.
@@ -23,6 +49,30 @@ class CloudInitPickleMixin:
 
     _ci_pkl_version = 0
 
+    def __getattr__(self, name):
+        """Load an attribute deferred by load_indexed_cache on first use."""
+        lazy_attrs = self.__dict__.get("_ci_lazy_attrs")
+        if not lazy_attrs or name not in lazy_attrs:
+            raise AttributeError(
+                "'%s' object has no attribute '%s'" % (
+                    type(self).__name__, name))
+        return self._ci_load_lazy_attr(name)
+
+    def _ci_load_lazy_attr(self, name):
+        """Return attribute name, loading it if deferred by
+        load_indexed_cache."""
+        if name not in self.__dict__:
+            loader = self.__dict__["_ci_lazy_attrs"].pop(name)
+            self.__dict__[name] = loader()
+        return self.__dict__[name]
+
+    def _ci_load_lazy_attrs(self) -> None:
+        """Load every attribute still deferred by load_indexed_cache."""
+        lazy_attrs = self.__dict__.get("_ci_lazy_attrs")
+        while lazy_attrs:
+            self._ci_load_lazy_attr(next(iter(lazy_attrs)))
+        self.__dict__.pop("_ci_lazy_attrs", None)
+
     def __getstate__(self):
         """Persist instance state, adding a pickle version attribute.
 
@@ -31,7 +81,9 @@ class CloudInitPickleMixin:
         ``__setstate__`` on unpickle.
 
         The value of ``_ci_pkl_version`` is ``type(self)._ci_pkl_version``.
+        Any attributes not yet loaded from an indexed cache are loaded first.
         """
+        self._ci_load_lazy_attrs()
         state = self.__dict__.copy()
         state["_ci_pkl_version"] = type(self)._ci_pkl_version
         return state
@@ -64,4 +116,217 @@ class CloudInitPickleMixin:
         """
 
 
+class _AttrPickler(pickle.Pickler):
+    """Pickle an attribute, storing references to its owner by id only.
+
+    Values of the owner's attributes in shared_attrs, a dict mapping their
+    id() to the attribute name, are also stored by name only.
+    """
+
+    def __init__(self, fp, owner, shared_attrs=None):
+        super().__init__(fp, protocol=pickle.HIGHEST_PROTOCOL)
+        self._owner = owner
+        self._shared_attrs = shared_attrs or {}
+        self.referenced_attrs = set()
+
+    def persistent_id(self, obj):
+        if obj is self._owner:
+            return _OWNER_PID
+        name = self._shared_attrs.get(id(obj))
+        if name is not None:
+            self.referenced_attrs.add(name)
+            return (_ATTR_PID, name)
+        return None
+
+
+class _AttrUnpickler(pickle.Unpickler):
+    """Unpickle an attribute, resolving references to its owner and to the
+    owner's other attributes."""
+
+    def __init__(self, fp, owner):
+        super().__init__(fp)
+        self._owner = owner
+
+    def persistent_load(self, pid):
+        if pid == _OWNER_PID:
+            return self._owner
+        if isinstance(pid, tuple) and len(pid) == 2 and pid[0] == _ATTR_PID:
+            try:
+                return self._owner._ci_load_lazy_attr(pid[1])
+            except KeyError:
+                pass
+        raise pickle.UnpicklingError("unsupported persistent id %r" % pid)
+
+
+def _dump_order(obj, state: dict) -> list:
+    """Return the names in state ordered so that attributes whose value is
+    referenced from another attribute come before it.
+
+    dump_indexed_cache only stores references to attributes dumped earlier,
+    so that loading an attribute never needs an attribute which is still
+    being loaded. When attributes reference each other in a cycle, one of
+    those references is restored as a separate copy.
+    """
+    shared_attrs = {}
+    for name, value in state.items():
+        if not isinstance(value, _UNSHARED_TYPES):
+            shared_attrs.setdefault(id(value), name)
+    references = {}
+    for name, value in state.items():
+        others = {
+            value_id: other for value_id, other in shared_attrs.items()
+            if other != name
+        }
+        pickler = _AttrPickler(io.BytesIO(), obj, others)
+        pickler.dump(value)
+        references[name] = pickler.referenced_attrs
+    order = []
+    visiting = set()
+
+    def visit(name):
+        if name in order or name in visiting:
+            return
+        visiting.add(name)
+        for referenced in state:
+            if referenced in references[name]:
+                visit(referenced)
+        visiting.discard(name)
+        order.append(name)
+
+    for name in state:
+        visit(name)
+    return order
+
+
+def _python_version():
+    return "%d.%d" % (sys.version_info.major, sys.version_info.minor)
+
+
+def is_indexed_cache(blob: bytes) -> bool:
+    """Return True if blob is in the indexed cache format."""
+    return blob[:len(INDEXED_CACHE_MAGIC)] == INDEXED_CACHE_MAGIC
+
+
+def dump_indexed_cache(obj: CloudInitPickleMixin) -> bytes:
+    """Serialize obj in the indexed cache format.
+
+    The format is a fixed preamble (magic, format version and header length)
+    followed by a JSON header and the payload. The header records the python
+    and cloud-init versions which wrote it, obj's class and
+    ``_ci_pkl_version`` and the offset and length of each instance attribute
+    in the payload. Each attribute is pickled separately so that
+    load_indexed_cache can defer unpickling it until it is used. References
+    back to obj itself, and to the value of another attribute of obj, such
+    as a datasource's ``paths`` from its ``distro``, are preserved; other
+    objects shared between attributes are restored as separate copies.
+    """
+    state = obj.__getstate__()
+    ci_pkl_version = state.pop("_ci_pkl_version", 0)
+    attrs = {}
+    shared_attrs = {}
+    payload = io.BytesIO()
+    for name in _dump_order(obj, state):
+        value = state[name]
+        offset = payload.tell()
+        _AttrPickler(payload, obj, shared_attrs).dump(value)
+        attrs[name] = [offset, payload.tell() - offset]
+        if not isinstance(value, _UNSHARED_TYPES):
+            shared_attrs.setdefault(id(value), name)
+    cls = type(obj)
+    header = json.dumps({
+        "python": _python_version(),
+        "cloudinit": version.version_string(),
+        "class": [cls.__module__, cls.__qualname__],
+        "ci_pkl_version": ci_pkl_version,
+        "attrs": attrs,
+        "payload_length": payload.tell(),
+    }, separators=(",", ":")).encode("utf-8")
+    preamble = _INDEXED_CACHE_PREAMBLE.pack(
+        INDEXED_CACHE_MAGIC, INDEXED_CACHE_VERSION, len(header))
+    return preamble + header + payload.getvalue()
+
+
+def read_indexed_cache_header(blob: bytes) -> dict:
+    """Return the header of an indexed cache without loading any attribute.
+
+    :raises IndexedCacheError: when blob is not a supported indexed cache.
+    """
+    try:
+        magic, fmt_version, header_len = _INDEXED_CACHE_PREAMBLE.unpack_from(
+            blob)
+    except struct.error as e:
+        raise IndexedCacheError("truncated cache preamble") from e
+    if magic != INDEXED_CACHE_MAGIC:
+        raise IndexedCacheError("not an indexed cache")
+    if fmt_version != INDEXED_CACHE_VERSION:
+        raise IndexedCacheError(
+            "unsupported cache format version %s" % fmt_version)
+    start = _INDEXED_CACHE_PREAMBLE.size
+    try:
+        header = json.loads(blob[start:start + header_len].decode("utf-8"))
+    except (UnicodeDecodeError, ValueError) as e:
+        raise IndexedCacheError("invalid cache header: %s" % e) from e
+    header["payload_offset"] = start + header_len
+    return header
+
+
+def load_indexed_cache(blob: bytes):
+    """Restore an object written by dump_indexed_cache.
+
+    Attributes which shadow a class attribute are loaded immediately; all
+    others are unpickled on first access. When the cache was written by a
+    different python or cloud-init version, or with a different
+    ``_ci_pkl_version``, all attributes are loaded, so that any unpickling
+    error is raised here, and ``_unpickle`` is called as it would be for a
+    pickle.
+
+    :raises IndexedCacheError: when blob is not a supported indexed cache,
+        is truncated or references a class which no longer exists.
+    """
+    header = read_indexed_cache_header(blob)
+    payload_length = len(blob) - header["payload_offset"]
+    try:
+        if header["payload_length"] != payload_length:
+            raise IndexedCacheError(
+                "cache payload is %s bytes, expected %s" % (
+                    payload_length, header["payload_length"]))
+        for name, (offset, length) in header["attrs"].items():
+            if offset < 0 or length < 0 or offset + length > payload_length:
+                raise IndexedCacheError(
+                    "attribute %s exceeds the cache payload" % name)
+    except (KeyError, TypeError, ValueError) as e:
+        raise IndexedCacheError("invalid cache header: %s" % e) from e
+    module_name, qualname = header["class"]
+    try:
+        cls = importlib.import_module(module_name)
+        for part in qualname.split("."):
+            cls = getattr(cls, part)
+    except (ImportError, AttributeError) as e:
+        raise IndexedCacheError(
+            "cache class %s.%s not found" % (module_name, qualname)) from e
+    obj = cls.__new__(cls)
+    payload = memoryview(blob)[header["payload_offset"]:]
+
+    def loader(offset, length):
+        def load():
+            fp = io.BytesIO(payload[offset:offset + length])
+            return _AttrUnpickler(fp, obj).load()
+        return load
+
+    obj.__dict__["_ci_lazy_attrs"] = {
+        name: loader(offset, length)
+        for name, (offset, length) in header["attrs"].items()
+    }
+    for name in header["attrs"]:
+        if hasattr(cls, name):
+            obj._ci_load_lazy_attr(name)
+    ci_pkl_version = header["ci_pkl_version"]
+    if (header["python"] != _python_version() or
+            header["cloudinit"] != version.version_string() or
+            ci_pkl_version != getattr(cls, "_ci_pkl_version", 0)):
+        obj._ci_load_lazy_attrs()
+        obj._unpickle(ci_pkl_version)
+    return obj
+
+
 # vi: ts=4 expandtab
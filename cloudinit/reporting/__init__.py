@@ -9,8 +9,11 @@ The reporting framework is intended to allow all parts of cloud-init to
 report events in a structured manner.
 """
 
+from cloudinit import log as logging
 from ..registry import DictRegistry
-from .handlers import available_handlers
+from .handlers import QueuedHandler, available_handlers
+
+LOG = logging.getLogger(__name__)
 
 DEFAULT_CONFIG = {
     'logging': {'type': 'log'},
@@ -23,7 +26,9 @@ def update_configuration(config):
     :param config:
         The dictionary containing changes to apply.  If a key is given
         with a False-ish value, the registered handler matching that name
-        will be unregistered.
+        will be unregistered.  A handler configured with 'async: true'
+        publishes events from a background thread, queueing at most
+        'async_queue_size' events, unless the handler already does so.
     """
     for handler_name, handler_config in config.items():
         if not handler_config:
@@ -32,8 +37,15 @@ def update_configuration(config):
             continue
         handler_config = handler_config.copy()
         cls = available_handlers.registered_items[handler_config.pop('type')]
+        is_async = handler_config.pop('async', False)
+        queue_size = handler_config.pop('async_queue_size', 1000)
         instantiated_handler_registry.unregister_item(handler_name)
         instance = cls(**handler_config)
+        if is_async and instance.publishes_in_background:
+            LOG.debug("Reporting handler %s already publishes events in the"
+                      " background, ignoring async", handler_name)
+        elif is_async:
+            instance = QueuedHandler(instance, max_queue_size=queue_size)
         instantiated_handler_registry.register_item(handler_name, instance)
 
 
@@ -43,6 +55,21 @@ def flush_events():
             handler.flush()
 
 
+def reset_configuration():
+    """Flush and close all handlers and restore DEFAULT_CONFIG.
+
+    Processes running several cloud-init commands use this between
+    commands, so that the handlers configured by one are not used by the
+    next.
+    """
+    flush_events()
+    for _, handler in instantiated_handler_registry.registered_items.items():
+        if hasattr(handler, 'close'):
+            handler.close()
+    instantiated_handler_registry.reset()
+    update_configuration(DEFAULT_CONFIG)
+
+
 instantiated_handler_registry = DictRegistry()
 update_configuration(DEFAULT_CONFIG)
 
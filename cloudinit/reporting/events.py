@@ -13,6 +13,7 @@ import os.path
 import time
 
 from . import instantiated_handler_registry, available_handlers
+from .handlers import QueuedHandler
 
 FINISH_EVENT_TYPE = 'finish'
 START_EVENT_TYPE = 'start'
@@ -58,13 +59,14 @@ class ReportingEvent(object):
 class FinishReportingEvent(ReportingEvent):
 
     def __init__(self, name, description, result=status.SUCCESS,
-                 post_files=None):
+                 post_files=None, metrics=None):
         super(FinishReportingEvent, self).__init__(
             FINISH_EVENT_TYPE, name, description)
         self.result = result
         if post_files is None:
             post_files = []
         self.post_files = post_files
+        self.metrics = metrics
         if result not in status:
             raise ValueError("Invalid result: %s" % result)
 
@@ -78,6 +80,8 @@ class FinishReportingEvent(ReportingEvent):
         data['result'] = self.result
         if self.post_files:
             data['files'] = _collect_file_info(self.post_files)
+        if self.metrics:
+            data['metrics'] = self.metrics
         return data
 
 
@@ -105,19 +109,22 @@ def report_event(event, excluded_handler_types=None):
 
     handlers = instantiated_handler_registry.registered_items.items()
     for _, handler in handlers:
-        if type(handler) in excluded_handler_classes:
+        handler_cls = type(handler)
+        if handler_cls is QueuedHandler:
+            handler_cls = type(handler.handler)
+        if handler_cls in excluded_handler_classes:
             continue  # skip this excluded handler
         handler.publish_event(event)
 
 
 def report_finish_event(event_name, event_description,
-                        result=status.SUCCESS, post_files=None):
+                        result=status.SUCCESS, post_files=None, metrics=None):
     """Report a "finish" event.
 
     See :py:func:`.report_event` for parameter details.
     """
     event = FinishReportingEvent(event_name, event_description, result,
-                                 post_files=post_files)
+                                 post_files=post_files, metrics=metrics)
     return report_event(event)
 
 
@@ -172,6 +179,10 @@ class ReportEventStack(object):
         in a given log file. For each filepath, if it's a valid regular file
         it will get: read & encoded as base64 at the close of the event.
         Default value, if None, is an empty list.
+
+    The ``metrics`` attribute may be set to a dict of measurements, such as
+    the resources used while the event ran, to be reported with the finish
+    event.
     """
 
     def __init__(self, name, description, message=None, parent=None,
@@ -186,6 +197,7 @@ class ReportEventStack(object):
         if post_files is None:
             post_files = []
         self.post_files = post_files
+        self.metrics = None
 
         # use parents reporting value if not provided
         if reporting_enabled is None:
@@ -252,7 +264,8 @@ class ReportEventStack(object):
             self.parent.children[self.name] = (result, msg)
         if self.reporting_enabled:
             report_finish_event(self.fullname, msg, result,
-                                post_files=self.post_files)
+                                post_files=self.post_files,
+                                metrics=self.metrics)
 
 
 def _collect_file_info(files):
@@ -3,16 +3,19 @@
 import abc
 import fcntl
 import json
+import mmap
 import os
 import queue
 import struct
 import threading
 import time
 import uuid
+from collections import OrderedDict, deque
 from datetime import datetime
 
 from cloudinit import log as logging
 from cloudinit.registry import DictRegistry
+from cloudinit.reporting import journal
 from cloudinit import (url_helper, util)
 
 LOG = logging.getLogger(__name__)
@@ -36,6 +39,159 @@ class ReportingHandler(metaclass=abc.ABCMeta):
     def flush(self):
         """Ensure ReportingHandler has published all events"""
 
+    def close(self):
+        """Stop publishing events and any thread publishing them."""
+
+    @property
+    def publishes_in_background(self):
+        """True if events are already published from a background thread."""
+        return False
+
+
+class _DroppedEvents:
+    """Count the events a handler drops.
+
+    The first drop is logged with its reason, later ones only by report,
+    which logs how many events were dropped since it was last called.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self._reported = 0
+
+    def drop(self, reason, *args):
+        self.count += 1
+        if self.count == 1:
+            LOG.warning(reason + ", dropping events", *args)
+
+    def report(self):
+        dropped = self.count - self._reported
+        if dropped:
+            LOG.warning("%s dropped %d events", self.name, dropped)
+            self._reported = self.count
+
+
+class _EventQueue(queue.Queue):
+    """Queue of events published by a handler's background thread.
+
+    At most maxsize events are queued; put_event drops events which do not
+    fit, or waits for room when block is set.
+    """
+
+    def __init__(self, name, maxsize, block=False):
+        super(_EventQueue, self).__init__(maxsize=maxsize)
+        self.block = block
+        self.dropped = _DroppedEvents(name)
+
+    def put_event(self, item):
+        try:
+            self.put(item, block=self.block)
+        except queue.Full:
+            self.dropped.drop(
+                "%s event queue full (%d events)", self.dropped.name,
+                self.maxsize)
+
+
+class QueuedHandler(ReportingHandler):
+    """Publish events to another handler from a background thread.
+
+    Events are queued without waiting and published to handler in order by
+    a worker thread, so that a slow handler does not delay the code
+    reporting them. At most max_queue_size events are queued; events which
+    do not fit are dropped. flush waits until every queued event is
+    published, then flushes handler.
+
+    The time events wait in the queue and the time handler takes to publish
+    them are recorded, see metrics.
+    """
+
+    def __init__(self, handler, max_queue_size=1000):
+        super(QueuedHandler, self).__init__()
+        self.handler = handler
+        self.q = _EventQueue(type(handler).__name__, max_queue_size)
+        self.published_events = 0
+        self.failed_events = 0
+        self.publish_time = 0.0
+        self.max_publish_time = 0.0
+        self.max_queue_time = 0.0
+        self.publish_thread = threading.Thread(
+            target=self._publish_events_routine
+        )
+        self.publish_thread.daemon = True
+        self.publish_thread.start()
+
+    def _publish_events_routine(self):
+        while True:
+            item = self.q.get()
+            if item is None:
+                self.q.task_done()
+                return
+            queued, event = item
+            start = time.monotonic()
+            try:
+                self.handler.publish_event(event)
+            except Exception as e:
+                self.failed_events += 1
+                LOG.warning("%s failed publishing event %s: %s",
+                            type(self.handler).__name__, event.as_string(), e)
+            finally:
+                end = time.monotonic()
+                self.published_events += 1
+                self.publish_time += end - start
+                self.max_publish_time = max(self.max_publish_time,
+                                            end - start)
+                self.max_queue_time = max(self.max_queue_time,
+                                          start - queued)
+                self.q.task_done()
+
+    @property
+    def dropped_events(self):
+        return self.q.dropped.count
+
+    @property
+    def publishes_in_background(self):
+        return True
+
+    def publish_event(self, event):
+        self.q.put_event((time.monotonic(), event))
+
+    def close(self):
+        self.q.put(None)
+        self.publish_thread.join()
+        self.handler.close()
+
+    def metrics(self):
+        """Return a dict of the counts and latencies of published events.
+
+        Latencies are in seconds: the mean and maximum time handler took
+        to publish an event and the maximum time an event was queued.
+        """
+        mean = 0.0
+        if self.published_events:
+            mean = self.publish_time / self.published_events
+        return {
+            'published': self.published_events,
+            'failed': self.failed_events,
+            'dropped': self.dropped_events,
+            'mean_publish_time': mean,
+            'max_publish_time': self.max_publish_time,
+            'max_queue_time': self.max_queue_time,
+        }
+
+    def flush(self):
+        self.q.join()
+        self.handler.flush()
+        name = type(self.handler).__name__
+        metrics = self.metrics()
+        LOG.debug(
+            "%s published %d events (%d failed) in %.5fs on average and at"
+            " most %.5fs, queued for at most %.5fs", name,
+            metrics['published'], metrics['failed'],
+            metrics['mean_publish_time'], metrics['max_publish_time'],
+            metrics['max_queue_time'])
+        self.q.dropped.report()
+
 
 class LogHandler(ReportingHandler):
     """Publishes events to the cloud-init log at the ``DEBUG`` log level."""
@@ -66,10 +222,57 @@ class PrintHandler(ReportingHandler):
         print(event.as_string())
 
 
+class JournalHandler(ReportingHandler):
+    """Append events to the binary journal read by cloud-init analyze.
+
+    Records carry monotonic timestamps, the event's parent and, for finish
+    events, the result and duration, so analyze does not parse the log.
+    Events are not reported when the journal cannot be written.
+    """
+
+    def __init__(self, path=None):
+        super(JournalHandler, self).__init__()
+        self.writer = journal.JournalWriter(path)
+        self._failed = False
+
+    def publish_event(self, event):
+        event_type = journal.EVENT_TYPES.get(event.event_type)
+        if event_type is None:
+            return
+        try:
+            self.writer.write(
+                event_type, event.name, event.description,
+                result=getattr(event, 'result', None))
+        except OSError as e:
+            if not self._failed:
+                LOG.debug("Could not write event journal %s: %s",
+                          self.writer.path, e)
+            self._failed = True
+
+
 class WebHookHandler(ReportingHandler):
+    """Post events to a webhook endpoint.
+
+    By default each event is posted synchronously as a JSON object. When
+    batch_size is set, events are queued and posted from a background
+    thread as JSON arrays of up to batch_size events, at least every
+    flush_interval seconds. At most max_queue_size events are queued; when
+    the queue is full, an overflow of 'drop' discards new events and
+    'block' waits for room in the queue. Dropped events are reported in the
+    log.
+    """
+
+    OVERFLOW_DROP = 'drop'
+    OVERFLOW_BLOCK = 'block'
+    # Sentinel queued by flush to post the current batch immediately
+    _FLUSH = object()
+    # Sentinel queued by close to post the current batch and stop
+    _STOP = object()
+
     def __init__(self, endpoint, consumer_key=None, token_key=None,
                  token_secret=None, consumer_secret=None, timeout=None,
-                 retries=None):
+                 retries=None, batch_size=None, flush_interval=1.0,
+                 max_queue_size=1000, overflow=OVERFLOW_DROP):
         super(WebHookHandler, self).__init__()
 
         if any([consumer_key, token_key, token_secret, consumer_secret]):
@@ -83,19 +286,102 @@ class WebHookHandler(ReportingHandler):
         self.retries = retries
         self.ssl_details = util.fetch_ssl_details()
 
-    def publish_event(self, event):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        if overflow not in (self.OVERFLOW_DROP, self.OVERFLOW_BLOCK):
+            LOG.warning("invalid webhook overflow '%s', using '%s'",
+                        overflow, self.OVERFLOW_DROP)
+            overflow = self.OVERFLOW_DROP
+        self.overflow = overflow
+        self.q = None
+        if batch_size:
+            self.q = _EventQueue(
+                'webhook handler', max_queue_size,
+                block=overflow == self.OVERFLOW_BLOCK)
+            self.publish_thread = threading.Thread(
+                target=self._publish_batches_routine
+            )
+            self.publish_thread.daemon = True
+            self.publish_thread.start()
+
+    def _post(self, data):
         if self.oauth_helper:
             readurl = self.oauth_helper.readurl
         else:
             readurl = url_helper.readurl
+        # readurl reuses a pooled keep-alive session per endpoint host
+        return readurl(
+            self.endpoint, data=data, timeout=self.timeout,
+            retries=self.retries, ssl_details=self.ssl_details)
+
+    def _publish_batch(self, batch):
         try:
-            return readurl(
-                self.endpoint, data=json.dumps(event.as_dict()),
-                timeout=self.timeout,
-                retries=self.retries, ssl_details=self.ssl_details)
+            self._post(json.dumps([event.as_dict() for event in batch]))
+        except Exception:
+            LOG.warning("failed posting batch of %d events", len(batch))
+
+    def _publish_batches_routine(self):
+        batch = []
+        deadline = None
+        unfinished = 0
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(deadline - time.monotonic(), 0)
+            try:
+                item = self.q.get(timeout=timeout)
+                unfinished += 1
+            except queue.Empty:
+                item = None  # flush_interval has elapsed
+            if (item is not None and item is not self._FLUSH and
+                    item is not self._STOP):
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            if batch:
+                self._publish_batch(batch)
+                batch = []
+            for _ in range(unfinished):
+                self.q.task_done()
+            unfinished = 0
+            if item is self._STOP:
+                return
+
+    @property
+    def dropped_events(self):
+        if self.q is None:
+            return 0
+        return self.q.dropped.count
+
+    @property
+    def publishes_in_background(self):
+        return self.q is not None
+
+    def publish_event(self, event):
+        if self.q is not None:
+            self.q.put_event(event)
+            return
+        try:
+            return self._post(json.dumps(event.as_dict()))
         except Exception:
             LOG.warning("failed posting event: %s", event.as_string())
 
+    def flush(self):
+        if self.q is None:
+            return
+        LOG.debug('WebHookHandler flushing remaining events')
+        self.q.put(self._FLUSH)
+        self.q.join()
+        self.q.dropped.report()
+
+    def close(self):
+        if self.q is None:
+            return
+        self.q.put(self._STOP)
+        self.publish_thread.join()
+
 
 class HyperVKvpReportingHandler(ReportingHandler):
     """
@@ -109,6 +395,13 @@ class HyperVKvpReportingHandler(ReportingHandler):
     This reporter collates all events for a module (origin|name) in a single
     json string in the dictionary.
 
+    The records of each batch of queued events are appended to the pool
+    file with a single write. The slots of the records written by cloud-init
+    are indexed, so that once max_pool_size bytes are used, the slots of the
+    oldest diagnostic events, then of other cloud-init events, are reused in
+    place through a memory map of the pool file. Records written by other
+    programs are kept.
+
     For more information, see
     https://technet.microsoft.com/en-us/library/dn798287.aspx#Linux%20guests
     """
@@ -124,17 +417,30 @@ class HyperVKvpReportingHandler(ReportingHandler):
     DESC_IDX_KEY = 'msg_i'
     JSON_SEPARATORS = (',', ':')
     KVP_POOL_FILE_GUEST = '/var/lib/hyperv/.kvp_pool_1'
+    # Events which are evicted first when the pool is over its budget
+    DIAGNOSTIC_EVENT_TYPES = ('diagnostic', 'compressed')
+    # Sentinel queued by close to stop the publishing thread
+    _STOP = object()
     _already_truncated_pool_file = False
 
     def __init__(self,
                  kvp_file_path=KVP_POOL_FILE_GUEST,
-                 event_types=None):
+                 event_types=None,
+                 max_pool_size=None):
         super(HyperVKvpReportingHandler, self).__init__()
         self._kvp_file_path = kvp_file_path
         HyperVKvpReportingHandler._truncate_guest_pool_file(
             self._kvp_file_path)
 
         self._event_types = event_types
+        self._max_pool_size = max_pool_size
+        # Offsets of the slots of each cloud-init event in the pool file,
+        # oldest first, keyed by event key. Built on the first write.
+        self._diagnostic_slots = None
+        self._event_slots = None
+        self._free_slots = deque()
+        self._pool_size = 0
+        self._dropped = _DroppedEvents('HyperVKvpReportingHandler')
         self.q = queue.Queue()
         self.incarnation_no = self._get_incarnation_no()
         self.event_key_prefix = "{0}|{1}".format(self.EVENT_PREFIX,
@@ -231,13 +537,140 @@ class HyperVKvpReportingHandler(ReportingHandler):
 
         return {'key': k, 'value': v}
 
-    def _append_kvp_item(self, record_data):
-        with open(self._kvp_file_path, 'ab') as f:
-            fcntl.flock(f, fcntl.LOCK_EX)
-            for data in record_data:
-                f.write(data)
-            f.flush()
-            fcntl.flock(f, fcntl.LOCK_UN)
+    def _slot_key(self, pool, offset):
+        """Return the key of the record at offset of the mapped pool."""
+        return pool[offset:offset + self.HV_KVP_EXCHANGE_MAX_KEY_SIZE].split(
+            b'\x00', 1)[0]
+
+    def _index_kvps(self, pool, size):
+        """Index the slots of the cloud-init records in the mapped pool."""
+        self._diagnostic_slots = OrderedDict()
+        self._event_slots = OrderedDict()
+        self._free_slots = deque()
+        prefix = (self.EVENT_PREFIX + '|').encode('utf-8')
+        for offset in range(0, size - size % self.HV_KVP_RECORD_SIZE,
+                            self.HV_KVP_RECORD_SIZE):
+            if pool[offset:offset + len(prefix)] != prefix:
+                continue
+            key = self._slot_key(pool, offset).decode('utf-8', 'replace')
+            # CLOUD_INIT|<incarnation>|<event_type>|<name>|<uuid>[|<slice>]
+            parts = key.split('|')
+            if len(parts) > 5 and parts[-1].isdigit():
+                key = key.rsplit('|', 1)[0]
+            slots = self._event_slots
+            if len(parts) > 2 and parts[2] in self.DIAGNOSTIC_EVENT_TYPES:
+                slots = self._diagnostic_slots
+            slots.setdefault(key, []).append(offset)
+
+    def _evict_oldest(self):
+        """Free the slots of the oldest cloud-init event in the pool.
+
+        @returns: False when there are no cloud-init events to evict.
+        """
+        for slots in (self._diagnostic_slots, self._event_slots):
+            if slots:
+                key, offsets = slots.popitem(last=False)
+                key = key.encode('utf-8')
+                self._free_slots.extend(
+                    (offset, key) for offset in offsets)
+                return True
+        return False
+
+    def _take_free_slot(self, pool, size):
+        """Return the (offset, evicted key) of a free slot which still holds
+        its evicted event, or None.
+
+        Slots past the end of the pool were planned in the current batch.
+        Others may have been reused by another cloud-init process.
+        """
+        while self._free_slots:
+            offset, key = self._free_slots.popleft()
+            if offset >= size or (
+                    offset + self.HV_KVP_RECORD_SIZE <= size and
+                    self._slot_key(pool, offset).startswith(key)):
+                return offset, key
+        return None
+
+    def _plan_kvp_writes(self, encoded_events, pool, size):
+        """Return the new size of the pool and a dict of offset to record.
+
+        @param encoded_events: List of (key, is_diagnostic, records) tuples.
+        """
+        writes = {}
+        end = size
+        budget = self._max_pool_size
+        for key, is_diagnostic, records in encoded_events:
+            offsets = []
+            # Free slots taken for this event, with the key they held
+            taken = []
+            event_start = end
+            if budget is None or len(records) * self.HV_KVP_RECORD_SIZE <= (
+                    budget):
+                while len(offsets) < len(records):
+                    if budget is None or (
+                            end + self.HV_KVP_RECORD_SIZE <= budget):
+                        offsets.append(end)
+                        end += self.HV_KVP_RECORD_SIZE
+                        continue
+                    slot = self._take_free_slot(pool, size)
+                    if slot is None and self._evict_oldest():
+                        continue
+                    if slot is None:
+                        break
+                    taken.append(slot)
+                    offsets.append(slot[0])
+            if len(offsets) < len(records):
+                # Records written by other programs fill the pool. The
+                # slots taken are still only reused while they hold the
+                # event evicted from them.
+                self._free_slots.extendleft(reversed(taken))
+                end = event_start
+                self._dropped.drop(
+                    "kvp pool %s is over its budget of %d bytes",
+                    self._kvp_file_path, budget)
+                continue
+            for offset, data in zip(offsets, records):
+                writes[offset] = data
+            slots = (self._diagnostic_slots if is_diagnostic
+                     else self._event_slots)
+            slots[key] = offsets
+        return end, writes
+
+    def _write_kvp_events(self, encoded_events):
+        """Write a batch of encoded events to the pool file."""
+        fd = os.open(self._kvp_file_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            size = os.fstat(fd).st_size
+            reindex = self._event_slots is None or size < self._pool_size
+            appended = self.HV_KVP_RECORD_SIZE * sum(
+                len(records) for _key, _diagnostic, records in encoded_events)
+            # The pool is only mapped to index it and to reuse its slots
+            pool = b''
+            if size and (reindex or (
+                    self._max_pool_size is not None and
+                    size + appended > self._max_pool_size)):
+                pool = mmap.mmap(fd, size)
+            try:
+                if reindex:
+                    # First write, or the pool was truncated since
+                    self._index_kvps(pool, size)
+                end, writes = self._plan_kvp_writes(
+                    encoded_events, pool, size)
+                for offset, data in writes.items():
+                    if offset < size:
+                        pool[offset:offset + self.HV_KVP_RECORD_SIZE] = data
+            finally:
+                if pool:
+                    pool.close()
+            if end > size:
+                # New slots are written at once past the end of the pool
+                os.pwrite(fd, b''.join(
+                    writes[offset] for offset in range(
+                        size, end, self.HV_KVP_RECORD_SIZE)), size)
+            self._pool_size = max(end, size)
+        finally:
+            os.close(fd)
 
     def _break_down(self, key, meta_data, description):
         del meta_data[self.MSG_KEY]
@@ -268,7 +701,7 @@ class HyperVKvpReportingHandler(ReportingHandler):
 
     def _encode_event(self, event):
         """
-        encode the event into kvp data bytes.
+        encode the event into its key and kvp data bytes.
         if the event content reaches the maximum length of kvp value.
         then it would be cut to multiple slices.
         """
@@ -287,10 +720,10 @@ class HyperVKvpReportingHandler(ReportingHandler):
         # break it down to slices.
         # this should be very corner case.
         if len(value) > self.HV_KVP_AZURE_MAX_VALUE_SIZE:
-            return self._break_down(key, meta_data, event.description)
+            return key, self._break_down(key, meta_data, event.description)
         else:
             data = self._encode_kvp_item(key, value)
-            return [data]
+            return key, [data]
 
     def _publish_event_routine(self):
         while True:
@@ -298,9 +731,13 @@ class HyperVKvpReportingHandler(ReportingHandler):
             try:
                 event = self.q.get(block=True)
                 items_from_queue += 1
-                encoded_data = []
-                while event is not None:
-                    encoded_data += self._encode_event(event)
+                encoded_events = []
+                while event is not None and event is not self._STOP:
+                    key, records = self._encode_event(event)
+                    encoded_events.append((
+                        key,
+                        event.event_type in self.DIAGNOSTIC_EVENT_TYPES,
+                        records))
                     try:
                         # get all the rest of the events in the queue
                         event = self.q.get(block=False)
@@ -308,12 +745,15 @@ class HyperVKvpReportingHandler(ReportingHandler):
                     except queue.Empty:
                         event = None
                 try:
-                    self._append_kvp_item(encoded_data)
+                    if encoded_events:
+                        self._write_kvp_events(encoded_events)
                 except (OSError, IOError) as e:
                     LOG.warning("failed posting events to kvp, %s", e)
                 finally:
                     for _ in range(items_from_queue):
                         self.q.task_done()
+                if event is self._STOP:
+                    return
             # when main process exits, q.get() will through EOFError
             # indicating we should exit this thread.
             except EOFError:
@@ -322,6 +762,10 @@ class HyperVKvpReportingHandler(ReportingHandler):
     # since the saving to the kvp pool can be a time costing task
     # if the kvp pool already contains a chunk of data,
     # so defer it to another thread.
+    @property
+    def publishes_in_background(self):
+        return True
+
     def publish_event(self, event):
         if not self._event_types or event.event_type in self._event_types:
             self.q.put(event)
@@ -329,6 +773,11 @@ class HyperVKvpReportingHandler(ReportingHandler):
     def flush(self):
         LOG.debug('HyperVReportingHandler flushing remaining events')
         self.q.join()
+        self._dropped.report()
+
+    def close(self):
+        self.q.put(self._STOP)
+        self.publish_thread.join()
 
 
 available_handlers = DictRegistry()
@@ -336,5 +785,6 @@ available_handlers.register_item('log', LogHandler)
 available_handlers.register_item('print', PrintHandler)
 available_handlers.register_item('webhook', WebHookHandler)
 available_handlers.register_item('hyperv', HyperVKvpReportingHandler)
+available_handlers.register_item('journal', JournalHandler)
 
 # vi: ts=4 expandtab
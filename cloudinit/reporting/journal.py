@@ -0,0 +1,166 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Binary journal of reporting events for cloud-init analyze.
+
+The journal starts with a header holding the wall clock time at which the
+monotonic clock started, followed by one record per event. Each record is a
+fixed RECORD header followed by the event's name and description:
+
+    event type    1 byte: START or FINISH
+    result        1 byte: index in RESULTS, 0 for start events
+    name length   2 bytes
+    desc length   2 bytes
+    (padding)     2 bytes
+    parent        8 bytes: offset of the parent's start record, or NO_PARENT
+    monotonic     8 bytes: double, seconds of the monotonic clock
+    duration      8 bytes: double, seconds since the start event, or -1
+
+All numbers are little-endian. Records are only ever appended, under an
+exclusive flock, so several processes can write to the same journal.
+"""
+
+import fcntl
+import os
+import struct
+import time
+
+JOURNAL_PATH = '/run/cloud-init/events.journal'
+
+MAGIC = b'CIEJ'
+VERSION = 1
+HEADER = struct.Struct('<4sHxxd')
+RECORD = struct.Struct('<BBHHxxQdd')
+
+START = 1
+FINISH = 2
+EVENT_TYPES = {'start': START, 'finish': FINISH}
+RESULTS = (None, 'SUCCESS', 'WARN', 'FAIL')
+NO_PARENT = 2 ** 64 - 1
+NO_DURATION = -1.0
+MAX_STRING = 2 ** 16 - 1
+
+
+def is_journal(path):
+    """Return True when the file at path is an event journal."""
+    try:
+        with open(path, 'rb') as fh:
+            return fh.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class JournalWriter(object):
+    """Append reporting events to a journal."""
+
+    def __init__(self, path=None):
+        self.path = path or JOURNAL_PATH
+        # Offset and monotonic time of the latest start record of each name
+        self._starts = {}
+
+    def _encode(self, text):
+        return str(text).encode('utf-8', 'replace')[:MAX_STRING]
+
+    def write(self, event_type, name, description, result=None,
+              monotonic=None):
+        """Append an event, returning the offset of its record.
+
+        @raises: OSError when the journal cannot be written.
+        """
+        if monotonic is None:
+            monotonic = time.monotonic()
+        parent = NO_PARENT
+        if '/' in name:
+            parent = self._starts.get(
+                name.rsplit('/', 1)[0], (NO_PARENT, None))[0]
+        duration = NO_DURATION
+        if event_type == FINISH and name in self._starts:
+            duration = monotonic - self._starts[name][1]
+        name_bytes = self._encode(name)
+        desc_bytes = self._encode(description)
+        if event_type == FINISH and result in RESULTS:
+            result_index = RESULTS.index(result)
+        else:
+            result_index = 0
+        record = RECORD.pack(
+            event_type, result_index,
+            len(name_bytes), len(desc_bytes), parent, monotonic,
+            duration) + name_bytes + desc_bytes
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            offset = os.fstat(fd).st_size
+            if offset == 0:
+                header = HEADER.pack(
+                    MAGIC, VERSION, time.time() - time.monotonic())
+                os.write(fd, header)
+                offset = len(header)
+            os.write(fd, record)
+        finally:
+            os.close(fd)
+        if event_type == START:
+            self._starts[name] = (offset, monotonic)
+        return offset
+
+
+def read_records(path):
+    """Return the header fields and the records of the journal at path.
+
+    @returns: Tuple of the wall clock time at which the monotonic clock
+        started and a list of (offset, event_type, result, name,
+        description, parent, monotonic, duration) tuples.
+    @raises: ValueError when path is not a journal of a known version.
+    """
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    if len(data) < HEADER.size:
+        raise ValueError('%s is not an event journal' % path)
+    magic, version, wall_offset = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('%s is not an event journal' % path)
+    records = []
+    unpack_from = RECORD.unpack_from
+    record_size = RECORD.size
+    end = len(data)
+    offset = HEADER.size
+    while offset + record_size <= end:
+        (event_type, result, name_len, desc_len, parent, monotonic,
+         duration) = unpack_from(data, offset)
+        name_start = offset + record_size
+        desc_start = name_start + name_len
+        next_offset = desc_start + desc_len
+        if next_offset > end:
+            # A record which was being written
+            break
+        records.append((
+            offset, event_type, RESULTS[result] if result < len(RESULTS)
+            else None, data[name_start:desc_start].decode('utf-8', 'replace'),
+            data[desc_start:next_offset].decode('utf-8', 'replace'), parent,
+            monotonic, duration))
+        offset = next_offset
+    return wall_offset, records
+
+
+def read_events(path):
+    """Return the events of the journal at path as analyze event dicts.
+
+    @raises: ValueError when path is not a journal of a known version.
+    """
+    wall_offset, records = read_records(path)
+    events = []
+    for (_offset, event_type, result, name, description, _parent,
+         monotonic, _duration) in records:
+        event = {
+            'name': name,
+            'description': description,
+            'event_type': 'start' if event_type == START else 'finish',
+            'origin': 'cloudinit',
+            'timestamp': wall_offset + monotonic,
+        }
+        if event_type == FINISH:
+            event['result'] = result
+        events.append(event)
+    return events
+
+# vi: ts=4 expandtab
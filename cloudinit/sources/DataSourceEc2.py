@@ -232,7 +232,8 @@ class DataSourceEc2(sources.DataSource):
                 headers_cb=self._get_headers,
                 exception_cb=self._imds_exception_cb,
                 request_method=request_method,
-                headers_redact=AWS_TOKEN_REDACT)
+                headers_redact=AWS_TOKEN_REDACT,
+                race=util.is_true(self.ds_cfg.get("race_metadata_urls")))
         except uhelp.UrlError:
             # We use the raised exception to interupt the retry loop.
             # Nothing else to do here.
@@ -290,7 +291,8 @@ class DataSourceEc2(sources.DataSource):
                 urls=urls, max_wait=url_params.max_wait_seconds,
                 timeout=url_params.timeout_seconds, status_cb=LOG.warning,
                 headers_redact=AWS_TOKEN_REDACT, headers_cb=self._get_headers,
-                request_method=request_method)
+                request_method=request_method,
+                race=util.is_true(mcfg.get("race_metadata_urls")))
 
             if url:
                 metadata_address = url2base[url]
@@ -475,6 +477,12 @@ class DataSourceEc2(sources.DataSource):
             exc_cb_ud = self._skip_or_refresh_stale_aws_token_cb
         else:
             exc_cb = exc_cb_ud = None
+        try:
+            crawl_workers = int(self.ds_cfg.get("crawl_workers", 1))
+        except (TypeError, ValueError):
+            LOG.warning("Ignoring invalid crawl_workers: %s",
+                        self.ds_cfg.get("crawl_workers"))
+            crawl_workers = 1
         try:
             crawled_metadata['user-data'] = ec2.get_instance_userdata(
                 api_version, self.metadata_address,
@@ -483,12 +491,12 @@ class DataSourceEc2(sources.DataSource):
             crawled_metadata['meta-data'] = ec2.get_instance_metadata(
                 api_version, self.metadata_address,
                 headers_cb=self._get_headers, headers_redact=redact,
-                exception_cb=exc_cb)
+                exception_cb=exc_cb, max_workers=crawl_workers)
             if self.cloud_name == CloudNames.AWS:
                 identity = ec2.get_instance_identity(
                     api_version, self.metadata_address,
                     headers_cb=self._get_headers, headers_redact=redact,
-                    exception_cb=exc_cb)
+                    exception_cb=exc_cb, max_workers=crawl_workers)
                 crawled_metadata['dynamic'] = {'instance-identity': identity}
         except Exception:
             util.logexc(
@@ -90,7 +90,8 @@ class DataSourceOpenStack(openstack.SourceMixin, sources.DataSource):
         start_time = time.time()
         avail_url, _response = url_helper.wait_for_url(
             urls=md_urls, max_wait=url_params.max_wait_seconds,
-            timeout=url_params.timeout_seconds)
+            timeout=url_params.timeout_seconds,
+            race=util.is_true(self.ds_cfg.get("race_metadata_urls")))
         if avail_url:
             LOG.debug("Using metadata source: '%s'", url2base[avail_url])
         else:
@@ -12,7 +12,9 @@ import abc
 import copy
 import json
 import os
+import time
 from collections import namedtuple
+from concurrent import futures
 from typing import Dict, List  # noqa: F401
 
 from cloudinit import dmi
@@ -213,6 +215,10 @@ class DataSource(CloudInitPickleMixin, metaclass=abc.ABCMeta):
 
     _dirty_cache = False
 
+    # Whether get_data writes INSTANCE_JSON_FILE. Concurrent datasource probes
+    # defer this until find_source has committed a single datasource.
+    _persist_on_get_data = True
+
     # N-tuple of keypaths or keynames redact from instance-data.json for
     # non-root users
     sensitive_metadata_keys = ('merged_cfg', 'security-credentials',)
@@ -326,7 +332,8 @@ class DataSource(CloudInitPickleMixin, metaclass=abc.ABCMeta):
         return_value = self._get_data()
         if not return_value:
             return return_value
-        self.persist_instance_data()
+        if self._persist_on_get_data:
+            self.persist_instance_data()
         return return_value
 
     def persist_instance_data(self):
@@ -825,29 +832,115 @@ def normalize_pubkey_data(pubkey_data):
     return keys
 
 
+def _probe_source(name, cls, mode, sys_cfg, distro, paths, reporter,
+                  defer_persist=False):
+    """Instantiate cls and attempt to crawl its metadata.
+
+    Each probe is reported as a child of reporter. When defer_persist is
+    True, instance-data.json is not written by the probe itself.
+
+    @return: A tuple of (datasource or None, seconds spent probing).
+    """
+    myrep = events.ReportEventStack(
+        name="search-%s" % name.replace("DataSource", ""),
+        description="searching for %s data from %s" % (mode, name),
+        message="no %s data found from %s" % (mode, name),
+        parent=reporter)
+    start = time.monotonic()
+    found = None
+    try:
+        with myrep:
+            LOG.debug("Seeing if we can get any data from %s", cls)
+            s = cls(sys_cfg, distro, paths)
+            if defer_persist:
+                s._persist_on_get_data = False
+            if s.update_metadata_if_supported(
+                [EventType.BOOT_NEW_INSTANCE]
+            ):
+                myrep.message = "found %s data from %s" % (mode, name)
+                found = s
+    except Exception:
+        util.logexc(LOG, "Getting data from %s failed", cls)
+    return (found, time.monotonic() - start)
+
+
+def _find_source_concurrently(sources, mode, max_workers, sys_cfg, distro,
+                              paths, reporter):
+    """Probe all sources in a thread pool and return the first winner.
+
+    Probes run concurrently but the result honors the priority order of
+    sources: a datasource is only committed once every higher priority
+    probe has completed without finding data.  Probes which have not yet
+    started are cancelled; probes already running are waited for and their
+    results discarded, so none still runs once the datasource is returned.
+    Only the committed datasource persists its instance-data.json.
+
+    @return: A tuple of (datasource, datasource name) or None.
+    """
+    LOG.debug("Probing %d %s data sources using %d workers",
+              len(sources), mode, max_workers)
+    executor = futures.ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="ds-probe")
+    pending = []
+    try:
+        for name, cls in sources:
+            pending.append((name, executor.submit(
+                _probe_source, name, cls, mode, sys_cfg, distro, paths,
+                reporter, True)))
+        for idx, (name, future) in enumerate(pending):
+            ds, elapsed = future.result()
+            LOG.debug("Probe of %s %s data source took %.3f seconds",
+                      mode, name, elapsed)
+            if ds:
+                running = [
+                    n for n, f in pending[idx + 1:]
+                    if not f.cancel() and not f.done()]
+                if running:
+                    LOG.debug("Waiting for lower priority %s probes: %s",
+                              mode, ", ".join(running))
+                executor.shutdown(wait=True)
+                ds._persist_on_get_data = True
+                ds.persist_instance_data()
+                return (ds, name)
+    finally:
+        for _name, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+    return None
+
+
 def find_source(sys_cfg, distro, paths, ds_deps, cfg_list, pkg_list, reporter):
     ds_list = list_sources(cfg_list, ds_deps, pkg_list)
     ds_names = [type_utils.obj_name(f) for f in ds_list]
     mode = "network" if DEP_NETWORK in ds_deps else "local"
     LOG.debug("Searching for %s data source in: %s", mode, ds_names)
 
-    for name, cls in zip(ds_names, ds_list):
-        myrep = events.ReportEventStack(
-            name="search-%s" % name.replace("DataSource", ""),
-            description="searching for %s data from %s" % (mode, name),
-            message="no %s data found from %s" % (mode, name),
-            parent=reporter)
-        try:
-            with myrep:
-                LOG.debug("Seeing if we can get any data from %s", cls)
-                s = cls(sys_cfg, distro, paths)
-                if s.update_metadata_if_supported(
-                    [EventType.BOOT_NEW_INSTANCE]
-                ):
-                    myrep.message = "found %s data from %s" % (mode, name)
-                    return (s, type_utils.obj_name(cls))
-        except Exception:
-            util.logexc(LOG, "Getting data from %s failed", cls)
+    try:
+        max_workers = util.get_cfg_option_int(
+            sys_cfg, "datasource_probe_workers", 1)
+    except ValueError:
+        LOG.warning("Ignoring invalid datasource_probe_workers: %s",
+                    sys_cfg.get("datasource_probe_workers"))
+        max_workers = 1
+
+    if max_workers > 1 and mode != "network":
+        # Local datasources may bring up ephemeral networking on the same
+        # interface, so they are always probed one at a time
+        LOG.debug("Probing %s data sources one at a time", mode)
+        max_workers = 1
+
+    if max_workers > 1 and len(ds_list) > 1:
+        found = _find_source_concurrently(
+            list(zip(ds_names, ds_list)), mode,
+            min(max_workers, len(ds_list)), sys_cfg, distro, paths, reporter)
+        if found:
+            return found
+    else:
+        for name, cls in zip(ds_names, ds_list):
+            s, _elapsed = _probe_source(
+                name, cls, mode, sys_cfg, distro, paths, reporter)
+            if s:
+                return (s, name)
 
     msg = ("Did not find any data source,"
            " searched classes: (%s)") % (", ".join(ds_names))
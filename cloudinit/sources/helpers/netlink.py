@@ -22,6 +22,12 @@ RTM_NEWLINK = 16
 RTM_DELLINK = 17
 RTM_GETLINK = 18
 RTM_SETLINK = 19
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_GETROUTE = 26
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
 MAX_SIZE = 65535
 RTA_DATA_OFFSET = 32
 MSG_TYPE_OFFSET = 16
@@ -32,12 +38,31 @@ IFINFOMSG_FMT = "BHiII"
 NLMSGHDR_SIZE = struct.calcsize(NLMSGHDR_FMT)
 IFINFOMSG_SIZE = struct.calcsize(IFINFOMSG_FMT)
 RTATTR_START_OFFSET = NLMSGHDR_SIZE + IFINFOMSG_SIZE
+RTATTR_HEADER = struct.Struct("HH")
 RTA_DATA_START_OFFSET = 4
 PAD_ALIGNMENT = 4
 
+IFLA_ADDRESS = 1
 IFLA_IFNAME = 3
 IFLA_OPERSTATE = 16
 
+# http://man7.org/linux/man-pages/man7/rtnetlink.7.html
+IFADDRMSG_FMT = "BBBBI"
+RTMSG_FMT = "BBBBBBBBI"
+IFADDRMSG_SIZE = struct.calcsize(IFADDRMSG_FMT)
+RTMSG_SIZE = struct.calcsize(RTMSG_FMT)
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_BROADCAST = 4
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_CACHEINFO = 12
+RTA_TABLE = 15
+
 # https://www.kernel.org/doc/Documentation/networking/operstates.txt
 OPER_UNKNOWN = 0
 OPER_NOTPRESENT = 1
@@ -57,6 +82,10 @@ class NetlinkCreateSocketError(RuntimeError):
     '''Raised if netlink socket fails during create or bind.'''
 
 
+class NetlinkDumpError(RuntimeError):
+    '''Raised if a netlink dump request fails or its reply is invalid.'''
+
+
 def create_bound_netlink_socket():
     '''Creates netlink socket and bind on netlink group to catch interface
     down/up events. The socket will bound only on RTMGRP_LINK (which only
@@ -150,6 +179,92 @@ def unpack_rta_attr(data, offset):
     return RTAAttr(length, rta_type, attr_data)
 
 
+def unpack_rta_attrs(data, offset):
+    '''Unpack all rta attributes of a netlink message.
+
+    :param: data: bytes of a single netlink message
+    :param: offset: offset of the first rta attribute, after the family
+            specific header of the message
+    :returns: dict of attribute data keyed by attribute type
+    '''
+    attrs = {}
+    # This runs for each message of a dump, so avoid lookups in the loop
+    unpack_header = RTATTR_HEADER.unpack_from
+    header_size = RTA_DATA_START_OFFSET
+    pad_mask = PAD_ALIGNMENT - 1
+    end = len(data) - header_size
+    while offset <= end:
+        length, rta_type = unpack_header(data, offset)
+        if length < header_size:
+            break
+        attrs[rta_type] = data[offset+header_size:offset+length]
+        offset += (length+pad_mask) & ~pad_mask
+    return attrs
+
+
+def dump_netlink_messages(msg_type, request, timeout=SELECT_TIMEOUT):
+    '''Send a rtnetlink dump request and read all messages of the reply.
+
+    Unlike read_netlink_messages, this does not log each message, as a dump
+    of the routing table can hold tens of thousands of them.
+
+    :param: msg_type: type of the request, such as RTM_GETLINK
+    :param: request: packed family specific header of the request, such as
+            an ifinfomsg for RTM_GETLINK
+    :param: timeout: seconds to wait for each read from the socket
+    :returns: list of messages, each the bytes of a single netlink message
+              including its header
+    :raises: NetlinkCreateSocketError if the socket cannot be created,
+             NetlinkDumpError if the dump fails
+    '''
+    try:
+        netlink_socket = socket.socket(socket.AF_NETLINK,
+                                       socket.SOCK_RAW,
+                                       socket.NETLINK_ROUTE)
+    except socket.error as e:
+        msg = "Exception during netlink socket create: %s" % e
+        raise NetlinkCreateSocketError(msg) from e
+    seq = 1
+    messages = []
+    with netlink_socket:
+        try:
+            netlink_socket.settimeout(timeout)
+            netlink_socket.bind((0, 0))
+            netlink_socket.sendall(
+                struct.pack(NLMSGHDR_FMT, NLMSGHDR_SIZE + len(request),
+                            msg_type, NLM_F_REQUEST | NLM_F_DUMP, seq, 0) +
+                request)
+            while True:
+                data = netlink_socket.recv(MAX_SIZE)
+                if not data:
+                    raise NetlinkDumpError(
+                        "Netlink socket closed during dump")
+                offset = 0
+                while offset + NLMSGHDR_SIZE <= len(data):
+                    nlheader = NetlinkHeader(
+                        *struct.unpack_from(NLMSGHDR_FMT, data, offset))
+                    if nlheader.length < NLMSGHDR_SIZE:
+                        raise NetlinkDumpError(
+                            "Invalid netlink message length %d" %
+                            nlheader.length)
+                    nl_msg = data[offset:offset+nlheader.length]
+                    offset += ((nlheader.length+PAD_ALIGNMENT-1) &
+                               ~(PAD_ALIGNMENT-1))
+                    if nlheader.seq != seq:
+                        continue
+                    if nlheader.type == NLMSG_DONE:
+                        return messages
+                    if nlheader.type == NLMSG_ERROR:
+                        errno = struct.unpack_from("i", nl_msg,
+                                                   NLMSGHDR_SIZE)[0]
+                        raise NetlinkDumpError(
+                            "Netlink dump failed: %s" % os.strerror(-errno))
+                    messages.append(nl_msg)
+        except (socket.error, struct.error) as e:
+            raise NetlinkDumpError(
+                "Exception during netlink dump: %s" % e) from e
+
+
 def read_rta_oper_state(data):
     '''Reads Interface name and operational state from RTA Data.
 
@@ -7,12 +7,14 @@ import socket
 import struct
 import codecs
 from cloudinit.sources.helpers.netlink import (
-    NetlinkCreateSocketError, create_bound_netlink_socket, read_netlink_socket,
-    read_rta_oper_state, unpack_rta_attr, wait_for_media_disconnect_connect,
+    NetlinkCreateSocketError, NetlinkDumpError, create_bound_netlink_socket,
+    dump_netlink_messages, read_netlink_socket, read_rta_oper_state,
+    unpack_rta_attr, unpack_rta_attrs, wait_for_media_disconnect_connect,
     wait_for_nic_attach_event, wait_for_nic_detach_event,
     OPER_DOWN, OPER_UP, OPER_DORMANT, OPER_LOWERLAYERDOWN, OPER_NOTPRESENT,
     OPER_TESTING, OPER_UNKNOWN, RTATTR_START_OFFSET, RTM_NEWLINK, RTM_DELLINK,
-    RTM_SETLINK, RTM_GETLINK, MAX_SIZE)
+    RTM_SETLINK, RTM_GETLINK, MAX_SIZE, NLMSG_DONE, NLMSG_ERROR,
+    NLMSGHDR_FMT, NLM_F_DUMP, NLM_F_REQUEST)
 
 
 def int_to_bytes(i):
@@ -133,6 +135,65 @@ class TestParseNetlinkMessage(CiTestCase):
         self.assertTrue('rta offset is less than expected length' in
                         str(context.exception))
 
+    def test_unpack_rta_attrs(self):
+        '''unpack_rta_attrs returns all attributes keyed by type'''
+        buf = bytearray(RTATTR_START_OFFSET + 20)
+        struct.pack_into("HH5sxxxHHc", buf, RTATTR_START_OFFSET, 9, 3,
+                         b"eth0\0", 5, 16, int_to_bytes(OPER_UP))
+        self.assertEqual(
+            {3: b"eth0\0", 16: int_to_bytes(OPER_UP)},
+            unpack_rta_attrs(bytes(buf), RTATTR_START_OFFSET))
+
+    def test_unpack_rta_attrs_stops_on_invalid_length(self):
+        '''unpack_rta_attrs ignores data after a zero length attribute'''
+        buf = bytearray(48)
+        struct.pack_into("HHc", buf, RTATTR_START_OFFSET, 5, 16,
+                         int_to_bytes(OPER_UP))
+        self.assertEqual(
+            {16: int_to_bytes(OPER_UP)},
+            unpack_rta_attrs(bytes(buf), RTATTR_START_OFFSET))
+
+
+def netlink_msg(msg_type, payload=b'', seq=1):
+    return struct.pack(
+        NLMSGHDR_FMT, 16 + len(payload), msg_type, 0, seq, 0) + payload
+
+
+@mock.patch('cloudinit.sources.helpers.netlink.socket.socket')
+class TestDumpNetlinkMessages(CiTestCase):
+
+    def test_dump_returns_messages_until_done(self, m_socket):
+        '''dump_netlink_messages reads all messages of a multipart reply'''
+        msg1 = netlink_msg(RTM_NEWLINK, b'link')
+        msg2 = netlink_msg(RTM_NEWLINK, b'lnk2')
+        other = netlink_msg(RTM_NEWLINK, b'othr', seq=7)
+        sock = m_socket.return_value
+        sock.recv.side_effect = [msg1 + other, msg2 + netlink_msg(NLMSG_DONE)]
+        self.assertEqual(
+            [msg1, msg2], dump_netlink_messages(RTM_GETLINK, b'request'))
+        sock.sendall.assert_called_once_with(
+            struct.pack(NLMSGHDR_FMT, 23, RTM_GETLINK,
+                        NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + b'request')
+
+    def test_dump_raises_on_netlink_error(self, m_socket):
+        '''dump_netlink_messages raises NetlinkDumpError on NLMSG_ERROR'''
+        sock = m_socket.return_value
+        sock.recv.return_value = netlink_msg(
+            NLMSG_ERROR, struct.pack("i", -1))
+        with self.assertRaises(NetlinkDumpError) as context:
+            dump_netlink_messages(RTM_GETLINK, b'')
+        self.assertEqual('Netlink dump failed: Operation not permitted',
+                         str(context.exception))
+
+    def test_dump_raises_on_socket_error(self, m_socket):
+        '''dump_netlink_messages raises NetlinkDumpError on socket errors'''
+        sock = m_socket.return_value
+        sock.recv.side_effect = socket.timeout('timed out')
+        with self.assertRaises(NetlinkDumpError) as context:
+            dump_netlink_messages(RTM_GETLINK, b'')
+        self.assertEqual('Exception during netlink dump: timed out',
+                         str(context.exception))
+
 
 @mock.patch('cloudinit.sources.helpers.netlink.socket.socket')
 @mock.patch('cloudinit.sources.helpers.netlink.read_netlink_socket')
@@ -4,14 +4,17 @@ import copy
 import inspect
 import os
 import stat
+import time
 
 from cloudinit.event import EventScope, EventType
 from cloudinit.helpers import Paths
 from cloudinit import importer
+from cloudinit.reporting import events
 from cloudinit.sources import (
     EXPERIMENTAL_TEXT, INSTANCE_JSON_FILE, INSTANCE_JSON_SENSITIVE_FILE,
-    METADATA_UNKNOWN, REDACT_SENSITIVE_VALUE, UNSET, DataSource,
-    canonical_cloud_id, redact_sensitive_keys)
+    METADATA_UNKNOWN, REDACT_SENSITIVE_VALUE, UNSET, DEP_FILESYSTEM,
+    DEP_NETWORK, DataSource, DataSourceNotFoundException, canonical_cloud_id,
+    find_source, redact_sensitive_keys)
 from cloudinit.tests.helpers import CiTestCase, mock
 from cloudinit.user_data import UserDataProcessor
 from cloudinit import util
@@ -768,4 +771,145 @@ class TestCanonicalCloudID(CiTestCase):
                                region='!chinaeast',
                                platform='platform'))
 
+
+class _SlowFoundDataSource(DataSourceTestSubclassNet):
+
+    dsname = 'SlowFound'
+
+    def _get_data(self):
+        time.sleep(0.2)
+        return super(_SlowFoundDataSource, self)._get_data()
+
+
+class _FastFoundDataSource(DataSourceTestSubclassNet):
+
+    dsname = 'FastFound'
+
+
+class _NotFoundDataSource(DataSourceTestSubclassNet):
+
+    dsname = 'NotFound'
+
+    def _get_data(self):
+        return False
+
+
+class _SlowNotFoundDataSource(DataSourceTestSubclassNet):
+
+    dsname = 'SlowNotFound'
+    finished = []
+
+    def _get_data(self):
+        time.sleep(0.2)
+        self.finished.append(self.dsname)
+        return False
+
+
+class TestFindSource(CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestFindSource, self).setUp()
+        self.paths = Paths({'run_dir': self.tmp_dir()})
+        self.reporter = events.ReportEventStack(
+            'init-network', 'searching for datasources',
+            reporting_enabled=False)
+
+    def _find_source(self, ds_list, sys_cfg=None,
+                     ds_deps=(DEP_FILESYSTEM, DEP_NETWORK)):
+        with mock.patch(
+            'cloudinit.sources.list_sources', return_value=ds_list
+        ):
+            return find_source(
+                sys_cfg or {}, 'distrotest', self.paths, list(ds_deps),
+                [], [], self.reporter)
+
+    def test_serial_search_returns_first_found_datasource(self):
+        """Without datasource_probe_workers sources are probed in order."""
+        ds, dsname = self._find_source(
+            [_NotFoundDataSource, _SlowFoundDataSource, _FastFoundDataSource])
+        self.assertIsInstance(ds, _SlowFoundDataSource)
+        self.assertEqual('_SlowFoundDataSource', dsname)
+        self.assertNotIn('Probing', self.logs.getvalue())
+
+    def test_concurrent_search_honors_datasource_priority(self):
+        """A slow higher priority datasource wins over a faster one."""
+        ds, dsname = self._find_source(
+            [_NotFoundDataSource, _SlowFoundDataSource, _FastFoundDataSource],
+            sys_cfg={'datasource_probe_workers': 3})
+        self.assertIsInstance(ds, _SlowFoundDataSource)
+        self.assertEqual('_SlowFoundDataSource', dsname)
+        self.assertIn(
+            'Probing 3 network data sources using 3 workers',
+            self.logs.getvalue())
+
+    def test_concurrent_search_reports_each_probe_as_child(self):
+        """Every completed probe is recorded in the reporter's children."""
+        self._find_source(
+            [_NotFoundDataSource, _FastFoundDataSource],
+            sys_cfg={'datasource_probe_workers': 2})
+        self.assertEqual(
+            (events.status.SUCCESS, 'no network data found from'
+             ' _NotFoundDataSource'),
+            self.reporter.children['search-_NotFound'])
+        self.assertEqual(
+            (events.status.SUCCESS, 'found network data from'
+             ' _FastFoundDataSource'),
+            self.reporter.children['search-_FastFound'])
+        self.assertIn(
+            'Probe of network _NotFoundDataSource data source took',
+            self.logs.getvalue())
+
+    def test_concurrent_search_persists_only_committed_datasource(self):
+        """Only the winning datasource writes instance-data.json."""
+        with mock.patch.object(
+            DataSource, 'persist_instance_data', autospec=True
+        ) as m_persist:
+            ds, _dsname = self._find_source(
+                [_SlowFoundDataSource, _FastFoundDataSource],
+                sys_cfg={'datasource_probe_workers': 2})
+        self.assertEqual([mock.call(ds)], m_persist.call_args_list)
+
+    def test_concurrent_search_raises_when_no_datasource_found(self):
+        """DataSourceNotFoundException is raised when all probes fail."""
+        with self.assertRaises(DataSourceNotFoundException) as ctx:
+            self._find_source(
+                [_NotFoundDataSource, _NotFoundDataSource],
+                sys_cfg={'datasource_probe_workers': 2})
+        self.assertIn('Did not find any data source', str(ctx.exception))
+
+    def test_concurrent_search_waits_for_lower_priority_probes(self):
+        """No probe is still running once a datasource is returned."""
+        self.addCleanup(_SlowNotFoundDataSource.finished.clear)
+        ds, _dsname = self._find_source(
+            [_FastFoundDataSource, _SlowNotFoundDataSource],
+            sys_cfg={'datasource_probe_workers': 2})
+        self.assertIsInstance(ds, _FastFoundDataSource)
+        self.assertEqual(['SlowNotFound'], _SlowNotFoundDataSource.finished)
+        self.assertIn(
+            'Waiting for lower priority network probes:'
+            ' _SlowNotFoundDataSource', self.logs.getvalue())
+
+    def test_local_search_is_serial(self):
+        """Local datasources are probed one at a time."""
+        ds, _dsname = self._find_source(
+            [_NotFoundDataSource, _FastFoundDataSource],
+            sys_cfg={'datasource_probe_workers': 2},
+            ds_deps=(DEP_FILESYSTEM,))
+        self.assertIsInstance(ds, _FastFoundDataSource)
+        self.assertIn('Probing local data sources one at a time',
+                      self.logs.getvalue())
+        self.assertNotIn('workers', self.logs.getvalue())
+
+    def test_invalid_probe_workers_falls_back_to_serial_search(self):
+        """An invalid datasource_probe_workers value is warned about."""
+        ds, _dsname = self._find_source(
+            [_FastFoundDataSource],
+            sys_cfg={'datasource_probe_workers': 'many'})
+        self.assertIsInstance(ds, _FastFoundDataSource)
+        self.assertIn(
+            'Ignoring invalid datasource_probe_workers: many',
+            self.logs.getvalue())
+
 # vi: ts=4 expandtab
@@ -7,8 +7,10 @@
 import copy
 import os
 import pickle
+import resource
 import sys
-from collections import namedtuple
+import time
+from collections import OrderedDict, namedtuple
 from typing import Dict, Set  # noqa: F401
 
 from cloudinit.settings import (
@@ -33,13 +35,16 @@ from cloudinit.sources import NetworkConfigSource
 from cloudinit import cloud
 from cloudinit import config
 from cloudinit import distros
+from cloudinit.distros import package_planner
 from cloudinit import helpers
 from cloudinit import importer
 from cloudinit import log as logging
 from cloudinit import net
 from cloudinit.net import cmdline
+from cloudinit import persistence
 from cloudinit.reporting import events
 from cloudinit import sources
+from cloudinit import subp
 from cloudinit import type_utils
 from cloudinit import util
 
@@ -48,6 +53,14 @@ LOG = logging.getLogger(__name__)
 NULL_DATA_SOURCE = None
 NO_PREVIOUS_INSTANCE_ID = "NO_PREVIOUS_INSTANCE_ID"
 
+# Formats which the datasource cache (obj.pkl) may be written in
+CACHE_FORMAT_PICKLE = "pickle"
+CACHE_FORMAT_INDEXED = "indexed"
+CACHE_FORMATS = (CACHE_FORMAT_PICKLE, CACHE_FORMAT_INDEXED)
+
+# I/O counters of this process, including its waited for children
+PROC_IO_PATH = "/proc/self/io"
+
 
 def update_event_enabled(
     datasource: sources.DataSource,
@@ -252,7 +265,14 @@ class Init(object):
             util.write_file(
                 self.paths.get_ipath_cur("manual_clean_marker"),
                 omode="w", content="")
-        return _pkl_store(self.datasource, self.paths.get_ipath_cur("obj_pkl"))
+        cache_format = util.get_cfg_option_str(
+            self.cfg, 'datasource_cache_format', CACHE_FORMAT_PICKLE)
+        if cache_format not in CACHE_FORMATS:
+            LOG.warning("Unknown datasource_cache_format '%s', using '%s'",
+                        cache_format, CACHE_FORMAT_PICKLE)
+            cache_format = CACHE_FORMAT_PICKLE
+        return _pkl_store(self.datasource, self.paths.get_ipath_cur("obj_pkl"),
+                          cache_format=cache_format)
 
     def _get_datasources(self):
         # Any config provided???
@@ -786,6 +806,12 @@ class Init(object):
         Find the config, determine whether to apply it, apply it via
         the distro, and optionally bring it up
         """
+        # Share one snapshot of the network devices between the lookups of
+        # the datasource, the fallback config, renames and the renderers
+        with net.interface_inventory():
+            return self._apply_network_config(bring_up)
+
+    def _apply_network_config(self, bring_up):
         netcfg, src = self._find_networking_config()
         if netcfg is None:
             LOG.info("network config is disabled by %s", src)
@@ -845,6 +871,61 @@ class Init(object):
             return
 
 
+def _bytes_written():
+    """Return the bytes written by this process and its children, or None.
+
+    Reads wchar rather than write_bytes, which only counts writes reaching
+    storage and so misses writes to tmpfs and the page cache.
+    """
+    try:
+        with open(PROC_IO_PATH) as fh:
+            for line in fh:
+                key, _, value = line.partition(':')
+                if key == 'wchar':
+                    return int(value)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _resource_usage():
+    """Return a snapshot of the resources used so far, see _usage_since."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (time.monotonic(), own.ru_utime + children.ru_utime,
+            own.ru_stime + children.ru_stime, own.ru_maxrss,
+            subp.started_count(), _bytes_written())
+
+
+def _usage_since(before):
+    """Return a dict of the resources used since the snapshot before.
+
+    CPU times include subprocesses which were waited for. The RSS delta is
+    the growth in KiB of the peak resident set size of cloud-init itself,
+    so is 0 for modules which stay within the peak of earlier modules.
+    """
+    now = _resource_usage()
+    wall, utime, stime, maxrss, started, written = (
+        a - b if None not in (a, b) else None for a, b in zip(now, before))
+    return OrderedDict((
+        ('wall_time', round(wall, 6)),
+        ('user_time', round(utime, 6)),
+        ('system_time', round(stime, 6)),
+        ('max_rss_delta', maxrss),
+        ('subprocesses', started),
+        ('bytes_written', written),
+    ))
+
+
+def _module_frequency(mod, freq):
+    """Return freq, else the frequency of mod, else PER_INSTANCE."""
+    if not freq:
+        freq = mod.frequency
+    if freq not in FREQUENCIES:
+        freq = PER_INSTANCE
+    return freq
+
+
 class Modules(object):
     def __init__(self, init, cfg_files=None, reporter=None):
         self.init = init
@@ -856,6 +937,11 @@ class Modules(object):
                 name="module-reporter", description="module-desc",
                 reporting_enabled=False)
         self.reporter = reporter
+        # Resources used by each module run, see _usage_since, which are
+        # also reported with the finish event of the stage
+        if reporter.metrics is None:
+            reporter.metrics = OrderedDict()
+        self.usage = reporter.metrics
 
     @property
     def cfg(self):
@@ -941,19 +1027,61 @@ class Modules(object):
             mostly_mods.append([mod, raw_name, freq, run_args])
         return mostly_mods
 
-    def _run_modules(self, mostly_mods):
+    def _plan_packages(self, mostly_mods):
+        """Return a PackagePlanner of the packages mostly_mods install."""
+        cc = self.init.cloudify()
+        runners = helpers.Runners(self.init.paths)
+        intents = []
+        for (mod, name, freq, args) in mostly_mods:
+            pkglist = []
+            changes_sources = False
+            if not runners.has_run(
+                    "config-%s" % name, _module_frequency(mod, freq)):
+                func_args = [name, self.cfg, cc, config.LOG, args]
+                try:
+                    if hasattr(mod, 'package_intents'):
+                        pkglist = mod.package_intents(*func_args)
+                    if hasattr(mod, 'changes_package_sources'):
+                        changes_sources = mod.changes_package_sources(
+                            *func_args)
+                except Exception:
+                    util.logexc(
+                        LOG, "Planning the packages of module %s failed",
+                        name)
+                    pkglist = []
+                    changes_sources = True
+            intents.append((name, pkglist, changes_sources))
+        planner = package_planner.PackagePlanner(cc.distro)
+        planner.plan(intents)
+        return planner
+
+    def _install_planned_packages(self, planner, position, name):
+        """Install the packages planned before module name at position."""
+        myrep = events.ReportEventStack(
+            name="install-packages-%s" % name,
+            description="installing the packages planned for modules",
+            parent=self.reporter)
+        with myrep:
+            installed = planner.install(position)
+            if installed:
+                myrep.message = "installed the packages of modules %s" % (
+                    ', '.join(installed))
+            else:
+                myrep.message = "modules will install their own packages"
+                myrep.result = events.status.WARN
+
+    def _run_modules(self, mostly_mods, planner=None):
         cc = self.init.cloudify()
         # Return which ones ran
         # and which ones failed + the exception of why it failed
         failures = []
         which_ran = []
-        for (mod, name, freq, args) in mostly_mods:
+        for position, (mod, name, freq, args) in enumerate(mostly_mods):
             try:
+                if planner and position in planner.batches:
+                    self._install_planned_packages(planner, position, name)
                 # Try the modules frequency, otherwise fallback to a known one
-                if not freq:
-                    freq = mod.frequency
-                if freq not in FREQUENCIES:
-                    freq = PER_INSTANCE
+                freq = _module_frequency(mod, freq)
                 LOG.debug("Running module %s (%s) with frequency %s",
                           name, mod, freq)
 
@@ -973,8 +1101,13 @@ class Modules(object):
                     name=run_name, description=desc, parent=self.reporter)
 
                 with myrep:
-                    ran, _r = cc.run(run_name, mod.handle, func_args,
-                                     freq=freq)
+                    before = _resource_usage()
+                    try:
+                        ran, _r = cc.run(run_name, mod.handle, func_args,
+                                         freq=freq)
+                    finally:
+                        myrep.metrics = self.usage[name] = _usage_since(
+                            before)
                     if ran:
                         myrep.message = "%s ran successfully" % run_name
                     else:
@@ -1033,7 +1166,24 @@ class Modules(object):
         if forced:
             LOG.info("running unverified_modules: '%s'", ', '.join(forced))
 
-        return self._run_modules(active_mods)
+        schemas = [mod.schema for mod, _name, _freq, _args in active_mods
+                   if isinstance(getattr(mod, 'schema', None), dict)]
+        if schemas:
+            # Imported here as config.schema imports this module
+            from cloudinit.config.schema import validate_cloudconfig_modules
+            # Validate the merged config once so modules reuse the results
+            try:
+                validate_cloudconfig_modules(self.cfg, schemas)
+            except Exception:
+                util.logexc(LOG, "Failed to validate cloud-config schema")
+        # Install the packages of several modules in as few package manager
+        # runs as possible, see package_planner
+        planner = self._plan_packages(active_mods)
+        self.init.distro.package_planner = planner
+        try:
+            return self._run_modules(active_mods, planner)
+        finally:
+            self.init.distro.package_planner = None
 
 
 def read_runtime_config():
@@ -1054,9 +1204,12 @@ def fetch_base_config():
         ], reverse=True)
 
 
-def _pkl_store(obj, fname):
+def _pkl_store(obj, fname, cache_format=CACHE_FORMAT_PICKLE):
     try:
-        pk_contents = pickle.dumps(obj)
+        if cache_format == CACHE_FORMAT_INDEXED:
+            pk_contents = persistence.dump_indexed_cache(obj)
+        else:
+            pk_contents = pickle.dumps(obj)
     except Exception:
         util.logexc(LOG, "Failed pickling datasource %s", obj)
         return False
@@ -1080,9 +1233,14 @@ def _pkl_load(fname):
     if not pickle_contents:
         return None
     try:
+        if persistence.is_indexed_cache(pickle_contents):
+            return persistence.load_indexed_cache(pickle_contents)
         return pickle.loads(pickle_contents)
     except sources.DatasourceUnpickleUserDataError:
         return None
+    except persistence.IndexedCacheError as e:
+        LOG.debug("Ignoring datasource cache %s: %s", fname, e)
+        return None
     except Exception:
         util.logexc(LOG, "Failed loading pickled blob from %s", fname)
         return None
@@ -9,6 +9,9 @@ from errno import ENOEXEC
 
 LOG = logging.getLogger(__name__)
 
+# The number of commands started by subp, see started_count
+_started = 0
+
 
 def prepend_base_command(base_command, commands):
     """Ensure user-provided commands start with base_command; warn otherwise.
@@ -257,6 +260,8 @@ def subp(args, data=None, rcs=None, env=None, capture=True,
         sp = subprocess.Popen(bytes_args, stdout=stdout,
                               stderr=stderr, stdin=stdin,
                               env=env, shell=shell, cwd=cwd)
+        global _started
+        _started += 1
         (out, err) = sp.communicate(data)
     except OSError as e:
         if status_cb:
@@ -298,6 +303,11 @@ def subp(args, data=None, rcs=None, env=None, capture=True,
     return (out, err)
 
 
+def started_count():
+    """Return the number of commands started by subp in this process."""
+    return _started
+
+
 def target_path(target, path=None):
     # return 'path' inside target, accepting target as None
     if target in (None, ""):
@@ -2,9 +2,13 @@
 
 """Tests netinfo module functions and classes."""
 
+import socket
+import struct
 from copy import copy
 
-from cloudinit.netinfo import netdev_info, netdev_pformat, route_pformat
+from cloudinit.netinfo import (
+    netdev_info, netdev_pformat, route_info, route_pformat)
+from cloudinit.sources.helpers import netlink
 from cloudinit.tests.helpers import CiTestCase, mock, readResource
 
 
@@ -22,11 +26,115 @@ ROUTE_FORMATTED_OUT = readResource("netinfo/route-formatted-output")
 FREEBSD_NETDEV_OUT = readResource("netinfo/freebsd-netdev-formatted-output")
 
 
+def rta_attr(rta_type, data):
+    """Return a packed rtattr, padded to the netlink alignment."""
+    attr = struct.pack('HH', netlink.RTA_DATA_START_OFFSET + len(data),
+                       rta_type) + data
+    return attr + b'\0' * (-len(attr) % netlink.PAD_ALIGNMENT)
+
+
+def nl_msg(msg_type, header, *attrs):
+    """Return a packed netlink message with a family header and attrs."""
+    payload = header + b''.join(attrs)
+    return struct.pack(netlink.NLMSGHDR_FMT,
+                       netlink.NLMSGHDR_SIZE + len(payload), msg_type, 0, 1,
+                       0) + payload
+
+
+def link_msg(index, name, flags, mac=None):
+    attrs = [rta_attr(netlink.IFLA_IFNAME, name.encode() + b'\0')]
+    if mac:
+        attrs.append(rta_attr(netlink.IFLA_ADDRESS, bytes.fromhex(
+            mac.replace(':', ''))))
+    return nl_msg(
+        netlink.RTM_NEWLINK,
+        struct.pack(netlink.IFINFOMSG_FMT, socket.AF_UNSPEC,
+                    1 if mac else 772, index, flags, 0),
+        *attrs)
+
+
+def addr_msg(family, index, addr, prefix, scope, bcast=None):
+    attrs = [rta_attr(netlink.IFA_ADDRESS, socket.inet_pton(family, addr))]
+    if family == socket.AF_INET:
+        attrs.append(rta_attr(netlink.IFA_LOCAL,
+                              socket.inet_pton(family, addr)))
+    if bcast:
+        attrs.append(rta_attr(netlink.IFA_BROADCAST,
+                              socket.inet_pton(family, bcast)))
+    return nl_msg(
+        netlink.RTM_NEWADDR,
+        struct.pack(netlink.IFADDRMSG_FMT, family, prefix, 0, scope, index),
+        *attrs)
+
+
+def route_msg(family, dst, dst_len, oif, gateway=None, metric=None,
+              table=254, expires=0):
+    attrs = [rta_attr(netlink.RTA_TABLE, struct.pack('I', table)),
+             rta_attr(netlink.RTA_OIF, struct.pack('i', oif))]
+    if dst_len:
+        attrs.append(rta_attr(netlink.RTA_DST, socket.inet_pton(family, dst)))
+    if gateway:
+        attrs.append(rta_attr(netlink.RTA_GATEWAY,
+                              socket.inet_pton(family, gateway)))
+    if metric is not None:
+        attrs.append(rta_attr(netlink.RTA_PRIORITY, struct.pack('I', metric)))
+    if expires:
+        attrs.append(rta_attr(netlink.RTA_CACHEINFO, struct.pack(
+            'IIiIIIII', 0, 0, expires, 0, 0, 0, 0, 0)))
+    return nl_msg(
+        netlink.RTM_NEWROUTE,
+        struct.pack(netlink.RTMSG_FMT, family, dst_len, 0, 0, table % 256, 0,
+                    0, 1, 0),
+        *attrs)
+
+
+# Netlink dumps matching SAMPLE_IPADDRSHOW_OUT and SAMPLE_IPROUTE_OUT_V*
+LINK_DUMP = [
+    link_msg(1, 'lo', 0x10049),
+    link_msg(2, 'enp0s25', 0x11043, '50:7b:9d:2c:af:91'),
+]
+ADDR_DUMP = [
+    addr_msg(socket.AF_INET, 1, '127.0.0.1', 8, 254),
+    addr_msg(socket.AF_INET, 2, '192.168.2.18', 24, 0, '192.168.2.255'),
+    addr_msg(socket.AF_INET6, 1, '::1', 128, 254),
+    addr_msg(socket.AF_INET6, 2, 'fe80::7777:2222:1111:eeee', 64, 0),
+    addr_msg(socket.AF_INET6, 2, 'fe80::8107:2b92:867e:f8a6', 64, 253),
+]
+ROUTE_DUMP = [
+    route_msg(socket.AF_INET, None, 0, 2, '192.168.2.1', 100),
+    route_msg(socket.AF_INET, None, 0, 3, '192.168.2.1', 150),
+    route_msg(socket.AF_INET, '192.168.2.0', 24, 2, metric=100),
+    route_msg(socket.AF_INET, '127.0.0.0', 8, 1, table=255),
+    route_msg(socket.AF_INET6, '2a00:abcd:82ae:cd33::657', 128, 2,
+              metric=256, expires=2334),
+    route_msg(socket.AF_INET6, '2a00:abcd:82ae:cd33::', 64, 2, metric=100),
+    route_msg(socket.AF_INET6, '2a00:abcd:82ae:cd33::', 56, 2,
+              'fe80::32ee:54de:cd43:b4e1', 100),
+    route_msg(socket.AF_INET6, 'fd81:123f:654::657', 128, 2, metric=256),
+    route_msg(socket.AF_INET6, 'fd81:123f:654::', 64, 2, metric=100),
+    route_msg(socket.AF_INET6, 'fd81:123f:654::', 48, 2,
+              'fe80::32ee:54de:cd43:b4e1', 100),
+    route_msg(socket.AF_INET6, 'fe80::abcd:ef12:bc34:da21', 128, 2,
+              metric=100),
+    route_msg(socket.AF_INET6, 'fe80::', 64, 2, metric=256),
+    route_msg(socket.AF_INET6, None, 0, 2, 'fe80::32ee:54de:cd43:b4e1', 100),
+    route_msg(socket.AF_INET6, '::1', 128, 1, metric=0, table=255),
+]
+
+
 class TestNetInfo(CiTestCase):
 
     maxDiff = None
     with_logs = True
 
+    def setUp(self):
+        super(TestNetInfo, self).setUp()
+        # Exercise the ip, ifconfig and netstat parsers
+        self.add_patch('cloudinit.netinfo._netdev_info_netlink',
+                       'm_netdev_netlink', return_value=None)
+        self.add_patch('cloudinit.netinfo._netdev_route_info_netlink',
+                       'm_route_netlink', return_value=None)
+
     @mock.patch('cloudinit.netinfo.subp.which')
     @mock.patch('cloudinit.netinfo.subp.subp')
     def test_netdev_old_nettools_pformat(self, m_subp, m_which):
@@ -178,4 +286,66 @@ class TestNetInfo(CiTestCase):
             self.logs.getvalue())
         m_subp.assert_not_called()
 
+
+@mock.patch('cloudinit.netinfo.util.is_Linux', return_value=True)
+@mock.patch('cloudinit.netinfo.subp.subp')
+class TestNetInfoNetlink(CiTestCase):
+
+    maxDiff = None
+    with_logs = True
+
+    def dump(self, msg_type, _request):
+        return {netlink.RTM_GETLINK: LINK_DUMP,
+                netlink.RTM_GETADDR: ADDR_DUMP,
+                netlink.RTM_GETROUTE: ROUTE_DUMP}[msg_type]
+
+    @mock.patch('cloudinit.netinfo.netlink.dump_netlink_messages')
+    def test_netdev_pformat_from_netlink(self, m_dump, m_subp, _m_linux):
+        """netdev_pformat renders netlink dumps like ip addr show output."""
+        m_dump.side_effect = self.dump
+        new_output = copy(NETDEV_FORMATTED_OUT)
+        new_output = new_output.replace('|   .    | 50:7b', '| global | 50:7b')
+        new_output = new_output.replace(
+            '255.0.0.0   |   .    |', '255.0.0.0   |  host  |')
+        self.assertEqual(new_output, netdev_pformat())
+        m_subp.assert_not_called()
+
+    @mock.patch('cloudinit.netinfo.socket.if_nameindex')
+    @mock.patch('cloudinit.netinfo.netlink.dump_netlink_messages')
+    def test_route_pformat_from_netlink(
+            self, m_dump, m_nameindex, m_subp, _m_linux):
+        """route_pformat renders netlink dumps like ip route output."""
+        m_dump.side_effect = self.dump
+        m_nameindex.return_value = [(1, 'lo'), (2, 'enp0s25'), (3, 'wlp3s0')]
+        self.assertEqual(ROUTE_FORMATTED_OUT, route_pformat())
+        m_subp.assert_not_called()
+
+    @mock.patch('cloudinit.netinfo.socket.if_nameindex')
+    @mock.patch('cloudinit.netinfo.netlink.dump_netlink_messages')
+    def test_route_info_matches_iproute_metrics(
+            self, m_dump, m_nameindex, m_subp, _m_linux):
+        """Route metrics and the local ipv6 table are read like ip does."""
+        m_dump.side_effect = self.dump
+        m_nameindex.return_value = [(1, 'lo'), (2, 'enp0s25'), (3, 'wlp3s0')]
+        routes = route_info()
+        self.assertEqual(
+            ['100', '150', '100'], [r['metric'] for r in routes['ipv4']])
+        self.assertEqual(
+            {'destination': '::1', 'gateway': '::', 'flags': 'U',
+             'iface': 'lo', 'metric': '0'},
+            routes['ipv6'][-1])
+
+    @mock.patch('cloudinit.netinfo.subp.which')
+    @mock.patch('cloudinit.netinfo.netlink.dump_netlink_messages')
+    def test_netdev_info_falls_back_to_iproute(
+            self, m_dump, m_which, m_subp, _m_linux):
+        """netdev_info parses ip addr show when netlink is unavailable."""
+        m_dump.side_effect = netlink.NetlinkCreateSocketError('no netlink')
+        m_which.side_effect = lambda x: x if x == 'ip' else None
+        m_subp.return_value = (SAMPLE_IPADDRSHOW_OUT, '')
+        self.assertEqual(['enp0s25', 'lo'], sorted(netdev_info()))
+        m_subp.assert_called_once_with(['ip', 'addr', 'show'])
+        self.assertIn(
+            'Could not read rtnetlink dump: no netlink', self.logs.getvalue())
+
 # vi: ts=4 expandtab
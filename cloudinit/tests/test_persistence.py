@@ -24,12 +24,20 @@ To avoid manually maintaining a list of classes for parametrization we use a
 simple metaclass, ``_Collector``, to gather them up.
 """
 
+import json
 import pickle
+import struct
 from unittest import mock
 
 import pytest
 
-from cloudinit.persistence import CloudInitPickleMixin
+from cloudinit.persistence import (
+    CloudInitPickleMixin,
+    IndexedCacheError,
+    dump_indexed_cache,
+    load_indexed_cache,
+    read_indexed_cache_header,
+)
 
 
 class _Collector(type):
@@ -125,3 +133,167 @@ class TestPickleMixin:
         part of the pickle load.
         """
         pickle.loads(pickle.dumps(cls()))
+
+
+class IndexedCacheOwner(CloudInitPickleMixin):
+    """A class to round-trip through the indexed cache format."""
+
+    _ci_pkl_version = 3
+    shadowed = "class default"
+
+    def __init__(self):
+        self.shadowed = "instance value"
+        self.blob = b"x" * 1024
+        self.metadata = {"instance-id": "i-1234"}
+        self.child = StateIsRestored()
+        self.back_reference = {"owner": self}
+
+    def _unpickle(self, ci_pkl_version: int) -> None:
+        self.unpickled_version = ci_pkl_version
+
+
+class SharedAttrsOwner(CloudInitPickleMixin):
+    """A class whose attributes reference each other."""
+
+    def __init__(self):
+        paths = {"run_dir": "/run/cloud-init"}
+        self.distro = {"paths": paths}
+        self.paths = paths
+        self.first = {}
+        self.second = {"first": self.first}
+        self.first["second"] = self.second
+
+
+def _rewrite_header(blob, update):
+    """Return blob with its JSON header modified in place by update."""
+    header = read_indexed_cache_header(blob)
+    payload = blob[header.pop("payload_offset"):]
+    update(header)
+    encoded = json.dumps(header).encode("utf-8")
+    return struct.pack(
+        "!8sHI", b"CI-CACHE", 1, len(encoded)) + encoded + payload
+
+
+class TestIndexedCache:
+    def test_round_trip_restores_state(self):
+        """Each attribute is restored, as is any reference to the owner."""
+        obj = load_indexed_cache(dump_indexed_cache(IndexedCacheOwner()))
+        assert isinstance(obj, IndexedCacheOwner)
+        assert "instance value" == obj.shadowed
+        assert b"x" * 1024 == obj.blob
+        assert {"instance-id": "i-1234"} == obj.metadata
+        assert "some state" == obj.child.some_state
+        assert obj is obj.back_reference["owner"]
+
+    def test_attributes_are_loaded_lazily(self):
+        """Only attributes shadowing class attributes are loaded eagerly."""
+        obj = load_indexed_cache(dump_indexed_cache(IndexedCacheOwner()))
+        assert "instance value" == obj.__dict__["shadowed"]
+        assert "metadata" not in obj.__dict__
+        assert "i-1234" == obj.metadata["instance-id"]
+        assert "metadata" in obj.__dict__
+        assert "blob" not in obj.__dict__
+
+    def test_unknown_attribute_raises_attribute_error(self):
+        """Missing attributes still raise AttributeError."""
+        obj = load_indexed_cache(dump_indexed_cache(IndexedCacheOwner()))
+        assert not hasattr(obj, "unpickled_version")
+        with pytest.raises(AttributeError, match="no attribute 'missing'"):
+            obj.missing  # pylint: disable=pointless-statement
+
+    def test_pickling_loads_deferred_attributes(self):
+        """A lazily loaded object pickles all of its attributes."""
+        obj = load_indexed_cache(dump_indexed_cache(IndexedCacheOwner()))
+        restored = pickle.loads(pickle.dumps(obj))
+        assert b"x" * 1024 == restored.blob
+        assert "_ci_lazy_attrs" not in restored.__dict__
+
+    def test_unpickle_called_on_version_change(self):
+        """_unpickle is only called when the class version has changed."""
+        blob = dump_indexed_cache(IndexedCacheOwner())
+        with mock.patch.object(IndexedCacheOwner, "_ci_pkl_version", 4):
+            obj = load_indexed_cache(blob)
+        assert 3 == obj.unpickled_version
+        assert "blob" in obj.__dict__
+
+    def test_cache_from_other_python_is_loaded_in_full(self):
+        """A cache written by another python version is not deferred."""
+        with mock.patch(
+            "cloudinit.persistence._python_version", return_value="2.7"
+        ):
+            blob = dump_indexed_cache(IndexedCacheOwner())
+        obj = load_indexed_cache(blob)
+        assert "_ci_lazy_attrs" not in obj.__dict__
+        assert b"x" * 1024 == obj.__dict__["blob"]
+        assert 3 == obj.unpickled_version
+
+    def test_header_is_read_without_loading_attributes(self):
+        """The header describes the cache and the offset of each attribute."""
+        header = read_indexed_cache_header(
+            dump_indexed_cache(IndexedCacheOwner()))
+        assert [__name__, "IndexedCacheOwner"] == header["class"]
+        assert 3 == header["ci_pkl_version"]
+        assert sorted(
+            ["shadowed", "blob", "metadata", "child", "back_reference"]
+        ) == sorted(header["attrs"])
+
+    @pytest.mark.parametrize(
+        "blob,message",
+        [
+            (b"", "truncated cache preamble"),
+            (pickle.dumps({"key": "value" * 4}), "not an indexed cache"),
+            (b"CI-CACHE\x00\x02\x00\x00\x00\x00",
+             "unsupported cache format version 2"),
+        ],
+    )
+    def test_invalid_cache_raises(self, blob, message):
+        """Malformed or unsupported caches raise IndexedCacheError."""
+        with pytest.raises(IndexedCacheError, match=message):
+            load_indexed_cache(blob)
+
+    def test_missing_class_raises(self):
+        """A cache referencing a class which no longer exists is stale."""
+        blob = dump_indexed_cache(IndexedCacheOwner())
+        with mock.patch.dict(globals()):
+            del globals()["IndexedCacheOwner"]
+            with pytest.raises(IndexedCacheError, match="not found"):
+                load_indexed_cache(blob)
+
+    @pytest.mark.parametrize("first_attr", ["distro", "paths"])
+    def test_shared_attributes_stay_shared(self, first_attr):
+        """An attribute referenced from another one is restored once."""
+        obj = load_indexed_cache(dump_indexed_cache(SharedAttrsOwner()))
+        getattr(obj, first_attr)
+        assert obj.distro["paths"] is obj.paths
+        assert {"run_dir": "/run/cloud-init"} == obj.paths
+
+    def test_attributes_referencing_each_other_load(self):
+        """Attributes in a reference cycle are loaded without recursing."""
+        obj = load_indexed_cache(dump_indexed_cache(SharedAttrsOwner()))
+        obj._ci_load_lazy_attrs()
+        assert obj.first["second"] is obj.second
+        copy = obj.second["first"]
+        assert copy["second"]["first"] is copy
+
+    def test_truncated_cache_raises(self):
+        """A cache cut short is detected before any attribute is loaded."""
+        blob = dump_indexed_cache(IndexedCacheOwner())
+        with pytest.raises(IndexedCacheError, match="cache payload is"):
+            load_indexed_cache(blob[:-1])
+
+    def test_attribute_beyond_payload_raises(self):
+        """Attribute offsets are checked against the payload length."""
+        def update(header):
+            header["attrs"]["blob"][1] = header["payload_length"] + 1
+
+        blob = _rewrite_header(dump_indexed_cache(IndexedCacheOwner()), update)
+        with pytest.raises(IndexedCacheError, match="blob exceeds"):
+            load_indexed_cache(blob)
+
+    def test_header_without_payload_length_raises(self):
+        """A header missing the payload length is invalid."""
+        blob = _rewrite_header(
+            dump_indexed_cache(IndexedCacheOwner()),
+            lambda header: header.pop("payload_length"))
+        with pytest.raises(IndexedCacheError, match="invalid cache header"):
+            load_indexed_cache(blob)
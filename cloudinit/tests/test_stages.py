@@ -6,6 +6,8 @@ import stat
 
 import pytest
 
+from cloudinit import distros
+from cloudinit import persistence
 from cloudinit import stages
 from cloudinit import sources
 from cloudinit.sources import NetworkConfigSource
@@ -416,6 +418,81 @@ class TestInit(CiTestCase):
             "network update allowed"
         ) in self.logs.getvalue()
 
+    def test_write_to_cache_defaults_to_pickle(self):
+        """The datasource cache is pickled unless configured otherwise."""
+        self.assertTrue(self.init._write_to_cache())
+        cache_file = self.init.paths.get_ipath_cur('obj_pkl')
+        with open(cache_file, 'rb') as stream:
+            self.assertEqual(b'\x80', stream.read(1))
+
+    def test_write_to_cache_honors_indexed_cache_format(self):
+        """datasource_cache_format: indexed writes a restorable cache."""
+        self.init._cfg['datasource_cache_format'] = 'indexed'
+        self.init.datasource.distro = distros.fetch('ubuntu')(
+            'ubuntu', {}, self.init.paths)
+        self.assertTrue(self.init._write_to_cache())
+        cache_file = self.init.paths.get_ipath_cur('obj_pkl')
+        with open(cache_file, 'rb') as stream:
+            self.assertTrue(persistence.is_indexed_cache(stream.read()))
+        ds = self.init._restore_from_cache()
+        self.assertIsInstance(ds, FakeDataSource)
+        self.assertEqual(TEST_INSTANCE_ID, ds.get_instance_id())
+        self.assertIs(ds.paths, ds.distro._paths)
+
+    def test_write_to_cache_warns_on_unknown_cache_format(self):
+        """An unknown datasource_cache_format falls back to pickle."""
+        self.init._cfg['datasource_cache_format'] = 'bogus'
+        self.assertTrue(self.init._write_to_cache())
+        self.assertIn(
+            "Unknown datasource_cache_format 'bogus', using 'pickle'",
+            self.logs.getvalue())
+
+    def test_restore_from_cache_ignores_truncated_indexed_cache(self):
+        """A truncated indexed cache is discarded and not loaded."""
+        cache_file = self.init.paths.get_ipath_cur('obj_pkl')
+        write_file(
+            cache_file,
+            persistence.dump_indexed_cache(self.init.datasource)[:-1],
+            omode='wb')
+        self.assertIsNone(self.init._restore_from_cache())
+        self.assertIn(
+            'Ignoring datasource cache %s: cache payload is' % cache_file,
+            self.logs.getvalue())
+
+    def test_restore_from_cache_loads_indexed_cache_from_other_python(self):
+        """An indexed cache from another python version is fully loaded."""
+        cache_file = self.init.paths.get_ipath_cur('obj_pkl')
+        with mock.patch(
+            'cloudinit.persistence._python_version', return_value='2.7'
+        ):
+            write_file(
+                cache_file,
+                persistence.dump_indexed_cache(self.init.datasource),
+                omode='wb')
+        ds = self.init._restore_from_cache()
+        self.assertEqual(self.init.datasource.paths.cloud_dir,
+                         ds.paths.cloud_dir)
+        self.assertNotIn('_ci_lazy_attrs', ds.__dict__)
+
+    def test_restore_from_cache_ignores_unloadable_indexed_cache(self):
+        """An indexed cache which fails to unpickle is discarded."""
+        cache_file = self.init.paths.get_ipath_cur('obj_pkl')
+        with mock.patch(
+            'cloudinit.persistence._python_version', return_value='2.7'
+        ):
+            write_file(
+                cache_file,
+                persistence.dump_indexed_cache(self.init.datasource),
+                omode='wb')
+        with mock.patch(
+            'cloudinit.persistence._AttrUnpickler.load',
+            side_effect=ValueError('unsupported pickle protocol: 9')
+        ):
+            self.assertIsNone(self.init._restore_from_cache())
+        self.assertIn(
+            'Failed loading pickled blob from %s' % cache_file,
+            self.logs.getvalue())
+
 
 class TestInit_InitializeFilesystem:
     """Tests for cloudinit.stages.Init._initialize_filesystem.
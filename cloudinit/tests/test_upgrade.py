@@ -13,28 +13,41 @@ tests in ``TestUpgrade``) and then checks that these hold true after unpickling
 ``tests/data/old_pickles/``.
 """
 
-import operator
 import pathlib
 
 import pytest
 
+from cloudinit.persistence import dump_indexed_cache, load_indexed_cache
 from cloudinit.stages import _pkl_load
 from cloudinit.tests.helpers import resourceLocation
 
 
 class TestUpgrade:
     @pytest.fixture(
-        params=pathlib.Path(resourceLocation("old_pickles")).glob("*.pkl"),
+        params=[
+            (path, indexed)
+            for path in pathlib.Path(
+                resourceLocation("old_pickles")).glob("*.pkl")
+            for indexed in (False, True)
+        ],
         scope="class",
-        ids=operator.attrgetter("name"),
+        ids=lambda param: "%s%s" % (
+            param[0].name, "-indexed" if param[1] else ""),
     )
     def previous_obj_pkl(self, request):
         """Load each pickle to memory once, then run all tests against it.
 
+        Each pickle is also round-tripped through the indexed cache format,
+        as it would be when cloud-init rewrites its cache after an upgrade.
+
         Test implementations _must not_ modify the ``previous_obj_pkl`` which
         they are passed, as that will affect tests that run after them.
         """
-        return _pkl_load(str(request.param))
+        path, indexed = request.param
+        obj = _pkl_load(str(path))
+        if indexed:
+            obj = load_indexed_cache(dump_indexed_cache(obj))
+        return obj
 
     def test_networking_set_on_distro(self, previous_obj_pkl):
         """We always expect to have ``.networking`` on ``Distro`` objects."""
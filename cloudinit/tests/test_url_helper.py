@@ -1,15 +1,19 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 from cloudinit.url_helper import (
-    NOT_FOUND, UrlError, REDACTED, oauth_headers, read_file_or_url,
-    retry_on_url_exc)
+    NOT_FOUND, RACE_DEFAULT_TIMEOUT, SESSION_POOL_MAXSIZE, UrlError, REDACTED,
+    close_sessions, get_session,
+    oauth_headers, read_file_or_url, readurl, retry_on_url_exc, wait_for_url)
 from cloudinit.tests.helpers import CiTestCase, mock, skipIf
 from cloudinit import util
 from cloudinit import version
 
+from concurrent import futures
 import httpretty
 import logging
 import requests
+import threading
+import time
 
 
 try:
@@ -157,6 +161,178 @@ class TestReadFileOrUrl(CiTestCase):
         self.assertEqual(m_response, response._response)
 
 
+class TestPooledSessions(CiTestCase):
+
+    def setUp(self):
+        super(TestPooledSessions, self).setUp()
+        self.addCleanup(close_sessions)
+
+    def test_get_session_reuses_session_per_host(self):
+        """Urls on the same scheme and host share a single session."""
+        session = get_session('http://169.254.169.254/latest/meta-data')
+        self.assertIs(
+            session, get_session('http://169.254.169.254/latest/user-data'))
+        self.assertIsNot(session, get_session('https://169.254.169.254/'))
+        self.assertIsNot(session, get_session('http://[fd00:ec2::254]/'))
+
+    def test_get_session_grows_pool_to_requested_size(self):
+        """A larger pool_maxsize grows the pool, a smaller one is ignored."""
+        url = 'http://169.254.169.254/latest/meta-data'
+        session = get_session(url)
+        self.assertEqual(
+            SESSION_POOL_MAXSIZE, session.get_adapter(url)._pool_maxsize)
+        self.assertIs(session, get_session(url, pool_maxsize=16))
+        self.assertEqual(16, session.get_adapter(url)._pool_maxsize)
+        get_session(url, pool_maxsize=2)
+        self.assertEqual(16, session.get_adapter(url)._pool_maxsize)
+
+    def test_close_sessions_closes_and_forgets_pooled_sessions(self):
+        """close_sessions closes sessions so new ones are created later."""
+        session = get_session('http://hostname/path')
+        with mock.patch.object(session, 'close') as m_close:
+            close_sessions()
+        self.assertEqual(1, m_close.call_count)
+        self.assertIsNot(session, get_session('http://hostname/path'))
+
+    @httpretty.activate
+    def test_readurl_uses_pooled_session_without_closing_it(self):
+        """readurl without a session leaves the pooled session open."""
+        url = 'http://hostname/path'
+        httpretty.register_uri(
+            httpretty.GET, url, body='content',
+            adding_headers={'Set-Cookie': 'key=value'})
+        session = get_session(url)
+        with mock.patch.object(session, 'close') as m_close:
+            self.assertEqual(b'content', readurl(url).contents)
+            self.assertEqual(b'content', readurl(url).contents)
+        self.assertEqual(0, m_close.call_count)
+        self.assertIs(session, get_session(url))
+        self.assertEqual(0, len(session.cookies))
+
+    @httpretty.activate
+    def test_readurl_closes_provided_session(self):
+        """An explicitly provided session is closed and not pooled."""
+        url = 'http://hostname/path'
+        httpretty.register_uri(httpretty.GET, url, body='content')
+        session = requests.Session()
+        with mock.patch.object(session, 'close') as m_close:
+            readurl(url, session=session)
+        self.assertEqual(1, m_close.call_count)
+        self.assertIsNot(session, get_session(url))
+
+
+class TestWaitForUrlRace(CiTestCase):
+
+    SLOW_URL = 'http://slow/path'
+    FAST_URL = 'http://fast/path'
+    BAD_URL = 'http://bad/path'
+
+    def _readurl(self, url, **kwargs):
+        if url == self.BAD_URL:
+            raise UrlError(ValueError('down'), url=url)
+        if url == self.SLOW_URL:
+            time.sleep(0.5)
+        response = mock.MagicMock(contents=url.encode(), code=200)
+        response.ok.return_value = True
+        return response
+
+    @mock.patch(M_PATH + 'readurl')
+    def test_race_returns_first_good_response(self, m_readurl):
+        """The fastest good url wins regardless of its position."""
+        m_readurl.side_effect = self._readurl
+        start = time.time()
+        url, contents = wait_for_url(
+            [self.SLOW_URL, self.FAST_URL], max_wait=10, timeout=5,
+            race=True)
+        self.assertEqual(self.FAST_URL, url)
+        self.assertEqual(self.FAST_URL.encode(), contents)
+        self.assertLess(time.time() - start, 0.5)
+
+    @mock.patch(M_PATH + 'readurl')
+    def test_race_reports_failures_to_callbacks(self, m_readurl):
+        """status_cb and exception_cb are called for each failed url."""
+        m_readurl.side_effect = self._readurl
+        status_cb = mock.Mock()
+        exception_cb = mock.Mock()
+        url, _contents = wait_for_url(
+            [self.BAD_URL, self.SLOW_URL], max_wait=10, timeout=5,
+            status_cb=status_cb, exception_cb=exception_cb, race=True)
+        self.assertEqual(self.SLOW_URL, url)
+        self.assertEqual(1, status_cb.call_count)
+        self.assertIn(
+            "Calling '%s' failed" % self.BAD_URL, status_cb.call_args[0][0])
+        exception = exception_cb.call_args[1]['exception']
+        self.assertIsInstance(exception, UrlError)
+
+    @mock.patch(M_PATH + 'time.sleep')
+    @mock.patch(M_PATH + 'readurl')
+    def test_race_gives_up_when_no_url_responds(self, m_readurl, m_sleep):
+        """A max_wait of 0 results in a single concurrent attempt."""
+        m_readurl.side_effect = UrlError(ValueError('down'))
+        self.assertEqual(
+            (False, None),
+            wait_for_url(
+                [self.BAD_URL, self.FAST_URL], max_wait=0, race=True))
+        self.assertEqual(2, m_readurl.call_count)
+        self.assertEqual(0, m_sleep.call_count)
+
+    @mock.patch(M_PATH + 'readurl')
+    def test_race_prefers_earlier_urls_arriving_together(self, m_readurl):
+        """Good responses collected together are taken in list order."""
+        m_readurl.side_effect = self._readurl
+        wait = futures.wait
+
+        def wait_all(fs, return_when):
+            return wait(fs, return_when=futures.ALL_COMPLETED)
+
+        with mock.patch(M_PATH + 'futures.wait', side_effect=wait_all):
+            url, _contents = wait_for_url(
+                [self.SLOW_URL, self.FAST_URL], max_wait=10, timeout=5,
+                race=True)
+        self.assertEqual(self.SLOW_URL, url)
+
+    @mock.patch(M_PATH + 'readurl')
+    def test_race_calls_headers_cb_from_calling_thread(self, m_readurl):
+        """headers_cb is called for every url before any request is made."""
+        m_readurl.side_effect = self._readurl
+        threads = []
+
+        def headers_cb(url):
+            self.assertEqual(0, m_readurl.call_count)
+            threads.append(threading.current_thread())
+            return {'url': url}
+
+        wait_for_url(
+            [self.SLOW_URL, self.FAST_URL], max_wait=10, timeout=5,
+            headers_cb=headers_cb, race=True)
+        self.assertEqual([threading.current_thread()] * 2, threads)
+        self.assertCountEqual(
+            [{'url': self.SLOW_URL}, {'url': self.FAST_URL}],
+            [call[1]['headers'] for call in m_readurl.call_args_list])
+
+    @mock.patch(M_PATH + 'readurl')
+    def test_race_bounds_requests_without_timeout(self, m_readurl):
+        """Racing without a timeout uses RACE_DEFAULT_TIMEOUT."""
+        m_readurl.side_effect = self._readurl
+        wait_for_url([self.BAD_URL, self.BAD_URL], max_wait=0, race=True)
+        self.assertEqual(
+            [RACE_DEFAULT_TIMEOUT] * 2,
+            [call[1]['timeout'] for call in m_readurl.call_args_list])
+
+    @mock.patch(M_PATH + 'readurl')
+    def test_race_propagates_exception_cb_errors(self, m_readurl):
+        """exception_cb may raise to interrupt waiting, as without race."""
+        m_readurl.side_effect = self._readurl
+
+        def exception_cb(msg, exception):
+            raise exception
+
+        with self.assertRaises(UrlError):
+            wait_for_url(
+                [self.BAD_URL, self.SLOW_URL], max_wait=10, race=True,
+                exception_cb=exception_cb)
+
+
 class TestRetryOnUrlExc(CiTestCase):
 
     def test_do_not_retry_non_urlerror(self):
@@ -11,11 +11,14 @@
 import copy
 import json
 import os
+import threading
 import time
+from concurrent import futures
 from email.utils import parsedate
 from errno import ENOENT
 from functools import partial
 from http.client import NOT_FOUND
+from http.cookiejar import DefaultCookiePolicy
 from itertools import count
 from urllib.parse import urlparse, urlunparse, quote
 
@@ -46,6 +49,65 @@ except ImportError:
     pass
 
 
+# Keep-alive connections retained per host by pooled sessions, unless a
+# larger pool is requested from get_session.
+SESSION_POOL_MAXSIZE = 4
+
+# Request timeout used by wait_for_url when racing urls without a timeout,
+# so that requests losing the race finish within it.
+RACE_DEFAULT_TIMEOUT = 10
+
+# Process-wide registry of pooled requests.Session objects and the size of
+# their connection pool, keyed by (scheme, netloc). See get_session and
+# close_sessions.
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def _session_key(url):
+    parsed_url = urlparse(url)
+    return (parsed_url.scheme, parsed_url.netloc)
+
+
+def get_session(url, pool_maxsize=SESSION_POOL_MAXSIZE):
+    """Return the process-wide pooled requests.Session for url's host.
+
+    Sessions are created on first use and kept open so that subsequent
+    requests to the same scheme and host reuse keep-alive connections.
+    Each host keeps at most pool_maxsize idle connections; callers making
+    concurrent requests should pass their number of workers. A pool is
+    only ever grown. Pooled sessions are shared between threads, so they
+    reject all cookies. Call close_sessions to tear them down.
+    """
+    key = _session_key(url)
+    prefix = '%s://' % key[0]
+    with _SESSIONS_LOCK:
+        session, maxsize = _SESSIONS.get(key, (None, 0))
+        if session is None:
+            session = requests.Session()
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        if maxsize < pool_maxsize:
+            previous = session.adapters.get(prefix)
+            session.mount(prefix, requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=pool_maxsize))
+            if previous is not None:
+                previous.close()
+            _SESSIONS[key] = (session, pool_maxsize)
+    return session
+
+
+def close_sessions():
+    """Close all pooled sessions and their keep-alive connections."""
+    with _SESSIONS_LOCK:
+        sessions = [session for session, _maxsize in _SESSIONS.values()]
+        _SESSIONS.clear()
+    for session in sessions:
+        try:
+            session.close()
+        except Exception as e:
+            LOG.debug("Failed to close pooled url session: %s", e)
+
+
 def _cleanurl(url):
     parsed_url = list(urlparse(url, scheme='http'))
     if not parsed_url[1] and parsed_url[2]:
@@ -218,7 +280,10 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
         as 'allow_redirects'. Default: True.
     :param exception_cb: Optional callable which accepts the params
         msg and exception and returns a boolean True if retries are permitted.
-    :param session: Optional exiting requests.Session instance to reuse.
+    :param session: Optional exiting requests.Session instance to reuse. The
+        session is closed once the request completes. When absent, the
+        pooled session for url's host from get_session is used and left
+        open for later requests.
     :param infinite: Bool, set True to retry indefinitely. Default: False.
     :param log_req_resp: Set False to turn off verbose debug messages.
     :param request_method: String passed as 'method' to Session.request.
@@ -297,10 +362,10 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
                           filtered_req_args)
 
             if session is None:
-                session = requests.Session()
-
-            with session as sess:
-                r = sess.request(**req_args)
+                r = get_session(url).request(**req_args)
+            else:
+                with session as sess:
+                    r = sess.request(**req_args)
 
             if check_status:
                 r.raise_for_status()
@@ -341,9 +406,40 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
     return None  # Should throw before this...
 
 
+def _attempt_wait_for_url(url, timeout, headers, headers_redact,
+                          request_method):
+    """Make a single wait_for_url request to url.
+
+    @return: A tuple of (response, url_exc, reason). url_exc is None when
+        the response is usable, otherwise reason describes the failure.
+    """
+    response = None
+    try:
+        response = readurl(
+            url, headers=headers, headers_redact=headers_redact,
+            timeout=timeout, check_status=False,
+            request_method=request_method)
+        if not response.contents:
+            reason = "empty response [%s]" % (response.code)
+            return (response, UrlError(
+                ValueError(reason), code=response.code,
+                headers=response.headers, url=url), reason)
+        elif not response.ok():
+            reason = "bad status code [%s]" % (response.code)
+            return (response, UrlError(
+                ValueError(reason), code=response.code,
+                headers=response.headers, url=url), reason)
+        return (response, None, "")
+    except UrlError as e:
+        return (response, e, "request error [%s]" % e)
+    except Exception as e:
+        return (response, e, "unexpected error [%s]" % e)
+
+
 def wait_for_url(urls, max_wait=None, timeout=None, status_cb=None,
                  headers_cb=None, headers_redact=None, sleep_time=1,
-                 exception_cb=None, sleep_time_cb=None, request_method=None):
+                 exception_cb=None, sleep_time_cb=None, request_method=None,
+                 race=False):
     """
     urls:      a list of urls to try
     max_wait:  roughly the maximum time to wait before giving up
@@ -360,6 +456,14 @@ def wait_for_url(urls, max_wait=None, timeout=None, status_cb=None,
     sleep_time_cb: call method with 2 arguments (response, loop_n) that
                    generates the next sleep time.
     request_method: indicate the type of HTTP request, GET, PUT, or POST
+    race:      request all urls concurrently in each loop and return the
+               first good response. Each loop then takes at most one
+               timeout rather than len(urls)*timeout. Good responses
+               arriving together are taken in the order of urls. Requests
+               still queued when the race is won are cancelled; those
+               already sent finish within timeout, RACE_DEFAULT_TIMEOUT
+               seconds when no timeout is given. headers_cb, status_cb and
+               exception_cb are called from the calling thread.
     returns: tuple of (url, response contents), on failure, (False, None)
 
     the idea of this routine is to wait for the EC2 metadata service to
@@ -392,6 +496,31 @@ def wait_for_url(urls, max_wait=None, timeout=None, status_cb=None,
             return False
         return ((max_wait <= 0) or (time.time() - start_time > max_wait))
 
+    def url_headers(url):
+        """Return the headers for url, or None once its failure is reported.
+        """
+        if headers_cb is None:
+            return {}
+        try:
+            return headers_cb(url) or {}
+        except Exception as e:
+            report_failure(url, e, "unexpected error [%s]" % e)
+            return None
+
+    def report_failure(url, url_exc, reason):
+        time_taken = int(time.time() - start_time)
+        max_wait_str = "%ss" % max_wait if max_wait else "unlimited"
+        status_msg = "Calling '%s' failed [%s/%s]: %s" % (url,
+                                                          time_taken,
+                                                          max_wait_str,
+                                                          reason)
+        status_cb(status_msg)
+        if exception_cb:
+            # This can be used to alter the headers that will be sent
+            # in the future, for example this is what the MAAS datasource
+            # does.
+            exception_cb(msg=status_msg, exception=url_exc)
+
     loop_n = 0
     response = None
     while True:
@@ -399,57 +528,64 @@ def wait_for_url(urls, max_wait=None, timeout=None, status_cb=None,
             sleep_time = sleep_time_cb(response, loop_n)
         else:
             sleep_time = int(loop_n / 5) + 1
-        for url in urls:
+        if race and len(urls) > 1:
             now = time.time()
             if loop_n != 0:
                 if timeup(max_wait, start_time):
                     break
-                if (max_wait is not None and
-                        timeout and (now + timeout > (start_time + max_wait))):
+                if (max_wait is not None and timeout and
+                        (now + timeout > (start_time + max_wait))):
                     # shorten timeout to not run way over max_time
                     timeout = int((start_time + max_wait) - now)
-
-            reason = ""
-            url_exc = None
+            race_timeout = timeout
+            if race_timeout is None:
+                race_timeout = RACE_DEFAULT_TIMEOUT
+            executor = futures.ThreadPoolExecutor(
+                max_workers=len(urls), thread_name_prefix="url-race")
+            pending = {}
             try:
-                if headers_cb is not None:
-                    headers = headers_cb(url)
-                else:
-                    headers = {}
-
-                response = readurl(
-                    url, headers=headers, headers_redact=headers_redact,
-                    timeout=timeout, check_status=False,
-                    request_method=request_method)
-                if not response.contents:
-                    reason = "empty response [%s]" % (response.code)
-                    url_exc = UrlError(ValueError(reason), code=response.code,
-                                       headers=response.headers, url=url)
-                elif not response.ok():
-                    reason = "bad status code [%s]" % (response.code)
-                    url_exc = UrlError(ValueError(reason), code=response.code,
-                                       headers=response.headers, url=url)
-                else:
+                all_headers = [url_headers(url) for url in urls]
+                for index, (url, headers) in enumerate(
+                        zip(urls, all_headers)):
+                    if headers is None:
+                        continue
+                    future = executor.submit(
+                        _attempt_wait_for_url, url, race_timeout, headers,
+                        headers_redact, request_method)
+                    pending[future] = (index, url)
+                not_done = set(pending)
+                while not_done:
+                    done, not_done = futures.wait(
+                        not_done, return_when=futures.FIRST_COMPLETED)
+                    for future in sorted(done, key=lambda f: pending[f]):
+                        url = pending[future][1]
+                        response, url_exc, reason = future.result()
+                        if url_exc is None:
+                            return url, response.contents
+                        report_failure(url, url_exc, reason)
+            finally:
+                for future in pending:
+                    future.cancel()
+                executor.shutdown(wait=False)
+        else:
+            for url in urls:
+                now = time.time()
+                if loop_n != 0:
+                    if timeup(max_wait, start_time):
+                        break
+                    if (max_wait is not None and timeout and
+                            (now + timeout > (start_time + max_wait))):
+                        # shorten timeout to not run way over max_time
+                        timeout = int((start_time + max_wait) - now)
+
+                headers = url_headers(url)
+                if headers is None:
+                    continue
+                response, url_exc, reason = _attempt_wait_for_url(
+                    url, timeout, headers, headers_redact, request_method)
+                if url_exc is None:
                     return url, response.contents
-            except UrlError as e:
-                reason = "request error [%s]" % e
-                url_exc = e
-            except Exception as e:
-                reason = "unexpected error [%s]" % e
-                url_exc = e
-
-            time_taken = int(time.time() - start_time)
-            max_wait_str = "%ss" % max_wait if max_wait else "unlimited"
-            status_msg = "Calling '%s' failed [%s/%s]: %s" % (url,
-                                                              time_taken,
-                                                              max_wait_str,
-                                                              reason)
-            status_cb(status_msg)
-            if exception_cb:
-                # This can be used to alter the headers that will be sent
-                # in the future, for example this is what the MAAS datasource
-                # does.
-                exception_cb(msg=status_msg, exception=url_exc)
+                report_failure(url, url_exc, reason)
 
         if timeup(max_wait, start_time):
             break
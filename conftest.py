@@ -12,7 +12,7 @@ from unittest import mock
 
 import pytest
 
-from cloudinit import helpers, subp
+from cloudinit import helpers, subp, url_helper
 
 
 class _FixtureUtils:
@@ -157,6 +157,13 @@ def disable_subp_usage(request, fixture_utils):
         yield
 
 
+@pytest.fixture(autouse=True)
+def close_url_sessions():
+    """Ensure pooled url_helper sessions do not leak between tests."""
+    yield
+    url_helper.close_sessions()
+
+
 @pytest.fixture(scope="session")
 def fixture_utils():
     """Return a namespace containing fixture utility functions.
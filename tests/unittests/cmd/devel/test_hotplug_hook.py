@@ -1,17 +1,23 @@
+import os
 import pytest
 from collections import namedtuple
 from unittest import mock
 from unittest.mock import call
 
-from cloudinit.cmd.devel.hotplug_hook import handle_hotplug
+from cloudinit.cmd.devel.hotplug_hook import (
+    coalesce_events, handle_events, handle_hotplug, parse_event,
+    read_event_batch, serve)
 from cloudinit.distros import Distro
 from cloudinit.event import EventType
 from cloudinit.net.activators import NetworkActivator
 from cloudinit.net.network_state import NetworkState
+from cloudinit.reporting.events import ReportEventStack
 from cloudinit.sources import DataSource
 from cloudinit.stages import Init
 
 
+M_PATH = 'cloudinit.cmd.devel.hotplug_hook.'
+
 hotplug_args = namedtuple('hotplug_args', 'udevaction, subsystem, devpath')
 FAKE_MAC = '11:22:33:44:55:66'
 
@@ -222,7 +228,151 @@ class TestHotplug:
                 udevaction='add',
                 subsystem='net'
             )
-        assert mocks.m_sleep.call_count == 5
         assert mocks.m_sleep.call_args_list == [
-            call(1), call(3), call(5), call(10), call(30)
-        ]
+            call(0.5), call(1), call(2), call(4)] + [call(5)] * 9
+        assert (
+            mocks.m_init.datasource.update_metadata_if_supported.call_count ==
+            14)
+
+    def test_polling_stops_once_device_detected(self, mocks):
+        mocks.m_network_state.iter_interfaces.side_effect = [
+            [{}], [{}], [{'mac_address': FAKE_MAC}]]
+        handle_hotplug(
+            hotplug_init=mocks.m_init,
+            devpath='/dev/fake',
+            udevaction='add',
+            subsystem='net'
+        )
+        assert mocks.m_sleep.call_args_list == [call(0.5), call(1)]
+        mocks.m_activator.bring_up_interface.assert_called_once_with('fake')
+
+
+class TestHandleEvents:
+    def test_events_share_one_refresh_and_apply(self, mocks):
+        init = mocks.m_init
+        mocks.m_network_state.iter_interfaces.return_value = [{
+            'mac_address': FAKE_MAC,
+        }]
+        handle_events(init, [
+            ('net', '/dev/fake%s' % n, 'add') for n in range(16)])
+        init.datasource.update_metadata_if_supported.assert_called_once_with([
+            EventType.HOTPLUG
+        ])
+        assert init.datasource.distro.apply_network_config.call_count == 1
+        assert mocks.m_activator.bring_up_interface.call_args_list == [
+            call('fake%s' % n) for n in range(16)]
+        init._write_to_cache.assert_called_once_with()
+
+    @mock.patch(M_PATH + 'read_sys_net_safe')
+    def test_undetected_device_is_dropped_from_batch(
+        self, m_read_sys_net, mocks, caplog
+    ):
+        init = mocks.m_init
+        m_read_sys_net.side_effect = lambda iface, _: 'mac-%s' % iface
+        mocks.m_network_state.iter_interfaces.return_value = [
+            {'mac_address': 'mac-fake0'}, {'mac_address': 'mac-fake2'}]
+        handle_events(init, [
+            ('net', '/dev/fake%s' % n, 'add') for n in range(3)])
+        assert mocks.m_activator.bring_up_interface.call_args_list == [
+            call('fake0'), call('fake2')]
+        assert 'Dropping add event for /dev/fake1' in caplog.text
+        init._write_to_cache.assert_called_once_with()
+
+    def test_apply_is_retried(self, mocks):
+        init = mocks.m_init
+        mocks.m_network_state.iter_interfaces.return_value = [{
+            'mac_address': FAKE_MAC,
+        }]
+        mocks.m_activator.bring_up_interface.side_effect = [
+            False, True, True]
+        handle_events(init, [
+            ('net', '/dev/fake0', 'add'), ('net', '/dev/fake1', 'add')])
+        assert mocks.m_activator.bring_up_interface.call_args_list == [
+            call('fake0'), call('fake1'), call('fake0')]
+        assert init.datasource.distro.apply_network_config.call_count == 2
+        assert mocks.m_sleep.call_args_list == [call(0.5)]
+        init._write_to_cache.assert_called_once_with()
+
+    def test_coalesce_events_keeps_last_event_per_device(self):
+        assert [
+            ('net', '/dev/b', 'add'), ('net', '/dev/a', 'remove')
+        ] == coalesce_events([
+            ('net', '/dev/a', 'add'), ('net', '/dev/b', 'add'),
+            ('net', '/dev/a', 'remove')])
+
+    def test_parse_event(self):
+        assert ('net', '/devices/eth1', 'add') == parse_event(
+            '--subsystem=net handle --devpath=/devices/eth1 --udevaction=add')
+
+
+class TestDaemon:
+    def _write(self, fd, *lines):
+        os.write(fd, b''.join(line.encode() + b'\n' for line in lines))
+
+    @mock.patch(M_PATH + 'COALESCE_WINDOW', 0.01)
+    def test_read_event_batch_returns_lines_written_together(self):
+        read_fd, write_fd = os.pipe()
+        self._write(write_fd, 'one')
+        os.write(write_fd, b'two\nthr')
+        assert (['one', 'two'], b'thr') == read_event_batch(read_fd)
+        os.write(write_fd, b'ee\n')
+        assert (['three'], b'') == read_event_batch(read_fd, b'thr')
+        os.close(write_fd)
+        assert ([], b'') == read_event_batch(read_fd)
+        os.close(read_fd)
+
+    @mock.patch(M_PATH + 'COALESCE_WINDOW', 0.01)
+    @mock.patch(M_PATH + 'url_helper.close_sessions')
+    @mock.patch(M_PATH + 'load_init')
+    @mock.patch(M_PATH + 'handle_events')
+    def test_serve_handles_coalesced_batches(
+        self, m_handle_events, m_load_init, m_close_sessions, caplog
+    ):
+        read_fd, write_fd = os.pipe()
+        self._write(
+            write_fd,
+            '--subsystem=net handle --devpath=/dev/a --udevaction=add',
+            '--subsystem=net query',
+            '--subsystem=net handle --devpath=/dev/a --udevaction=remove',
+            '--subsystem=net handle --devpath=/dev/b --udevaction=add')
+        os.close(write_fd)
+        init = m_load_init.return_value
+        with mock.patch('sys.stderr'):
+            serve(read_fd, ReportEventStack(
+                'hotplug-hook', 'test', reporting_enabled=False))
+        os.close(read_fd)
+        m_handle_events.assert_called_once_with(
+            init, [('net', '/dev/a', 'remove'), ('net', '/dev/b', 'add')])
+        assert 1 == m_close_sessions.call_count
+        assert 'Ignoring invalid hotplug event: --subsystem=net query' in (
+            caplog.text)
+
+    @mock.patch(M_PATH + 'COALESCE_WINDOW', 0.01)
+    @mock.patch(M_PATH + 'url_helper.close_sessions')
+    @mock.patch(M_PATH + 'load_init')
+    @mock.patch(M_PATH + 'handle_events')
+    def test_serve_reloads_init_for_each_batch(
+        self, m_handle_events, m_load_init, m_close_sessions
+    ):
+        """Each batch sees the config and datasource cache as they are."""
+        read_fd, write_fd = os.pipe()
+        inits = [mock.MagicMock(spec=Init), mock.MagicMock(spec=Init)]
+        m_load_init.side_effect = inits
+
+        def handle_events(hotplug_init, hotplug_events):
+            if hotplug_init is inits[0]:
+                self._write(write_fd, '--subsystem=net handle'
+                            ' --devpath=/dev/b --udevaction=add')
+            else:
+                os.close(write_fd)
+
+        m_handle_events.side_effect = handle_events
+        self._write(
+            write_fd,
+            '--subsystem=net handle --devpath=/dev/a --udevaction=add')
+        serve(read_fd, ReportEventStack(
+            'hotplug-hook', 'test', reporting_enabled=False))
+        os.close(read_fd)
+        assert inits == [
+            call_args[0][0] for call_args in m_handle_events.call_args_list]
+        assert 2 == m_close_sessions.call_count
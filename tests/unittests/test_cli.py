@@ -5,6 +5,7 @@ import io
 from collections import namedtuple
 
 from cloudinit.cmd import main as cli
+from cloudinit.reporting import events
 from cloudinit.tests import helpers as test_helpers
 from cloudinit.util import load_file, load_json
 
@@ -20,6 +21,9 @@ class TestCLI(test_helpers.FilesystemMockingTestCase):
         super(TestCLI, self).setUp()
         self.stderr = io.StringIO()
         self.patchStdoutAndStderr(stderr=self.stderr)
+        patcher = mock.patch('cloudinit.cmd.main.enable_event_journal')
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def _call_main(self, sysv_args=None):
         if not sysv_args:
@@ -99,6 +103,30 @@ class TestCLI(test_helpers.FilesystemMockingTestCase):
             os.path.exists(self.tmp_path('result.json', link_d)),
             'unexpected result.json link found')
 
+    def test_status_wrapper_modules_final_writes_module_usage(self):
+        """Resources used by each module are written to status and result."""
+        tmpd = self.tmp_dir()
+        data_d = self.tmp_path('data', tmpd)
+        link_d = self.tmp_path('link', tmpd)
+        usage = {'final-message': {'wall_time': 0.5, 'subprocesses': 1}}
+        reporter = events.ReportEventStack('modules-final', 'running modules')
+
+        def myaction(name, args):
+            args.reporter.metrics = usage
+            return []
+
+        FakeArgs = namedtuple('FakeArgs', ['action', 'local', 'mode',
+                                           'reporter'])
+        myargs = FakeArgs(('ignored_name', myaction), False, 'final',
+                          reporter)
+        cli.status_wrapper('modules', myargs, data_d, link_d)
+        status_v1 = load_json(
+            load_file(self.tmp_path('status.json', link_d)))['v1']
+        self.assertEqual(usage, status_v1['modules-final']['modules'])
+        result_v1 = load_json(
+            load_file(self.tmp_path('result.json', link_d)))['v1']
+        self.assertEqual({'modules-final': usage}, result_v1['modules'])
+
     def test_no_arguments_shows_usage(self):
         exit_code = self._call_main()
         self.assertIn('usage: cloud-init', self.stderr.getvalue())
@@ -145,6 +173,16 @@ class TestCLI(test_helpers.FilesystemMockingTestCase):
         self.assertEqual('modules', parseargs.action[0])
         self.assertEqual('main_modules', parseargs.action[1].__name__)
 
+    @mock.patch('cloudinit.cmd.main.record_boot_times')
+    @mock.patch('cloudinit.cmd.main.status_wrapper', return_value=0)
+    def test_boot_times_recorded_after_final_stage(
+            self, m_status_wrapper, m_record_boot_times):
+        """Boot times are recorded once the final stage finished."""
+        self._call_main(['cloud-init', 'modules', '--mode', 'config'])
+        self.assertEqual(0, m_record_boot_times.call_count)
+        self._call_main(['cloud-init', 'modules', '--mode', 'final'])
+        self.assertEqual(1, m_record_boot_times.call_count)
+
     def test_conditional_subcommands_from_entry_point_sys_argv(self):
         """Subcommands from entry-point are properly parsed from sys.argv."""
         stdout = io.StringIO()
@@ -248,7 +286,7 @@ class TestCLI(test_helpers.FilesystemMockingTestCase):
         self.assertEqual('cc_ntp', parseargs.name)
         self.assertFalse(parseargs.report)
 
-    @mock.patch('cloudinit.cmd.main.dhclient_hook.handle_args')
+    @mock.patch('cloudinit.dhclient_hook.handle_args')
     def test_dhclient_hook_subcommand(self, m_handle_args):
         """The subcommand 'dhclient-hook' calls dhclient_hook with args."""
         self._call_main(['cloud-init', 'dhclient-hook', 'up', 'eth0'])
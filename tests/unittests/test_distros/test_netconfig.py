@@ -909,6 +909,90 @@ class TestNetCfgDistroPhoton(TestNetCfgDistroBase):
                                expected_cfgs.copy())
 
 
+@mock.patch('cloudinit.distros.activators.select_activator')
+class TestNetCfgDistroBringUp(TestNetCfgDistroBase):
+
+    def setUp(self):
+        super(TestNetCfgDistroBringUp, self).setUp()
+        self.distro = self._get_distro('ubuntu')
+        self.distro._paths = helpers.Paths({'run_dir': self.tmp_dir()})
+        self.add_patch(
+            'cloudinit.distros.Distro._write_network_state',
+            'm_write_network_state', return_value='netplan')
+
+    def _changed_config(self):
+        config = copy.deepcopy(V1_NET_CFG)
+        config['config'][1]['mtu'] = 9000
+        return config
+
+    def test_first_bring_up_brings_up_all_interfaces(self, m_select):
+        """Without previous digests every interface is brought up."""
+        self.distro.apply_network_config(V1_NET_CFG, bring_up=True)
+        activator = m_select.return_value
+        self.assertEqual(1, activator.bring_up_all_interfaces.call_count)
+        self.assertEqual(0, activator.bring_up_interfaces.call_count)
+
+    def test_unchanged_config_brings_up_nothing(self, m_select):
+        """Applying the same config again does not touch any interface."""
+        self.distro.apply_network_config(V1_NET_CFG, bring_up=True)
+        m_select.reset_mock()
+        self.distro.apply_network_config(V1_NET_CFG, bring_up=True)
+        activator = m_select.return_value
+        self.assertEqual(0, activator.bring_up_all_interfaces.call_count)
+        self.assertEqual(0, activator.bring_up_interfaces.call_count)
+
+    def test_changed_interfaces_are_brought_up(self, m_select):
+        """Only interfaces whose config changed are brought up."""
+        self.distro.apply_network_config(V1_NET_CFG, bring_up=True)
+        m_select.reset_mock()
+        self.distro.apply_network_config(
+            self._changed_config(), bring_up=True)
+        activator = m_select.return_value
+        self.assertEqual(0, activator.bring_up_all_interfaces.call_count)
+        activator.bring_up_interfaces.assert_called_once_with(['eth1'])
+
+    def test_changes_are_diffed_against_the_last_bring_up(self, m_select):
+        """Configs written without bring up are still brought up later."""
+        self.distro.apply_network_config(V1_NET_CFG, bring_up=True)
+        self.distro.apply_network_config(
+            self._changed_config(), bring_up=False)
+        m_select.reset_mock()
+        self.distro.apply_network_config(
+            self._changed_config(), bring_up=True)
+        m_select.return_value.bring_up_interfaces.assert_called_once_with(
+            ['eth1'])
+
+    def test_other_renderer_brings_up_all_interfaces(self, m_select):
+        """Digests of another renderer are not compared."""
+        self.distro.apply_network_config(V1_NET_CFG, bring_up=True)
+        self.m_write_network_state.return_value = 'eni'
+        m_select.reset_mock()
+        self.distro.apply_network_config(V1_NET_CFG, bring_up=True)
+        self.assertEqual(
+            1, m_select.return_value.bring_up_all_interfaces.call_count)
+
+    def test_failed_bring_up_is_retried(self, m_select):
+        """Digests are not stored when interfaces failed to come up."""
+        activator = m_select.return_value
+        activator.bring_up_all_interfaces.return_value = False
+        self.distro.apply_network_config(V1_NET_CFG, bring_up=True)
+        m_select.reset_mock()
+        self.distro.apply_network_config(V1_NET_CFG, bring_up=True)
+        self.assertEqual(1, activator.bring_up_all_interfaces.call_count)
+
+    def test_failed_changed_interfaces_are_retried(self, m_select):
+        """Changed interfaces which failed to come up are brought up again."""
+        activator = m_select.return_value
+        self.distro.apply_network_config(V1_NET_CFG, bring_up=True)
+        activator.bring_up_interfaces.return_value = False
+        self.distro.apply_network_config(
+            self._changed_config(), bring_up=True)
+        m_select.reset_mock()
+        self.distro.apply_network_config(
+            self._changed_config(), bring_up=True)
+        activator.bring_up_interfaces.assert_called_once_with(['eth1'])
+
+
 def get_mode(path, target=None):
     return os.stat(subp.target_path(target, path)).st_mode & 0o777
 
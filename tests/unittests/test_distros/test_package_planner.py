@@ -0,0 +1,97 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+from cloudinit import distros
+from cloudinit.distros.package_planner import PackagePlanner, package_specs
+from cloudinit.tests.helpers import CiTestCase, mock
+
+from tests.unittests.util import TestingDistro
+
+
+class TestPackagePlanner(CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestPackagePlanner, self).setUp()
+        self.distro = TestingDistro()
+        self.add_patch(
+            'tests.unittests.util.TestingDistro._install_packages',
+            'm_install', autospec=False)
+        self.planner = PackagePlanner(self.distro)
+        self.distro.package_planner = self.planner
+
+    def test_package_specs(self):
+        """All forms accepted by install_packages are normalized."""
+        self.assertEqual([('ntp', None)], package_specs('ntp'))
+        self.assertEqual([('puppet', '6.0')], package_specs(('puppet', '6.0')))
+        self.assertEqual([('chef', None)], package_specs(('chef',)))
+        self.assertEqual(
+            [('lxd', None), ('zfs', '2'), ('ruby', None)],
+            package_specs(['lxd', ['zfs', '2'], ('ruby', None)]))
+        with self.assertRaisesRegex(ValueError, 'Invalid package'):
+            package_specs([('a', 'b', 'c')])
+
+    def test_plan_batches_until_package_sources_change(self):
+        """Modules after one changing the package sources start a batch."""
+        batches = self.planner.plan([
+            ('write-files', [], False), ('snap', ['squashfuse'], False),
+            ('apt-configure', [], True), ('locale', [], False),
+            ('ubuntu-advantage', ['ubuntu-advantage-tools'], True),
+            ('ntp', ['chrony'], False), ('lxd', ['lxd'], False)])
+        self.assertEqual({
+            1: [('snap', [('squashfuse', None)])],
+            4: [('ubuntu-advantage', [('ubuntu-advantage-tools', None)])],
+            5: [('ntp', [('chrony', None)]), ('lxd', [('lxd', None)])],
+        }, batches)
+
+    def test_batches_are_installed_once(self):
+        """A batch installs the packages of its modules in a single run."""
+        self.planner.plan([('ntp', ['chrony'], False),
+                           ('lxd', ['lxd', 'chrony'], False),
+                           ('puppet', [('puppet', '6.0')], False)])
+        self.assertEqual([], self.planner.install(1))
+        with mock.patch.object(self.distro,
+                               'update_package_sources') as m_update:
+            self.assertEqual(['ntp', 'lxd', 'puppet'],
+                             self.planner.install(0))
+        m_update.assert_called_once_with()
+        self.m_install.assert_called_once_with(
+            [('chrony', None), ('lxd', None), ('puppet', '6.0')])
+        self.assertEqual([], self.planner.install(0))
+        self.distro.install_packages(['lxd', 'chrony'])
+        self.distro.install_packages(('puppet', '6.0'))
+        self.assertEqual(1, self.m_install.call_count)
+        self.distro.install_packages(['lxd', 'zfsutils-linux'])
+        self.assertEqual(2, self.m_install.call_count)
+
+    def test_failed_batch_leaves_modules_to_install_their_packages(self):
+        """When a batch fails each module installs its own packages."""
+        self.m_install.side_effect = RuntimeError('dpkg lock')
+        self.planner.plan([('ntp', ['chrony'], False),
+                           ('lxd', ['lxd'], False)])
+        self.assertEqual([], self.planner.install(0))
+        self.assertIn(
+            'Failed to install packages for modules ntp, lxd together',
+            self.logs.getvalue())
+        self.m_install.side_effect = None
+        self.distro.install_packages(['chrony'])
+        self.assertEqual(
+            [mock.call([('chrony', None), ('lxd', None)]),
+             mock.call(['chrony'])], self.m_install.call_args_list)
+
+    def test_distros_overriding_install_packages(self):
+        """Distros may still override install_packages instead."""
+        self.assertNotIn('_install_packages',
+                         distros.Distro.__abstractmethods__)
+
+        class OverridingDistro(TestingDistro):
+            install_packages = mock.Mock()
+
+        distro = OverridingDistro()
+        planner = PackagePlanner(distro)
+        planner.plan([('ntp', ['chrony'], False)])
+        self.assertEqual(['ntp'], planner.install(0))
+        distro.install_packages.assert_called_once_with([('chrony', None)])
+        self.m_install.assert_not_called()
+
+# vi: ts=4 expandtab
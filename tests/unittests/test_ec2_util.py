@@ -176,4 +176,94 @@ class TestEc2Util(helpers.HttprettyTestCase):
         self.assertEqual(iam['info']['LastUpdated'], '2016-10-27T17:29:39Z')
         self.assertNotIn('security-credentials', iam)
 
+
+class TestMetadataMaterializer(helpers.CiTestCase):
+
+    with_logs = True
+
+    BASE_URL = 'http://169.254.169.254/latest/meta-data/'
+    TREE = {
+        '': 'ami-id\nblock-device-mapping/\nnetwork/\npublic-keys/\n'
+            'services/\nservices',
+        'ami-id': 'ami-123',
+        'block-device-mapping/': 'ami\nephemeral0',
+        'block-device-mapping/ami': 'sda1',
+        'block-device-mapping/ephemeral0': 'sdb',
+        'network/': 'interfaces/',
+        'network/interfaces/': 'macs/',
+        'network/interfaces/macs/': '0a:01/\n0a:02/',
+        'network/interfaces/macs/0a:01/': 'device-number\nlocal-ipv4s',
+        'network/interfaces/macs/0a:01/device-number': '0',
+        'network/interfaces/macs/0a:01/local-ipv4s': '10.0.0.1\n10.0.0.2',
+        'network/interfaces/macs/0a:02/': 'device-number',
+        'network/interfaces/macs/0a:02/device-number': '1',
+        'public-keys/': '0=my-key',
+        'public-keys/0/openssh-key': 'ssh-rsa AAAA my-key',
+        'services/': 'domain',
+        'services/domain': 'amazonaws.com',
+        'services': '{"duplicate": true}',
+    }
+
+    def setUp(self):
+        super(TestMetadataMaterializer, self).setUp()
+        self.addCleanup(uh.close_sessions)
+
+    def _caller(self, url):
+        return self.TREE[url[len(self.BASE_URL):]].encode()
+
+    def _materialize(self, max_workers):
+        materializer = eu.MetadataMaterializer(
+            self._caller(self.BASE_URL), self.BASE_URL, self._caller,
+            max_workers=max_workers)
+        return (materializer.materialize(), materializer)
+
+    def test_concurrent_crawl_matches_sequential_crawl(self):
+        """A concurrent crawl produces exactly the sequential result."""
+        sequential, seq_materializer = self._materialize(max_workers=1)
+        concurrent, con_materializer = self._materialize(max_workers=4)
+        self.assertEqual(sequential, concurrent)
+        self.assertEqual(
+            ['0', ['10.0.0.1', '10.0.0.2']],
+            [concurrent['network']['interfaces']['macs']['0a:01'][k]
+             for k in ('device-number', 'local-ipv4s')])
+        self.assertEqual(
+            {'my-key': 'ssh-rsa AAAA my-key'}, concurrent['public-keys'])
+        self.assertEqual(
+            seq_materializer.requests_made, con_materializer.requests_made)
+        self.assertEqual(17, con_materializer.requests_made)
+
+    def test_concurrent_crawl_warns_on_duplicate_keys(self):
+        """Leaves clashing with a child are dropped with a warning."""
+        md, _materializer = self._materialize(max_workers=4)
+        self.assertEqual({'domain': 'amazonaws.com'}, md['services'])
+        self.assertIn(
+            'Duplicate key found in results from %s' % self.BASE_URL,
+            self.logs.getvalue())
+
+    def test_concurrent_crawl_reports_requests_made(self):
+        """The number of requests and time saved are logged."""
+        self._materialize(max_workers=4)
+        self.assertIn(
+            'Materialized %s with 17 requests in' % self.BASE_URL,
+            self.logs.getvalue())
+        self.assertIn('using 4 workers', self.logs.getvalue())
+
+    def test_concurrent_crawl_sizes_session_pool_to_workers(self):
+        """The pooled session keeps a connection alive for each worker."""
+        self._materialize(max_workers=16)
+        adapter = uh.get_session(self.BASE_URL).get_adapter(self.BASE_URL)
+        self.assertEqual(16, adapter._pool_maxsize)
+
+    def test_concurrent_crawl_raises_caller_errors(self):
+        """Errors from the caller propagate as in the sequential crawl."""
+        def caller(url):
+            if url.endswith('/ephemeral0'):
+                raise uh.UrlError('broken')
+            return self._caller(url)
+
+        materializer = eu.MetadataMaterializer(
+            caller(self.BASE_URL), self.BASE_URL, caller, max_workers=4)
+        with self.assertRaises(uh.UrlError):
+            materializer.materialize()
+
 # vi: ts=4 expandtab
@@ -1,6 +1,8 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import logging
 import random
+import threading
 
 from cloudinit.config import cc_disk_setup
 from cloudinit.tests.helpers import CiTestCase, ExitStack, mock, TestCase
@@ -239,5 +241,67 @@ class TestMkfsCommandHandling(CiTestCase):
         subp.assert_called_once_with(
             ['/sbin/mkswap', '/dev/xdb1', '-L', 'swap', '-f'], shell=False)
 
+
+@mock.patch('cloudinit.config.cc_disk_setup.util.udevadm_settle')
+@mock.patch('cloudinit.config.cc_disk_setup.mkfs')
+@mock.patch('cloudinit.config.cc_disk_setup.mkpart')
+class TestHandle(CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestHandle, self).setUp()
+        self.cloud = mock.Mock()
+        self.cloud.device_name_to_device.return_value = None
+
+    def test_disks_set_up_concurrently(self, m_mkpart, m_mkfs, m_settle):
+        """Disks are set up concurrently, udev is settled once per phase."""
+        # Both disks must be partitioned at once to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
+        m_mkpart.side_effect = lambda device, definition, settle: (
+            barrier.wait())
+        cfg = {
+            'disk_setup': {
+                '/dev/xda': {'table_type': 'gpt', 'layout': [50, 50]},
+                '/dev/xdb': {'table_type': 'gpt', 'layout': True}},
+            'fs_setup': [
+                {'device': '/dev/xda', 'partition': 1, 'filesystem': 'ext4'},
+                {'device': '/dev/xdb', 'partition': 1, 'filesystem': 'xfs'},
+                {'device': '/dev/xda', 'partition': 2, 'filesystem': 'xfs'}]}
+        cc_disk_setup.handle(
+            'disk_setup', cfg, self.cloud, logging.getLogger(), [])
+        self.assertEqual(
+            [mock.call('/dev/xda', cfg['disk_setup']['/dev/xda'],
+                       settle=False),
+             mock.call('/dev/xdb', cfg['disk_setup']['/dev/xdb'],
+                       settle=False)],
+            sorted(m_mkpart.call_args_list, key=lambda c: c[0][0]))
+        self.assertEqual(3, m_mkfs.call_count)
+        xda_calls = [c for c in m_mkfs.call_args_list
+                     if c[0][0]['device'] == '/dev/xda']
+        self.assertEqual(
+            [mock.call(cfg['fs_setup'][0], settle=False),
+             mock.call(cfg['fs_setup'][2], settle=False)], xda_calls)
+        # Before partitioning, then once after each phase
+        self.assertEqual(3, m_settle.call_count)
+        self.assertRegex(
+            self.logs.getvalue(),
+            r'Partitioned disks: /dev/xda in [.0-9]+ seconds, /dev/xdb in')
+
+    def test_failed_entry_does_not_stop_others(
+            self, m_mkpart, m_mkfs, m_settle):
+        """An entry failing is logged, the next entries are set up."""
+        m_mkfs.side_effect = [RuntimeError('mkfs failed'), None]
+        cfg = {'fs_setup': [
+            {'device': '/dev/xda', 'filesystem': 'ext4'},
+            {'device': '/dev/xda', 'partition': 1, 'filesystem': 'ext4'}]}
+        cc_disk_setup.handle(
+            'disk_setup', cfg, self.cloud, logging.getLogger(), [])
+        self.assertEqual(2, m_mkfs.call_count)
+        self.assertIn('Failed during filesystem operation\nmkfs failed',
+                      self.logs.getvalue())
+        self.assertEqual(2, m_settle.call_count)
+        m_mkpart.assert_not_called()
+
 #
 # vi: ts=4 expandtab
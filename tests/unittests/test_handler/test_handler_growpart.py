@@ -10,6 +10,7 @@ import errno
 import logging
 import os
 import re
+import threading
 import unittest
 from contextlib import ExitStack
 from unittest import mock
@@ -163,7 +164,7 @@ class TestConfig(TestCase):
             self.handle(self.name, {}, self.cloud_init, self.log, self.args)
 
             factory.assert_called_once_with('auto')
-            rsdevs.assert_called_once_with(myresizer, ['/'])
+            rsdevs.assert_called_once_with(myresizer, ['/'], resize_fs=True)
 
 
 class TestResize(unittest.TestCase):
@@ -226,6 +227,46 @@ class TestResize(unittest.TestCase):
             cc_growpart.device_part_info = opinfo
             os.stat = real_stat
 
+    @mock.patch('cloudinit.config.cc_resizefs.do_resize')
+    @mock.patch('cloudinit.config.cc_growpart.util.mounts')
+    @mock.patch('cloudinit.config.cc_growpart.os.stat')
+    @mock.patch('cloudinit.config.cc_growpart.device_part_info')
+    def test_disks_resized_concurrently(self, m_info, m_stat, m_mounts,
+                                        m_do_resize):
+        """Disks are resized concurrently, their partitions in turn."""
+        m_info.side_effect = simple_device_part_info
+        m_stat.return_value = Bunch(st_mode=25008)
+        m_mounts.return_value = {
+            '/dev/XXda1': {'fstype': 'ext4', 'mountpoint': '/'},
+            '/dev/XXda2': {'fstype': 'xfs', 'mountpoint': '/srv'},
+            '/dev/YYda1': {'fstype': 'ext4', 'mountpoint': '/data'}}
+        # Partitions of different disks wait for each other, which would
+        # time out if the disks were resized one after the other
+        barrier = threading.Barrier(2, timeout=5)
+        resize_calls = []
+
+        class myresizer(object):
+            def resize(self, diskdev, partnum, partdev):
+                if partnum == "1":
+                    barrier.wait()
+                resize_calls.append(partdev)
+                return (1024, 2048)
+
+        devs = ["/dev/XXda1", "/dev/XXda2", "/dev/YYda1"]
+        resized = cc_growpart.resize_devices(myresizer(), devs, resize_fs=True)
+        self.assertEqual(devs, [entry for (entry, _a, _m) in resized])
+        self.assertEqual(
+            [cc_growpart.RESIZE.CHANGED] * 3,
+            [action for (_e, action, _m) in resized])
+        self.assertLess(resize_calls.index("/dev/XXda1"),
+                        resize_calls.index("/dev/XXda2"))
+        self.assertIn("root filesystem left to resizefs", resized[0][2])
+        self.assertIn("resized xfs filesystem on /srv in", resized[1][2])
+        self.assertEqual(
+            [mock.call(('resize2fs', '/dev/YYda1'), cc_growpart.LOG),
+             mock.call(('xfs_growfs', '/srv'), cc_growpart.LOG)],
+            sorted(m_do_resize.call_args_list, key=lambda c: c[0][0][1]))
+
 
 def simple_device_part_info(devpath):
     # simple stupid return (/dev/vda, 1) for /dev/vda
@@ -1,9 +1,11 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import json
 import os.path
 from unittest import mock
 
 from cloudinit.config import cc_mounts
+from cloudinit import util
 
 from cloudinit.tests import helpers as test_helpers
 
@@ -193,62 +195,110 @@ class TestSwapFileCreation(test_helpers.FilesystemMockingTestCase):
 
         return dev
 
+    @mock.patch('cloudinit.config.cc_mounts.allocate_swapfile')
     @mock.patch('cloudinit.util.get_mount_info')
     @mock.patch('cloudinit.util.kernel_version')
     def test_swap_creation_method_fallocate_on_xfs(self, m_kernel_version,
-                                                   m_get_mount_info):
+                                                   m_get_mount_info,
+                                                   m_allocate):
         m_kernel_version.return_value = (4, 20)
         m_get_mount_info.return_value = ["", "xfs"]
 
         cc_mounts.handle(None, self.cc, self.mock_cloud, self.mock_log, [])
+        m_allocate.assert_called_once_with(
+            self.swap_path, '0', 'fallocate', None)
         self.m_subp_subp.assert_has_calls([
-            mock.call(['fallocate', '-l', '0M', self.swap_path], capture=True),
             mock.call(['mkswap', self.swap_path]),
             mock.call(['swapon', '-a'])])
 
+    @mock.patch('cloudinit.config.cc_mounts.allocate_swapfile')
     @mock.patch('cloudinit.util.get_mount_info')
     @mock.patch('cloudinit.util.kernel_version')
     def test_swap_creation_method_xfs(self, m_kernel_version,
-                                      m_get_mount_info):
+                                      m_get_mount_info,
+                                      m_allocate):
         m_kernel_version.return_value = (3, 18)
         m_get_mount_info.return_value = ["", "xfs"]
 
         cc_mounts.handle(None, self.cc, self.mock_cloud, self.mock_log, [])
+        m_allocate.assert_called_once_with(
+            self.swap_path, '0', 'write', None)
         self.m_subp_subp.assert_has_calls([
-            mock.call(['dd', 'if=/dev/zero',
-                       'of=' + self.swap_path,
-                       'bs=1M', 'count=0'], capture=True),
             mock.call(['mkswap', self.swap_path]),
             mock.call(['swapon', '-a'])])
 
+    @mock.patch('cloudinit.config.cc_mounts.allocate_swapfile')
     @mock.patch('cloudinit.util.get_mount_info')
     @mock.patch('cloudinit.util.kernel_version')
     def test_swap_creation_method_btrfs(self, m_kernel_version,
-                                        m_get_mount_info):
+                                        m_get_mount_info,
+                                        m_allocate):
         m_kernel_version.return_value = (4, 20)
         m_get_mount_info.return_value = ["", "btrfs"]
 
         cc_mounts.handle(None, self.cc, self.mock_cloud, self.mock_log, [])
+        m_allocate.assert_called_once_with(
+            self.swap_path, '0', 'fallocate', None)
         self.m_subp_subp.assert_has_calls([
-            mock.call(['dd', 'if=/dev/zero',
-                       'of=' + self.swap_path,
-                       'bs=1M', 'count=0'], capture=True),
+            mock.call(['chattr', '+C', self.swap_path]),
             mock.call(['mkswap', self.swap_path]),
             mock.call(['swapon', '-a'])])
 
+    @mock.patch('cloudinit.config.cc_mounts.allocate_swapfile')
     @mock.patch('cloudinit.util.get_mount_info')
     @mock.patch('cloudinit.util.kernel_version')
     def test_swap_creation_method_ext4(self, m_kernel_version,
-                                       m_get_mount_info):
+                                       m_get_mount_info,
+                                       m_allocate):
         m_kernel_version.return_value = (5, 14)
         m_get_mount_info.return_value = ["", "ext4"]
 
         cc_mounts.handle(None, self.cc, self.mock_cloud, self.mock_log, [])
+        m_allocate.assert_called_once_with(
+            self.swap_path, '0', 'fallocate', None)
         self.m_subp_subp.assert_has_calls([
-            mock.call(['fallocate', '-l', '0M', self.swap_path], capture=True),
             mock.call(['mkswap', self.swap_path]),
             mock.call(['swapon', '-a'])])
 
+    @mock.patch('cloudinit.config.cc_mounts.util.fork_cb')
+    @mock.patch('cloudinit.util.get_mount_info')
+    def test_swap_creation_in_background(self, m_get_mount_info, m_fork_cb):
+        """The swap file is created, added to fstab and enabled by a forked
+        child."""
+        m_get_mount_info.return_value = ["", "ext4"]
+        status_file = os.path.join(self.new_root, 'swap-status.json')
+        self.mock_cloud.paths.get_runpath.return_value = status_file
+        self.mock_cloud.paths.boot_finished = '/boot-finished'
+        self.cc['swap']['background'] = True
+
+        cc_mounts.handle(None, self.cc, self.mock_cloud, self.mock_log, [])
+        m_fork_cb.assert_called_once_with(
+            cc_mounts.create_swapfile_after_boot, self.swap_path, '0',
+            '/boot-finished', status_file)
+        self.assertEqual(
+            {'filename': self.swap_path, 'size': 0, 'status': 'pending'},
+            json.loads(util.load_file(status_file)))
+        self.assertNotIn(mock.call(['swapon', '-a']),
+                         self.m_subp_subp.call_args_list)
+        # The swap file is added to fstab once created by the child
+        self.assertFalse(os.path.exists(self.fstab_path))
+
+    @mock.patch('cloudinit.config.cc_mounts.util.fork_cb')
+    @mock.patch('cloudinit.util.get_mount_info')
+    def test_stale_temporary_swap_file_is_removed(
+            self, m_get_mount_info, m_fork_cb):
+        """A swap file left half allocated by a killed child is removed
+        before sizing and forking a new one."""
+        m_get_mount_info.return_value = ["", "ext4"]
+        util.write_file(self.swap_path + '.tmp', 'partial')
+        status_file = os.path.join(self.new_root, 'swap-status.json')
+        self.mock_cloud.paths.get_runpath.return_value = status_file
+        self.cc['swap']['background'] = True
+
+        cc_mounts.handle(None, self.cc, self.mock_cloud, self.mock_log, [])
+        self.assertFalse(os.path.exists(self.swap_path + '.tmp'))
+        self.assertEqual(1, m_fork_cb.call_count)
+
 
 class TestFstabHandling(test_helpers.FilesystemMockingTestCase):
 
@@ -88,6 +88,22 @@ class TestNtp(FilesystemMockingTestCase):
         mock_subp.which.assert_called_with('ntpdx')
         install_func.assert_called_once_with(['ntpx'])
 
+    @mock.patch("cloudinit.config.cc_ntp.subp")
+    def test_package_intents(self, mock_subp):
+        """package_intents returns the client packages handle installs."""
+        mock_subp.which.return_value = None  # check_exe not found.
+        mycloud = get_cloud('ubuntu')
+        for cfg, packages in (
+                ({}, []),
+                ({'ntp': None}, ['chrony']),
+                ({'ntp': {'enabled': False}}, []),
+                ({'ntp': {'ntp_client': 'ntp'}}, ['ntp'])):
+            self.assertEqual(packages, cc_ntp.package_intents(
+                'ntp', cfg, mycloud, None, []))
+        mock_subp.which.return_value = '/usr/sbin/chronyd'
+        self.assertEqual([], cc_ntp.package_intents(
+            'ntp', {'ntp': None}, mycloud, None, []))
+
     @mock.patch("cloudinit.config.cc_ntp.subp")
     def test_ntp_install_not_needed(self, mock_subp):
         """ntp_install_client doesn't install when check_exe is found."""
@@ -0,0 +1,38 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+from cloudinit.config import cc_package_update_upgrade_install as cc_pkg
+from cloudinit.distros.package_planner import PackagePlanner
+from cloudinit.tests.helpers import CiTestCase, mock
+
+
+class TestPackageIntents(CiTestCase):
+
+    def test_pinned_packages_installed_after_upgrade(self):
+        """Packages are left to handle, which installs them last."""
+        cfg = {'packages': [['foo', '1.2']], 'package_upgrade': True}
+        args = ('package-update-upgrade-install', cfg, None, None, [])
+        self.assertEqual([], cc_pkg.package_intents(*args))
+        self.assertTrue(cc_pkg.changes_package_sources(*args))
+        distro = mock.Mock()
+        planner = PackagePlanner(distro)
+        self.assertEqual({}, planner.plan([
+            ('package-update-upgrade-install', cc_pkg.package_intents(*args),
+             cc_pkg.changes_package_sources(*args))]))
+
+        cloud = mock.Mock(distro=distro)
+        cc_pkg.handle('package-update-upgrade-install', cfg, cloud,
+                      mock.Mock(), [])
+        self.assertEqual(
+            [mock.call.update_package_sources(),
+             mock.call.package_command('upgrade'),
+             mock.call.install_packages([['foo', '1.2']])],
+            distro.method_calls)
+
+    def test_packages_planned_without_update_or_upgrade(self):
+        """Without update or upgrade the packages can be batched."""
+        cfg = {'packages': ['foo']}
+        args = ('package-update-upgrade-install', cfg, None, None, [])
+        self.assertEqual(['foo'], cc_pkg.package_intents(*args))
+        self.assertFalse(cc_pkg.changes_package_sources(*args))
+
+# vi: ts=4 expandtab
@@ -3,6 +3,7 @@ import cloudinit
 from cloudinit.config.schema import (
     CLOUD_CONFIG_HEADER, SchemaValidationError, annotated_cloudconfig_file,
     get_schema_doc, get_schema, validate_cloudconfig_file,
+    set_lazy_schema_doc, validate_cloudconfig_modules,
     validate_cloudconfig_schema, main)
 from cloudinit.util import write_file
 
@@ -10,6 +11,7 @@ from cloudinit.tests.helpers import CiTestCase, mock, skipUnlessJsonSchema
 
 from copy import copy
 import itertools
+import types
 import pytest
 from pathlib import Path
 from textwrap import dedent
@@ -118,6 +120,85 @@ class ValidateCloudConfigSchemaTest(CiTestCase):
             str(context_mgr.exception))
 
 
+class ValidateCloudConfigModulesTest(CiTestCase):
+    """Tests for validate_cloudconfig_modules and validator caching."""
+
+    with_logs = True
+
+    def setUp(self):
+        super(ValidateCloudConfigModulesTest, self).setUp()
+        self.schema = {
+            'id': 'cc_testmod', 'properties': {'p1': {'type': 'string'}}}
+        self.schemas = [
+            {'id': 'cc_other', 'properties': {'p2': {'type': 'integer'}}},
+            self.schema]
+        for name, value in (
+                ('_VALIDATORS', {}),
+                ('_PRECOMPUTED_ERRORS', {'config': None, 'errors': {}})):
+            patcher = mock.patch('cloudinit.config.schema.' + name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @skipUnlessJsonSchema()
+    def test_validator_is_cached_per_schema(self):
+        """The validator for a schema is only created once."""
+        from cloudinit.config.schema import _get_validator
+        validator = _get_validator(self.schema)
+        self.assertIs(validator, _get_validator(self.schema))
+        self.assertIsNot(validator, _get_validator(copy(self.schema)))
+
+    @skipUnlessJsonSchema()
+    def test_validator_cache_is_bounded(self):
+        """The oldest validators are evicted once the cache is full."""
+        from cloudinit.config import schema
+        schemas = [copy(self.schema) for _ in range(3)]
+        with mock.patch.object(schema, '_MAX_VALIDATORS', 2):
+            for module_schema in schemas:
+                schema._get_validator(module_schema)
+        self.assertEqual(
+            [id(schemas[1]), id(schemas[2])], list(schema._VALIDATORS))
+
+    @skipUnlessJsonSchema()
+    def test_module_pass_does_not_cache_or_import_all_modules(self):
+        """Only the schemas passed are validated, without get_schema."""
+        from cloudinit.config import schema
+        with mock.patch.object(schema, 'get_schema') as m_get_schema:
+            validate_cloudconfig_modules({'p1': -1}, self.schemas)
+        self.assertEqual(0, m_get_schema.call_count)
+        self.assertEqual({}, schema._VALIDATORS)
+
+    @skipUnlessJsonSchema()
+    def test_module_errors_are_reused(self):
+        """Modules reuse the errors found in the single validation pass."""
+        config = {'p1': -1, 'p2': 'x'}
+        validate_cloudconfig_modules(config, self.schemas)
+        with mock.patch(
+            'cloudinit.config.schema._get_validator'
+        ) as m_get_validator:
+            with self.assertRaises(SchemaValidationError) as context_mgr:
+                validate_cloudconfig_schema(
+                    dict(config), self.schema, strict=True)
+        self.assertEqual(
+            "Cloud config schema errors: p1: -1 is not of type 'string'",
+            str(context_mgr.exception))
+        m_get_validator.return_value.iter_errors.assert_not_called()
+
+    @skipUnlessJsonSchema()
+    def test_changed_config_is_validated_again(self):
+        """A config differing from the validated one is validated again."""
+        validate_cloudconfig_modules({'p1': 'valid'}, self.schemas)
+        with self.assertRaises(SchemaValidationError):
+            validate_cloudconfig_schema({'p1': -1}, self.schema, strict=True)
+
+    @skipUnlessJsonSchema()
+    def test_unknown_schema_is_validated(self):
+        """A schema which was not passed is validated directly."""
+        validate_cloudconfig_modules({'p1': -1}, self.schemas)
+        validate_cloudconfig_schema(
+            {'p1': -1}, {'properties': {'p1': {'type': 'integer'}}})
+        self.assertNotIn('Invalid config', self.logs.getvalue())
+
+
 class TestCloudConfigExamples:
     schema = get_schema()
     params = [
@@ -200,6 +281,48 @@ class ValidateCloudConfigFileTest(CiTestCase):
             str(context_mgr.exception))
 
 
+class SetLazySchemaDocTest(CiTestCase):
+    """Tests for set_lazy_schema_doc."""
+
+    def setUp(self):
+        super(SetLazySchemaDocTest, self).setUp()
+        self.module = types.ModuleType('cc_lazy', 'Original docstring')
+        self.module.schema = {
+            'title': 'title', 'description': 'description', 'id': 'id',
+            'name': 'name', 'frequency': 'frequency', 'distros': ['debian']}
+        patcher = mock.patch.dict('sys.modules', {'cc_lazy': self.module})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_doc_is_rendered_on_first_access(self):
+        """The schema doc is only rendered when __doc__ is accessed."""
+        with mock.patch(
+            'cloudinit.config.schema.get_schema_doc', return_value='doc'
+        ) as m_get_schema_doc:
+            set_lazy_schema_doc('cc_lazy')
+            self.assertEqual(0, m_get_schema_doc.call_count)
+            self.assertEqual('doc', self.module.__doc__)
+            self.assertEqual('doc', self.module.__doc__)
+        m_get_schema_doc.assert_called_once_with(self.module.schema)
+
+    def test_doc_matches_get_schema_doc(self):
+        """The lazily rendered doc is the rendered schema doc."""
+        set_lazy_schema_doc('cc_lazy')
+        self.assertEqual(
+            get_schema_doc(self.module.schema), self.module.__doc__)
+
+    def test_assigned_doc_is_returned(self):
+        """A __doc__ assigned after set_lazy_schema_doc is honored."""
+        set_lazy_schema_doc('cc_lazy')
+        self.module.__doc__ = 'assigned'
+        self.assertEqual('assigned', self.module.__doc__)
+
+    def test_config_modules_render_docs_lazily(self):
+        """Config modules defer rendering their schema docs to __doc__."""
+        from cloudinit.config import cc_runcmd
+        self.assertIn('**Summary:** Run arbitrary commands', cc_runcmd.__doc__)
+
+
 class GetSchemaDocTest(CiTestCase):
     """Tests for get_schema_doc."""
 
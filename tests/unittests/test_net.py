@@ -6,6 +6,7 @@ from cloudinit.net import cmdline
 from cloudinit.net import (
     eni, interface_has_own_mac, natural_sort_key, netplan, network_state,
     renderers, sysconfig, networkd)
+from cloudinit.net.renderer import write_file_if_changed
 from cloudinit.sources.helpers import openstack
 from cloudinit import temp_utils
 from cloudinit import subp
@@ -4257,6 +4258,23 @@ class TestNetplanPostcommands(CiTestCase):
             renderer.render_network_state(ns, target=render_dir)
             mock_subp.assert_has_calls(expected)
 
+    @mock.patch.object(netplan.Renderer, '_netplan_generate')
+    @mock.patch.object(netplan.Renderer, '_net_setup_link')
+    @mock.patch('cloudinit.subp.subp')
+    def test_netplan_render_skips_postcmds_when_unchanged(
+            self, mock_subp, mock_net_setup_link, mock_netplan_generate):
+        """Re-rendering an unchanged config does not run netplan again."""
+        ns = network_state.parse_net_config_data(self.mycfg,
+                                                 skip_broken=False)
+        render_dir = self.tmp_dir()
+        renderer = netplan.Renderer(
+            {'netplan_path': 'netplan.yaml', 'postcmds': True})
+        mock_subp.side_effect = subp.ProcessExecutionError
+        renderer.render_network_state(ns, target=render_dir)
+        renderer.render_network_state(ns, target=render_dir)
+        self.assertEqual(1, mock_netplan_generate.call_count)
+        self.assertEqual(1, mock_net_setup_link.call_count)
+
 
 class TestEniNetworkStateToEni(CiTestCase):
     mycfg = {
@@ -5312,6 +5330,22 @@ class TestRenderersSelect:
                 renderers.select(priority=renderers.DEFAULT_PRIORITY)
 
 
+class TestWriteFileIfChanged(CiTestCase):
+
+    def test_write_file_if_changed(self):
+        """Files are only rewritten when their content or mode changes."""
+        path = self.tmp_path('ifcfg-eth0')
+        self.assertTrue(write_file_if_changed(path, 'DEVICE=eth0'))
+        mtime = os.stat(path).st_mtime_ns
+        self.assertFalse(write_file_if_changed(path, 'DEVICE=eth0'))
+        self.assertEqual(mtime, os.stat(path).st_mtime_ns)
+        self.assertTrue(
+            write_file_if_changed(path, 'DEVICE=eth0', 0o600))
+        self.assertEqual(0o600, os.stat(path).st_mode & 0o7777)
+        self.assertTrue(write_file_if_changed(path, 'DEVICE=eth1'))
+        self.assertEqual('DEVICE=eth1', util.load_file(path))
+
+
 class TestNetRenderers(CiTestCase):
     @mock.patch("cloudinit.net.renderers.sysconfig.available")
     @mock.patch("cloudinit.net.renderers.eni.available")
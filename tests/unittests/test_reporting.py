@@ -2,13 +2,16 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import json
+import queue
+import threading
 from unittest import mock
 
 from cloudinit import reporting
 from cloudinit.reporting import events
 from cloudinit.reporting import handlers
 
-from cloudinit.tests.helpers import TestCase
+from cloudinit.tests.helpers import CiTestCase, TestCase
 
 
 def _fake_registry():
@@ -267,7 +270,7 @@ class TestReportingEventStack(TestCase):
             [mock.call('myname', 'mydesc')], report_start.call_args_list)
         self.assertEqual(
             [mock.call('myname', 'mydesc', events.status.SUCCESS,
-                       post_files=[])],
+                       post_files=[], metrics=None)],
             report_finish.call_args_list)
 
     @mock.patch('cloudinit.reporting.events.report_finish_event')
@@ -282,7 +285,8 @@ class TestReportingEventStack(TestCase):
             pass
         self.assertEqual([mock.call(name, desc)], report_start.call_args_list)
         self.assertEqual(
-            [mock.call(name, desc, events.status.FAIL, post_files=[])],
+            [mock.call(name, desc, events.status.FAIL, post_files=[],
+                       metrics=None)],
             report_finish.call_args_list)
 
     @mock.patch('cloudinit.reporting.events.report_finish_event')
@@ -298,7 +302,8 @@ class TestReportingEventStack(TestCase):
             pass
         self.assertEqual([mock.call(name, desc)], report_start.call_args_list)
         self.assertEqual(
-            [mock.call(name, desc, events.status.WARN, post_files=[])],
+            [mock.call(name, desc, events.status.WARN, post_files=[],
+                       metrics=None)],
             report_finish.call_args_list)
 
     @mock.patch('cloudinit.reporting.events.report_start_event')
@@ -327,7 +332,8 @@ class TestReportingEventStack(TestCase):
                 child.result = events.status.WARN
 
         report_finish.assert_called_with(
-            "topname", "topdesc", events.status.WARN, post_files=[])
+            "topname", "topdesc", events.status.WARN, post_files=[],
+            metrics=None)
 
     @mock.patch('cloudinit.reporting.events.report_finish_event')
     def test_message_used_in_finish(self, report_finish):
@@ -336,7 +342,7 @@ class TestReportingEventStack(TestCase):
             pass
         self.assertEqual(
             [mock.call("myname", "mymessage", events.status.SUCCESS,
-                       post_files=[])],
+                       post_files=[], metrics=None)],
             report_finish.call_args_list)
 
     @mock.patch('cloudinit.reporting.events.report_finish_event')
@@ -345,7 +351,7 @@ class TestReportingEventStack(TestCase):
             c.message = "all good"
         self.assertEqual(
             [mock.call("myname", "all good", events.status.SUCCESS,
-                       post_files=[])],
+                       post_files=[], metrics=None)],
             report_finish.call_args_list)
 
     @mock.patch('cloudinit.reporting.events.report_start_event')
@@ -382,6 +388,201 @@ class TestReportingEventStack(TestCase):
         self.assertRaises(ValueError, setattr, f, "result", "BOGUS")
 
 
+class TestWebHookHandler(CiTestCase):
+    with_logs = True
+
+    def setUp(self):
+        super(TestWebHookHandler, self).setUp()
+        patcher = mock.patch('cloudinit.reporting.handlers.url_helper.readurl')
+        self.m_readurl = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch(
+            'cloudinit.reporting.handlers.util.fetch_ssl_details',
+            return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _posted(self):
+        return [json.loads(call[1]['data'])
+                for call in self.m_readurl.call_args_list]
+
+    def test_events_posted_individually_by_default(self):
+        handler = handlers.WebHookHandler('http://example/')
+        handler.publish_event(events.ReportingEvent('start', 'a', 'desc'))
+        self.assertEqual(1, self.m_readurl.call_count)
+        self.assertEqual('a', self._posted()[0]['name'])
+        handler.flush()
+
+    def test_events_posted_in_batches(self):
+        handler = handlers.WebHookHandler(
+            'http://example/', batch_size=2, flush_interval=60)
+        for name in ('a', 'b', 'c'):
+            handler.publish_event(events.ReportingEvent('start', name, 'd'))
+        handler.flush()
+        self.assertEqual(
+            [['a', 'b'], ['c']],
+            [[event['name'] for event in batch] for batch in self._posted()])
+
+    def test_partial_batch_posted_after_flush_interval(self):
+        handler = handlers.WebHookHandler(
+            'http://example/', batch_size=10, flush_interval=0.01)
+        handler.publish_event(events.ReportingEvent('start', 'a', 'desc'))
+        handler.q.join()
+        self.assertEqual(1, self.m_readurl.call_count)
+
+    def test_failed_post_does_not_stop_publishing(self):
+        self.m_readurl.side_effect = [Exception('boom'), None]
+        handler = handlers.WebHookHandler(
+            'http://example/', batch_size=1, flush_interval=60)
+        handler.publish_event(events.ReportingEvent('start', 'a', 'desc'))
+        handler.publish_event(events.ReportingEvent('start', 'b', 'desc'))
+        handler.flush()
+        self.assertEqual(2, self.m_readurl.call_count)
+        self.assertIn(
+            'failed posting batch of 1 events', self.logs.getvalue())
+
+    def test_events_dropped_when_queue_is_full(self):
+        handler = handlers.WebHookHandler(
+            'http://example/', batch_size=1, max_queue_size=1)
+        with mock.patch.object(handler.q, 'put', side_effect=queue.Full):
+            handler.publish_event(events.ReportingEvent('start', 'a', 'd'))
+            handler.publish_event(events.ReportingEvent('start', 'b', 'd'))
+        handler.flush()
+        self.assertEqual(2, handler.dropped_events)
+        self.assertIn('dropping events', self.logs.getvalue())
+        self.assertIn('webhook handler dropped 2 events', self.logs.getvalue())
+
+    def test_close_posts_pending_batch_and_stops_thread(self):
+        handler = handlers.WebHookHandler(
+            'http://example/', batch_size=10, flush_interval=60)
+        handler.publish_event(events.ReportingEvent('start', 'a', 'desc'))
+        handler.close()
+        self.assertEqual([['a']], [[event['name'] for event in batch]
+                                   for batch in self._posted()])
+        self.assertFalse(handler.publish_thread.is_alive())
+
+    def test_invalid_overflow_defaults_to_drop(self):
+        handler = handlers.WebHookHandler('http://example/', overflow='bogus')
+        self.assertEqual(handlers.WebHookHandler.OVERFLOW_DROP,
+                         handler.overflow)
+
+
+class TestQueuedHandler(CiTestCase):
+    with_logs = True
+
+    def test_events_published_in_background_in_order(self):
+        """Events are published in order, and all of them once flushed."""
+        published = []
+        wrapped = mock.Mock(publish_event=published.append)
+        handler = handlers.QueuedHandler(wrapped)
+        evts = [events.ReportingEvent('start', str(n), 'd') for n in range(5)]
+        for event in evts:
+            handler.publish_event(event)
+        handler.flush()
+        self.assertEqual(evts, published)
+        self.assertEqual(1, wrapped.flush.call_count)
+        metrics = handler.metrics()
+        self.assertEqual(5, metrics['published'])
+        self.assertEqual(0, metrics['dropped'])
+        self.assertIn('published 5 events (0 failed)', self.logs.getvalue())
+
+    def test_slow_handler_does_not_block_and_drops_overflow(self):
+        """A slow handler delays no caller; events beyond the queue drop."""
+        entered = threading.Event()
+        release = threading.Event()
+
+        def publish_event(event):
+            entered.set()
+            release.wait(5)
+
+        handler = handlers.QueuedHandler(
+            mock.Mock(publish_event=publish_event), max_queue_size=1)
+        handler.publish_event(events.ReportingEvent('start', 'a', 'd'))
+        self.assertTrue(entered.wait(5))
+        # 'a' is being published, 'b' is queued and 'c' does not fit
+        for name in ('b', 'c'):
+            handler.publish_event(events.ReportingEvent('start', name, 'd'))
+        release.set()
+        handler.flush()
+        self.assertEqual(2, handler.metrics()['published'])
+        self.assertEqual(1, handler.metrics()['dropped'])
+        self.assertIn('dropped 1 events', self.logs.getvalue())
+
+    def test_close_stops_thread_and_closes_handler(self):
+        """close publishes queued events, then stops the worker thread."""
+        wrapped = mock.Mock()
+        handler = handlers.QueuedHandler(wrapped)
+        handler.publish_event(events.ReportingEvent('start', 'a', 'd'))
+        handler.close()
+        self.assertEqual(1, wrapped.publish_event.call_count)
+        self.assertEqual(1, wrapped.close.call_count)
+        self.assertFalse(handler.publish_thread.is_alive())
+
+    def test_reset_configuration_closes_handlers(self):
+        """Configured handlers are closed and the defaults restored."""
+        registry = reporting.DictRegistry()
+        patcher = mock.patch.object(
+            reporting, 'instantiated_handler_registry', registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        reporting.update_configuration(
+            {'printer': {'type': 'print', 'async': True}})
+        handler = registry.registered_items['printer']
+        reporting.reset_configuration()
+        self.assertFalse(handler.publish_thread.is_alive())
+        self.assertEqual(['logging'], list(registry.registered_items))
+
+    def test_handler_failures_are_counted(self):
+        """Exceptions of the handler are logged instead of raised."""
+        handler = handlers.QueuedHandler(
+            mock.Mock(publish_event=mock.Mock(side_effect=OSError('down'))))
+        handler.publish_event(events.ReportingEvent('start', 'a', 'd'))
+        handler.flush()
+        self.assertEqual(1, handler.metrics()['failed'])
+        self.assertIn('failed publishing event start: a: d: down',
+                      self.logs.getvalue())
+
+    def test_async_configuration_queues_handler(self):
+        """Handlers configured with async are queued, and still excluded
+        from events by their own type."""
+        registry = reporting.DictRegistry()
+        for module in (reporting, events):
+            patcher = mock.patch.object(
+                module, 'instantiated_handler_registry', registry)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        reporting.update_configuration(
+            {'printer': {'type': 'print', 'async': True,
+                         'async_queue_size': 10}})
+        handler = reporting.instantiated_handler_registry.registered_items[
+            'printer']
+        self.assertIsInstance(handler, handlers.QueuedHandler)
+        self.assertIsInstance(handler.handler, handlers.PrintHandler)
+        self.assertEqual(10, handler.q.maxsize)
+        with mock.patch.object(handler, 'publish_event') as m_publish:
+            events.report_event(events.ReportingEvent('start', 'a', 'd'),
+                                excluded_handler_types={'print'})
+            self.assertEqual(0, m_publish.call_count)
+            events.report_event(events.ReportingEvent('start', 'a', 'd'))
+            self.assertEqual(1, m_publish.call_count)
+
+    def test_async_ignored_for_handlers_queueing_events(self):
+        """A batched webhook already queues events and is not queued twice."""
+        registry = reporting.DictRegistry()
+        patcher = mock.patch.object(
+            reporting, 'instantiated_handler_registry', registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        reporting.update_configuration(
+            {'hook': {'type': 'webhook', 'endpoint': 'http://example/',
+                      'batch_size': 10, 'async': True}})
+        handler = registry.registered_items['hook']
+        self.assertIsInstance(handler, handlers.WebHookHandler)
+        self.assertTrue(handler.publishes_in_background)
+        self.assertIn('already publishes events in the background',
+                      self.logs.getvalue())
+
+
 class TestStatusAccess(TestCase):
     def test_invalid_status_access_raises_value_error(self):
         self.assertRaises(AttributeError, getattr, events.status, "BOGUS")
@@ -330,3 +330,88 @@ class TextKvpReporter(CiTestCase):
         self.assertEqual(2, len(kvps))
         self.assertNotEqual(kvps[0]["key"], kvps[1]["key"],
                             "duplicate keys for KVP entries")
+
+    def _write_other_record(self):
+        reporter = HyperVKvpReportingHandler(kvp_file_path=self.tmp_file_path)
+        with open(self.tmp_file_path, 'wb') as f:
+            f.write(reporter._encode_kvp_item('other', '{"name":"other"}'))
+
+    def _publish(self, reporter, *evts):
+        for evt in evts:
+            reporter.publish_event(evt)
+            reporter.q.join()
+        return [json.loads(kvp['value'])['name']
+                for kvp in reporter._iterate_kvps(0)]
+
+    def test_pool_budget_reuses_oldest_diagnostic_slots(self):
+        """Over budget, the oldest diagnostic events are replaced first."""
+        reporter = HyperVKvpReportingHandler(
+            kvp_file_path=self.tmp_file_path,
+            max_pool_size=3 * HyperVKvpReportingHandler.HV_KVP_RECORD_SIZE)
+        names = self._publish(
+            reporter,
+            events.ReportingEvent('start', 'stage', 'desc'),
+            events.ReportingEvent('diagnostic', 'diag1', 'desc'),
+            events.ReportingEvent('diagnostic', 'diag2', 'desc'),
+            events.ReportingEvent('finish', 'stage', 'desc'),
+            events.ReportingEvent('start', 'stage2', 'desc'))
+        self.assertEqual(['stage', 'stage', 'stage2'], names)
+        self.assertEqual(3 * reporter.HV_KVP_RECORD_SIZE,
+                         os.path.getsize(self.tmp_file_path))
+
+    def test_pool_budget_keeps_records_of_other_programs(self):
+        """Only cloud-init records are replaced, including earlier ones."""
+        self._write_other_record()
+        budget = 2 * HyperVKvpReportingHandler.HV_KVP_RECORD_SIZE
+        reporter = HyperVKvpReportingHandler(
+            kvp_file_path=self.tmp_file_path, max_pool_size=budget)
+        self._publish(reporter, events.ReportingEvent('start', 'one', 'd'))
+        # Another stage indexes the records written before it
+        reporter = HyperVKvpReportingHandler(
+            kvp_file_path=self.tmp_file_path, max_pool_size=budget)
+        names = self._publish(
+            reporter, events.ReportingEvent('start', 'two', 'desc'))
+        self.assertEqual(['other', 'two'], names)
+
+    def test_close_writes_queued_events_and_stops_thread(self):
+        """close writes the queued events before stopping the thread."""
+        reporter = HyperVKvpReportingHandler(kvp_file_path=self.tmp_file_path)
+        reporter.publish_event(events.ReportingEvent('start', 'one', 'desc'))
+        reporter.close()
+        self.assertFalse(reporter.publish_thread.is_alive())
+        self.assertEqual(
+            ['one'], [json.loads(kvp['value'])['name']
+                      for kvp in reporter._iterate_kvps(0)])
+
+    def test_dropped_event_keeps_evicted_keys_of_its_slots(self):
+        """Slots taken by a dropped event are not reused once overwritten."""
+        size = 2 * HyperVKvpReportingHandler.HV_KVP_RECORD_SIZE
+        reporter = HyperVKvpReportingHandler(
+            kvp_file_path=self.tmp_file_path, max_pool_size=size)
+        reporter._index_kvps(b'', 0)
+        reporter._event_slots['old'] = [0]
+        other = reporter._encode_kvp_item('other', 'value')
+        pool = reporter._encode_kvp_item('old', 'value') + other
+        records = [b'record'] * 2
+        self.assertEqual((size, {}), reporter._plan_kvp_writes(
+            [('new', False, records)], pool, size))
+        self.assertEqual([(0, b'old')], list(reporter._free_slots))
+        # Another process reused the slot before the next batch
+        self.assertEqual((size, {}), reporter._plan_kvp_writes(
+            [('new', False, records[:1])], other + other, size))
+
+    def test_pool_budget_drops_events_without_room(self):
+        """Events are dropped when other programs' records fill the pool."""
+        self._write_other_record()
+        reporter = HyperVKvpReportingHandler(
+            kvp_file_path=self.tmp_file_path,
+            max_pool_size=HyperVKvpReportingHandler.HV_KVP_RECORD_SIZE)
+        with mock.patch('cloudinit.reporting.handlers.LOG') as m_log:
+            names = self._publish(
+                reporter, events.ReportingEvent('start', 'one', 'desc'))
+        self.assertEqual(['other'], names)
+        self.assertEqual(1, m_log.warning.call_count)
+        with mock.patch('cloudinit.reporting.handlers.LOG') as m_log:
+            reporter.flush()
+        m_log.warning.assert_called_once_with(
+            '%s dropped %d events', 'HyperVKvpReportingHandler', 1)
@@ -0,0 +1,112 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+import os
+
+from cloudinit.reporting import events, journal
+from cloudinit.reporting.handlers import JournalHandler
+from cloudinit.tests.helpers import CiTestCase, mock
+from cloudinit.util import write_file
+
+
+class TestJournal(CiTestCase):
+
+    def setUp(self):
+        super(TestJournal, self).setUp()
+        self.path = os.path.join(self.tmp_dir(), 'run', 'events.journal')
+
+    def test_records_round_trip(self):
+        """Records are read back with their parents and durations."""
+        writer = journal.JournalWriter(self.path)
+        stage = writer.write(journal.START, 'init-local', 'searching',
+                             monotonic=1.0)
+        child = writer.write(journal.START, 'init-local/check-cache',
+                             'attempting to read from cache', monotonic=1.5)
+        writer.write(journal.FINISH, 'init-local/check-cache', 'no cache',
+                     result='SUCCESS', monotonic=1.75)
+        writer.write(journal.FINISH, 'init-local', 'searching',
+                     result='FAIL', monotonic=3.0)
+        self.assertTrue(journal.is_journal(self.path))
+        _wall_offset, records = journal.read_records(self.path)
+        self.assertEqual([
+            (stage, journal.START, None, 'init-local', 'searching',
+             journal.NO_PARENT, 1.0, journal.NO_DURATION),
+            (child, journal.START, None, 'init-local/check-cache',
+             'attempting to read from cache', stage, 1.5,
+             journal.NO_DURATION),
+            (mock.ANY, journal.FINISH, 'SUCCESS', 'init-local/check-cache',
+             'no cache', stage, 1.75, 0.25),
+            (mock.ANY, journal.FINISH, 'FAIL', 'init-local', 'searching',
+             journal.NO_PARENT, 3.0, 2.0)], records)
+
+    def test_writers_append_to_the_same_journal(self):
+        """Each boot stage process appends to the journal of the boot."""
+        journal.JournalWriter(self.path).write(
+            journal.START, 'init-local', 'searching', monotonic=1.0)
+        journal.JournalWriter(self.path).write(
+            journal.START, 'init-network', 'searching', monotonic=2.0)
+        self.assertEqual(
+            ['init-local', 'init-network'],
+            [e['name'] for e in journal.read_events(self.path)])
+
+    def test_read_events_returns_analyze_events(self):
+        """Events have wall clock timestamps and finish events a result."""
+        writer = journal.JournalWriter(self.path)
+        writer.write(journal.START, 'init-local', 'searching')
+        writer.write(journal.FINISH, 'init-local', 'searching',
+                     result='SUCCESS')
+        wall_offset, records = journal.read_records(self.path)
+        start, finish = journal.read_events(self.path)
+        self.assertEqual(
+            {'name': 'init-local', 'description': 'searching',
+             'event_type': 'start', 'origin': 'cloudinit',
+             'timestamp': wall_offset + records[0][6]}, start)
+        self.assertEqual('SUCCESS', finish['result'])
+
+    def test_partial_record_is_ignored(self):
+        """A record still being written is not returned."""
+        journal.JournalWriter(self.path).write(
+            journal.START, 'init-local', 'searching')
+        with open(self.path, 'ab') as fh:
+            fh.write(journal.RECORD.pack(
+                journal.START, 0, 10, 0, journal.NO_PARENT, 1.0, -1.0))
+        self.assertEqual(1, len(journal.read_events(self.path)))
+
+    def test_read_rejects_other_files(self):
+        """Files which are not journals raise ValueError."""
+        write_file(self.path, '2021-01-01 00:00:00,000 - start: init-local\n')
+        self.assertFalse(journal.is_journal(self.path))
+        with self.assertRaisesRegex(ValueError, 'not an event journal'):
+            journal.read_records(self.path)
+
+
+class TestJournalHandler(CiTestCase):
+
+    with_logs = True
+
+    def test_events_are_journaled(self):
+        """Start and finish events are appended with their result."""
+        path = self.tmp_path('events.journal')
+        handler = JournalHandler(path=path)
+        handler.publish_event(events.ReportingEvent(
+            'start', 'init-local', 'searching'))
+        handler.publish_event(events.FinishReportingEvent(
+            'init-local', 'searching', events.status.WARN))
+        handler.publish_event(events.ReportingEvent(
+            'diagnostic', 'init-local', 'not journaled'))
+        self.assertEqual(
+            [('start', None), ('finish', 'WARN')],
+            [(e['event_type'], e.get('result'))
+             for e in journal.read_events(path)])
+
+    def test_unwritable_journal_is_not_fatal(self):
+        """Events are dropped when the journal cannot be written."""
+        path = self.tmp_path('events.journal')
+        write_file(path, 'not a directory')
+        handler = JournalHandler(path=os.path.join(path, 'events.journal'))
+        for _ in range(2):
+            handler.publish_event(events.ReportingEvent(
+                'start', 'init-local', 'searching'))
+        self.assertEqual(
+            1, self.logs.getvalue().count('Could not write event journal'))
+
+# vi: ts=4 expandtab
@@ -2,8 +2,10 @@
 
 import copy
 import os
+import types
+from unittest import mock
 
-
+from cloudinit.reporting import events
 from cloudinit.settings import PER_INSTANCE
 from cloudinit import safeyaml
 from cloudinit import stages
@@ -81,6 +83,73 @@ class TestSimpleRun(helpers.FilesystemMockingTestCase):
             " distro 'ubuntu'",
             self.logs.getvalue())
 
+    @mock.patch('cloudinit.reporting.events.report_finish_event')
+    def test_none_ds_records_module_resource_usage(self, m_report_finish):
+        """The resources used by each module are kept and reported."""
+        initer = stages.Init()
+        initer.read_cfg()
+        initer.initialize()
+        initer.fetch()
+        initer.instancify()
+        initer.update()
+
+        mods = stages.Modules(initer, reporter=events.ReportEventStack(
+            'init-network', 'running modules'))
+        mods.run_section('cloud_init_modules')
+        self.assertEqual(['write-files', 'runcmd'], list(mods.usage))
+        usage = mods.usage['write-files']
+        self.assertEqual(
+            ['wall_time', 'user_time', 'system_time', 'max_rss_delta',
+             'subprocesses', 'bytes_written'], list(usage))
+        self.assertGreater(usage['wall_time'], 0)
+        self.assertEqual(0, usage['subprocesses'])
+        metrics = [call[1]['metrics']
+                   for call in m_report_finish.call_args_list]
+        self.assertEqual([mods.usage['write-files'], mods.usage['runcmd']],
+                         metrics)
+        self.assertIs(mods.usage, mods.reporter.metrics)
+
+    def test_none_ds_installs_planned_packages_together(self):
+        """Packages of modules are installed by one package manager run
+        until a module changes the package sources."""
+        initer = stages.Init()
+        initer.read_cfg()
+        initer.initialize()
+        initer.fetch()
+        initer.instancify()
+        initer.update()
+
+        def fake_module(packages, changes_sources=False):
+            mod = types.ModuleType('cc_fake')
+            mod.frequency = PER_INSTANCE
+            mod.distros = mod.osfamilies = []
+            mod.package_intents = lambda *_args: packages
+            mod.changes_package_sources = lambda *_args: changes_sources
+
+            def handle(_name, _cfg, cloud, _log, _args):
+                if packages:
+                    cloud.distro.install_packages(packages)
+            mod.handle = handle
+            return mod
+
+        mostly_mods = [
+            [fake_module(['ntp']), 'one', None, []],
+            [fake_module(['lxd'], changes_sources=True), 'two', None, []],
+            [fake_module([]), 'three', None, []],
+            [fake_module(['ntp', ('puppet', '6.0')]), 'four', None, []]]
+        mods = stages.Modules(initer)
+        with mock.patch.object(mods, '_fixup_modules',
+                               return_value=mostly_mods):
+            with mock.patch.object(initer.distro,
+                                   '_install_packages') as m_install:
+                (which_ran, failures) = mods.run_section('cloud_init_modules')
+        self.assertEqual([], failures)
+        self.assertEqual(['one', 'two', 'three', 'four'], which_ran)
+        self.assertEqual(
+            [mock.call([('ntp', None), ('lxd', None)]),
+             mock.call([('puppet', '6.0')])], m_install.call_args_list)
+        self.assertIsNone(initer.distro.package_planner)
+
     def test_none_ds_skips_modules_which_define_unmatched_distros(self):
         """Skip modules which define distros which don't match the current."""
         initer = stages.Init()
@@ -125,6 +194,28 @@ class TestSimpleRun(helpers.FilesystemMockingTestCase):
             " distro 'ubuntu'",
             self.logs.getvalue())
 
+    @mock.patch('cloudinit.config.schema.validate_cloudconfig_modules')
+    def test_none_ds_validates_merged_config_once(self, m_validate):
+        """run_section validates the merged config once for all modules."""
+        initer = stages.Init()
+        initer.read_cfg()
+        initer.initialize()
+        initer.fetch()
+        initer.instancify()
+        initer.update()
+        initer.cloudify().run('consume_data', initer.consume_data,
+                              args=[PER_INSTANCE], freq=PER_INSTANCE)
+
+        mods = stages.Modules(initer)
+        (which_ran, failures) = mods.run_section('cloud_init_modules')
+        self.assertTrue(len(failures) == 0)
+        self.assertIn('runcmd', which_ran)
+        from cloudinit.config import cc_runcmd
+        self.assertEqual(1, m_validate.call_count)
+        config, schemas = m_validate.call_args[0]
+        self.assertEqual(mods.cfg, config)
+        self.assertIn(cc_runcmd.schema, schemas)
+
     def test_none_ds_forces_run_via_unverified_modules(self):
         """run_section forced skipped modules by using unverified_modules."""
 
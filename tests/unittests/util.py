@@ -58,7 +58,7 @@ class TestingDistro(distros.Distro):
             paths = {}
         super(TestingDistro, self).__init__(name, cfg, paths)
 
-    def install_packages(self, pkglist):
+    def _install_packages(self, pkglist):
         pass
 
     def set_hostname(self, hostname, fqdn=None):